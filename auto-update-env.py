@@ -1,27 +1,18 @@
 #!/usr/bin/env python3
 import os
 import re
-import requests
+import sys
+
+# Public IP discovery is shared with the backend's host identity service
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+from host_identity import discover_public_ip
+
 
 def get_instance_ip():
     """Get public IP with multiple fallbacks."""
-    services = [
-        "https://icanhazip.com",
-        "https://api.ipify.org",
-        "https://checkip.amazonaws.com",
-        "https://ipinfo.io/ip",
-    ]
-
-    for service in services:
-        try:
-            response = requests.get(service, timeout=5)
-            ip = response.text.strip()
-            if ip and 6 < len(ip) < 16:
-                print(f"✅ Using public IP: {ip}")
-                return ip
-        except Exception as e:
-            print(f"⚠️ Failed to get IP from {service}: {e}")
-
+    ip = discover_public_ip(timeout=5)
+    if ip:
+        return ip
     print("🚨 No public IP found, using localhost")
     return "127.0.0.1"
 
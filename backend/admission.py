@@ -0,0 +1,157 @@
+import os
+import threading
+import time
+
+ADMISSION_MAX_CPU = float(os.getenv('ADMISSION_MAX_CPU', 0.85))  # host CPU utilisation above which installs wait
+ADMISSION_MIN_MEMORY_MB = int(os.getenv('ADMISSION_MIN_MEMORY_MB', 1024))  # available memory below which signups are refused
+ADMISSION_MIN_DISK_MB = int(os.getenv('ADMISSION_MIN_DISK_MB', 5120))  # free disk below which signups are refused
+ADMISSION_DISK_PATH = os.getenv('ADMISSION_DISK_PATH', '/var/lib/docker')
+ADMISSION_SAMPLE_INTERVAL = float(os.getenv('ADMISSION_SAMPLE_INTERVAL', 2))
+
+MB = 1024 * 1024
+
+
+class HostSaturatedError(Exception):
+    """Raised when the host lacks the memory or disk for another store"""
+
+
+def read_cpu_times():
+    """(idle, total) jiffies from /proc/stat, or None where /proc is unavailable"""
+    try:
+        with open('/proc/stat') as f:
+            fields = [int(value) for value in f.readline().split()[1:]]
+    except (OSError, ValueError):
+        return None
+    # idle + iowait count as idle time
+    return fields[3] + (fields[4] if len(fields) > 4 else 0), sum(fields)
+
+
+def _read_int(path):
+    try:
+        with open(path) as f:
+            value = f.read().strip()
+    except OSError:
+        return None
+    return int(value) if value.isdigit() else None
+
+
+def read_memory_available():
+    """Bytes of memory available to new containers: MemAvailable, capped by our cgroup's limit"""
+    available = None
+    try:
+        with open('/proc/meminfo') as f:
+            for line in f:
+                if line.startswith('MemAvailable:'):
+                    available = int(line.split()[1]) * 1024
+                    break
+    except (OSError, ValueError):
+        pass
+    # cgroup v2, then v1; an unlimited cgroup reports "max" or a huge number
+    for limit_path, usage_path in (
+        ('/sys/fs/cgroup/memory.max', '/sys/fs/cgroup/memory.current'),
+        ('/sys/fs/cgroup/memory/memory.limit_in_bytes', '/sys/fs/cgroup/memory/memory.usage_in_bytes')
+    ):
+        limit, usage = _read_int(limit_path), _read_int(usage_path)
+        if limit is not None and usage is not None and limit < 1 << 60:
+            headroom = max(0, limit - usage)
+            available = headroom if available is None else min(available, headroom)
+            break
+    return available
+
+
+def read_disk_free(path):
+    try:
+        stats = os.statvfs(path)
+    except OSError:
+        return None
+    return stats.f_bavail * stats.f_frsize
+
+
+class AdmissionController:
+    """Samples host CPU, memory and disk and decides whether new deployments may start.
+
+    A memory or disk shortfall refuses new signups outright, since waiting
+    will not free either. CPU saturation only holds back the next installer
+    (see PhaseSlots) until load drops, so bursts queue instead of thrashing.
+    Samples are taken on a background thread; checks read the cached values.
+    """
+
+    def __init__(self, disk_path=ADMISSION_DISK_PATH, max_cpu=ADMISSION_MAX_CPU, min_memory_mb=ADMISSION_MIN_MEMORY_MB,
+                 min_disk_mb=ADMISSION_MIN_DISK_MB, interval=ADMISSION_SAMPLE_INTERVAL, fallback_disk_path='.'):
+        self.disk_path = disk_path if os.path.exists(disk_path) else fallback_disk_path
+        self.max_cpu = max_cpu
+        self.min_memory = min_memory_mb * MB
+        self.min_disk = min_disk_mb * MB
+        self.interval = interval
+        self._cpu_times = read_cpu_times()
+        self._sample = {'cpu': None, 'memory_available': None, 'disk_free': None, 'sampled_at': None}
+        self._lock = threading.Lock()
+        self._thread = None
+        self.rejections = {'memory': 0, 'disk': 0}
+        self.sample()
+
+    def start(self):
+        if self._thread:
+            return
+        self._thread = threading.Thread(target=self._sample_loop, name="admission-sampler", daemon=True)
+        self._thread.start()
+
+    def sample(self):
+        cpu = None
+        times = read_cpu_times()
+        if times and self._cpu_times:
+            idle = times[0] - self._cpu_times[0]
+            total = times[1] - self._cpu_times[1]
+            if total > 0:
+                cpu = round(1 - idle / total, 3)
+        self._cpu_times = times
+        with self._lock:
+            self._sample = {
+                'cpu': cpu,
+                'memory_available': read_memory_available(),
+                'disk_free': read_disk_free(self.disk_path),
+                'sampled_at': time.time()
+            }
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self._sample)
+
+    def rejection(self, count=True):
+        """Why a new store can't be placed on this host right now, or None"""
+        sample = self.snapshot()
+        reason = None
+        if sample['memory_available'] is not None and sample['memory_available'] < self.min_memory:
+            reason = 'memory'
+        elif sample['disk_free'] is not None and sample['disk_free'] < self.min_disk:
+            reason = 'disk'
+        if reason and count:
+            with self._lock:
+                self.rejections[reason] += 1
+        return reason
+
+    def cpu_available(self):
+        """Whether the host has CPU headroom for another installer"""
+        cpu = self.snapshot()['cpu']
+        return cpu is None or cpu < self.max_cpu
+
+    def stats(self):
+        sample = self.snapshot()
+        with self._lock:
+            rejections = dict(self.rejections)
+        return dict(
+            sample,
+            max_cpu=self.max_cpu,
+            min_memory=self.min_memory,
+            min_disk=self.min_disk,
+            disk_path=self.disk_path,
+            rejections=rejections
+        )
+
+    def _sample_loop(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.sample()
+            except Exception as e:
+                print(f"⚠️  Host sampling failed: {e}")
@@ -1,529 +1,1452 @@
 import os
-import socket
-import subprocess
+import secrets
+import shutil
 import time
 import requests
 import threading
-from flask import Flask, jsonify, request
+from concurrent.futures import ThreadPoolExecutor
+from flask import Flask, Response, jsonify, request, stream_with_context
 from flask_cors import CORS
+from admission import AdmissionController, HostSaturatedError
+from code_layer import CODE_MODE, CODE_ROOT, SEED_SCRIPT_PATH, WEB_ROOT, CodeLayer
+from cluster import SERVER_WORKERS, STATE_PUBLISH_INTERVAL, CommandQueue, LeaderElection
+from golden_snapshot import GOLDEN_SNAPSHOT, GoldenSnapshot
+from hibernation import HIBERNATE_AFTER, WAKE_PORT, Hibernator
+from images import MYSQL_IMAGE, PRESTASHOP_IMAGE, ImageCache, ImageUnavailableError
+from inventory import ContainerInventory
+from host_identity import HostIdentity
+from jobs import PhaseSlots, ProvisioningQueue, QueueFullError
+from metering import METERING_SUMMARY_WINDOW, METRICS, ResourceMeter
+from metrics import DOCKER_CALL_BUCKETS, InstrumentedEngine, MetricsRegistry, PhaseTracker
+from nodes import NodePool, RoutedEngine, load_nodes
+from profiles import (APACHE_CONFIG_PATH, DEFAULT_PROFILE, MYSQL_CONFIG_PATH, PHP_CONFIG_PATH, PROFILES,
+                      apache_config, describe, get_profile, mysql_config, php_config, shop_settings)
+from progress_stream import ProgressBroker, stream_progress
+from shared_db import DB_MODE, SHARED_DB_CONTAINER, SHARED_DB_NETWORK, SharedDatabase
+from tenant_http import BACKEND_CONTAINER, BACKEND_NETWORK, TenantHTTP
+from tenant_registry import TenantRegistry
+from tenant_spec import ConfigFile, Healthcheck, Mount, Service, TenantSpec, remove_project
+from readiness import ContainerEventWatcher, wait_until
+from router import ROUTER_NETWORK, ROUTING_MODE, WAKE_UPSTREAM, Router
+from warm_pool import WarmPool
 
 app = Flask(__name__)
-SERVER_IP = os.getenv('SERVER_IP', 'localhost')
 CORS(app, origins="*")
 BASE_PORT = int(os.getenv('BASE_PORT', 8081))
-TENANTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'tenants')
+TENANTS_DIR = os.path.abspath(os.getenv('TENANTS_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'tenants')))
 os.makedirs(TENANTS_DIR, exist_ok=True)
+MYSQL_READY_TIMEOUT = int(os.getenv('MYSQL_READY_TIMEOUT', 120))
+SHOP_READY_TIMEOUT = int(os.getenv('SHOP_READY_TIMEOUT', 300))
+BATCH_MAX_SIZE = int(os.getenv('BATCH_MAX_SIZE', 100))
+TEARDOWN_WORKERS = int(os.getenv('TEARDOWN_WORKERS', 4))
+TENANTS_PAGE_MAX = int(os.getenv('TENANTS_PAGE_MAX', 500))
+# Seconds a profile rollout waits between checks for an idle provisioning worker
+ROLLOUT_POLL_INTERVAL = float(os.getenv('ROLLOUT_POLL_INTERVAL', 1))
+TENANT_STATES = ('processing', 'completed', 'error', 'deleting')
+# Credentials of the per-store MySQL service in dedicated database mode
+DEDICATED_DATABASE = {'host': 'db', 'name': 'prestashop', 'user': 'psuser', 'password': 'pspassword'}
+
+# Prometheus metrics served on /metrics
+metrics = MetricsRegistry()
+docker_calls = metrics.counter('saas_docker_calls_total', 'Docker Engine API and docker-compose calls', ('operation', 'outcome'))
+docker_call_seconds = metrics.histogram('saas_docker_call_duration_seconds', 'Duration of Docker calls', ('operation',), DOCKER_CALL_BUCKETS)
+
+# Tenants, deployment progress and progress history live in SQLite so they survive restarts
+registry = TenantRegistry(os.getenv('REGISTRY_PATH', os.path.join(TENANTS_DIR, '.registry.db')))
+
+# Stores are spread over the Docker nodes in DOCKER_NODES; docker sends each call to the owning node.
+# The shared database and edge router only exist on the primary node, so those modes keep stores there.
+nodes = NodePool(
+    load_nodes(TENANTS_DIR, BASE_PORT, lambda engine: InstrumentedEngine(engine, docker_calls, docker_call_seconds), registry=registry),
+    registry,
+    pinned=DB_MODE == 'shared' or ROUTING_MODE == 'host'
+)
+docker = RoutedEngine(nodes)
+# Store images are pulled ahead of time on every node rather than inside `docker-compose up`
+images = ImageCache(nodes.nodes, [PRESTASHOP_IMAGE] + ([] if DB_MODE == 'shared' else [MYSQL_IMAGE]))
+phase_tracker = PhaseTracker(
+    metrics.histogram('saas_provisioning_phase_duration_seconds', 'Time spent in each deployment phase', ('phase',)),
+    metrics.histogram('saas_provisioning_duration_seconds', 'Time from queueing to the end of a deployment', ('outcome',)),
+    metrics.counter('saas_provisioning_failures_total', 'Failed deployments by the phase they failed in', ('phase',))
+)
+container_events = ContainerEventWatcher([node.engine for node in nodes.nodes])
+# Tenant listings and diagnostics read container state from memory instead of asking Docker
+inventory = ContainerInventory(nodes.nodes, container_events)
+# CPU, memory, network and disk use of every store, from one stats stream per container
+meter = ResourceMeter(nodes.nodes, container_events, inventory, registry)
+# With CODE_MODE=shared stores mount the PrestaShop code read-only and only keep their own files
+code_layer = CodeLayer(PRESTASHOP_IMAGE, container_events) if CODE_MODE == 'shared' else None
+host_identity = HostIdentity()
+tenant_http = TenantHTTP(docker)
+
+provisioning_queue = ProvisioningQueue()
+admission = AdmissionController(fallback_disk_path=TENANTS_DIR)
+# Installs beyond the first also wait while the host CPU is saturated
+db_slots = PhaseSlots(gate=admission.cpu_available)
+teardown_pool = ThreadPoolExecutor(max_workers=TEARDOWN_WORKERS, thread_name_prefix='teardown')
+warm_pool = WarmPool(TENANTS_DIR)
+progress_broker = ProgressBroker(registry)
+shared_db = SharedDatabase(docker, TENANTS_DIR, container_events)
+golden_snapshot = GoldenSnapshot(os.getenv('GOLDEN_SNAPSHOT_DIR', os.path.join(TENANTS_DIR, '.golden')))
+# Under gunicorn every worker process imports this module; only the elected leader runs the
+# provisioning queue, pools and background loops. Every worker answers reads from the registry,
+# the state the leader publishes there and its own container inventory; changes go to the leader as commands
+election = LeaderElection(os.path.join(TENANTS_DIR, '.leader.lock'))
+commands = CommandQueue(registry, election)
+
+def tenant_containers(tenant):
+    """The tenant's own containers in start order (shared-mode stores have no database container)"""
+    if shared_db.credentials(tenant):
+        return [f'{tenant}_shop']
+    return [f'{tenant}_db', f'{tenant}_shop']
+
+# With host routing, stores sit behind one edge proxy instead of publishing a port each
+router = None
+if ROUTING_MODE == 'host':
+    router = Router(
+        docker, TENANTS_DIR, host_identity.ip, container_events,
+        wake_upstream=WAKE_UPSTREAM or f"http://{'backend' if BACKEND_NETWORK else 'host.docker.internal'}:{WAKE_PORT}"
+    )
+# Without the router, wake listeners bind the stores' published ports, which a backend in a
+# bridge-networked container (as under Docker Compose) never receives traffic on
+HIBERNATION_AVAILABLE = router is not None or not BACKEND_CONTAINER
+if HIBERNATE_AFTER and not HIBERNATION_AVAILABLE:
+    print("⚠️  Hibernation is off: the backend runs in a container, so port-mode wake listeners can't be reached. Use ROUTING_MODE=host")
+# Wake listeners run on the backend's host, so only stores on the primary node hibernate
+hibernator = Hibernator(
+    docker, container_events, registry, tenant_containers, tenant_http.address,
+    exclude=lambda tenant: warm_pool.is_warm(tenant) or not nodes.on_primary(tenant) or tenant_has_job(tenant), router=router,
+    traffic=meter.received_bytes, forget_address=tenant_http.forget, idle_after=HIBERNATE_AFTER if HIBERNATION_AVAILABLE else 0
+)
+
+metrics.gauge('saas_provisioning_queue_depth', 'Deployments waiting for a provisioning worker', lambda: provisioning_queue.stats()['queued'])
+metrics.gauge('saas_provisioning_running', 'Deployments being executed by a worker', lambda: provisioning_queue.stats()['running'])
+metrics.gauge('saas_provisioning_workers', 'Provisioning worker threads', lambda: provisioning_queue.workers)
+metrics.gauge('saas_db_slot_waiters', 'Deployments waiting for a database-heavy phase slot', lambda: db_slots.stats()['waiting'])
+metrics.gauge('saas_host_cpu_utilization', 'Host CPU utilisation (0-1) from the admission sampler', lambda: admission.snapshot()['cpu'] or 0)
+metrics.gauge('saas_host_memory_available_bytes', 'Memory available for new stores', lambda: admission.snapshot()['memory_available'] or 0)
+metrics.gauge('saas_host_disk_free_bytes', 'Free disk space for store data', lambda: admission.snapshot()['disk_free'] or 0)
+metrics.gauge('saas_admission_rejections', 'Signups refused because the host was saturated', lambda: admission.stats()['rejections'], ('reason',))
+metrics.gauge('saas_deployments_active', 'Deployments in flight by current phase', phase_tracker.active, ('phase',))
+metrics.gauge('saas_tenants', 'Tenants by deployment state', registry.counts, ('state',))
+metrics.gauge('saas_warm_pool_ready', 'Pre-installed stores ready to be claimed', lambda: warm_pool.stats()['ready'])
+metrics.gauge('saas_ports_free', 'Free host ports in the tenant range', lambda: sum(node.ports.stats()['free'] for node in nodes.nodes))
+metrics.gauge('saas_node_tenants', 'Stores placed on each Docker node', lambda: {node['name']: node['tenants'] for node in nodes.stats()['nodes']}, ('node',))
+metrics.gauge('saas_images_missing', 'Store images not yet pulled on each node', lambda: {
+    name: sum(1 for state in states.values() if not state['present']) for name, states in images.stats()['nodes'].items()
+}, ('node',))
+metrics.gauge('saas_metering_streams', 'Open container stats streams', lambda: meter.stats()['streams'])
+metrics.gauge('saas_containers', 'Containers on the Docker nodes by state, from the inventory', lambda: inventory.stats()['states'], ('state',))
+metrics.gauge('saas_tenants_hibernated', 'Stores stopped for inactivity', lambda: hibernator.stats()['hibernated'])
+metrics.gauge('saas_progress_watchers', 'Open deployment progress streams', lambda: progress_broker.stats()['watchers'])
+
+def update_progress(tenant, stage, message, percent=None, result=None):
+    """Update deployment progress and push it to stream subscribers"""
+    state = stage if stage in ('completed', 'error') else None
+    registry.record_progress(tenant, stage, message, percent, state=state, result=result)
+    phase_tracker.record(tenant, stage)
+    progress_broker.publish(tenant)
 
-# Store deployment progress
-deployment_progress = {}
-
-def update_progress(tenant, stage, message, percent=None):
-    """Update deployment progress"""
-    if tenant not in deployment_progress:
-        deployment_progress[tenant] = {
-            'stage': '',
-            'message': '',
-            'percent': 0,
-            'status': 'processing',  # processing, completed, error
-            'start_time': time.time()
-        }
-    
-    deployment_progress[tenant]['stage'] = stage
-    deployment_progress[tenant]['message'] = message
-    deployment_progress[tenant]['last_update'] = time.time()
-    
-    if percent is not None:
-        deployment_progress[tenant]['percent'] = percent
-    
     print(f"🔔 {tenant}: {stage} - {message} ({percent}%)")
 
-def get_next_port():
-    port = BASE_PORT
-    max_port = BASE_PORT + 50
-
-    print(f"🔍 Looking for available port starting from {port}...")
-
-    # Get all ports currently used by Docker
-    used_ports = set()
-    try:
-        result = subprocess.run(
-            'docker ps --format "{{.Ports}}" | grep -oP "\\d+?(?=->)"',
-            shell=True,
-            capture_output=True,
-            text=True
-        )
-        if result.returncode == 0 and result.stdout.strip():
-            used_ports = set(int(p) for p in result.stdout.strip().split('\n') if p.isdigit())
-        print(f"Ports currently used by Docker: {used_ports}")
-    except Exception as e:
-        print(f"Error checking Docker ports: {e}")
-
-    while port <= max_port:
-        # Check if Docker is using this port
-        if port in used_ports:
-            print(f"❌ Port {port} is used by Docker")
-            port += 1
+def get_next_port(tenant):
+    """Reserve a host port for tenant from its node's allocator"""
+    port = nodes.ports(tenant).reserve(tenant)
+    print(f"✅ Port {port} reserved for {tenant}")
+    return port
+
+def list_tenants():
+    """Tenant ids that have a directory under TENANTS_DIR (dot-directories hold backend state)"""
+    return {
+        name for name in os.listdir(TENANTS_DIR)
+        if not name.startswith('.') and os.path.isdir(os.path.join(TENANTS_DIR, name))
+    }
+
+def recover_registry():
+    """Continue tenant ids after existing directories and fail deployments cut off by a restart"""
+    numbers = [int(name[len('tenant'):]) for name in list_tenants() if name[len('tenant'):].isdigit()]
+    registry.seed(max(numbers, default=0))
+    for tenant, state in registry.recover():
+        action = 'removal' if state == 'deleting' else 'deployment'
+        print(f"⚠️  {tenant}: {action} was interrupted by a restart, marked as failed")
+
+def reconcile_ports():
+    """Re-sync each node's port ledger with the ports its Docker daemon actually publishes"""
+    tenants = list_tenants()
+    for node in nodes.nodes:
+        # A worker taking over as leader loaded its reservations before the previous leader last changed them
+        node.ports.reload()
+        try:
+            published = node.engine.published_ports()
+        except Exception as e:
+            print(f"⚠️  Could not list Docker ports on node {node.name} for reconciliation: {e}")
             continue
+        node.ports.reconcile(published, {tenant for tenant in tenants if nodes.node_of(tenant) is node})
 
-        # Also try socket bind as backup check
+def get_instance_ip():
+    """Server IP from the cached host identity; never does network lookups"""
+    return host_identity.ip()
+
+def store_domain(tenant, port):
+    """Address a store is served on: its router hostname, or its node's IP and its published port"""
+    if router:
+        return router.hostname(tenant)
+    return f"{nodes.public_ip(tenant) or get_instance_ip()}:{port}"
+
+def log_container_states(tenant):
+    """Print a failed tenant's containers as the inventory last saw them; logs are fetched by /tenants/<id>/diagnostics"""
+    print(f"Containers of {tenant}:")
+    print(format_container_table(inventory.containers(tenant)))
+
+def format_container_table(containers):
+    """Render inventory entries like `docker ps --format table`"""
+    lines = ["NAMES\tSTATE\tPORTS"]
+    for container in containers:
+        state = f"{container['state']} ({container['health']})" if container['health'] else container['state']
+        ports = ', '.join(f"{port}->80/tcp" for port in container['ports'])
+        lines.append(f"{container['name']}\t{state}\t{ports}")
+    return '\n'.join(lines)
+
+def tenant_diagnostics(tenant, tail, node):
+    """Container states and the last tail log lines of each of a tenant's containers on node"""
+    logs = {}
+    for name in tenant_containers(tenant):
         try:
-            with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-                s.settimeout(1)
-                s.bind(('0.0.0.0', port))
-                s.close()
-                print(f"✅ Port {port} is available")
-                return port
-        except OSError:
-            print(f"❌ Port {port} is in use (bind failed)")
-            port += 1
+            stdout, stderr = node.engine.logs(name, tail=tail)
+            logs[name] = {'stdout': stdout, 'stderr': stderr}
         except Exception as e:
-            print(f"⚠️  Port {port} error: {e}")
-            port += 1
+            logs[name] = {'error': str(e)}
+    return {'containers': inventory.containers(tenant), 'logs': logs}
 
-    raise Exception(f"No available ports found in range {BASE_PORT}-{max_port}")
+class DeploymentError(Exception):
+    """Raised when a provisioning job cannot bring a store up"""
 
-def get_instance_ip():
-    """Get server IP - optimized for GCP but works everywhere"""
-    
-    # Try GCP metadata first (if on GCP)
+def allocate_tenant():
+    """Allocate the next tenant id, place it on a Docker node and create its directory.
+
+    Raises NodesFullError (a HostSaturatedError) when no node has room.
+    """
+    tenant = registry.allocate()
     try:
-        response = requests.get(
-            'http://metadata.google.internal/computeMetadata/v1/instance/network-interfaces/0/access-configs/0/external-ip',
-            headers={'Metadata-Flavor': 'Google'},
-            timeout=1
-        )
-        ip = response.text.strip()
-        if ip and 6 < len(ip) < 16:
-            print(f"✅ Using GCP external IP: {ip}")
-            return ip
-    except:
-        pass  # Not on GCP or metadata unavailable
-    
-    # Then try public IP services (works everywhere)
-    services = [
-        'https://icanhazip.com',
-        'https://api.ipify.org', 
-        'https://checkip.amazonaws.com',
-        'https://ipinfo.io/ip'
-    ]
-    
-    for service in services:
+        nodes.place(tenant)
+    except Exception:
+        registry.delete(tenant)
+        raise
+    os.makedirs(os.path.join(TENANTS_DIR, tenant), exist_ok=True)
+    return tenant
+
+def discard_tenant(tenant):
+    """Forget a tenant that was allocated but never started"""
+    registry.delete(tenant)
+    nodes.forget(tenant)
+    progress_broker.forget(tenant)
+    phase_tracker.forget(tenant)
+    os.rmdir(os.path.join(TENANTS_DIR, tenant))
+
+def teardown_tenant(tenant):
+    """Remove a tenant's containers, volumes, database, port and records"""
+    path = os.path.join(TENANTS_DIR, tenant)
+    try:
+        # The backend leaves the store's network first, or Docker refuses to remove it
+        tenant_http.detach(f'{tenant}_shop')
+        # Removes exactly this project's containers, network and volumes, like `docker-compose down -v`
+        remove_project(nodes.engine_for(tenant), tenant)
+        for name in tenant_containers(tenant):
+            docker.remove_container(name)
+    except Exception as e:
+        raise DeploymentError(f'Could not remove {tenant} containers: {e}')
+    if shared_db.credentials(tenant):
+        shared_db.drop_tenant_database(tenant)
+    hibernator.forget(tenant)
+    if router:
+        router.remove_route(tenant)
+    nodes.ports(tenant).release(tenant)
+    registry.delete(tenant)
+    nodes.forget(tenant)
+    provisioning_queue.forget(tenant)
+    progress_broker.forget(tenant)
+    phase_tracker.forget(tenant)
+    meter.forget(tenant)
+    shutil.rmtree(path, ignore_errors=True)
+
+def tenant_network(tenant):
+    """The tenant's own bridge network, which only its containers (and a containerized backend) join"""
+    return f'{tenant}_{tenant}-net'
+
+def connect_backend(tenant):
+    """Let the backend reach the store's shop over the tenant's network; the primary node's are the only ones it can join"""
+    if nodes.on_primary(tenant):
+        tenant_http.attach(f'{tenant}_shop', tenant_network(tenant))
+
+def connect_backend_to_stores():
+    """Join the networks of existing stores, moving stores created on the old shared backend network off it"""
+    for tenant in list_tenants():
+        if not nodes.on_primary(tenant):
+            continue
         try:
-            response = requests.get(service, timeout=3)
-            ip = response.text.strip()
-            if ip and 6 < len(ip) < 16:
-                print(f"✅ Using public IP from {service}: {ip}")
-                return ip
+            connect_backend(tenant)
+            if BACKEND_NETWORK and tenant_http.container:
+                nodes.primary.engine.disconnect_network(BACKEND_NETWORK, f'{tenant}_shop')
         except Exception as e:
-            print(f"⚠️  Failed to get IP from {service}: {e}")
-            continue
-    
-    # Final fallback
-    print("🚨 Warning: No public IP found, using localhost fallback")
-    return 'localhost'
+            print(f"⚠️  Could not connect to the network of {tenant}: {e}")
 
-def trigger_admin_renaming(tenant, port):
-    """Access the admin URL to trigger folder renaming"""
-    try:
-        ip_address = get_instance_ip()
-        admin_url = f"http://{ip_address}:{port}/admin"
-        print(f"Triggering admin folder renaming by accessing: {admin_url}")
+def tenant_has_job(tenant):
+    """Whether a provisioning job (deployment or profile change) is queued or running for tenant"""
+    job = provisioning_queue.get(tenant)
+    return bool(job and job['state'] in ('queued', 'running'))
 
-        # Make a request to the admin URL to trigger renaming
-        response = requests.get(admin_url, timeout=30, allow_redirects=True)
-        print(f"Admin access response status: {response.status_code}")
+def tenant_busy(tenant, status):
+    """Whether a tenant is being deployed, reconfigured or removed right now"""
+    return tenant_has_job(tenant) or status['status'] in ('processing', 'deleting')
 
-        # Wait a moment for the renaming to complete
-        time.sleep(10)
-        return True
-    except Exception as e:
-        print(f"Error triggering admin renaming: {e}")
-        return False
-
-def get_actual_admin_folder(tenant):
-    """Simple and reliable admin folder detection"""
+def remove_tenant(tenant):
+    """Tear a tenant down, leaving it in the error state if that fails so the delete can be retried"""
     try:
-        print(f"🔍 Simple search for admin folder in {tenant}_shop...")
-
-        # Just list all directories and look for the one that starts with 'admin'
-        result = subprocess.run(
-            f'docker exec {tenant}_shop ls /var/www/html',
-            shell=True,
-            capture_output=True,
-            text=True,
-            timeout=30
-        )
-
-        if result.returncode == 0:
-            all_items = result.stdout.strip().split('\n')
-            print(f"All items in /var/www/html: {all_items}")
-
-            for item in all_items:
-                if item.startswith('admin') and item != 'admin':
-                    print(f"✅ Found admin folder: {item}")
-                    return item
-
-        # Fallback: try with find command
-        result = subprocess.run(
-            f'docker exec {tenant}_shop find /var/www/html -maxdepth 1 -type d -name "admin*" -exec basename {{}} \\;',
-            shell=True,
-            capture_output=True,
-            text=True,
-            timeout=30
-        )
-
-        if result.returncode == 0 and result.stdout.strip():
-            folders = [f.strip() for f in result.stdout.strip().split('\n') if f.strip()]
-            for folder in folders:
-                if folder.startswith('admin') and folder != 'admin':
-                    print(f" Found admin folder via find: {folder}")
-                    return folder
-
-        print(" No renamed admin folder found, using default 'admin'")
-        return "admin"
-
+        teardown_tenant(tenant)
+        print(f"🗑️  {tenant} removed")
     except Exception as e:
-        print(f" Error detecting admin folder: {e}")
-        return "admin"
-
-def debug_admin_folder_detection(tenant):
-    """Debug function to see what's really in the container"""
-    print(f"🔍 DEBUG: Checking {tenant}_shop container...")
-
-    commands = [
-        "ls -la /var/www/html | grep admin",
-        "find /var/www/html -maxdepth 1 -name 'admin*' -type d",
-        "ls -d /var/www/html/admin*/ 2>/dev/null || echo 'No admin folders found'",
-        "ls /var/www/html | grep ^admin"
-    ]
-
-    for i, cmd in enumerate(commands, 1):
-        print(f"Command {i}: {cmd}")
-        result = subprocess.run(
-            f'docker exec {tenant}_shop {cmd}',
-            shell=True,
-            capture_output=True,
-            text=True,
-            timeout=30
-        )
-        print(f"Output: {result.stdout}")
-        if result.stderr:
-            print(f"Error: {result.stderr}")
-        print("---")
-
-def check_container_health(tenant):
-    """Check if containers are running and healthy"""
-    print(f"Checking health of {tenant} containers...")
-
-    # Check if containers exist and are running
-    result = subprocess.run(
-        f'docker ps -a --filter "name={tenant}" --format "table {{.Names}}\\t{{.Status}}\\t{{.Ports}}"',
-        shell=True,
-        capture_output=True,
-        text=True
-    )
-    print("Container status:")
-    print(result.stdout)
-
-    # Check PrestaShop logs
-    print(f"Checking PrestaShop logs for {tenant}_shop:")
-    logs_result = subprocess.run(
-        f'docker logs --tail 20 {tenant}_shop',
-        shell=True,
-        capture_output=True,
-        text=True
-    )
-    print(logs_result.stdout)
-    if logs_result.stderr:
-        print("Errors:", logs_result.stderr)
-
-    # Check MySQL logs
-    print(f"Checking MySQL logs for {tenant}_db:")
-    db_logs = subprocess.run(
-        f'docker logs --tail 10 {tenant}_db',
-        shell=True,
-        capture_output=True,
-        text=True
-    )
-    print(db_logs.stdout)
-
-@app.route('/create-store', methods=['POST'])
-def create_store():
+        print(f"❌ Removing {tenant} failed: {e}")
+        registry.record_progress(tenant, 'error', f'Removal failed: {e}', 0, state='error')
+        raise
+
+def begin_removal(tenant):
+    """Mark a tenant as being removed; returns why it can't be, or None"""
+    status = registry.get(tenant)
+    if status is None:
+        return 'not_found'
+    if tenant_busy(tenant, status):
+        return 'busy'
+    # One conditional update, so of two concurrent deletes only one goes on to tear the store down
+    if not registry.begin_removal(tenant, 'Removing store...'):
+        return 'busy' if registry.get(tenant) else 'not_found'
+    warm_pool.discard(tenant)
+    return None
+
+def tenant_spec(tenant, port, domain, admin_folder, admin_email, admin_password, database=None, restored=False, profile=None):
+    """Describe a tenant's stack.
+
+    The performance profile (standard by default) sets the container limits
+    and the MySQL, PHP and Apache config files copied into the containers.
+
+    Without a port (host routing) the shop publishes nothing and joins the
+    edge router's network instead.
+
+    With database credentials (shared database mode) only PrestaShop runs,
+    attached to the shared MySQL network; otherwise the tenant gets its own
+    MySQL service. A restored store (golden snapshot) skips the installer
+    and keeps its web root volume empty until the snapshot is copied in.
+    With the shared code layer the web root volume only holds the store's
+    own files and is filled by the seed script on first start.
+    """
+    profile = profile or get_profile(None)
+    networks = [f'{tenant}-net']
+    external_networks = {}
+    services = []
+    volumes = [f'ps_data_{tenant}']
+    shop_networks = [f'{tenant}-net']
+    if database:
+        shop_networks.append('shared-db')
+        external_networks['shared-db'] = SHARED_DB_NETWORK
+    else:
+        database = dict(DEDICATED_DATABASE)
+        volumes.insert(0, f'db_data_{tenant}')
+        services.append(Service(
+            name='db',
+            container=f'{tenant}_db',
+            image=MYSQL_IMAGE,
+            environment={
+                'MYSQL_ROOT_PASSWORD': 'root',
+                'MYSQL_DATABASE': database['name'],
+                'MYSQL_USER': database['user'],
+                'MYSQL_PASSWORD': database['password']
+            },
+            networks=[f'{tenant}-net'],
+            mounts=[Mount(f'db_data_{tenant}', '/var/lib/mysql')],
+            healthcheck=Healthcheck(['CMD', 'mysqladmin', 'ping', '-h', 'localhost'], timeout=20, retries=10),
+            memory=profile.db_memory,
+            cpus=profile.db_cpus,
+            files=[ConfigFile(MYSQL_CONFIG_PATH, mysql_config(profile))]
+        ))
+
+    if not port:
+        shop_networks.append('proxy')
+        external_networks['proxy'] = ROUTER_NETWORK
+
+    shop_mounts = [Mount(f'ps_data_{tenant}', WEB_ROOT, nocopy=restored)]
+    shop_files = [ConfigFile(PHP_CONFIG_PATH, php_config(profile)), ConfigFile(APACHE_CONFIG_PATH, apache_config(profile))]
+    command = []
+    external_volumes = {}
+    if code_layer:
+        shop_mounts = [Mount(f'ps_data_{tenant}', WEB_ROOT, nocopy=True), Mount('code', CODE_ROOT, read_only=True)]
+        shop_files.append(ConfigFile(SEED_SCRIPT_PATH, code_layer.seed_script()))
+        command = ['sh', SEED_SCRIPT_PATH]
+        external_volumes['code'] = code_layer.volume(nodes.node_of(tenant))
+
+    services.append(Service(
+        name='prestashop',
+        container=f'{tenant}_shop',
+        image=PRESTASHOP_IMAGE,
+        environment={
+            'DB_SERVER': database['host'],
+            'DB_NAME': database['name'],
+            'DB_USER': database['user'],
+            'DB_PASSWD': database['password'],
+            'PS_INSTALL_AUTO': '0' if restored else '1',
+            'PS_DEV_MODE': '0',
+            'PS_HOST_MODE': '1',
+            'PS_ENABLE_SSL': '0',
+            'PS_HANDLE_DYNAMIC_DOMAIN': '0',
+            'PS_DOMAIN': domain,
+            'PS_LANGUAGE': 'en',
+            'PS_COUNTRY': 'US',
+            'PS_FOLDER_ADMIN': admin_folder,
+            'PS_FOLDER_INSTALL': 'install',
+            'ADMIN_MAIL': admin_email,
+            'ADMIN_PASSWD': admin_password
+        },
+        networks=shop_networks,
+        mounts=shop_mounts,
+        port=port,
+        healthcheck=Healthcheck(['CMD', 'curl', '-f', 'http://localhost:80'], timeout=10, retries=20, start_period=60),
+        memory=profile.shop_memory,
+        cpus=profile.shop_cpus,
+        depends_on=['db'] if services else [],
+        files=shop_files,
+        command=command
+    ))
+    return TenantSpec(tenant, services, networks, volumes, external_networks, external_volumes)
+
+def acquire_db_slot(tenant):
+    """Wait for a database-heavy phase slot, telling the user if they have to queue"""
+    db_slots.acquire(tenant, lambda: update_progress(tenant, 'waiting_db_slot', 'Waiting for host capacity to install your store...', 30))
+
+def provision_store(tenant, admin_email, admin_password, use_snapshot=True, profile=None):
+    """Run the full store deployment for tenant; executed by a provisioning worker.
+
+    When a golden snapshot exists (and use_snapshot is set) the store is
+    cloned from it instead of running the PrestaShop installer. Containers
+    are created (and images pulled) before a database slot is taken, so
+    only the installer or dump import is throttled by DB_PHASE_CONCURRENCY.
+    """
+    profile = profile or get_profile(None)
     try:
-        body = request.get_json(force=True)
-        custom_email = body.get("email")
-        custom_password = body.get("password")
-        ip_address = get_instance_ip()
-
-        existing = os.listdir(TENANTS_DIR)
-        tenant = f"tenant{len(existing)+1}"
-        
-        # Initialize progress
         update_progress(tenant, 'starting', 'Initializing store deployment...', 0)
-        
-        port = get_next_port()
+        registry.update(tenant, profile=profile.name)
+
+        # Behind the edge router stores are addressed by hostname and need no port
+        port = None
+        if router is None:
+            port = get_next_port(tenant)
+            registry.update(tenant, port=port)
+        domain = store_domain(tenant, port)
         path = os.path.join(TENANTS_DIR, tenant)
         os.makedirs(path, exist_ok=True)
 
-        admin_email = custom_email
-        admin_password = custom_password
-        admin_folder = "admin"
-
-        update_progress(tenant, 'cleaning', 'Cleaning up previous deployments...', 10)
-
-        # Clean up any existing containers
-        print(f"Cleaning up any existing {tenant} containers...")
-        subprocess.run(f'docker-compose -f {path}/docker-compose.yml down -v', shell=True, capture_output=True)
-        subprocess.run(f'docker rm -f {tenant}_shop {tenant}_db', shell=True, capture_output=True)
-
-        update_progress(tenant, 'configuring', 'Creating Docker configuration...', 20)
-
-        # Create docker-compose.yml file
-        compose = f"""
-services:
-  db:
-    image: mysql:5.7
-    container_name: {tenant}_db
-    restart: unless-stopped
-    environment:
-      MYSQL_ROOT_PASSWORD: root
-      MYSQL_DATABASE: prestashop
-      MYSQL_USER: psuser
-      MYSQL_PASSWORD: pspassword
-    networks:
-      - {tenant}-net
-    volumes:
-      - db_data_{tenant}:/var/lib/mysql
-    healthcheck:
-      test: ["CMD", "mysqladmin", "ping", "-h", "localhost"]
-      timeout: 20s
-      retries: 10
-
-  prestashop:
-    image: prestashop/prestashop:8.1.6-apache
-    container_name: {tenant}_shop
-    restart: unless-stopped
-    depends_on:
-      db:
-        condition: service_healthy
-    networks:
-      - {tenant}-net
-    ports:
-      - "{port}:80"
-    environment:
-      DB_SERVER: db
-      DB_USER: psuser
-      DB_PASSWD: pspassword
-      PS_INSTALL_AUTO: '1'
-      PS_DEV_MODE: '0'
-      PS_HOST_MODE: '1'
-      PS_ENABLE_SSL: '0'
-      PS_HANDLE_DYNAMIC_DOMAIN: '0'
-      PS_DOMAIN: {ip_address}:{port}
-      PS_LANGUAGE: en
-      PS_COUNTRY: US
-      PS_FOLDER_ADMIN: {admin_folder}
-      PS_FOLDER_INSTALL: install
-      ADMIN_MAIL: {admin_email}
-      ADMIN_PASSWD: {admin_password}
-    volumes:
-      - ps_data_{tenant}:/var/www/html
-    healthcheck:
-      test: ["CMD", "curl", "-f", "http://localhost:80"]
-      timeout: 10s
-      retries: 20
-      start_period: 60s
-
-volumes:
-  db_data_{tenant}:
-  ps_data_{tenant}:
-
-networks:
-  {tenant}-net:
-    driver: bridge
-"""
-
-        with open(os.path.join(path, "docker-compose.yml"), "w") as f:
-            f.write(compose)
+        # PrestaShop renames admin/ to PS_FOLDER_ADMIN during install, so the folder is known up front
+        admin_folder = f"admin{secrets.token_hex(4)}"
+
+        engine = nodes.engine_for(tenant)
+        compose_path = os.path.join(path, 'docker-compose.yml')
+        if os.path.exists(compose_path):
+            # Only a re-deployment has an earlier stack to clear; fresh tenants skip straight to creation
+            update_progress(tenant, 'cleaning', 'Cleaning up previous deployments...', 10)
+            print(f"Cleaning up existing {tenant} containers...")
+            tenant_http.detach(f'{tenant}_shop')
+            remove_project(engine, tenant)
+
+        database = None
+        if DB_MODE == 'shared':
+            update_progress(tenant, 'preparing_database', 'Creating store database on the shared server...', 15)
+            database = shared_db.create_tenant_database(tenant)
+
+        node = nodes.node_of(tenant)
+        if not images.ready(node.name):
+            # A fresh or pruned host: wait for the background pull instead of pulling in every deployment
+            update_progress(tenant, 'pulling_images', 'Downloading store software...', 20)
+            images.ensure(node.name, lambda progress: update_progress(
+                tenant, 'pulling_images', f'Downloading store software... ({progress:.0%})', 20 + progress * 5
+            ))
+        code_volume = None
+        if code_layer:
+            if not code_layer.ready(node):
+                # Once per node and image; every later store mounts the same volume
+                update_progress(tenant, 'preparing_code', 'Preparing store software...', 25)
+            code_volume = code_layer.ensure(node)
+
+        snapshot = golden_snapshot.metadata() if use_snapshot and GOLDEN_SNAPSHOT else None
+        if snapshot and snapshot.get('code_layer') != code_volume:
+            # A snapshot's web root only works on the code layer (or full web root) it was captured with
+            snapshot = None
+
+        update_progress(tenant, 'configuring', 'Creating Docker configuration...', 25)
+
+        spec = tenant_spec(tenant, port, domain, admin_folder, admin_email, admin_password, database,
+                           restored=snapshot is not None, profile=profile)
+
+        # The stack is created through the Engine API; the compose file lets operators manage it by hand
+        with open(compose_path, "w") as f:
+            f.write(spec.to_compose())
+
+        def docker_step(action, *args):
+            try:
+                action(engine, *args)
+            except Exception as e:
+                update_progress(tenant, 'error', f'Docker failed: {e}', 0)
+                log_container_states(tenant)
+                # Nothing is listening on the port, so hand it back straight away
+                nodes.ports(tenant).release(tenant)
+                raise DeploymentError(f'Docker failed: {e}')
+
+        if snapshot:
+            # Create the containers stopped so the web root is in place before PrestaShop first boots
+            update_progress(tenant, 'cloning_snapshot', 'Copying pre-installed store files...', 25)
+            docker_step(spec.create, path)
+            golden_snapshot.restore_files(docker, f'{tenant}_shop', database or DEDICATED_DATABASE, path)
+        else:
+            update_progress(tenant, 'creating_containers', 'Creating containers...', 25)
+            docker_step(spec.create, path)
+            # The installer hammers MySQL from first boot until the shop is healthy
+            acquire_db_slot(tenant)
+        connect_backend(tenant)
 
         update_progress(tenant, 'starting_containers', 'Starting Docker containers...', 30)
 
-        # Start Docker containers
-        print(f"Starting Docker Compose for {tenant} on port {port}...")
-
-        result = subprocess.run(
-            f'docker-compose -f docker-compose.yml up -d',
-            cwd=path,
-            shell=True,
-            capture_output=True,
-            text=True,
-            timeout=180
-        )
-
-        print("Docker Compose output:", result.stdout)
-        if result.stderr:
-            print("Docker Compose errors:", result.stderr)
-
-        if result.returncode != 0:
-            update_progress(tenant, 'error', f'Docker failed: {result.stderr}', 0)
-            check_container_health(tenant)
-            return jsonify({'error': f'Docker failed: {result.stderr}'}), 500
-
-        update_progress(tenant, 'waiting_mysql', 'Waiting for database to start...', 40)
-
-        # Wait for MySQL to be healthy first
-        print("Waiting for MySQL to be healthy...")
-        for i in range(60):
-            db_health = subprocess.run(
-                f'docker inspect --format="{{{{.State.Health.Status}}}}" {tenant}_db',
-                shell=True,
-                capture_output=True,
-                text=True
-            )
-            if db_health.stdout.strip() == 'healthy':
+        # Start the database first; like compose's depends_on, the shop only starts once it is healthy
+        print(f"Starting {tenant} at {domain}...")
+        if database is None:
+            docker_step(spec.start, 'db')
+
+            update_progress(tenant, 'waiting_mysql', 'Waiting for database to start...', 40)
+
+            # Wait for MySQL to be healthy first; health_status events wake us as soon as it flips
+            print("Waiting for MySQL to be healthy...")
+
+            def mysql_healthy():
+                return docker.health_status(f'{tenant}_db') == 'healthy'
+
+            def mysql_waiting(attempt, elapsed):
+                print(f"MySQL still starting (check {attempt}, {elapsed:.0f}s)")
+                update_progress(tenant, 'waiting_mysql', f'Database starting... ({elapsed:.0f}s)', 40 + min(elapsed / MYSQL_READY_TIMEOUT, 1) * 10)
+
+            if wait_until(mysql_healthy, MYSQL_READY_TIMEOUT, container_events, f'{tenant}_db', mysql_waiting):
                 print("MySQL is healthy!")
                 update_progress(tenant, 'mysql_ready', 'Database is ready!', 50)
-                break
-            print(f"MySQL health: {db_health.stdout.strip()} (attempt {i+1}/60)")
-            update_progress(tenant, 'waiting_mysql', f'Database starting... ({i+1}/60 attempts)', 40 + (i/60)*10)
-            time.sleep(2)
-        else:
-            update_progress(tenant, 'error', 'MySQL failed to become healthy', 0)
-            check_container_health(tenant)
-            return jsonify({'error': 'MySQL failed to become healthy'}), 500
+            else:
+                update_progress(tenant, 'error', 'MySQL failed to become healthy', 0)
+                log_container_states(tenant)
+                raise DeploymentError('MySQL failed to become healthy')
+
+        docker_step(spec.start, 'prestashop')
+        if router:
+            router.add_route(tenant)
+
+        if snapshot:
+            acquire_db_slot(tenant)
+            update_progress(tenant, 'importing_database', 'Importing pre-installed store data...', 55)
+            container, client_args, client_env = tenant_mysql(tenant)
+            golden_snapshot.restore_database(docker, container, ['mysql'] + client_args, client_env, tenant)
+            db_slots.release(tenant)
 
         update_progress(tenant, 'waiting_prestashop', 'Starting PrestaShop application...', 60)
 
         # Now wait for PrestaShop
         print("Waiting for PrestaShop to be healthy...")
-        shop_url = f"http://{ip_address}:{port}"
+        shop_url = f"http://{domain}"
 
-        for i in range(120):
+        def shop_ready():
             # Check container health status
-            shop_health = subprocess.run(
-                f'docker inspect --format="{{{{.State.Health.Status}}}}" {tenant}_shop',
-                shell=True,
-                capture_output=True,
-                text=True
-            )
-            health_status = shop_health.stdout.strip()
-            print(f"PrestaShop health: {health_status} (attempt {i+1}/120)")
-            
-            progress = 60 + (i/120)*20
-            update_progress(tenant, 'waiting_prestashop', f'PrestaShop starting... ({i+1}/120 attempts)', progress)
-
-            if health_status == 'healthy':
+            if docker.health_status(f'{tenant}_shop') == 'healthy':
                 print("PrestaShop is healthy!")
-                update_progress(tenant, 'prestashop_ready', 'PrestaShop is ready!', 80)
-                break
+                return True
 
-            # Also try direct HTTP check
+            # Also try the shop directly over its container network, which only the primary node shares with us
+            if not nodes.on_primary(tenant):
+                return False
             try:
-                r = requests.get(shop_url, timeout=5)
+                r = tenant_http.get(f'{tenant}_shop', '/', host=domain)
                 if r.status_code == 200:
                     print("Store is accessible via HTTP!")
-                    update_progress(tenant, 'prestashop_ready', 'PrestaShop is ready!', 80)
-                    break
-            except:
+                    return True
+            except requests.RequestException:
                 pass
+            return False
+
+        def shop_waiting(attempt, elapsed):
+            print(f"PrestaShop still starting (check {attempt}, {elapsed:.0f}s)")
+            progress = 60 + min(elapsed / SHOP_READY_TIMEOUT, 1) * 20
+            update_progress(tenant, 'waiting_prestashop', f'PrestaShop starting... ({elapsed:.0f}s)', progress)
 
-            time.sleep(2)
+        shop_is_ready = wait_until(shop_ready, SHOP_READY_TIMEOUT, container_events, f'{tenant}_shop', shop_waiting)
+        db_slots.release(tenant)
+        if shop_is_ready:
+            update_progress(tenant, 'prestashop_ready', 'PrestaShop is ready!', 80)
         else:
-            update_progress(tenant, 'error', 'PrestaShop took too long to start', 0)
-            check_container_health(tenant)
-            return jsonify({
-                'error': 'PrestaShop took too long to start',
+            update_progress(tenant, 'error', 'PrestaShop took too long to start. Check the URL in a few minutes.', 0, result={
                 'url': shop_url,
                 'admin_email': admin_email,
-                'admin_password': admin_password,
-                'message': 'Store deployment started but may need more time. Check the URL in a few minutes.'
-            }), 202
+                'admin_password': admin_password
+            })
+            log_container_states(tenant)
+            raise DeploymentError('PrestaShop took too long to start')
 
         update_progress(tenant, 'finalizing', 'Finalizing setup...', 85)
 
-        # TRIGGER THE ADMIN RENAMING
-        print(" Triggering admin folder renaming...")
-        trigger_admin_renaming(tenant, port)
-
-        update_progress(tenant, 'detecting_admin', 'Configuring admin dashboard...', 90)
-
-        # Debug what's actually there
-        debug_admin_folder_detection(tenant)
-
-        # Wait a bit more to ensure renaming is complete
-        time.sleep(5)
+        if snapshot:
+            # The clone still carries the snapshot's admin folder, domain and placeholder owner
+            update_progress(tenant, 'rekeying', 'Configuring your admin account...', 90)
+            rename_admin_folder(tenant, snapshot['admin_folder'], admin_folder)
+            apply_owner(tenant, domain, admin_email, admin_password)
+        apply_shop_settings(tenant, profile)
 
-        # Now detect the actual admin folder
-        print(" Detecting renamed admin folder...")
-        actual_admin_folder = get_actual_admin_folder(tenant)
-
-        # If we still only found 'admin', try one more time with delay
-        if actual_admin_folder == "admin":
-            print("Retrying admin folder detection with longer delay...")
-            time.sleep(10)
-            actual_admin_folder = get_actual_admin_folder(tenant)
-
-        admin_url = f"{shop_url}/{actual_admin_folder}"
-
-        update_progress(tenant, 'completed', 'Store deployment completed!', 100)
+        admin_url = f"{shop_url}/{admin_folder}"
 
         print(f" Final Admin URL: {admin_url}")
 
-        check_container_health(tenant)
-        
         # Store final result
-        deployment_progress[tenant]['status'] = 'completed'
-        deployment_progress[tenant]['result'] = {
+        result = {
             'url': shop_url,
             'admin_url': admin_url,
-            'admin_folder': actual_admin_folder,
+            'admin_folder': admin_folder,
             'admin_email': admin_email,
             'admin_password': admin_password
         }
-        
-        return jsonify({
+        registry.update(tenant, admin_folder=admin_folder)
+        update_progress(tenant, 'completed', 'Store deployment completed!', 100, result=result)
+        return result
+
+    except DeploymentError:
+        raise
+    except Exception as e:
+        update_progress(tenant, 'error', f'Deployment failed: {str(e)}', 0)
+        log_container_states(tenant)
+        raise
+    finally:
+        db_slots.release(tenant)
+
+def sql_quote(value):
+    """Quote a string literal for the mysql client"""
+    return "'" + str(value).replace('\\', '\\\\').replace("'", "\\'") + "'"
+
+def tenant_mysql(tenant):
+    """Container, mysql client arguments and environment for a tenant's PrestaShop database"""
+    database = shared_db.credentials(tenant)
+    if database:
+        return SHARED_DB_CONTAINER, [f"-u{database['user']}", database['name']], [f"MYSQL_PWD={database['password']}"]
+    return f'{tenant}_db', [f"-u{DEDICATED_DATABASE['user']}", DEDICATED_DATABASE['name']], [f"MYSQL_PWD={DEDICATED_DATABASE['password']}"]
+
+def run_tenant_sql(tenant, sql):
+    """Run SQL statements against a tenant's PrestaShop database"""
+    container, client_args, client_env = tenant_mysql(tenant)
+    exit_code, stdout, stderr = docker.exec_run(container, ['mysql'] + client_args + ['-e', sql], env=client_env, timeout=60)
+    if exit_code != 0:
+        raise DeploymentError(f'SQL update failed for {tenant}: {stderr.strip()}')
+    return stdout
+
+def apply_shop_settings(tenant, profile):
+    """Set the profile's PrestaShop cache options (CCC, Smarty) in the store's configuration"""
+    run_tenant_sql(tenant, '\n'.join(
+        f"UPDATE ps_configuration SET value = {sql_quote(value)} WHERE name = {sql_quote(name)};"
+        for name, value in shop_settings(profile).items()
+    ))
+    # Compiled templates and combined assets were built with the old settings
+    docker.exec_run(f'{tenant}_shop', ['sh', '-c', 'rm -rf /var/www/html/var/cache/prod /var/www/html/themes/*/assets/cache/*'])
+
+def hash_admin_password(tenant, password):
+    """Hash a back-office password the way PrestaShop does (PHP password_hash)"""
+    exit_code, stdout, stderr = docker.exec_run(
+        f'{tenant}_shop',
+        ['php', '-r', 'echo password_hash(getenv("PS_NEW_PASSWD"), PASSWORD_BCRYPT);'],
+        env=[f'PS_NEW_PASSWD={password}'],
+        timeout=30
+    )
+    if exit_code != 0 or not stdout.strip():
+        raise DeploymentError(f'Password hashing failed for {tenant}: {stderr.strip()}')
+    return stdout.strip()
+
+def apply_owner(tenant, domain, admin_email, admin_password):
+    """Point an installed store at its domain and set the back-office owner's credentials"""
+    password_hash = hash_admin_password(tenant, admin_password)
+    run_tenant_sql(tenant, f"""
+UPDATE ps_employee SET email = {sql_quote(admin_email)}, passwd = {sql_quote(password_hash)},
+    last_passwd_gen = NOW() WHERE id_employee = 1;
+UPDATE ps_configuration SET value = {sql_quote(admin_email)} WHERE name = 'PS_SHOP_EMAIL';
+UPDATE ps_configuration SET value = {sql_quote(domain)} WHERE name IN ('PS_SHOP_DOMAIN', 'PS_SHOP_DOMAIN_SSL');
+UPDATE ps_shop_url SET domain = {sql_quote(domain)}, domain_ssl = {sql_quote(domain)};
+""")
+    # Drop the compiled container/config cache so the new domain takes effect
+    docker.exec_run(f'{tenant}_shop', ['rm', '-rf', '/var/www/html/var/cache/prod'])
+
+def rename_admin_folder(tenant, current, folder):
+    """Give a cloned store its own admin folder name"""
+    exit_code, _, stderr = docker.exec_run(f'{tenant}_shop', ['mv', f'/var/www/html/{current}', f'/var/www/html/{folder}'])
+    if exit_code != 0:
+        raise DeploymentError(f'Could not rename admin folder for {tenant}: {stderr.strip()}')
+
+def rekey_store(tenant, warm, admin_email, admin_password):
+    """Hand a warm-pool stack to its new owner by rewriting credentials and domain"""
+    try:
+        update_progress(tenant, 'claiming', 'Assigning a pre-installed store...', 80)
+        domain = store_domain(tenant, warm['port'])
+
+        update_progress(tenant, 'rekeying', 'Configuring your admin account...', 90)
+        apply_owner(tenant, domain, admin_email, admin_password)
+
+        shop_url = f"http://{domain}"
+        result = {
             'url': shop_url,
-            'admin_url': admin_url,
-            'admin_folder': actual_admin_folder,
+            'admin_url': f"{shop_url}/{warm['admin_folder']}",
+            'admin_folder': warm['admin_folder'],
             'admin_email': admin_email,
-            'admin_password': admin_password,
-            'tenant_id': tenant,
-            'message': 'Store created successfully! Use the Admin URL below to access your dashboard.'
-        })
+            'admin_password': admin_password
+        }
+        update_progress(tenant, 'completed', 'Store deployment completed!', 100, result=result)
+        return result
 
+    except DeploymentError as e:
+        update_progress(tenant, 'error', str(e), 0)
+        raise
     except Exception as e:
         update_progress(tenant, 'error', f'Deployment failed: {str(e)}', 0)
-        check_container_health(tenant)
-        return jsonify({'error': str(e)}), 500
+        raise
+
+def record_profile_progress(tenant, stage, message, percent=None):
+    """Progress of a profile change; the store stays completed throughout"""
+    registry.record_progress(tenant, stage, message, percent)
+    progress_broker.publish(tenant)
+    print(f"🎚️  {tenant}: {stage} - {message}")
+
+def change_profile(tenant, profile):
+    """Move a deployed store onto another performance profile; executed by a provisioning worker.
+
+    New limits are applied to the running containers and the config files
+    are copied in, then the containers restart one at a time (database
+    first), each waiting until healthy before the next goes down.
+    """
+    status = registry.get(tenant)
+    result = status.get('result') or {}
+    path = os.path.join(TENANTS_DIR, tenant)
+    engine = nodes.engine_for(tenant)
+    spec = tenant_spec(
+        tenant, status['port'], store_domain(tenant, status['port']), status['admin_folder'],
+        result.get('admin_email'), result.get('admin_password'), shared_db.credentials(tenant),
+        restored=True, profile=profile
+    )
+    try:
+        for i, service in enumerate(spec.services):
+            record_profile_progress(tenant, 'applying_profile', f'Applying the {profile.name} profile to {service.name}...',
+                                    100 * i // len(spec.services))
+            engine.update_container(service.container, spec.resources(service))
+            spec.upload_files(engine, service, path)
+            engine.restart_container(service.container)
+            timeout = MYSQL_READY_TIMEOUT if service.name == 'db' else SHOP_READY_TIMEOUT
+            if not wait_until(lambda: docker.health_status(service.container) == 'healthy', timeout, container_events, service.container):
+                raise DeploymentError(f'{service.container} did not become healthy after restarting')
+        apply_shop_settings(tenant, profile)
+        spec.write_files(path)
+        with open(os.path.join(path, 'docker-compose.yml'), 'w') as f:
+            f.write(spec.to_compose())
+    except Exception as e:
+        record_profile_progress(tenant, 'profile_failed', f'Changing to the {profile.name} profile failed: {e}')
+        log_container_states(tenant)
+        raise
+    registry.update(tenant, profile=profile.name)
+    record_profile_progress(tenant, 'completed', f'Now on the {profile.name} profile', 100)
+
+def profile_change_refusal(tenant, status):
+    """Why a store can't change profile right now, or None"""
+    if status['status'] != 'completed' or warm_pool.is_warm(tenant):
+        return 'not_deployed'
+    if tenant_busy(tenant, status):
+        return 'busy'
+    if hibernator.hibernated(tenant):
+        # Its database is stopped, so the PrestaShop settings can't be written
+        return 'hibernated'
+    return None
+
+def provision_warm_store(tenant):
+    """Install a stack with placeholder credentials and park it in the warm pool"""
+    try:
+        result = provision_store(tenant, 'warm-pool@example.com', secrets.token_urlsafe(16) + '1!', profile=PROFILES[DEFAULT_PROFILE])
+    except Exception:
+        warm_pool.mark_failed(tenant)
+        # Leave nothing behind: a failing install would otherwise leak a stack per refill
+        try:
+            teardown_tenant(tenant)
+        except Exception as e:
+            print(f"❌ Removing failed warm stack {tenant} failed: {e}")
+        raise
+    warm_pool.mark_ready(tenant, {'port': nodes.ports(tenant).port_for(tenant), 'admin_folder': result['admin_folder']})
+
+def fill_warm_pool(needed):
+    """Start warming stacks, but only on workers no signup is waiting for and while the host has headroom"""
+    if admission.rejection(count=False) or not admission.cpu_available() or not images.ready():
+        return
+    for _ in range(min(needed, provisioning_queue.idle_workers())):
+        if not nodes.has_room():
+            return
+        tenant = allocate_tenant()
+        warm_pool.begin_fill(tenant)
+        try:
+            provisioning_queue.submit(tenant, provision_warm_store, tenant)
+        except QueueFullError:
+            warm_pool.mark_failed(tenant, backoff=False)
+            discard_tenant(tenant)
+            return
+
+def build_golden_snapshot(tenant):
+    """Install a store from scratch, capture it as the golden snapshot, then remove it"""
+    ok = False
+    try:
+        result = provision_store(tenant, 'golden-snapshot@example.com', secrets.token_urlsafe(16) + '1!', use_snapshot=False)
+        container, client_args, client_env = tenant_mysql(tenant)
+        dump_cmd = ['mysqldump', '--single-transaction', '--no-tablespaces'] + client_args
+        golden_snapshot.capture(docker, f'{tenant}_shop', container, dump_cmd, client_env, result['admin_folder'], tenant,
+                                code_layer=code_layer.volume(nodes.node_of(tenant)) if code_layer else None)
+        ok = True
+    finally:
+        golden_snapshot.end_build(ok)
+        teardown_tenant(tenant)
+
+def start_golden_snapshot_build():
+    """Queue a snapshot build on a throwaway tenant; None if a build is already running"""
+    if not golden_snapshot.begin_build():
+        return None
+    try:
+        tenant = allocate_tenant()
+    except HostSaturatedError:
+        golden_snapshot.end_build(False)
+        raise
+    update_progress(tenant, 'queued', 'Waiting to build the golden snapshot...', 0)
+    try:
+        provisioning_queue.submit(tenant, build_golden_snapshot, tenant)
+    except QueueFullError:
+        golden_snapshot.end_build(False)
+        discard_tenant(tenant)
+        raise
+    return tenant
+
+def host_saturated_response(error):
+    return {'error': str(error), 'message': 'The server is at capacity. Please retry later.'}, 503, {'Retry-After': '120'}
+
+def images_unavailable_response(error):
+    return {'error': str(error), 'message': 'New stores are temporarily unavailable. Please retry later.'}, 503, {'Retry-After': '60'}
+
+def queue_full_response(error):
+    return {'error': str(error), 'message': 'Too many stores are being created right now. Please retry shortly.'}, 429, {'Retry-After': '30'}
+
+def json_object():
+    """The request body as a JSON object, or None when it is anything else (a list, a string, invalid JSON)"""
+    body = request.get_json(force=True, silent=True)
+    return body if isinstance(body, dict) else None
+
+def published(key):
+    """What the leader last published under key (see start_state_publisher), or None"""
+    return registry.state(key)[0]
+
+def job_status(tenant):
+    """The tenant's queued or running provisioning job, as the leader last published it in other workers"""
+    if election.leader:
+        return provisioning_queue.get(tenant)
+    return (published('jobs') or {}).get(tenant)
+
+def warm_tenants():
+    """Unclaimed warm stacks, as the leader last published them in other workers"""
+    if election.leader:
+        return set(warm_pool.tenants())
+    return set(published('warm') or [])
+
+def leader_stats(key, stats):
+    """stats() in the leader; in other workers, that part of the health the leader last published"""
+    if election.leader:
+        return stats()
+    return (published('health') or {}).get(key) or {'status': 'starting'}
+
+def start_store(admin_email, admin_password, batch_id=None, admit=True, profile=None):
+    """Queue a store for its owner, from the warm pool when possible.
+
+    Warm stacks are built on DEFAULT_PROFILE, so other profiles always get
+    a new stack.
+
+    Returns (tenant, job, warm). Raises QueueFullError (after cleaning up)
+    when the queue is saturated; batch stores use the places their batch
+    reserved in the queue. A new stack raises HostSaturatedError when the
+    host lacks memory or disk, unless admit is False (the caller already
+    checked), or ImageUnavailableError while the store images can't be
+    pulled on the node it was placed on.
+    """
+    profile = profile or PROFILES[DEFAULT_PROFILE]
+    claimed = warm_pool.claim() if profile.name == DEFAULT_PROFILE else None
+    if claimed:
+        tenant, warm = claimed
+        registry.restart_progress(tenant)
+        if batch_id:
+            registry.update(tenant, batch_id=batch_id)
+        update_progress(tenant, 'queued', 'Reserving a pre-installed store...', 0)
+        try:
+            job = provisioning_queue.submit(tenant, rekey_store, tenant, warm, admin_email, admin_password, reserved=bool(batch_id))
+        except QueueFullError:
+            registry.update(tenant, state='completed')
+            warm_pool.unclaim(tenant, warm)
+            raise
+        return tenant, job, True
+
+    reason = admission.rejection() if admit else None
+    if reason:
+        raise HostSaturatedError(f'Not enough {reason} on this host for another store')
+
+    tenant = allocate_tenant()
+    # While images are still downloading the store is queued; only a failing pull on its node refuses it
+    image_error = images.error(nodes.node_of(tenant).name)
+    if image_error:
+        discard_tenant(tenant)
+        raise ImageUnavailableError(image_error)
+    if batch_id:
+        registry.update(tenant, batch_id=batch_id)
+    update_progress(tenant, 'queued', 'Waiting for a free deployment slot...', 0)
+
+    try:
+        job = provisioning_queue.submit(tenant, provision_store, tenant, admin_email, admin_password,
+                                       profile=profile, reserved=bool(batch_id))
+    except QueueFullError:
+        discard_tenant(tenant)
+        raise
+    return tenant, job, False
+
+@app.route('/create-store', methods=['POST'])
+def create_store():
+    body = json_object()
+    if body is None:
+        return jsonify({'error': 'The request body must be a JSON object'}), 400
+    admin_email = body.get("email")
+    admin_password = body.get("password")
+    if not admin_email or not admin_password:
+        return jsonify({'error': 'email and password are required'}), 400
+    profile = body.get('profile') or DEFAULT_PROFILE
+    if profile not in PROFILES:
+        return jsonify({'error': f"profile must be one of: {', '.join(PROFILES)}"}), 400
+    return commands.call(queue_store, admin_email=admin_email, admin_password=admin_password, profile=profile)
+
+@commands.handler
+def queue_store(admin_email, admin_password, profile):
+    """Queue one signup in the leader; answers /create-store"""
+    profile = PROFILES[profile]
+    try:
+        tenant, job, warm = start_store(admin_email, admin_password, profile=profile)
+    except QueueFullError as e:
+        return queue_full_response(e)
+    except HostSaturatedError as e:
+        return host_saturated_response(e)
+    except ImageUnavailableError as e:
+        return images_unavailable_response(e)
+
+    response = {
+        'tenant_id': tenant,
+        'profile': profile.name,
+        'status': job['state'],
+        'status_url': f"/deployment-status/{tenant}",
+        'message': 'Store deployment queued. Poll the status URL for progress.'
+    }
+    if warm:
+        response['warm'] = True
+    return response, 202
+
+@app.route('/tenants/batch', methods=['POST'])
+def create_store_batch():
+    """Queue many stores at once; they share the worker pool and database slots"""
+    body = json_object()
+    if body is None:
+        return jsonify({'error': 'The request body must be a JSON object'}), 400
+    stores = body.get('stores')
+    if not isinstance(stores, list) or not stores:
+        return jsonify({'error': 'stores must be a non-empty list of {email, password}'}), 400
+    if len(stores) > BATCH_MAX_SIZE:
+        return jsonify({'error': f'A batch can hold at most {BATCH_MAX_SIZE} stores'}), 400
+    invalid = [i for i, store in enumerate(stores) if not isinstance(store, dict) or not store.get('email') or not store.get('password')]
+    if invalid:
+        return jsonify({'error': 'every store needs an email and password', 'invalid': invalid}), 400
+    unknown = [i for i, store in enumerate(stores) if (store.get('profile') or DEFAULT_PROFILE) not in PROFILES]
+    if unknown:
+        return jsonify({'error': f"profile must be one of: {', '.join(PROFILES)}", 'invalid': unknown}), 400
+    return commands.call(queue_store_batch, stores=stores)
+
+@commands.handler
+def queue_store_batch(stores):
+    """Queue a batch of signups in the leader; answers POST /tenants/batch"""
+    reason = admission.rejection()
+    if reason:
+        return host_saturated_response(HostSaturatedError(f'Not enough {reason} on this host for another store'))
+
+    # The whole batch counts against the queue limit, so it is accepted or refused as one
+    try:
+        provisioning_queue.reserve(len(stores))
+    except QueueFullError as e:
+        return queue_full_response(e)
+
+    batch_id = f"batch-{secrets.token_hex(6)}"
+    items = []
+    try:
+        for store in stores:
+            try:
+                tenant, job, warm = start_store(store['email'], store['password'], batch_id, admit=False,
+                                                profile=PROFILES[store.get('profile') or DEFAULT_PROFILE])
+            except (HostSaturatedError, ImageUnavailableError) as e:
+                # Every node filled up part-way through the batch, or the store's node can't pull the images
+                items.append({'email': store['email'], 'tenant_id': None, 'status': 'rejected', 'error': str(e)})
+                continue
+            items.append({
+                'email': store['email'],
+                'tenant_id': tenant,
+                'status': job['state'],
+                'status_url': f"/deployment-status/{tenant}",
+                'warm': warm
+            })
+    finally:
+        # Places of rejected stores (or of the rest of a batch cut short by an error) go back
+        provisioning_queue.unreserve(len(stores) - sum(1 for item in items if item['tenant_id']))
+    print(f"📦 {batch_id}: queued {len(items)} stores")
+    return {
+        'batch_id': batch_id,
+        'status_url': f"/tenants/batch/{batch_id}",
+        'tenants': items,
+        'message': 'Batch queued. Poll the status URL for per-store progress.'
+    }, 202
+
+@app.route('/tenants/batch/<batch_id>', methods=['GET'])
+def get_batch_status(batch_id):
+    """Per-store progress of a batch and totals by state"""
+    statuses = registry.batch(batch_id)
+    if not statuses:
+        return jsonify({'error': 'Batch not found'}), 404
+    counts = {}
+    for status in statuses:
+        counts[status['status']] = counts.get(status['status'], 0) + 1
+    return jsonify({
+        'batch_id': batch_id,
+        'total': len(statuses),
+        'counts': counts,
+        'done': all(status['status'] in ('completed', 'error') for status in statuses),
+        'tenants': [
+            {key: status.get(key) for key in ('tenant_id', 'status', 'stage', 'message', 'percent', 'result')}
+            for status in statuses
+        ]
+    })
+
+@app.route('/tenants/batch', methods=['DELETE'])
+def delete_tenant_batch():
+    """Remove many stores (listed, or every store of a batch) in the background"""
+    body = json_object()
+    if body is None:
+        return jsonify({'error': 'The request body must be a JSON object'}), 400
+    tenants = body.get('tenants')
+    if body.get('batch_id'):
+        tenants = [status['tenant_id'] for status in registry.batch(body['batch_id'])]
+    if not isinstance(tenants, list) or not tenants or not all(isinstance(tenant, str) for tenant in tenants):
+        return jsonify({'error': 'tenants must be a non-empty list of tenant ids, or pass a batch_id'}), 400
+    if len(tenants) > BATCH_MAX_SIZE:
+        return jsonify({'error': f'A batch can hold at most {BATCH_MAX_SIZE} stores'}), 400
+    return commands.call(remove_store_batch, tenants=tenants)
+
+@commands.handler
+def remove_store_batch(tenants):
+    """Start removing stores in the leader's teardown pool; answers DELETE /tenants/batch"""
+    items = []
+    for tenant in tenants:
+        refused = begin_removal(tenant)
+        if refused is None:
+            teardown_pool.submit(remove_tenant, tenant)
+        items.append({'tenant_id': tenant, 'result': refused or 'deleting'})
+    return {
+        'tenants': items,
+        'message': 'Removal started. A store is gone once /deployment-status returns 404.'
+    }, 202
+
+def store_urls(status):
+    """The shop and admin URLs from a tenant's deployment result, leaving out its credentials"""
+    result = status.get('result') or {}
+    return {'url': result.get('url'), 'admin_url': result.get('admin_url')}
+
+def tenant_summary(status, containers, warm):
+    """A tenant's listing entry: deployment state, store URLs and containers, without credentials"""
+    summary = {key: status.get(key) for key in (
+        'tenant_id', 'status', 'stage', 'message', 'percent', 'node', 'port', 'profile', 'hibernated',
+        'batch_id', 'start_time', 'last_update', 'last_access'
+    )}
+    summary.update(store_urls(status))
+    summary.update({
+        'warm': status['tenant_id'] in warm,
+        'containers': [{key: container[key] for key in ('name', 'state', 'health')} for container in containers]
+    })
+    return summary
+
+@app.route('/tenants', methods=['GET'])
+def list_tenant_stores():
+    """Tenants a page at a time, optionally filtered by state; served from the registry and container inventory"""
+    state = request.args.get('state')
+    if state and state not in TENANT_STATES:
+        return jsonify({'error': f'state must be one of {", ".join(TENANT_STATES)}'}), 400
+    try:
+        page = int(request.args.get('page', 1))
+        per_page = int(request.args.get('per_page', 50))
+    except ValueError:
+        return jsonify({'error': 'page and per_page must be integers'}), 400
+    if page < 1 or not 1 <= per_page <= TENANTS_PAGE_MAX:
+        return jsonify({'error': f'page must be at least 1 and per_page between 1 and {TENANTS_PAGE_MAX}'}), 400
+
+    total, statuses = registry.page(state, per_page, (page - 1) * per_page)
+    containers = inventory.by_project()
+    warm = warm_tenants()
+    return jsonify({
+        'tenants': [tenant_summary(status, containers.get(status['tenant_id'], []), warm) for status in statuses],
+        'total': total,
+        'page': page,
+        'per_page': per_page,
+        'pages': (total + per_page - 1) // per_page
+    })
+
+@app.route('/tenants/<tenant_id>', methods=['GET'])
+def get_tenant(tenant_id):
+    """One tenant's full status with its containers as the inventory sees them"""
+    status = registry.get(tenant_id)
+    if status is None:
+        return jsonify({'error': 'Tenant not found'}), 404
+    if status.get('result'):
+        status['result'] = store_urls(status)
+    status['warm'] = tenant_id in warm_tenants()
+    status['containers'] = inventory.containers(tenant_id)
+    status['phases'] = registry.timeline(tenant_id)
+    status['usage'] = meter.summary(tenant_id, METERING_SUMMARY_WINDOW)
+    job = job_status(tenant_id)
+    if job:
+        status['job'] = job
+    return jsonify(status)
+
+def usage_window():
+    """The window query argument in seconds (default METERING_SUMMARY_WINDOW), or None if invalid"""
+    try:
+        window = int(request.args.get('window', METERING_SUMMARY_WINDOW))
+    except ValueError:
+        return None
+    return window if window > 0 else None
+
+@app.route('/tenants/<tenant_id>/usage', methods=['GET'])
+def get_tenant_usage(tenant_id):
+    """A store's CPU, memory, network and disk series, as the leader's stats streams recorded them"""
+    if registry.get(tenant_id) is None:
+        return jsonify({'error': 'Tenant not found'}), 404
+    window = usage_window()
+    if window is None:
+        return jsonify({'error': 'window must be a positive number of seconds'}), 400
+    usage = meter.usage(tenant_id, window) or {
+        'tenant_id': tenant_id, 'resolution': meter.resolution, 'current': {}, 'series': []
+    }
+    usage['summary'] = meter.summary(tenant_id, window)
+    return jsonify(usage)
+
+@app.route('/usage/top', methods=['GET'])
+def get_top_usage():
+    """The stores using the most CPU, memory, network or disk over a recent window"""
+    metric = request.args.get('by', 'cpu')
+    if metric not in METRICS:
+        return jsonify({'error': f'by must be one of {", ".join(METRICS)}'}), 400
+    window = usage_window()
+    try:
+        limit = int(request.args.get('limit', 10))
+    except ValueError:
+        limit = 0
+    if window is None or not 1 <= limit <= TENANTS_PAGE_MAX:
+        return jsonify({'error': f'window must be a positive number of seconds and limit between 1 and {TENANTS_PAGE_MAX}'}), 400
+    return jsonify({'by': metric, 'window': window, 'tenants': meter.top(metric, limit, window)})
+
+@app.route('/tenants/<tenant_id>/diagnostics', methods=['GET'])
+def get_tenant_diagnostics(tenant_id):
+    """Log tails of a failed tenant's containers, fetched from Docker on request"""
+    status = registry.get(tenant_id)
+    if status is None:
+        return jsonify({'error': 'Tenant not found'}), 404
+    if status['status'] != 'error':
+        return jsonify({'error': 'Diagnostics are only collected for failed deployments'}), 409
+    try:
+        tail = min(max(int(request.args.get('tail', 50)), 1), 1000)
+    except ValueError:
+        return jsonify({'error': 'tail must be an integer'}), 400
+    diagnostics = tenant_diagnostics(tenant_id, tail, nodes.by_name.get(status['node'], nodes.primary))
+    return jsonify(dict(diagnostics, tenant_id=tenant_id, stage=status['stage'], message=status['message']))
+
+@app.route('/tenants/<tenant_id>', methods=['DELETE'])
+def delete_tenant(tenant_id):
+    """Remove one store: its containers, network, volumes, database, route, port and directory"""
+    return commands.call(remove_store, tenant=tenant_id)
+
+@commands.handler
+def remove_store(tenant):
+    """Remove a store in the leader and wait until it is gone"""
+    refused = begin_removal(tenant)
+    if refused == 'not_found':
+        return {'error': 'Tenant not found'}, 404
+    if refused == 'busy':
+        return {'error': 'Store is being deployed or removed; retry once that finishes'}, 409
+    try:
+        remove_tenant(tenant)
+    except Exception as e:
+        return {'error': f'Removal failed: {e}'}, 500
+    return {'tenant_id': tenant, 'deleted': True}, 200
 
 @app.route('/deployment-status/<tenant_id>', methods=['GET'])
 def get_deployment_status(tenant_id):
     """Get the current deployment status for a tenant"""
-    if tenant_id in deployment_progress:
-        return jsonify(deployment_progress[tenant_id])
-    else:
+    status = registry.get(tenant_id)
+    if status is None:
+        return jsonify({'error': 'Deployment not found'}), 404
+    job = job_status(tenant_id)
+    # What the leader published can trail the registry by up to STATE_PUBLISH_INTERVAL
+    if job and (election.leader or status['status'] == 'processing'):
+        status['job'] = job
+    status['phases'] = registry.timeline(tenant_id)
+    if request.args.get('history'):
+        status['history'] = registry.history(tenant_id)
+    return jsonify(status)
+
+@app.route('/deployment-stream/<tenant_id>', methods=['GET'])
+def stream_deployment_status(tenant_id):
+    """Server-Sent Events stream of deployment progress for a tenant"""
+    if registry.get(tenant_id) is None:
         return jsonify({'error': 'Deployment not found'}), 404
 
+    # EventSource resends Last-Event-ID on reconnect; the query param covers manual resumes
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id') or 0
+    try:
+        last_event_id = int(last_event_id)
+    except ValueError:
+        last_event_id = 0
+
+    return Response(
+        stream_with_context(stream_progress(progress_broker, tenant_id, last_event_id, lambda: registry.get(tenant_id))),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+def leader_health():
+    return {
+        'status': 'healthy',
+        'provisioning': provisioning_queue.stats(),
+        'db_slots': db_slots.stats(),
+        'admission': admission.stats(),
+        'images': images.stats(),
+        'code_layer': code_layer.stats() if code_layer else {'mode': CODE_MODE},
+        'inventory': inventory.stats(),
+        'metering': meter.stats(),
+        'warm_pool': warm_pool.stats(),
+        'progress_streams': progress_broker.stats(),
+        'ports': nodes.primary.ports.stats(),
+        'nodes': nodes.stats(),
+        'golden_snapshot': golden_snapshot.stats(),
+        'hibernation': hibernator.stats(),
+        'commands': commands.stats(),
+        'router': router.stats() if router else None,
+        'host': host_identity.stats(),
+        'tenants': registry.counts()
+    }
+
 @app.route('/health', methods=['GET'])
 def health_check():
-    return jsonify({'status': 'healthy'})
+    """Backend state; workers other than the leader report what it last published"""
+    if election.leader:
+        health = leader_health()
+    else:
+        health, published_at = registry.state('health')
+        health = dict(health, published_at=published_at) if health else {'status': 'starting'}
+        health['progress_streams'] = progress_broker.stats()
+        health['inventory'] = inventory.stats()
+    health['server'] = election.stats()
+    return jsonify(health)
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """Prometheus scrape endpoint; workers other than the leader serve its last published rendering"""
+    text = metrics.render() if election.leader else published('metrics')
+    if text is None:
+        return jsonify({'error': 'No leader has published metrics yet'}), 503
+    return Response(text, content_type=MetricsRegistry.CONTENT_TYPE)
+
+@app.route('/warm-pool', methods=['GET'])
+def warm_pool_stats():
+    """Warm pool size, hit/miss and refill counters"""
+    return jsonify(leader_stats('warm_pool', warm_pool.stats))
+
+@app.route('/golden-snapshot', methods=['GET'])
+def golden_snapshot_status():
+    """Current golden snapshot and build/restore counters"""
+    return jsonify(leader_stats('golden_snapshot', golden_snapshot.stats))
+
+@app.route('/golden-snapshot', methods=['POST'])
+def rebuild_golden_snapshot():
+    """Capture a fresh golden snapshot (e.g. after a PrestaShop image upgrade)"""
+    return commands.call(queue_golden_snapshot)
+
+@commands.handler
+def queue_golden_snapshot():
+    try:
+        tenant = start_golden_snapshot_build()
+    except QueueFullError as e:
+        return queue_full_response(e)
+    except HostSaturatedError as e:
+        return host_saturated_response(e)
+    if tenant is None:
+        return {'error': 'A golden snapshot build is already running'}, 409
+    return {
+        'tenant_id': tenant,
+        'status_url': f"/deployment-status/{tenant}",
+        'message': 'Golden snapshot build queued.'
+    }, 202
+
+@app.route('/tenants/<tenant_id>/hibernate', methods=['POST'])
+def hibernate_tenant(tenant_id):
+    """Stop a store now instead of waiting for it to go idle"""
+    return commands.call(hibernate_store, tenant=tenant_id)
+
+@commands.handler
+def hibernate_store(tenant):
+    status = registry.get(tenant)
+    if status is None:
+        return {'error': 'Tenant not found'}, 404
+    if status['status'] != 'completed' or warm_pool.is_warm(tenant):
+        return {'error': 'Only deployed stores can be hibernated'}, 409
+    if not nodes.on_primary(tenant):
+        return {'error': 'Only stores on the primary node can be hibernated'}, 409
+    if not HIBERNATION_AVAILABLE:
+        return {'error': 'Hibernation needs ROUTING_MODE=host while the backend runs in a container'}, 409
+    if not hibernator.hibernate(tenant, status['port']):
+        return {'error': 'Store is already hibernated or waking up'}, 409
+    return {'tenant_id': tenant, 'hibernated': True}, 200
+
+@app.route('/tenants/<tenant_id>/wake', methods=['POST'])
+def wake_tenant(tenant_id):
+    """Start a hibernated store ahead of its first visitor"""
+    return commands.call(wake_store, tenant=tenant_id)
+
+@commands.handler
+def wake_store(tenant):
+    if registry.get(tenant) is None:
+        return {'error': 'Tenant not found'}, 404
+    if not hibernator.hibernated(tenant):
+        return {'error': 'Store is not hibernated'}, 409
+    threading.Thread(target=hibernator.wake, args=(tenant,), name=f"wake-{tenant}", daemon=True).start()
+    return {'tenant_id': tenant, 'status_url': f"/deployment-status/{tenant}", 'message': 'Store is waking up.'}, 202
+
+@app.route('/tenants/<tenant_id>/profile', methods=['PUT'])
+def set_tenant_profile(tenant_id):
+    """Move a store onto another performance profile with a rolling restart of its containers"""
+    body = json_object()
+    if body is None:
+        return jsonify({'error': 'The request body must be a JSON object'}), 400
+    if body.get('profile') not in PROFILES:
+        return jsonify({'error': f"profile must be one of: {', '.join(PROFILES)}"}), 400
+    return commands.call(queue_profile_change, tenant=tenant_id, profile=body['profile'])
+
+@commands.handler
+def queue_profile_change(tenant, profile):
+    profile = PROFILES[profile]
+    status = registry.get(tenant)
+    if status is None:
+        return {'error': 'Tenant not found'}, 404
+    refused = profile_change_refusal(tenant, status)
+    if refused:
+        return {'error': {
+            'not_deployed': 'Only deployed stores can change profile',
+            'busy': 'Store is being deployed, reconfigured or removed',
+            'hibernated': 'Wake the store before changing its profile'
+        }[refused]}, 409
+    # Recorded first so a watcher that connects before a worker picks the job up doesn't see a finished store
+    record_profile_progress(tenant, 'profile_queued', f'Waiting to apply the {profile.name} profile...', 0)
+    try:
+        provisioning_queue.submit(tenant, change_profile, tenant, profile)
+    except QueueFullError as e:
+        record_profile_progress(tenant, 'profile_failed', f'Changing to the {profile.name} profile failed: {e}')
+        return queue_full_response(e)
+    return {
+        'tenant_id': tenant,
+        'profile': profile.name,
+        'status_url': f"/deployment-status/{tenant}",
+        'message': 'Profile change queued. The store restarts one container at a time.'
+    }, 202
+
+@app.route('/profiles', methods=['GET'])
+def list_profiles():
+    """Performance profiles with their settings and how many stores use each"""
+    counts = registry.profile_counts()
+    return jsonify({
+        'default': DEFAULT_PROFILE,
+        'profiles': {name: dict(describe(profile), tenants=counts.get(name, 0)) for name, profile in PROFILES.items()}
+    })
+
+@app.route('/profiles/<name>/rollout', methods=['POST'])
+def rollout_profile(name):
+    """Re-apply a profile to every store on it, e.g. after PERFORMANCE_PROFILES changed; PROVISION_WORKERS bounds how many restart at once"""
+    if name not in PROFILES:
+        return jsonify({'error': 'Profile not found'}), 404
+    return commands.call(queue_profile_rollout, name=name)
+
+@commands.handler
+def queue_profile_rollout(name):
+    profile = PROFILES[name]
+    items = []
+    queued = []
+    for tenant in registry.on_profile(name):
+        status = registry.get(tenant)
+        if status is None:
+            continue
+        refused = profile_change_refusal(tenant, status)
+        if refused is None:
+            record_profile_progress(tenant, 'profile_queued', f'Waiting to apply the {profile.name} profile...', 0)
+            queued.append(tenant)
+        items.append({'tenant_id': tenant, 'result': refused or 'queued'})
+    print(f"🎚️  Rolling out the {name} profile to {len(queued)} stores")
+    threading.Thread(target=roll_out_profile, args=(queued, profile), name=f'rollout-{name}', daemon=True).start()
+    return {'profile': name, 'tenants': items}, 202
+
+def roll_out_profile(tenants, profile):
+    """Hand a rollout's stores to the provisioning queue one at a time, each once a worker is idle.
+
+    A rollout can cover every store, so it never takes the waiting places
+    that signups and batches are admitted against.
+    """
+    for tenant in tenants:
+        while True:
+            status = registry.get(tenant)
+            refused = profile_change_refusal(tenant, status) if status else 'not_found'
+            if refused:
+                # Removed, hibernated or otherwise changed since the rollout started; busy stores record their own progress
+                if refused not in ('not_found', 'busy'):
+                    record_profile_progress(tenant, 'profile_failed', f'Skipped by the {profile.name} rollout: {refused}')
+                break
+            if provisioning_queue.idle_workers():
+                try:
+                    provisioning_queue.submit(tenant, change_profile, tenant, profile)
+                    break
+                except QueueFullError:
+                    pass
+            time.sleep(ROLLOUT_POLL_INTERVAL)
 
 @app.route('/debug/containers', methods=['GET'])
 def debug_containers():
-    """Debug endpoint to see all containers"""
-    result = subprocess.run('docker ps -a', shell=True, capture_output=True, text=True)
-    return f"<pre>{result.stdout}</pre>"
+    """Every container on every node, from the inventory"""
+    return jsonify({'containers': inventory.containers(), 'inventory': inventory.stats()})
 
 # Clean up old deployment progress data (older than 1 hour)
 def cleanup_old_progress():
     current_time = time.time()
     tenants_to_remove = []
-    for tenant, data in deployment_progress.items():
-        if current_time - data.get('start_time', current_time) > 3600:  # 1 hour
+    for tenant in progress_broker.tenants():
+        data = registry.get(tenant) or {}
+        if current_time - data.get('start_time', 0) > 3600:  # 1 hour
             tenants_to_remove.append(tenant)
-    
+
     for tenant in tenants_to_remove:
-        del deployment_progress[tenant]
+        provisioning_queue.forget(tenant)
+        progress_broker.forget(tenant)
+
+    # The registry keeps each tenant's state; only old progress history is pruned
+    registry.prune_history()
 
 # Run cleanup every 30 minutes
 def start_cleanup_thread():
@@ -535,8 +1458,58 @@ def start_cleanup_thread():
     thread = threading.Thread(target=cleanup_loop, daemon=True)
     thread.start()
 
-# Start cleanup thread when app starts
-start_cleanup_thread()
+# Share what only the leader knows with the other workers
+def start_state_publisher():
+    def publish_loop():
+        while True:
+            try:
+                registry.publish_state('health', leader_health())
+                registry.publish_state('jobs', provisioning_queue.jobs())
+                registry.publish_state('warm', warm_pool.tenants())
+                registry.publish_state('metrics', metrics.render())
+            except Exception as e:
+                print(f"⚠️  Could not publish leader state: {e}")
+            time.sleep(STATE_PUBLISH_INTERVAL)
+
+    thread = threading.Thread(target=publish_loop, name='state-publisher', daemon=True)
+    thread.start()
+
+def start_leader():
+    """Start the background work; runs in exactly one worker process"""
+    host_identity.start()
+    admission.start()
+    recover_registry()
+    nodes.load(list_tenants())
+    images.start()
+    if nodes.pinned and len(nodes.nodes) > 1:
+        print(f"⚠️  DB_MODE=shared and ROUTING_MODE=host only run on the primary node; placing every store on {nodes.primary.name}")
+    start_cleanup_thread()
+    reconcile_ports()
+    connect_backend_to_stores()
+    container_events.start()
+    inventory.start()
+    meter.start()
+    if router:
+        try:
+            router.start(BACKEND_NETWORK)
+        except Exception as e:
+            print(f"🚨 Edge router unavailable: {e}")
+    hibernator.start()
+    if GOLDEN_SNAPSHOT and golden_snapshot.metadata() is None:
+        start_golden_snapshot_build()
+    warm_pool.start(fill_warm_pool)
+    if SERVER_WORKERS > 1:
+        start_state_publisher()
+        commands.start()
+
+def start_worker():
+    """Follow Docker events in a worker that isn't the leader, for its own container inventory"""
+    container_events.start()
+    inventory.start()
+
+election.start(start_leader)
+if not election.leader:
+    start_worker()
 
 if __name__ == '__main__':
     print(f"Tenants directory: {TENANTS_DIR}")
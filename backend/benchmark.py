@@ -0,0 +1,349 @@
+#!/usr/bin/env python3
+"""Drive concurrent signups through the backend against the simulated Docker engine.
+
+Runs offline: no Docker daemon, network or PrestaShop image is needed.
+Every store goes through create_store, status polling and teardown, and
+the run reports throughput, time-to-store percentiles and the backend's
+CPU and memory use. Thresholds turn it into a CI regression check:
+
+    python benchmark.py --signups 200 --concurrency 50 --workers 8 --max-p95 3
+"""
+import argparse
+import contextlib
+import json
+import math
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile; None for an empty list"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def summarize(values):
+    return {
+        'count': len(values),
+        'p50': percentile(values, 50),
+        'p95': percentile(values, 95),
+        'p99': percentile(values, 99),
+        'max': max(values) if values else None
+    }
+
+
+def rss_mb():
+    """Current resident set size in MiB from /proc (Linux)"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2 ** 20
+    except (OSError, ValueError):
+        return None
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--signups', type=int, default=50, help='stores to create')
+    parser.add_argument('--concurrency', type=int, default=10, help='simultaneous signup clients')
+    parser.add_argument('--workers', type=int, default=4, help='PROVISION_WORKERS for the backend')
+    parser.add_argument('--db-slots', type=int, default=2, help='DB_PHASE_CONCURRENCY for the backend (0 = no limit)')
+    parser.add_argument('--queue-limit', type=int, default=1000, help='PROVISION_QUEUE_LIMIT for the backend')
+    parser.add_argument('--poll-interval', type=float, default=0.05, help='seconds between status polls')
+    parser.add_argument('--container-start', type=float, default=0.05, help='seconds `compose up` blocks')
+    parser.add_argument('--db-healthy', type=float, default=0.2, help='seconds until MySQL reports healthy')
+    parser.add_argument('--install', type=float, default=0.5, help='seconds until PrestaShop finishes installing')
+    parser.add_argument('--restored', type=float, default=0.1, help='seconds until a snapshot-restored shop is healthy')
+    parser.add_argument('--image-pull', type=float, default=1.0, help='seconds to pull a missing image')
+    parser.add_argument('--cold-images', action='store_true', help='start with no images pulled, as after `docker system prune -a`')
+    parser.add_argument('--compose-failure-rate', type=float, default=0.0)
+    parser.add_argument('--db-failure-rate', type=float, default=0.0)
+    parser.add_argument('--shop-failure-rate', type=float, default=0.0)
+    parser.add_argument('--ready-timeout', type=int, default=5, help='MySQL/PrestaShop readiness timeout in seconds')
+    parser.add_argument('--db-mode', choices=['dedicated', 'shared'], default='dedicated')
+    parser.add_argument('--golden-snapshot', action='store_true', help='clone stores from a golden snapshot')
+    parser.add_argument('--nodes', type=int, default=1, help='simulated Docker nodes to spread stores over')
+    parser.add_argument('--placement', choices=['least_loaded', 'binpack'], default='least_loaded', help='PLACEMENT_STRATEGY for the backend')
+    parser.add_argument('--routing', choices=['ports', 'host'], default='ports', help='ROUTING_MODE for the backend')
+    parser.add_argument('--warm-pool', type=int, default=0, help='WARM_POOL_SIZE for the backend')
+    parser.add_argument('--ports', type=int, default=1000, help='ports to reserve and release when timing the allocator')
+    parser.add_argument('--seed', type=int, default=None, help='seed for failure injection')
+    parser.add_argument('--json', action='store_true', help='print the report as JSON')
+    parser.add_argument('--verbose', action='store_true', help='show the backend\'s own log output')
+    parser.add_argument('--max-p95', type=float, help='fail if p95 time-to-store exceeds this many seconds')
+    parser.add_argument('--min-throughput', type=float, help='fail if fewer stores per second are created')
+    parser.add_argument('--max-failure-rate', type=float, help='fail if a larger share of signups fails')
+    return parser.parse_args(argv)
+
+
+def configure_environment(args, tenants_dir):
+    """The backend reads its settings at import time, so set them before importing app"""
+    os.environ.update({
+        'DOCKER_ENGINE': 'fake',
+        'TENANTS_DIR': tenants_dir,
+        'SERVER_IP': '127.0.0.1',
+        'PROVISION_WORKERS': str(args.workers),
+        'PROVISION_QUEUE_LIMIT': str(args.queue_limit),
+        'DB_PHASE_CONCURRENCY': str(args.db_slots),
+        'MYSQL_READY_TIMEOUT': str(args.ready_timeout),
+        'SHOP_READY_TIMEOUT': str(args.ready_timeout),
+        'DB_MODE': args.db_mode,
+        'GOLDEN_SNAPSHOT': '1' if args.golden_snapshot else '0',
+        'WARM_POOL_SIZE': str(args.warm_pool),
+        'WARM_POOL_REFILL_INTERVAL': '1',
+        'ROUTING_MODE': args.routing,
+        'WAKE_PORT': '0',
+        'PLACEMENT_STRATEGY': args.placement,
+        'DOCKER_NODES': json.dumps([{'name': node, 'url': url} for node, url in node_urls(args)]) if args.nodes > 1 else ''
+    })
+
+
+def node_urls(args):
+    """(name, engine URL) of each simulated node; the first uses the process-wide fake engine"""
+    return [('node0', '')] + [(f'node{i}', f'fake://node{i}') for i in range(1, args.nodes)]
+
+
+def benchmark_ports(count, tenants_dir):
+    """Reserve and release count ports; returns operations per second"""
+    from port_allocator import PortAllocator
+    from tenant_registry import TenantRegistry
+    allocator = PortAllocator(20000, max(count, 1), TenantRegistry(os.path.join(tenants_dir, '.bench-ports.db')), 'bench')
+    started = time.perf_counter()
+    for i in range(count):
+        allocator.reserve(f'bench{i}')
+    for i in range(count):
+        allocator.release(f'bench{i}')
+    elapsed = time.perf_counter() - started
+    return round(2 * count / elapsed, 1) if elapsed else None
+
+
+def wait_for(client, path, predicate, timeout):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate(client.get(path).get_json()):
+            return True
+        time.sleep(0.05)
+    return False
+
+
+def run_signups(app_module, args):
+    client_lock = threading.Lock()
+    results = []
+    request_latencies, poll_latencies = [], []
+    counters = {'rejected': 0}
+    next_signup = iter(range(args.signups))
+
+    def signup(index):
+        client = app_module.app.test_client()
+        body = {'email': f'bench{index}@example.com', 'password': f'Bench-{index}-pass'}
+        started = time.perf_counter()
+        while True:
+            sent = time.perf_counter()
+            response = client.post('/create-store', json=body)
+            with client_lock:
+                request_latencies.append(time.perf_counter() - sent)
+            if response.status_code != 429:
+                break
+            with client_lock:
+                counters['rejected'] += 1
+            time.sleep(min(float(response.headers.get('Retry-After', 1)), 0.5))
+        tenant = response.get_json().get('tenant_id')
+        status = {}
+        while tenant:
+            polled = time.perf_counter()
+            status = client.get(f'/deployment-status/{tenant}').get_json()
+            with client_lock:
+                poll_latencies.append(time.perf_counter() - polled)
+            if status.get('status') in ('completed', 'error'):
+                break
+            time.sleep(args.poll_interval)
+        return {
+            'tenant': tenant,
+            'status': status.get('status', 'error'),
+            # The phase the deployment was in when it ended (the stage itself is just "error")
+            'stage': (status.get('phases') or [{}])[-1].get('phase', status.get('stage')),
+            'time_to_store': time.perf_counter() - started,
+            'warm': bool(response.get_json().get('warm')),
+            'node': status.get('node')
+        }
+
+    def client_loop():
+        while True:
+            with client_lock:
+                index = next(next_signup, None)
+            if index is None:
+                return
+            result = signup(index)
+            with client_lock:
+                results.append(result)
+
+    threads = [threading.Thread(target=client_loop, daemon=True) for _ in range(max(1, args.concurrency))]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results, request_latencies, poll_latencies, counters, time.perf_counter() - started
+
+
+def teardown(app_module, tenants):
+    durations = []
+    for tenant in tenants:
+        started = time.perf_counter()
+        app_module.teardown_tenant(tenant)
+        durations.append(time.perf_counter() - started)
+    return durations
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    tenants_dir = tempfile.mkdtemp(prefix='saas-benchmark-')
+    configure_environment(args, tenants_dir)
+    try:
+        if args.verbose:
+            report = run(args, tenants_dir)
+        else:
+            # The backend logs every progress step; keep the report readable
+            with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+                report = run(args, tenants_dir)
+    finally:
+        shutil.rmtree(tenants_dir, ignore_errors=True)
+    if report is None:
+        print("🚨 Golden snapshot was not built; aborting", file=sys.stderr)
+        return 2
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
+
+    problems = []
+    p95 = report['time_to_store']['p95']
+    if args.max_p95 is not None and (p95 is None or p95 > args.max_p95):
+        problems.append(f"p95 time-to-store {p95} s exceeds {args.max_p95} s")
+    if args.min_throughput is not None and (report['throughput_per_second'] or 0) < args.min_throughput:
+        problems.append(f"throughput {report['throughput_per_second']}/s below {args.min_throughput}/s")
+    if args.max_failure_rate is not None and args.signups and report['failed'] / args.signups > args.max_failure_rate:
+        problems.append(f"failure rate {report['failed'] / args.signups:.2%} above {args.max_failure_rate:.2%}")
+    for problem in problems:
+        print(f"❌ {problem}", file=sys.stderr)
+    return 1 if problems else 0
+
+
+def run(args, tenants_dir):
+    """Set up the fake engine and backend, run the signups and return the report"""
+
+    from docker_engine import set_engine
+    from fake_engine import FakeDockerEngine
+    engines = []
+    for index, (_, url) in enumerate(node_urls(args)):
+        engine = FakeDockerEngine(
+            latencies={
+                'container_start': args.container_start,
+                'db_healthy': args.db_healthy,
+                'shop_healthy': args.install,
+                'shop_restored': args.restored,
+                'image_pull': args.image_pull
+            },
+            failure_rates={
+                'compose': args.compose_failure_rate,
+                'db': args.db_failure_rate,
+                'shop': args.shop_failure_rate
+            },
+            seed=None if args.seed is None else args.seed + index
+        )
+        if args.cold_images:
+            engine.prune_images()
+        set_engine(engine, url)
+        engines.append(engine)
+
+    import app as app_module
+
+    ports_per_second = benchmark_ports(args.ports, tenants_dir)
+
+    if args.golden_snapshot and not wait_for(app_module.app.test_client(), '/golden-snapshot', lambda s: s['ready'] and not s['building'], 60):
+        return None
+    if args.cold_images:
+        # Measure signups after the startup pre-pull, as on a host reset while the backend kept running
+        wait_for(app_module.app.test_client(), '/health', lambda s: s['images']['ready'], 120)
+    if args.warm_pool:
+        wait_for(app_module.app.test_client(), '/warm-pool', lambda s: s['ready'] >= args.warm_pool, 60)
+
+    # CPU is measured over the signups only, so setup and the allocator timing don't skew it
+    cpu_start = resource.getrusage(resource.RUSAGE_SELF)
+    results, request_latencies, poll_latencies, counters, wall = run_signups(app_module, args)
+    teardown_durations = teardown(app_module, [r['tenant'] for r in results if r['tenant']])
+
+    cpu_end = resource.getrusage(resource.RUSAGE_SELF)
+    cpu_seconds = (cpu_end.ru_utime - cpu_start.ru_utime) + (cpu_end.ru_stime - cpu_start.ru_stime)
+    completed = [r for r in results if r['status'] == 'completed']
+    failed = [r for r in results if r['status'] != 'completed']
+    failed_stages = {}
+    for r in failed:
+        failed_stages[r['stage']] = failed_stages.get(r['stage'], 0) + 1
+    placements = {}
+    for r in completed:
+        placements[r['node']] = placements.get(r['node'], 0) + 1
+    docker_calls = {}
+    for engine in engines:
+        for call, count in engine.calls.items():
+            docker_calls[call] = docker_calls.get(call, 0) + count
+
+    report = {
+        'signups': args.signups,
+        'concurrency': args.concurrency,
+        'workers': args.workers,
+        'completed': len(completed),
+        'failed': len(failed),
+        'failed_stages': failed_stages,
+        'warm_hits': sum(1 for r in results if r['warm']),
+        'rejected_429': counters['rejected'],
+        'wall_seconds': round(wall, 3),
+        'throughput_per_second': round(len(completed) / wall, 3) if wall else None,
+        'time_to_store': summarize([r['time_to_store'] for r in completed]),
+        'create_store_request': summarize(request_latencies),
+        'status_poll_request': summarize(poll_latencies),
+        'teardown': summarize(teardown_durations),
+        'port_ops_per_second': ports_per_second,
+        'placements': placements,
+        'docker_calls': docker_calls,
+        'cpu_seconds': round(cpu_seconds, 3),
+        'cpu_percent': round(100 * cpu_seconds / wall, 1) if wall else None,
+        'rss_mb': round(rss_mb() or 0, 1),
+        'max_rss_mb': round(cpu_end.ru_maxrss / 1024, 1)
+    }
+    return report
+
+
+def print_report(report):
+    def fmt(stats):
+        if not stats['count']:
+            return 'n/a'
+        return '  '.join(f"{key} {stats[key] * 1000:.1f}ms" for key in ('p50', 'p95', 'p99', 'max'))
+
+    print("\n📊 Benchmark results")
+    print(f"Signups:          {report['signups']} ({report['concurrency']} concurrent, {report['workers']} workers)")
+    print(f"Completed:        {report['completed']}   failed: {report['failed']} {report['failed_stages'] or ''}")
+    print(f"429 rejections:   {report['rejected_429']}   warm pool hits: {report['warm_hits']}")
+    print(f"Wall time:        {report['wall_seconds']} s")
+    print(f"Throughput:       {report['throughput_per_second']} stores/s")
+    print(f"Time to store:    {fmt(report['time_to_store'])}")
+    print(f"create-store:     {fmt(report['create_store_request'])}")
+    print(f"Status poll:      {fmt(report['status_poll_request'])}")
+    print(f"Teardown:         {fmt(report['teardown'])}")
+    print(f"Port allocator:   {report['port_ops_per_second']} ops/s")
+    print(f"Placements:       {report['placements']}")
+    print(f"Docker calls:     {report['docker_calls']}")
+    print(f"CPU:              {report['cpu_seconds']} s ({report['cpu_percent']}%)")
+    print(f"Memory:           {report['rss_mb']} MiB RSS (peak {report['max_rss_mb']} MiB)")
+
+
+if __name__ == '__main__':
+    sys.exit(main())
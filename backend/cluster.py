@@ -0,0 +1,176 @@
+import fcntl
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Worker processes serving the API; gunicorn.conf.py sets this for the workers it starts
+SERVER_WORKERS = max(1, int(os.getenv('SERVER_WORKERS', 1) or 1))
+LEADER_RETRY = float(os.getenv('LEADER_RETRY', 2))  # seconds between election attempts by the other workers
+STATE_PUBLISH_INTERVAL = float(os.getenv('STATE_PUBLISH_INTERVAL', 1))
+COMMAND_POLL_INTERVAL = float(os.getenv('COMMAND_POLL_INTERVAL', 0.05))  # seconds between checks for new commands and results
+COMMAND_PICKUP_TIMEOUT = float(os.getenv('COMMAND_PICKUP_TIMEOUT', 10))  # seconds a command may wait for a leader to take it
+COMMAND_TIMEOUT = int(os.getenv('COMMAND_TIMEOUT', 300))  # seconds a worker waits for the leader to finish a command
+COMMAND_WORKERS = int(os.getenv('COMMAND_WORKERS', 8))
+
+
+class LeaderElection:
+    """Picks the one worker process that runs the backend's background work.
+
+    The leader holds an exclusive flock on a file in the tenants
+    directory. The kernel drops the lock with the process, so when the
+    leader dies (or gunicorn recycles it) another worker takes over within
+    LEADER_RETRY seconds and runs on_elected() itself.
+    """
+
+    def __init__(self, path, retry=LEADER_RETRY):
+        self.path = path
+        self.retry = retry
+        self.leader = False
+        self.elected_at = None
+        self._file = None
+
+    def start(self, on_elected):
+        """Become the leader now if no one else is, otherwise keep trying in the background"""
+        if self._acquire():
+            self._elected(on_elected)
+            return
+        threading.Thread(target=self._campaign, args=(on_elected,), name='leader-election', daemon=True).start()
+
+    def holder(self):
+        """Pid of the current leader, or None while there is none"""
+        try:
+            with open(self.path) as f:
+                return int(f.read().strip() or 0) or None
+        except (OSError, ValueError):
+            return None
+
+    def stats(self):
+        return {
+            'workers': SERVER_WORKERS,
+            'pid': os.getpid(),
+            'leader': self.leader,
+            'leader_pid': os.getpid() if self.leader else self.holder(),
+            'elected_at': self.elected_at
+        }
+
+    def _acquire(self):
+        f = open(self.path, 'a+')
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            f.close()
+            return False
+        f.seek(0)
+        f.truncate()
+        f.write(str(os.getpid()))
+        f.flush()
+        self._file = f
+        return True
+
+    def _elected(self, on_elected):
+        self.leader = True
+        self.elected_at = time.time()
+        if SERVER_WORKERS > 1:
+            print(f"👑 Worker {os.getpid()} is the leader")
+        on_elected()
+
+    def _campaign(self, on_elected):
+        while not self._acquire():
+            time.sleep(self.retry)
+        try:
+            self._elected(on_elected)
+        except Exception as e:
+            print(f"🚨 Worker {os.getpid()} could not take over as leader: {e}")
+
+
+class CommandQueue:
+    """Requests only the leader can carry out, handed to it through the registry.
+
+    Handlers are registered with @commands.handler and return what a Flask
+    view returns: (body, status) or (body, status, headers), JSON-safe. The
+    leader runs call() directly; any other worker stores the call as a
+    command row and polls for its result. The leader polls for new
+    commands every COMMAND_POLL_INTERVAL and runs them on COMMAND_WORKERS
+    threads, so a slow removal doesn't hold up signups.
+    """
+
+    UNAVAILABLE = (
+        {'error': 'No leader worker took the request', 'message': 'The backend is restarting. Please retry shortly.'},
+        503, {'Retry-After': '5'}
+    )
+
+    def __init__(self, registry, election, poll_interval=COMMAND_POLL_INTERVAL, pickup_timeout=COMMAND_PICKUP_TIMEOUT,
+                 timeout=COMMAND_TIMEOUT, workers=COMMAND_WORKERS):
+        self.registry = registry
+        self.election = election
+        self.poll_interval = poll_interval
+        self.pickup_timeout = pickup_timeout
+        self.timeout = timeout
+        self.workers = max(1, workers)
+        self._handlers = {}
+        self._pool = None
+        self.executed = 0
+        self.failed = 0
+
+    def handler(self, fn):
+        self._handlers[fn.__name__] = fn
+        return fn
+
+    def call(self, fn, **args):
+        """fn(**args) in the leader, wherever this worker is"""
+        if self.election.leader:
+            return fn(**args)
+        command = self.registry.submit_command(fn.__name__, args)
+        started = time.time()
+        while True:
+            time.sleep(self.poll_interval)
+            state, result = self.registry.collect_command(command)
+            if state == 'done':
+                return tuple(result)
+            if state is None:
+                return self.UNAVAILABLE
+            waited = time.time() - started
+            if state == 'pending' and waited > self.pickup_timeout and self.registry.cancel_command(command):
+                return self.UNAVAILABLE
+            if waited > self.timeout:
+                # It may still complete; whatever it changes shows up in the registry
+                return {'error': f'The leader did not finish the request within {self.timeout}s'}, 504
+
+    def start(self):
+        """Run commands for the other workers; called by the leader once it is ready"""
+        if self._pool:
+            return
+        # Commands the previous leader was running when it died are answered, not re-run
+        lost = self.registry.fail_running_commands(
+            [{'error': 'The leader worker restarted while handling the request'}, 503, {'Retry-After': '5'}]
+        )
+        if lost:
+            print(f"⚠️  {lost} requests were cut off by the previous leader's exit")
+        self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='command')
+        threading.Thread(target=self._poll_loop, name='command-poller', daemon=True).start()
+
+    def stats(self):
+        return {'executed': self.executed, 'failed': self.failed, 'pending': self.registry.pending_commands()}
+
+    def _poll_loop(self):
+        while True:
+            try:
+                for command, name, args in self.registry.claim_commands(self.workers):
+                    self._pool.submit(self._run, command, name, args)
+            except Exception as e:
+                print(f"⚠️  Could not read commands: {e}")
+            time.sleep(self.poll_interval)
+
+    def _run(self, command, name, args):
+        try:
+            result = self._handlers[name](**args)
+            self.executed += 1
+        except Exception as e:
+            self.failed += 1
+            print(f"🚨 Command {name} failed: {e}")
+            result = ({'error': f'{name} failed: {e}'}, 500)
+        try:
+            self.registry.finish_command(command, list(result))
+        except Exception as e:
+            print(f"⚠️  Could not store the result of command {name}: {e}")
@@ -0,0 +1,182 @@
+import os
+import re
+import threading
+import time
+
+from docker_engine import DockerEngineError
+from readiness import wait_until
+
+# private: every store's volume holds the whole web root; shared: the PrestaShop code is mounted read-only from one volume per node
+CODE_MODE = os.getenv('CODE_MODE', 'private')
+CODE_LAYER_BUILD_TIMEOUT = int(os.getenv('CODE_LAYER_BUILD_TIMEOUT', 600))
+CODE_LAYER_LABEL = 'saas.code-layer'
+
+WEB_ROOT = '/var/www/html'
+CODE_ROOT = '/var/www/core'
+SEED_SCRIPT_PATH = '/usr/local/bin/code-layer.sh'
+# The image's own start script (installer, admin folder rename, apache)
+IMAGE_START_SCRIPT = '/tmp/docker_run.sh'
+# Paths PrestaShop writes to, relative to the web root: copied into each store's volume. The
+# installer is copied too since it writes while it runs; the image's start script deletes it after.
+TENANT_PATHS = ('admin', 'app/config', 'cache', 'config', 'download', 'img', 'install', 'mails',
+                'override', 'themes', 'translations', 'upload', 'var')
+
+# Runs as the shop's command. On first start it fills the store's (empty) web root: tenant paths are
+# copied from the code layer, other directories become symlinks into it and top-level files are copied,
+# so PrestaShop resolves its root (and config) to the store's own volume. A web root that already holds
+# a store (restored from a snapshot) is left alone; an interrupted seed resumes, keeping what exists.
+SEED_SCRIPT = """#!/bin/sh
+set -e
+TENANT_PATHS=" {tenant_paths} "
+seed() {{
+    mkdir -p "{web_root}/$1"
+    chown www-data:www-data "{web_root}/$1"
+    for entry in "{code_root}${{1:+/$1}}"/* "{code_root}${{1:+/$1}}"/.[!.]*; do
+        [ -e "$entry" ] || continue
+        name="${{1:+$1/}}$(basename "$entry")"
+        case "$TENANT_PATHS" in
+            *" $name/"*) seed "$name"; continue ;;
+        esac
+        if [ "$name" = .complete ] || [ -e "{web_root}/$name" ] || [ -L "{web_root}/$name" ]; then
+            continue
+        fi
+        case "$TENANT_PATHS" in
+            *" $name "*) cp -a "$entry" "{web_root}/$name" ;;
+            *) if [ -d "$entry" ]; then ln -s "$entry" "{web_root}/$name"; else cp -a "$entry" "{web_root}/$name"; fi ;;
+        esac
+    done
+}}
+if [ ! -e {web_root}/.code-layer ]; then
+    if [ ! -e {web_root}/index.php ] || [ -e {web_root}/.code-layer-seeding ]; then
+        touch {web_root}/.code-layer-seeding
+        seed ""
+        rm {web_root}/.code-layer-seeding
+    fi
+    touch {web_root}/.code-layer
+fi
+exec {start_script}
+"""
+
+# Copies the image's web root into an empty code volume; the marker is written last so a partial copy is redone
+BUILD_SCRIPT = f"""set -e
+[ -e {CODE_ROOT}/.complete ] && exit 0
+find {CODE_ROOT} -mindepth 1 -delete
+cp -a {WEB_ROOT}/. {CODE_ROOT}/
+touch {CODE_ROOT}/.complete
+"""
+
+
+class CodeLayerError(Exception):
+    """Raised when the shared code volume can't be built on a node"""
+
+
+class CodeLayer:
+    """The PrestaShop code shared read-only by every store on a node (CODE_MODE=shared).
+
+    The image's web root is copied once into a volume named after the image
+    ID, so a re-pulled image gets a fresh layer while running stores keep
+    theirs. Stores mount it at CODE_ROOT and keep only their writable paths
+    (TENANT_PATHS) in their own volume, which the seed script fills on first
+    start. Layers of older images are removed once no store uses them.
+    """
+
+    def __init__(self, image, watcher, build_timeout=CODE_LAYER_BUILD_TIMEOUT):
+        self.image = image
+        self.watcher = watcher
+        self.build_timeout = build_timeout
+        self._volumes = {}
+        self._lock = threading.Lock()
+        self._node_locks = {}
+        self.builds = 0
+        self.build_seconds = 0.0
+
+    def volume(self, node):
+        """Name of the code volume for node's copy of the image"""
+        with self._lock:
+            if node.name in self._volumes:
+                return self._volumes[node.name]
+        info = node.engine.inspect_image(self.image)
+        if not info:
+            raise CodeLayerError(f'{self.image} is not on node {node.name}')
+        image = re.sub(r'[^a-zA-Z0-9_.-]', '-', self.image.rsplit('/', 1)[-1])
+        return f"code-{image}-{info['Id'].split(':')[-1][:12]}"
+
+    def ready(self, node):
+        with self._lock:
+            return node.name in self._volumes
+
+    def ensure(self, node):
+        """Build node's code volume unless this process already has; the image must be on the node"""
+        with self._lock:
+            if node.name in self._volumes:
+                return self._volumes[node.name]
+            node_lock = self._node_locks.setdefault(node.name, threading.Lock())
+        with node_lock:
+            with self._lock:
+                if node.name in self._volumes:
+                    return self._volumes[node.name]
+            volume = self.volume(node)
+            self._build(node, volume)
+            with self._lock:
+                self._volumes[node.name] = volume
+            self._prune(node, volume)
+            return volume
+
+    def _build(self, node, volume):
+        engine = node.engine
+        started = time.time()
+        container = f'{volume}-build'
+        engine.create_volume(volume, {CODE_LAYER_LABEL: self.image})
+        engine.remove_container(container)
+        engine.create_container(container, {
+            'Image': self.image,
+            'Cmd': ['sh', '-c', BUILD_SCRIPT],
+            'Labels': {CODE_LAYER_LABEL: self.image},
+            'HostConfig': {'Mounts': [{'Type': 'volume', 'Source': volume, 'Target': CODE_ROOT}]}
+        })
+        try:
+            engine.start_container(container)
+            state = wait_until(lambda: self._exited(engine, container), self.build_timeout, self.watcher, container)
+            if state is None:
+                raise CodeLayerError(f'Building {volume} on node {node.name} timed out')
+            if state['ExitCode'] != 0:
+                _, stderr = engine.logs(container, tail=5)
+                raise CodeLayerError(f'Building {volume} on node {node.name} failed: {stderr.strip()}')
+        finally:
+            engine.remove_container(container)
+        elapsed = time.time() - started
+        with self._lock:
+            self.builds += 1
+            self.build_seconds += elapsed
+        print(f"📚 Code layer {volume} ready on node {node.name} ({elapsed:.1f}s)")
+
+    @staticmethod
+    def _exited(engine, container):
+        info = engine.inspect_container(container)
+        state = (info or {}).get('State') or {}
+        return state if state.get('Status') in ('exited', 'dead') else None
+
+    def _prune(self, node, current):
+        for volume in node.engine.list_volumes(label=CODE_LAYER_LABEL):
+            if volume['Name'] == current:
+                continue
+            try:
+                node.engine.remove_volume(volume['Name'])
+                print(f"🧹 Removed unused code layer {volume['Name']} on node {node.name}")
+            except DockerEngineError:
+                pass  # still mounted by stores created from the older image
+
+    def seed_script(self):
+        return SEED_SCRIPT.format(
+            tenant_paths=' '.join(TENANT_PATHS), web_root=WEB_ROOT, code_root=CODE_ROOT, start_script=IMAGE_START_SCRIPT
+        )
+
+    def stats(self):
+        with self._lock:
+            return {
+                'mode': CODE_MODE,
+                'image': self.image,
+                'volumes': dict(self._volumes),
+                'builds': self.builds,
+                'build_seconds': round(self.build_seconds, 1)
+            }
@@ -0,0 +1,422 @@
+import http.client
+import json
+import os
+import queue
+import shutil
+import socket
+import struct
+import subprocess
+import threading
+from urllib.parse import quote, urlencode, urlparse
+
+DOCKER_ENGINE = os.getenv('DOCKER_ENGINE', 'socket')  # socket, fake
+DOCKER_SOCKET = os.getenv('DOCKER_SOCKET', '/var/run/docker.sock')
+DOCKER_API_VERSION = os.getenv('DOCKER_API_VERSION', 'v1.41')
+DOCKER_POOL_SIZE = int(os.getenv('DOCKER_POOL_SIZE', 8))
+
+
+class DockerEngineError(Exception):
+    """Raised when the Docker Engine API answers with an error"""
+
+    def __init__(self, status, message):
+        super().__init__(f"Docker API error {status}: {message}")
+        self.status = status
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    """HTTP connection over the Docker unix socket"""
+
+    def __init__(self, socket_path, timeout=60):
+        super().__init__('localhost', timeout=timeout)
+        self.socket_path = socket_path
+
+    def connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        sock.connect(self.socket_path)
+        self.sock = sock
+
+
+def demux_stream(data):
+    """Split Docker's multiplexed stdout/stderr stream into two strings"""
+    stdout, stderr = [], []
+    offset = 0
+    while offset + 8 <= len(data):
+        stream_type, length = struct.unpack('>BxxxL', data[offset:offset + 8])
+        chunk = data[offset + 8:offset + 8 + length]
+        (stderr if stream_type == 2 else stdout).append(chunk)
+        offset += 8 + length
+    return b''.join(stdout).decode(errors='replace'), b''.join(stderr).decode(errors='replace')
+
+
+def split_image(name):
+    """(repository, tag) of an image reference; the tag defaults to latest"""
+    repository, _, tag = name.rpartition(':')
+    # A colon before the last slash belongs to a registry host:port
+    if not repository or '/' in tag:
+        return name, 'latest'
+    return repository, tag
+
+
+class DockerEngine:
+    """Docker Engine API client that keeps a pool of persistent socket connections.
+
+    Talks to the local unix socket by default; with docker_host set to
+    tcp://host:port it reaches a remote daemon instead, and docker-compose
+    is pointed at the same daemon through DOCKER_HOST.
+    """
+
+    def __init__(self, socket_path=DOCKER_SOCKET, pool_size=DOCKER_POOL_SIZE, api_version=DOCKER_API_VERSION, docker_host=None):
+        self.socket_path = socket_path
+        self.api_version = api_version
+        self.docker_host = docker_host
+        self._address = None
+        if docker_host and docker_host.startswith('tcp://'):
+            url = urlparse(docker_host)
+            self._address = (url.hostname, url.port or 2375)
+        self._pool = queue.LifoQueue(maxsize=pool_size)
+
+    def _connect(self, timeout):
+        if self._address:
+            return http.client.HTTPConnection(*self._address, timeout=timeout)
+        return UnixHTTPConnection(self.socket_path, timeout=timeout)
+
+    def _get_connection(self, timeout):
+        try:
+            conn = self._pool.get_nowait()
+            conn.timeout = timeout
+            if conn.sock:
+                conn.sock.settimeout(timeout)
+            return conn, True
+        except queue.Empty:
+            return self._connect(timeout), False
+
+    def _release(self, conn):
+        try:
+            self._pool.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+    def request(self, method, path, params=None, body=None, timeout=60):
+        """Send one API request, returning (status, raw_body)"""
+        url = f"/{self.api_version}{path}"
+        if params:
+            url += '?' + urlencode(params)
+        headers = {}
+        payload = None
+        if body is not None:
+            payload = json.dumps(body)
+            headers['Content-Type'] = 'application/json'
+
+        for attempt in range(2):
+            conn, reused = self._get_connection(timeout)
+            try:
+                conn.request(method, url, body=payload, headers=headers)
+                response = conn.getresponse()
+                data = response.read()
+            except (http.client.HTTPException, ConnectionError, BrokenPipeError):
+                conn.close()
+                # An idle pooled connection may have been closed by the daemon; retry once on a fresh one
+                if reused and attempt == 0:
+                    continue
+                raise
+            except Exception:
+                conn.close()
+                raise
+            if response.will_close:
+                conn.close()
+            else:
+                self._release(conn)
+            return response.status, data
+
+    def request_json(self, method, path, params=None, body=None, timeout=60, allow_404=False):
+        status, data = self.request(method, path, params=params, body=body, timeout=timeout)
+        if status == 404 and allow_404:
+            return None
+        if status >= 400:
+            try:
+                message = json.loads(data).get('message', data)
+            except ValueError:
+                message = data.decode(errors='replace')
+            raise DockerEngineError(status, message)
+        return json.loads(data) if data else None
+
+    def ping(self):
+        status, _ = self.request('GET', '/_ping', timeout=5)
+        return status == 200
+
+    def list_containers(self, all=False, name=None, label=None):
+        params = {'all': '1' if all else '0'}
+        filters = {}
+        if name:
+            filters['name'] = [name]
+        if label:
+            filters['label'] = [label]
+        if filters:
+            params['filters'] = json.dumps(filters)
+        return self.request_json('GET', '/containers/json', params=params)
+
+    def create_container(self, name, config):
+        """Create (but don't start) a container from an Engine API config"""
+        return self.request_json('POST', '/containers/create', params={'name': name}, body=config)
+
+    def create_network(self, name, labels=None):
+        """Create a bridge network; an existing one with that name is kept"""
+        status, data = self.request('POST', '/networks/create', body={
+            'Name': name, 'Driver': 'bridge', 'CheckDuplicate': True, 'Labels': labels or {}
+        })
+        if status >= 400 and status != 409:
+            raise DockerEngineError(status, data.decode(errors='replace'))
+
+    def connect_network(self, network, container, aliases=None):
+        self.request_json('POST', f'/networks/{quote(network)}/connect', body={
+            'Container': container, 'EndpointConfig': {'Aliases': aliases or []}
+        })
+
+    def disconnect_network(self, network, container):
+        status, data = self.request('POST', f'/networks/{quote(network)}/disconnect', body={'Container': container, 'Force': True})
+        if status >= 400 and status != 404:
+            raise DockerEngineError(status, data.decode(errors='replace'))
+
+    def list_networks(self, label=None):
+        params = {'filters': json.dumps({'label': [label]})} if label else None
+        return self.request_json('GET', '/networks', params=params)
+
+    def remove_network(self, name):
+        status, data = self.request('DELETE', f'/networks/{quote(name)}')
+        if status >= 400 and status != 404:
+            raise DockerEngineError(status, data.decode(errors='replace'))
+
+    def create_volume(self, name, labels=None):
+        """Create a named volume (idempotent)"""
+        self.request_json('POST', '/volumes/create', body={'Name': name, 'Labels': labels or {}})
+
+    def list_volumes(self, label=None):
+        params = {'filters': json.dumps({'label': [label]})} if label else None
+        return (self.request_json('GET', '/volumes', params=params) or {}).get('Volumes') or []
+
+    def remove_volume(self, name):
+        status, data = self.request('DELETE', f'/volumes/{quote(name)}')
+        if status >= 400 and status != 404:
+            raise DockerEngineError(status, data.decode(errors='replace'))
+
+    def inspect_container(self, name):
+        """Return the container's inspect document, or None when it doesn't exist"""
+        return self.request_json('GET', f'/containers/{quote(name)}/json', allow_404=True)
+
+    def health_status(self, name):
+        """Health status string like `docker inspect --format {{.State.Health.Status}}`"""
+        info = self.inspect_container(name)
+        if not info:
+            return ''
+        health = info.get('State', {}).get('Health')
+        return health.get('Status', '') if health else ''
+
+    def published_ports(self):
+        """Map of host port -> container name for running containers"""
+        ports = {}
+        for container in self.list_containers():
+            for mapping in container.get('Ports') or []:
+                if mapping.get('PublicPort'):
+                    ports[mapping['PublicPort']] = container['Names'][0].lstrip('/')
+        return ports
+
+    def exec_run(self, name, cmd, env=None, timeout=60):
+        """Run a command in a container, returning (exit_code, stdout, stderr)"""
+        created = self.request_json('POST', f'/containers/{quote(name)}/exec', body={
+            'AttachStdout': True,
+            'AttachStderr': True,
+            'Cmd': cmd,
+            'Env': env or []
+        }, timeout=timeout)
+        exec_id = created['Id']
+        status, data = self.request('POST', f'/exec/{exec_id}/start', body={'Detach': False, 'Tty': False}, timeout=timeout)
+        if status >= 400:
+            raise DockerEngineError(status, data.decode(errors='replace'))
+        stdout, stderr = demux_stream(data)
+        info = self.request_json('GET', f'/exec/{exec_id}/json', timeout=timeout)
+        return info.get('ExitCode', -1), stdout, stderr
+
+    def logs(self, name, tail=20):
+        """Return (stdout, stderr) for the last lines of a container's log"""
+        status, data = self.request('GET', f'/containers/{quote(name)}/logs', params={
+            'stdout': '1', 'stderr': '1', 'tail': str(tail)
+        })
+        if status == 404:
+            return '', f'No such container: {name}'
+        if status >= 400:
+            raise DockerEngineError(status, data.decode(errors='replace'))
+        return demux_stream(data)
+
+    def start_container(self, name):
+        status, data = self.request('POST', f'/containers/{quote(name)}/start')
+        # 304: already running
+        if status >= 400:
+            raise DockerEngineError(status, data.decode(errors='replace'))
+
+    def stop_container(self, name, timeout=10):
+        """Stop a container, giving it timeout seconds to shut down cleanly"""
+        status, data = self.request('POST', f'/containers/{quote(name)}/stop', params={'t': str(timeout)}, timeout=timeout + 30)
+        if status >= 400 and status != 404:
+            raise DockerEngineError(status, data.decode(errors='replace'))
+
+    def restart_container(self, name, timeout=10):
+        status, data = self.request('POST', f'/containers/{quote(name)}/restart', params={'t': str(timeout)}, timeout=timeout + 30)
+        if status >= 400:
+            raise DockerEngineError(status, data.decode(errors='replace'))
+
+    def update_container(self, name, resources):
+        """Change a container's resource limits (Memory, MemorySwap, NanoCpus) without recreating it"""
+        return self.request_json('POST', f'/containers/{quote(name)}/update', body=resources)
+
+    def container_stats(self, name):
+        """A single stats sample (no streaming), or None when the container doesn't exist"""
+        return self.request_json('GET', f'/containers/{quote(name)}/stats', params={'stream': '0', 'one-shot': '1'}, allow_404=True)
+
+    def remove_container(self, name, force=True):
+        status, data = self.request('DELETE', f'/containers/{quote(name)}', params={'force': '1' if force else '0', 'v': '1'})
+        if status >= 400 and status != 404:
+            raise DockerEngineError(status, data.decode(errors='replace'))
+
+    def get_archive(self, name, path, dest, timeout=600):
+        """Stream a tar archive of path inside the container into the local file dest.
+
+        Like events(), archive transfers use their own connection so large
+        copies never hold a pooled one.
+        """
+        url = f"/{self.api_version}/containers/{quote(name)}/archive?" + urlencode({'path': path})
+        conn = self._connect(timeout)
+        try:
+            conn.request('GET', url)
+            response = conn.getresponse()
+            if response.status >= 400:
+                raise DockerEngineError(response.status, response.read().decode(errors='replace'))
+            with open(dest, 'wb') as f:
+                shutil.copyfileobj(response, f, 1024 * 1024)
+        finally:
+            conn.close()
+
+    def put_archive(self, name, path, src, timeout=600):
+        """Extract the local tar file src into directory path of a (possibly stopped) container"""
+        url = f"/{self.api_version}/containers/{quote(name)}/archive?" + urlencode({'path': path})
+        conn = self._connect(timeout)
+        try:
+            with open(src, 'rb') as f:
+                conn.request('PUT', url, body=f, headers={
+                    'Content-Type': 'application/x-tar',
+                    'Content-Length': str(os.path.getsize(src))
+                })
+                response = conn.getresponse()
+            data = response.read()
+            if response.status >= 400:
+                raise DockerEngineError(response.status, data.decode(errors='replace'))
+        finally:
+            conn.close()
+
+    def events(self, filters=None):
+        """Yield decoded events from the daemon's event stream until it closes.
+
+        Uses its own long-lived connection rather than one from the pool.
+        """
+        url = f"/{self.api_version}/events"
+        if filters:
+            url += '?' + urlencode({'filters': json.dumps(filters)})
+        return self._stream_json(url, None)
+
+    def stream_stats(self, name, timeout=60):
+        """Yield the container's stats samples (about one a second) until it stops, on a long-lived connection"""
+        return self._stream_json(f"/{self.api_version}/containers/{quote(name)}/stats?stream=1", timeout)
+
+    def _stream_json(self, url, timeout):
+        conn = self._connect(timeout)
+        try:
+            conn.request('GET', url)
+            response = conn.getresponse()
+            if response.status >= 400:
+                raise DockerEngineError(response.status, response.read().decode(errors='replace'))
+            buffer = b''
+            while True:
+                chunk = response.read1(65536)
+                if not chunk:
+                    return
+                buffer += chunk
+                while b'\n' in buffer:
+                    line, buffer = buffer.split(b'\n', 1)
+                    if line.strip():
+                        yield json.loads(line)
+        finally:
+            conn.close()
+
+    def inspect_image(self, name):
+        """Image details, or None when the image is not on this daemon"""
+        return self.request_json('GET', f'/images/{quote(name)}/json', allow_404=True)
+
+    def pull_image(self, name, timeout=1800):
+        """Pull an image, yielding the daemon's decoded progress messages.
+
+        Like events(), a pull streams over its own connection.
+        """
+        repository, tag = split_image(name)
+        url = f"/{self.api_version}/images/create?" + urlencode({'fromImage': repository, 'tag': tag})
+        conn = self._connect(timeout)
+        try:
+            conn.request('POST', url)
+            response = conn.getresponse()
+            if response.status >= 400:
+                raise DockerEngineError(response.status, response.read().decode(errors='replace'))
+            for line in response:
+                if not line.strip():
+                    continue
+                message = json.loads(line)
+                # Pull failures arrive as an error message inside a 200 stream
+                if message.get('error'):
+                    raise DockerEngineError(500, message['error'])
+                yield message
+        finally:
+            conn.close()
+
+    def compose(self, project_dir, *args, timeout=180):
+        """Run docker-compose for a tenant project; the Engine API has no compose endpoint"""
+        return subprocess.run(
+            ['docker-compose', '-f', 'docker-compose.yml'] + list(args),
+            cwd=project_dir,
+            env=dict(os.environ, DOCKER_HOST=self.docker_host) if self.docker_host else None,
+            capture_output=True,
+            text=True,
+            timeout=timeout
+        )
+
+
+_engines = {}
+_engine_lock = threading.Lock()
+
+
+def _create_engine(url):
+    if url.startswith('fake://') or (not url and DOCKER_ENGINE == 'fake'):
+        from fake_engine import FakeDockerEngine
+        return FakeDockerEngine()
+    if url.startswith('unix://'):
+        return DockerEngine(socket_path=url[len('unix://'):], docker_host=url)
+    if url.startswith('tcp://'):
+        return DockerEngine(docker_host=url)
+    if url:
+        raise ValueError(f'Unsupported Docker endpoint {url!r} (use unix://, tcp:// or fake://)')
+    return DockerEngine()
+
+
+def get_engine(url=''):
+    """Return the process-wide engine for a Docker endpoint URL.
+
+    The empty URL is the local engine selected by DOCKER_ENGINE; fake://<name>
+    gives each name its own simulated engine.
+    """
+    with _engine_lock:
+        if url not in _engines:
+            _engines[url] = _create_engine(url)
+        return _engines[url]
+
+
+def set_engine(engine, url=''):
+    """Swap the process-wide engine for a URL (used by tests and benchmarks)"""
+    with _engine_lock:
+        _engines[url] = engine
@@ -0,0 +1,531 @@
+import io
+import os
+import queue
+import random
+import re
+import secrets
+import subprocess
+import tarfile
+import threading
+import time
+
+from docker_engine import DockerEngineError
+from tenant_spec import PROJECT_LABEL
+
+# Seconds after `compose up` at which each simulated transition happens
+DEFAULT_LATENCIES = {
+    'container_start': 0.0,  # time `compose up` itself blocks (image start, network setup)
+    'db_healthy': 0.2,
+    'shop_healthy': 0.5,
+    'shop_restored': 0.1,  # shop started on a web root restored from a golden snapshot
+    'admin_rename': 0.1,
+    'image_pull': 1.0,  # time to pull a missing image, whether by pull_image or inside `compose up`
+    'oneshot': 0.2,  # run time of a container created with its own command (code layer build)
+    'stats_interval': 1.0  # seconds between samples on a stats stream
+}
+
+# Probability that a `compose up` or image pull fails, or that a new db/shop container never turns healthy
+DEFAULT_FAILURE_RATES = {
+    'compose': 0.0,
+    'pull': 0.0,
+    'db': 0.0,
+    'shop': 0.0
+}
+
+FAKE_PARAMETERS = """<?php return array (
+  'parameters' =>
+  array (
+    'database_host' => 'db',
+    'database_port' => '',
+    'database_name' => 'prestashop',
+    'database_user' => 'psuser',
+    'database_password' => 'pspassword',
+    'database_prefix' => 'ps_',
+    'secret' => 'fake',
+    'cookie_key' => 'fake',
+    'cookie_iv' => 'fake',
+    'new_cookie_key' => 'def00000fake',
+  ),
+);
+"""
+
+
+class FakeDockerEngine:
+    """In-process stand-in for DockerEngine.
+
+    Containers created from a tenant's docker-compose.yml move through
+    starting -> healthy on a timer, and the PrestaShop admin folder is
+    renamed shortly after the shop becomes healthy, mimicking the real
+    image without running anything. A shop whose web root was filled from
+    an archive before it started skips the simulated installer.
+    failure_rates injects compose errors and containers that never become
+    healthy; seed makes those draws reproducible. Every image counts as
+    pulled until prune_images() simulates `docker system prune -a`, which
+    keeps the images containers were created from.
+    """
+
+    def __init__(self, latencies=None, failure_rates=None, seed=None):
+        self.latencies = dict(DEFAULT_LATENCIES, **(latencies or {}))
+        self.failure_rates = dict(DEFAULT_FAILURE_RATES, **(failure_rates or {}))
+        self._random = random.Random(seed)
+        self.containers = {}
+        self.networks = {}
+        self.volumes = {}
+        self.images = None  # None: every image is present
+        self.calls = {}
+        self._subscribers = []
+        self._lock = threading.Lock()
+
+    def _count(self, call):
+        with self._lock:
+            self.calls[call] = self.calls.get(call, 0) + 1
+
+    def _emit(self, name, action, labels=None):
+        # Like the daemon, events carry the container's labels as attributes
+        attributes = dict(labels or {}, name=name)
+        event = {'Type': 'container', 'Action': action, 'Actor': {'Attributes': attributes}, 'time': int(time.time())}
+        for subscriber in list(self._subscribers):
+            subscriber.put(event)
+
+    def _delay(self, container):
+        if container['role'] == 'service':
+            return 0
+        if container['role'] == 'db':
+            return self.latencies['db_healthy']
+        return self.latencies['shop_restored' if container['installed'] else 'shop_healthy']
+
+    def _schedule_health(self, name, delay):
+        def emit():
+            container = self.containers.get(name)
+            if container and container['running']:
+                self._emit(name, f'health_status: {self._health(container)}')
+        timer = threading.Timer(delay, emit)
+        timer.daemon = True
+        timer.start()
+
+    def _add_container(self, name, role, ports=(), admin_folder='admin', start=True, labels=None):
+        self.containers[name] = {
+            'name': name,
+            'role': role,
+            'labels': dict(labels or {}),
+            'started_at': None,
+            'ports': list(ports),
+            'admin_folder': admin_folder,
+            'installed': False,
+            'failing': self._random.random() < self.failure_rates.get(role, 0),
+            'rx_bytes': 0,
+            'files': set(),
+            'running': False,
+            'oneshot': False,
+            'exit_code': None,
+            'image': None
+        }
+        self._emit(name, 'create', labels)
+        if start:
+            self._start(name)
+
+    def _start(self, name):
+        container = self.containers[name]
+        container['running'] = True
+        container['started_at'] = time.time()
+        container['exit_code'] = None
+        self._emit(name, 'start', container['labels'])
+        if container['oneshot']:
+            self._schedule_exit(name, self.latencies['oneshot'])
+        else:
+            self._schedule_health(name, self._delay(container))
+
+    def _schedule_exit(self, name, delay):
+        def finish():
+            with self._lock:
+                container = self.containers.get(name)
+                if not container or not container['running']:
+                    return
+                container['running'] = False
+                container['exit_code'] = 0
+            self._emit(name, 'die', container['labels'])
+        timer = threading.Timer(delay, finish)
+        timer.daemon = True
+        timer.start()
+
+    def _health(self, container):
+        if not container['running'] or container['failing']:
+            return 'unhealthy'
+        elapsed = time.time() - container['started_at']
+        return 'healthy' if elapsed >= self._delay(container) else 'starting'
+
+    def _web_root(self, container):
+        admin = 'admin'
+        elapsed = time.time() - container['started_at']
+        if container['installed'] or elapsed >= self.latencies['shop_healthy'] + self.latencies['admin_rename']:
+            admin = container['admin_folder']
+        return sorted(['index.php', 'config', 'img', 'modules', 'themes', admin])
+
+    def ping(self):
+        self._count('ping')
+        return True
+
+    @staticmethod
+    def _labelled(labels, label):
+        key, _, value = label.partition('=')
+        return key in labels and (not value or labels[key] == value)
+
+    def list_containers(self, all=False, name=None, label=None):
+        self._count('list_containers')
+        with self._lock:
+            containers = list(self.containers.values())
+        result = []
+        for container in containers:
+            if name and name not in container['name']:
+                continue
+            if label and not self._labelled(container['labels'], label):
+                continue
+            if not all and not container['running']:
+                continue
+            result.append({
+                'Names': ['/' + container['name']],
+                'Labels': dict(container['labels']),
+                'State': 'running' if container['running'] else 'exited',
+                'Status': f"Up ({self._health(container)})" if container['running'] else 'Exited (0)',
+                'Ports': [{'PrivatePort': 80, 'PublicPort': port, 'Type': 'tcp'} for port in container['ports']]
+            })
+        return result
+
+    def inspect_container(self, name):
+        self._count('inspect_container')
+        container = self.containers.get(name)
+        if not container:
+            return None
+        return {
+            'Name': '/' + name,
+            'Image': self._image_id(container['image']) if container['image'] else None,
+            'State': {
+                'Status': 'running' if container['running'] else 'exited',
+                'Running': container['running'],
+                'ExitCode': container['exit_code'] or 0,
+                'Health': {'Status': self._health(container)}
+            },
+            # Loopback stands in for the container IP: probes get a fast "connection refused"
+            'NetworkSettings': {'Networks': {'bridge': {'IPAddress': '127.0.0.1'}}}
+        }
+
+    def health_status(self, name):
+        info = self.inspect_container(name)
+        return info['State']['Health']['Status'] if info else ''
+
+    def published_ports(self):
+        ports = {}
+        for container in self.list_containers():
+            for mapping in container['Ports']:
+                ports[mapping['PublicPort']] = container['Names'][0].lstrip('/')
+        return ports
+
+    def exec_run(self, name, cmd, env=None, timeout=60):
+        self._count('exec_run')
+        container = self.containers.get(name)
+        if not container or not container['running']:
+            return 1, '', f'Error: No such container: {name}'
+        if container['role'] == 'service':
+            # Backend-managed services (the edge router) only keep track of uploaded files
+            if cmd[:1] == ['ls']:
+                return 0, '\n'.join(sorted(container['files'])) + '\n', ''
+            if cmd[:1] == ['rm']:
+                container['files'] -= {os.path.basename(path) for path in cmd[1:]}
+            return 0, '', ''
+        if cmd[:1] == ['ls']:
+            return 0, '\n'.join(self._web_root(container)) + '\n', ''
+        if cmd[:1] == ['php']:
+            return 0, '$2y$10$' + secrets.token_hex(26), ''
+        if cmd[:1] == ['mv'] and os.path.basename(cmd[1]) == container['admin_folder']:
+            container['admin_folder'] = os.path.basename(cmd[2])
+        return 0, '', ''
+
+    def logs(self, name, tail=20):
+        self._count('logs')
+        if name not in self.containers:
+            return '', f'Error: No such container: {name}'
+        return f'{name} started (fake engine)\n', ''
+
+    def start_container(self, name):
+        self._count('start_container')
+        with self._lock:
+            container = self.containers.get(name)
+            if not container:
+                raise FileNotFoundError(f'No such container: {name}')
+            if not container['running']:
+                self._start(name)
+
+    def stop_container(self, name, timeout=10):
+        self._count('stop_container')
+        with self._lock:
+            container = self.containers.get(name)
+            if not container or not container['running']:
+                return
+            container['running'] = False
+        self._emit(name, 'die')
+        self._emit(name, 'stop')
+
+    def restart_container(self, name, timeout=10):
+        self._count('restart_container')
+        self.stop_container(name, timeout)
+        self.start_container(name)
+
+    def update_container(self, name, resources):
+        self._count('update_container')
+        container = self.containers.get(name)
+        if not container:
+            raise DockerEngineError(404, f'No such container: {name}')
+        container['resources'] = dict(resources)
+        return {'Warnings': []}
+
+    def container_stats(self, name):
+        self._count('container_stats')
+        container = self.containers.get(name)
+        if not container:
+            return None
+        return {'networks': {'eth0': {'rx_bytes': container['rx_bytes'], 'tx_bytes': container['rx_bytes']}}}
+
+    def stream_stats(self, name, timeout=60):
+        """Yield a stats sample every stats_interval while the container runs, like the daemon's stats stream"""
+        self._count('stream_stats')
+        container = self.containers.get(name)
+        if not container:
+            raise DockerEngineError(404, f'No such container: {name}')
+        cpu = system = disk = 0
+        previous = None
+        while container['running'] and self.containers.get(name) is container:
+            # Shops burn more CPU than databases; a container's load wanders around its own level
+            load = container.setdefault('load', self._random.uniform(0.05, 0.6 if container['role'] == 'shop' else 0.3))
+            cpu += int(load * self._random.uniform(0.5, 1.5) * 1e9 * self.latencies['stats_interval'])
+            system += int(4 * 1e9 * self.latencies['stats_interval'])
+            disk += self._random.randrange(0, 64 * 1024)
+            sample = {
+                'read': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+                'cpu_stats': {'cpu_usage': {'total_usage': cpu}, 'system_cpu_usage': system, 'online_cpus': 4},
+                'precpu_stats': previous or {'cpu_usage': {'total_usage': 0}},
+                'memory_stats': {'usage': int(load * 512 * 1024 ** 2), 'stats': {'inactive_file': 8 * 1024 ** 2}, 'limit': 1024 ** 3},
+                'networks': {'eth0': {'rx_bytes': container['rx_bytes'], 'tx_bytes': container['rx_bytes'] * 4}},
+                'blkio_stats': {'io_service_bytes_recursive': [{'op': 'read', 'value': disk}, {'op': 'write', 'value': disk // 2}]}
+            }
+            previous = sample['cpu_stats']
+            yield sample
+            time.sleep(self.latencies['stats_interval'])
+
+    def record_traffic(self, name, nbytes=1500):
+        """Simulate requests reaching a container (shows up in container_stats)"""
+        container = self.containers.get(name)
+        if container:
+            container['rx_bytes'] += nbytes
+
+    def remove_container(self, name, force=True):
+        self._count('remove_container')
+        with self._lock:
+            container = self.containers.pop(name, None)
+        if container:
+            if container['running']:
+                self._emit(name, 'die', container['labels'])
+            self._emit(name, 'destroy', container['labels'])
+
+    def get_archive(self, name, path, dest, timeout=600):
+        """Write a small stand-in tar: a dump file for databases, a web root for shops"""
+        self._count('get_archive')
+        container = self.containers.get(name)
+        if not container:
+            raise FileNotFoundError(f'No such container: {name}')
+        if container['role'] == 'db':
+            files = {os.path.basename(path): b'-- fake dump\n'}
+        else:
+            files = {
+                'html/index.php': b'<?php\n',
+                'html/app/config/parameters.php': FAKE_PARAMETERS.encode(),
+                f"html/{container['admin_folder']}/index.php": b'<?php\n'
+            }
+        with tarfile.open(dest, 'w') as archive:
+            for member, content in files.items():
+                info = tarfile.TarInfo(member)
+                info.size = len(content)
+                archive.addfile(info, io.BytesIO(content))
+
+    def put_archive(self, name, path, src, timeout=600):
+        """Record an upload; a web root with an admin folder marks the shop as installed"""
+        self._count('put_archive')
+        container = self.containers.get(name)
+        if not container:
+            raise FileNotFoundError(f'No such container: {name}')
+        with tarfile.open(src) as archive:
+            names = archive.getnames()
+        if container['role'] == 'service':
+            container['files'].update(names)
+            return
+        for member in names:
+            parts = member.split('/')
+            if container['role'] == 'shop' and len(parts) > 2 and parts[0] == 'html' and parts[1].startswith('admin'):
+                container['admin_folder'] = parts[1]
+                container['installed'] = True
+
+    def create_container(self, name, config):
+        """Create a stopped container; the role (db, shop, service) comes from the name like in compose()"""
+        self._count('create_container')
+        if not self._has_image(config['Image']):
+            raise DockerEngineError(404, f"No such image: {config['Image']}")
+        env = dict(item.split('=', 1) for item in config.get('Env') or [])
+        bindings = (config.get('HostConfig') or {}).get('PortBindings') or {}
+        ports = [int(binding['HostPort']) for mappings in bindings.values() for binding in mappings]
+        with self._lock:
+            if name in self.containers:
+                raise DockerEngineError(409, f'Conflict. The container name "/{name}" is already in use')
+            if name.endswith('_db'):
+                self._add_container(name, 'db', start=False, labels=config.get('Labels'))
+            elif not name.endswith('_shop'):
+                self._add_container(name, 'service', start=False, labels=config.get('Labels'))
+                # Services run the image's own command; one created with a command runs it and exits (unless it sleeps)
+                self.containers[name]['oneshot'] = bool(config.get('Cmd')) and config.get('Entrypoint') != ['sleep']
+            else:
+                folder = env.get('PS_FOLDER_ADMIN', 'admin')
+                folder = folder if folder != 'admin' else 'admin' + secrets.token_hex(4)
+                self._add_container(name, 'shop', ports, folder, start=False, labels=config.get('Labels'))
+            self.containers[name]['image'] = self._image_name(config['Image'])
+        return {'Id': secrets.token_hex(32), 'Warnings': []}
+
+    def create_network(self, name, labels=None):
+        self._count('create_network')
+        with self._lock:
+            self.networks.setdefault(name, dict(labels or {}))
+
+    def connect_network(self, network, container, aliases=None):
+        self._count('connect_network')
+        if container not in self.containers:
+            raise DockerEngineError(404, f'No such container: {container}')
+
+    def disconnect_network(self, network, container):
+        self._count('disconnect_network')
+
+    def list_networks(self, label=None):
+        self._count('list_networks')
+        with self._lock:
+            return [{'Name': name, 'Labels': labels} for name, labels in self.networks.items()
+                    if not label or self._labelled(labels, label)]
+
+    def remove_network(self, name):
+        self._count('remove_network')
+        with self._lock:
+            self.networks.pop(name, None)
+
+    def create_volume(self, name, labels=None):
+        self._count('create_volume')
+        with self._lock:
+            self.volumes.setdefault(name, dict(labels or {}))
+
+    def list_volumes(self, label=None):
+        self._count('list_volumes')
+        with self._lock:
+            return [{'Name': name, 'Labels': labels} for name, labels in self.volumes.items()
+                    if not label or self._labelled(labels, label)]
+
+    def remove_volume(self, name):
+        self._count('remove_volume')
+        with self._lock:
+            self.volumes.pop(name, None)
+
+    def prune_images(self):
+        """Forget every pulled image no container uses, like `docker system prune -a`"""
+        with self._lock:
+            used = {container['image'] for container in self.containers.values() if container['image']}
+            self.images = used if self.images is None else self.images & used
+
+    @staticmethod
+    def _image_id(name):
+        return 'sha256:' + format(abs(hash(name)), 'x').ljust(64, '0')
+
+    def _image_name(self, reference):
+        """The tag an image ID stands for among the pulled images, or the reference itself"""
+        if reference.startswith('sha256:'):
+            known = self.images if self.images is not None else {
+                container['image'] for container in self.containers.values() if container['image']
+            }
+            return next((name for name in known if self._image_id(name) == reference), reference)
+        return reference
+
+    def _has_image(self, name):
+        return self.images is None or self._image_name(name) in self.images
+
+    def inspect_image(self, name):
+        self._count('inspect_image')
+        if not self._has_image(name):
+            return None
+        return {'Id': self._image_id(name), 'RepoTags': [name], 'RepoDigests': [f"{name.split(':')[0]}@{self._image_id(name + '@')}"]}
+
+    def pull_image(self, name, timeout=1800):
+        """Yield download progress for one simulated layer over the image_pull latency"""
+        self._count('pull_image')
+        total, steps = 100 * 1024 * 1024, 10
+        for step in range(1, steps + 1):
+            time.sleep(self.latencies['image_pull'] / steps)
+            yield {'status': 'Downloading', 'id': 'layer0', 'progressDetail': {'current': total * step // steps, 'total': total}}
+        if self._random.random() < self.failure_rates['pull']:
+            raise RuntimeError(f'simulated pull failure for {name}')
+        with self._lock:
+            if self.images is not None:
+                self.images.add(name)
+        yield {'status': 'Pull complete', 'id': 'layer0'}
+        yield {'status': f'Status: Downloaded newer image for {name}'}
+
+    def events(self, filters=None):
+        """Yield simulated container events (start, health_status) as they happen"""
+        subscriber = queue.Queue()
+        self._subscribers.append(subscriber)
+        try:
+            while True:
+                yield subscriber.get()
+        finally:
+            self._subscribers.remove(subscriber)
+
+    def compose(self, project_dir, *args, timeout=180):
+        """Interpret `up -d` / `down` for a generated tenant compose file"""
+        self._count('compose')
+        command = args[0] if args else ''
+        compose_file = os.path.join(project_dir, 'docker-compose.yml')
+        names, images, ports, admin_folder = [], [], [], 'admin'
+        if os.path.exists(compose_file):
+            with open(compose_file) as f:
+                content = f.read()
+            names = re.findall(r'container_name:\s*(\S+)', content)
+            images = re.findall(r'image:\s*(\S+)', content)
+            ports = [int(p) for p in re.findall(r'"(\d+):80"', content)]
+            match = re.search(r'PS_FOLDER_ADMIN:\s*(\S+)', content)
+            if match:
+                admin_folder = match.group(1)
+
+        start = '--no-start' not in args
+        if command == 'up':
+            if start and self.latencies['container_start']:
+                time.sleep(self.latencies['container_start'])
+            missing = [image for image in images if not self._has_image(image)]
+            if missing:
+                # compose pulls missing images itself before creating anything
+                time.sleep(self.latencies['image_pull'] * len(missing))
+                with self._lock:
+                    self.images.update(missing)
+            if self._random.random() < self.failure_rates['compose']:
+                return subprocess.CompletedProcess(args, 1, stdout='', stderr='simulated docker-compose failure')
+        labels = {PROJECT_LABEL: os.path.basename(os.path.normpath(project_dir))}
+        with self._lock:
+            if command == 'up':
+                for name in names:
+                    existing = self.containers.get(name)
+                    if existing:
+                        if start and not existing['running']:
+                            self._start(name)
+                    elif name.endswith('_db'):
+                        self._add_container(name, 'db', start=start, labels=labels)
+                    elif not name.endswith('_shop'):
+                        self._add_container(name, 'service', start=start, labels=labels)
+                    else:
+                        # The real image renames admin/ on first install; simulate a random suffix
+                        folder = admin_folder if admin_folder != 'admin' else 'admin' + secrets.token_hex(4)
+                        self._add_container(name, 'shop', ports, folder, start=start, labels=labels)
+            elif command == 'down':
+                for name in names:
+                    if self.containers.pop(name, None):
+                        self._emit(name, 'destroy', labels)
+        return subprocess.CompletedProcess(args, 0, stdout=f'{command} {" ".join(names)}\n', stderr='')
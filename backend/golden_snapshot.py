@@ -0,0 +1,237 @@
+import hashlib
+import io
+import json
+import os
+import re
+import secrets
+import shlex
+import shutil
+import tarfile
+import threading
+import time
+
+GOLDEN_SNAPSHOT = os.getenv('GOLDEN_SNAPSHOT', '0') == '1'
+WEB_ROOT = '/var/www/html'
+PARAMETERS_MEMBER = 'html/app/config/parameters.php'
+SNAPSHOT_FILE = 'snapshot.json'
+
+
+class SnapshotError(Exception):
+    """Raised when a golden snapshot cannot be captured or restored"""
+
+
+def new_cookie_key():
+    """A random key in defuse/php-encryption's ASCII-safe format (PrestaShop's new_cookie_key)"""
+    raw = b'\xde\xf0\x00\x00' + secrets.token_bytes(32)
+    return (raw + hashlib.sha256(raw).digest()).hex()
+
+
+def render_parameters(template, values):
+    """Replace scalar entries of PrestaShop's app/config/parameters.php"""
+    for key, value in values.items():
+        escaped = str(value).replace('\\', '\\\\').replace("'", "\\'")
+        template = re.sub(
+            r"('%s' => )'(?:[^'\\]|\\.)*'" % re.escape(key),
+            lambda match: f"{match.group(1)}'{escaped}'",
+            template
+        )
+    return template
+
+
+class GoldenSnapshot:
+    """A fully installed PrestaShop (database dump + web root archive) that new stores are cloned from.
+
+    Snapshots are captured into a fresh version directory and published by
+    rewriting snapshot.json, so a rebuild never disturbs restores in flight.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._lock = threading.Lock()
+        self.building = False
+        self.stats_counters = {
+            'builds': 0,
+            'build_failures': 0,
+            'restores': 0
+        }
+        self._meta = self._load()
+
+    def _load(self):
+        path = os.path.join(self.directory, SNAPSHOT_FILE)
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path) as f:
+                meta = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"⚠️  Ignoring unreadable golden snapshot {path}: {e}")
+            return None
+        if not os.path.isdir(os.path.join(self.directory, meta['version'])):
+            return None
+        return meta
+
+    def metadata(self):
+        """The current snapshot's metadata, or None if none has been captured"""
+        with self._lock:
+            return self._meta
+
+    def _path(self, meta, name):
+        return os.path.join(self.directory, meta['version'], name)
+
+    def begin_build(self):
+        """Claim the single build slot; False if a build is already running"""
+        with self._lock:
+            if self.building:
+                return False
+            self.building = True
+            return True
+
+    def end_build(self, ok):
+        with self._lock:
+            self.building = False
+            self.stats_counters['builds' if ok else 'build_failures'] += 1
+
+    def capture(self, engine, shop_container, db_container, dump_cmd, dump_env, admin_folder, source, code_layer=None):
+        """Dump the database and archive the web root of an installed store.
+
+        dump_cmd is the mysqldump invocation for the store's database, run
+        inside db_container with dump_env. code_layer names the shared code
+        volume the store's web root links into, if any.
+        """
+        version = time.strftime('%Y%m%d%H%M%S') + '-' + secrets.token_hex(2)
+        version_dir = os.path.join(self.directory, version)
+        os.makedirs(version_dir)
+        scratch = f'/tmp/golden-{version}'
+        try:
+            exit_code, _, stderr = engine.exec_run(
+                db_container,
+                ['sh', '-c', f'mkdir -p {scratch} && {shlex.join(dump_cmd)} > {scratch}/golden.sql'],
+                env=dump_env,
+                timeout=600
+            )
+            if exit_code != 0:
+                raise SnapshotError(f'Database dump failed: {stderr.strip()}')
+            engine.get_archive(db_container, f'{scratch}/golden.sql', os.path.join(version_dir, 'db.tar'))
+            engine.exec_run(db_container, ['rm', '-rf', scratch])
+
+            web_archive = os.path.join(version_dir, 'web.tar')
+            engine.get_archive(shop_container, WEB_ROOT, web_archive)
+            parameters = self._extract_parameters(web_archive)
+
+            meta = {
+                'version': version,
+                'created_at': time.time(),
+                'source': source,
+                'admin_folder': admin_folder,
+                'code_layer': code_layer,
+                'parameters': parameters,
+                'size': sum(os.path.getsize(os.path.join(version_dir, name)) for name in os.listdir(version_dir))
+            }
+        except Exception:
+            shutil.rmtree(version_dir, ignore_errors=True)
+            raise
+
+        tmp_path = os.path.join(self.directory, SNAPSHOT_FILE + '.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, os.path.join(self.directory, SNAPSHOT_FILE))
+        with self._lock:
+            previous, self._meta = self._meta, meta
+        self._prune(keep={version, previous['version'] if previous else None})
+        print(f"📸 Golden snapshot {version} captured from {source} ({meta['size'] / 1e6:.0f} MB)")
+        return meta
+
+    @staticmethod
+    def _extract_parameters(web_archive):
+        """Keep parameters.php (and its tar header fields) so restores can rewrite it up front"""
+        with tarfile.open(web_archive, 'r|') as archive:
+            for member in archive:
+                if member.name == PARAMETERS_MEMBER:
+                    return {
+                        'content': archive.extractfile(member).read().decode(),
+                        'mode': member.mode,
+                        'uid': member.uid,
+                        'gid': member.gid
+                    }
+        raise SnapshotError(f'{PARAMETERS_MEMBER} not found in web root archive')
+
+    def _prune(self, keep):
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if os.path.isdir(path) and name not in keep:
+                shutil.rmtree(path, ignore_errors=True)
+
+    def restore_files(self, engine, shop_container, database, scratch_dir):
+        """Fill a created (not yet started) shop container's web root from the snapshot.
+
+        database holds host/name/user/password for the store; parameters.php
+        is rewritten with them and with fresh secrets before the shop starts.
+        """
+        meta = self.metadata()
+        if meta is None:
+            raise SnapshotError('No golden snapshot available')
+        engine.put_archive(shop_container, os.path.dirname(WEB_ROOT), self._path(meta, 'web.tar'), timeout=900)
+
+        parameters = meta['parameters']
+        content = render_parameters(parameters['content'], {
+            'database_host': database['host'],
+            'database_name': database['name'],
+            'database_user': database['user'],
+            'database_password': database['password'],
+            'secret': secrets.token_hex(32),
+            'cookie_key': secrets.token_hex(32),
+            'cookie_iv': secrets.token_hex(16),
+            'new_cookie_key': new_cookie_key()
+        }).encode()
+        archive_path = os.path.join(scratch_dir, 'parameters.tar')
+        with tarfile.open(archive_path, 'w') as archive:
+            info = tarfile.TarInfo(PARAMETERS_MEMBER)
+            info.size = len(content)
+            info.mode = parameters['mode']
+            info.uid = parameters['uid']
+            info.gid = parameters['gid']
+            info.mtime = int(time.time())
+            archive.addfile(info, io.BytesIO(content))
+        try:
+            engine.put_archive(shop_container, os.path.dirname(WEB_ROOT), archive_path)
+        finally:
+            os.remove(archive_path)
+        return meta
+
+    def restore_database(self, engine, db_container, client_cmd, client_env, scratch_name):
+        """Import the snapshot's dump with client_cmd (a mysql invocation) inside db_container"""
+        meta = self.metadata()
+        if meta is None:
+            raise SnapshotError('No golden snapshot available')
+        scratch = f'/tmp/golden-{scratch_name}'
+        exit_code, _, stderr = engine.exec_run(db_container, ['mkdir', '-p', scratch])
+        if exit_code != 0:
+            raise SnapshotError(f'Could not prepare database import: {stderr.strip()}')
+        try:
+            engine.put_archive(db_container, scratch, self._path(meta, 'db.tar'), timeout=900)
+            exit_code, _, stderr = engine.exec_run(
+                db_container,
+                ['sh', '-c', f'{shlex.join(client_cmd)} < {scratch}/golden.sql'],
+                env=client_env,
+                timeout=900
+            )
+            if exit_code != 0:
+                raise SnapshotError(f'Database import failed: {stderr.strip()}')
+        finally:
+            engine.exec_run(db_container, ['rm', '-rf', scratch])
+        with self._lock:
+            self.stats_counters['restores'] += 1
+
+    def stats(self):
+        with self._lock:
+            meta = self._meta
+            return dict(
+                self.stats_counters,
+                enabled=GOLDEN_SNAPSHOT,
+                ready=meta is not None,
+                building=self.building,
+                version=meta['version'] if meta else None,
+                created_at=meta['created_at'] if meta else None,
+                size=meta['size'] if meta else None
+            )
+
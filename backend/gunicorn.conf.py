@@ -0,0 +1,17 @@
+import multiprocessing
+import os
+
+# gunicorn -c gunicorn.conf.py app:app
+bind = os.getenv('SERVER_BIND', '0.0.0.0:5000')
+# Every worker serves status, progress streams and health; one elected worker also runs
+# provisioning and the background loops. 0 means one worker per CPU core.
+workers = int(os.getenv('SERVER_WORKERS', 0) or 0) or multiprocessing.cpu_count()
+# Threads per worker; each open deployment progress stream holds one
+worker_class = 'gthread'
+threads = int(os.getenv('SERVER_THREADS', 32))
+# Workers import the app themselves, so the background threads start in the elected worker rather than the master
+preload_app = False
+graceful_timeout = 30
+
+# The app reads this to tell whether it shares the backend with other workers
+os.environ['SERVER_WORKERS'] = str(workers)
@@ -0,0 +1,432 @@
+import os
+import selectors
+import socket
+import threading
+import time
+
+from readiness import wait_until
+from router import ROUTE_PROPAGATION_DELAY
+
+HIBERNATE_AFTER = int(os.getenv('HIBERNATE_AFTER', 0))  # seconds without traffic; 0 disables hibernation
+HIBERNATE_SWEEP_INTERVAL = int(os.getenv('HIBERNATE_SWEEP_INTERVAL', 60))
+WAKE_TIMEOUT = int(os.getenv('WAKE_TIMEOUT', 120))
+WAKE_LISTEN_ADDRESS = os.getenv('WAKE_LISTEN_ADDRESS', '0.0.0.0')
+WAKE_PORT = int(os.getenv('WAKE_PORT', 8070))  # single wake listener used behind the edge router
+
+WAKE_FAILED_RESPONSE = (
+    b"HTTP/1.1 503 Service Unavailable\r\n"
+    b"Retry-After: 30\r\n"
+    b"Content-Type: text/plain\r\n"
+    b"Content-Length: 38\r\n"
+    b"Connection: close\r\n\r\n"
+    b"This store is waking up, retry shortly."
+)
+
+NOT_FOUND_RESPONSE = (
+    b"HTTP/1.1 404 Not Found\r\n"
+    b"Content-Length: 0\r\n"
+    b"Connection: close\r\n\r\n"
+)
+
+
+def _redirect_response(path):
+    """Send the visitor back to the same URL, which the router now routes to the awake store"""
+    return (
+        "HTTP/1.1 307 Temporary Redirect\r\n"
+        f"Location: {path}\r\n"
+        "Content-Length: 0\r\n"
+        "Connection: close\r\n\r\n"
+    ).encode()
+
+
+def _read_request_head(client, limit=16384, timeout=5):
+    """(host, path) from the start of an HTTP request, or None if it can't be parsed"""
+    client.settimeout(timeout)
+    data = b''
+    try:
+        while b'\r\n\r\n' not in data and len(data) < limit:
+            chunk = client.recv(4096)
+            if not chunk:
+                break
+            data += chunk
+    except OSError:
+        return None
+    lines = data.split(b'\r\n')
+    parts = lines[0].split(b' ')
+    if len(parts) < 3:
+        return None
+    host = None
+    for line in lines[1:]:
+        name, _, value = line.partition(b':')
+        if name.strip().lower() == b'host':
+            host = value.strip().decode('latin-1')
+            break
+    if not host:
+        return None
+    return host, parts[1].decode('latin-1')
+
+
+def _drain(client):
+    """Read whatever the client has sent so far; closing with unread input resets the connection and can lose our reply"""
+    try:
+        client.setblocking(False)
+        while client.recv(65536):
+            pass
+    except OSError:
+        pass
+    client.settimeout(5)
+
+
+def _relay(source, destination):
+    """Copy bytes from source to destination until source closes"""
+    try:
+        while True:
+            data = source.recv(65536)
+            if not data:
+                break
+            destination.sendall(data)
+    except OSError:
+        pass
+    finally:
+        try:
+            destination.shutdown(socket.SHUT_WR)
+        except OSError:
+            pass
+
+
+def _pipe(client, upstream):
+    """Relay both directions between two sockets, closing them when both sides are done"""
+    threads = [
+        threading.Thread(target=_relay, args=(client, upstream), daemon=True),
+        threading.Thread(target=_relay, args=(upstream, client), daemon=True)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    client.close()
+    upstream.close()
+
+
+class Hibernator:
+    """Stops idle stores and wakes them on their first incoming connection.
+
+    A store counts as idle when its shop container has received no network
+    traffic for idle_after seconds. Hibernating stops the containers (which
+    frees their memory) and binds a listener on the store's host port. The
+    first connection to arrive is held while the containers start; once the
+    shop is healthy, held connections are piped through to it and the port
+    is handed back to Docker.
+
+    Behind the edge router stores have no port of their own. Hibernating
+    removes the store's route instead, so the router's catch-all sends its
+    visitors to one shared wake listener that picks the store from the Host
+    header and, once it is awake, redirects them back to the same URL.
+
+    containers(tenant) returns the tenant's own containers in start order,
+    shop last; address(container) resolves a container's network address
+    and forget_address(container) drops a cached one, since a restarted
+    container can come back with a new IP.
+    traffic(container), when given, returns the bytes a container has
+    received from an already open stats stream (None if it has none), which
+    saves the sweep a stats request per store.
+    """
+
+    def __init__(self, engine, watcher, registry, containers, address, exclude=None, router=None, traffic=None,
+                 forget_address=None, idle_after=HIBERNATE_AFTER, sweep_interval=HIBERNATE_SWEEP_INTERVAL, wake_timeout=WAKE_TIMEOUT):
+        self.engine = engine
+        self.watcher = watcher
+        self.registry = registry
+        self.containers = containers
+        self.address = address
+        self.exclude = exclude or (lambda tenant: False)
+        self.router = router
+        self.traffic = traffic
+        self.forget_address = forget_address or (lambda container: None)
+        self.idle_after = idle_after
+        self.sweep_interval = sweep_interval
+        self.wake_timeout = wake_timeout
+        self._selector = selectors.DefaultSelector()
+        self._listeners = {}
+        self._sleeping = {}
+        self._held = {}
+        self._busy = set()
+        self._received = {}
+        self._started_at = time.time()
+        self._lock = threading.Lock()
+        self._threads = []
+        self.stats_counters = {
+            'hibernations': 0,
+            'wakes': 0,
+            'wake_failures': 0,
+            'held_connections': 0
+        }
+
+    def start(self):
+        """Re-open wake listeners for stores left hibernated and start the idle sweep"""
+        if self._threads:
+            return
+        accept = threading.Thread(target=self._accept_loop, name="wake-listener", daemon=True)
+        accept.start()
+        self._threads.append(accept)
+        if self.router:
+            self._listen(None, WAKE_PORT)
+        for tenant, port in self.registry.hibernated_tenants():
+            with self._lock:
+                self._sleeping[tenant] = port
+            if self.router:
+                continue
+            try:
+                self._listen(tenant, port)
+            except OSError as e:
+                print(f"⚠️  Could not listen on port {port} for hibernated {tenant}: {e}")
+        if self.idle_after > 0:
+            sweep = threading.Thread(target=self._sweep_loop, name="hibernation-sweep", daemon=True)
+            sweep.start()
+            self._threads.append(sweep)
+            print(f"😴 Hibernation enabled: stores stop after {self.idle_after}s without traffic")
+
+    def hibernated(self, tenant):
+        with self._lock:
+            return tenant in self._sleeping
+
+    def sweep(self, now=None):
+        """Record traffic on awake stores and hibernate the ones idle for too long"""
+        now = time.time() if now is None else now
+        for tenant, port, last_access in self.registry.awake_tenants():
+            with self._lock:
+                if tenant in self._busy:
+                    continue
+            if self.exclude(tenant):
+                continue
+            received = self._received_bytes(f'{tenant}_shop')
+            if received is None:
+                continue
+            previous = self._received.get(tenant)
+            self._received[tenant] = received
+            if previous is None:
+                # First sample since startup: traffic before it is unknown
+                last_access = max(last_access, self._started_at)
+            elif received != previous:
+                self.registry.touch(tenant, now)
+                last_access = now
+            if now - last_access >= self.idle_after:
+                try:
+                    self.hibernate(tenant, port)
+                except Exception as e:
+                    print(f"⚠️  Could not hibernate {tenant}: {e}")
+
+    def hibernate(self, tenant, port):
+        """Stop the tenant's containers and listen on its port (or the wake route) for the next visitor"""
+        with self._lock:
+            if tenant in self._busy or tenant in self._sleeping:
+                return False
+            self._busy.add(tenant)
+        try:
+            if self.router:
+                # Visitors fall through to the wake listener from now on
+                self.router.remove_route(tenant)
+            # Shop first so it never runs without its database
+            for name in reversed(self.containers(tenant)):
+                self.engine.stop_container(name)
+            if not self.router:
+                self._listen(tenant, port)
+            with self._lock:
+                self._sleeping[tenant] = port
+            self.registry.set_hibernated(tenant, time.time())
+            self._received.pop(tenant, None)
+            with self._lock:
+                self.stats_counters['hibernations'] += 1
+            print(f"😴 {tenant} hibernated")
+            return True
+        finally:
+            with self._lock:
+                self._busy.discard(tenant)
+
+    def wake(self, tenant):
+        """Start a hibernated store, wait until it is healthy and hand over held connections"""
+        with self._lock:
+            if tenant in self._busy or tenant not in self._sleeping:
+                return False
+            self._busy.add(tenant)
+            port = self._sleeping[tenant]
+        print(f"⏰ Waking {tenant}...")
+        started = time.time()
+        shop = f'{tenant}_shop'
+        healthy = False
+        try:
+            # Docker needs the port back before the shop container can publish it
+            self._close_listener(tenant)
+            for name in self.containers(tenant):
+                self.engine.start_container(name)
+            # Held connections go to the address the shop has now, not the one it had before it stopped
+            self.forget_address(shop)
+            healthy = bool(wait_until(
+                lambda: self.engine.health_status(shop) == 'healthy',
+                self.wake_timeout, self.watcher, shop
+            ))
+            if healthy and self.router:
+                self.router.add_route(tenant)
+                time.sleep(ROUTE_PROPAGATION_DELAY)
+        except Exception as e:
+            print(f"⚠️  Failed to wake {tenant}: {e}")
+            healthy = False
+
+        with self._lock:
+            held = self._held.pop(tenant, [])
+            self._busy.discard(tenant)
+            if healthy:
+                self._sleeping.pop(tenant, None)
+            self.stats_counters['wakes' if healthy else 'wake_failures'] += 1
+        if healthy:
+            self.registry.set_hibernated(tenant, None)
+            self.registry.touch(tenant, time.time())
+            print(f"✅ {tenant} awake after {time.time() - started:.1f}s, releasing {len(held)} held connection(s)")
+            for client, path in held:
+                if path is None:
+                    self._forward(client, shop)
+                    continue
+                try:
+                    client.sendall(_redirect_response(path))
+                except OSError:
+                    pass
+                client.close()
+            return True
+
+        for client, _ in held:
+            _drain(client)
+            try:
+                client.sendall(WAKE_FAILED_RESPONSE)
+            except OSError:
+                pass
+            client.close()
+        # Stay hibernated so the next visitor retries the wake-up
+        for name in reversed(self.containers(tenant)):
+            try:
+                self.engine.stop_container(name)
+            except Exception:
+                pass
+        if self.router:
+            return False
+        try:
+            self._listen(tenant, port)
+        except OSError as e:
+            print(f"⚠️  Could not listen on port {port} for {tenant}: {e}")
+        return False
+
+    def forget(self, tenant):
+        """Drop a removed tenant's listener and held connections"""
+        self._close_listener(tenant)
+        with self._lock:
+            held = self._held.pop(tenant, [])
+            self._sleeping.pop(tenant, None)
+        for client, _ in held:
+            client.close()
+        self._received.pop(tenant, None)
+
+    def stats(self):
+        with self._lock:
+            return dict(
+                self.stats_counters,
+                enabled=self.idle_after > 0,
+                idle_after=self.idle_after,
+                hibernated=len(self._sleeping),
+                waking=len(self._busy)
+            )
+
+    def _received_bytes(self, container):
+        received = self.traffic(container) if self.traffic else None
+        if received is not None:
+            return received
+        try:
+            stats = self.engine.container_stats(container)
+        except Exception as e:
+            print(f"⚠️  Could not read stats for {container}: {e}")
+            return None
+        if not stats:
+            return None
+        return sum(network.get('rx_bytes', 0) for network in (stats.get('networks') or {}).values())
+
+    def _listen(self, tenant, port):
+        listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        try:
+            listener.bind((WAKE_LISTEN_ADDRESS, port))
+            listener.listen(64)
+        except OSError:
+            listener.close()
+            raise
+        listener.setblocking(False)
+        with self._lock:
+            self._listeners[tenant] = listener
+        self._selector.register(listener, selectors.EVENT_READ, tenant)
+
+    def _close_listener(self, tenant):
+        with self._lock:
+            listener = self._listeners.pop(tenant, None)
+        if listener:
+            self._selector.unregister(listener)
+            listener.close()
+
+    def _accept_loop(self):
+        while True:
+            try:
+                events = self._selector.select(timeout=1)
+            except OSError:
+                continue
+            for key, _ in events:
+                tenant = key.data
+                try:
+                    client, _ = key.fileobj.accept()
+                except OSError:
+                    continue
+                client.setblocking(True)
+                if tenant is None:
+                    # Shared listener: the store is named by the request's Host header
+                    threading.Thread(target=self._route_visitor, args=(client,), daemon=True).start()
+                else:
+                    self._hold(tenant, client, None)
+
+    def _hold(self, tenant, client, path):
+        with self._lock:
+            self._held.setdefault(tenant, []).append((client, path))
+            self.stats_counters['held_connections'] += 1
+            waking = tenant in self._busy
+        if not waking:
+            threading.Thread(target=self.wake, args=(tenant,), name=f"wake-{tenant}", daemon=True).start()
+
+    def _route_visitor(self, client):
+        head = _read_request_head(client)
+        tenant = self.router.tenant_for_host(head[0]) if head else None
+        if tenant and self.hibernated(tenant):
+            client.settimeout(None)
+            self._hold(tenant, client, head[1])
+            return
+        try:
+            if tenant and self.registry.get(tenant):
+                # Woken a moment ago; give the router time to pick up the route
+                time.sleep(ROUTE_PROPAGATION_DELAY)
+                client.sendall(_redirect_response(head[1]))
+            else:
+                client.sendall(NOT_FOUND_RESPONSE)
+        except OSError:
+            pass
+        client.close()
+
+    def _forward(self, client, container):
+        try:
+            upstream = socket.create_connection((self.address(container), 80), timeout=10)
+        except (OSError, TypeError) as e:
+            print(f"⚠️  Could not forward a held connection to {container}: {e}")
+            client.close()
+            return
+        upstream.settimeout(None)
+        threading.Thread(target=_pipe, args=(client, upstream), daemon=True).start()
+
+    def _sweep_loop(self):
+        while True:
+            time.sleep(self.sweep_interval)
+            try:
+                self.sweep()
+            except Exception as e:
+                print(f"⚠️  Hibernation sweep failed: {e}")
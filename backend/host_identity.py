@@ -0,0 +1,111 @@
+import ipaddress
+import os
+import threading
+import time
+
+import requests
+
+SERVER_IP = os.getenv('SERVER_IP', '')
+HOST_IP_TTL = int(os.getenv('HOST_IP_TTL', 3600))
+FALLBACK_IP = 'localhost'
+
+GCP_METADATA_URL = 'http://metadata.google.internal/computeMetadata/v1/instance/network-interfaces/0/access-configs/0/external-ip'
+PUBLIC_IP_SERVICES = [
+    'https://icanhazip.com',
+    'https://api.ipify.org',
+    'https://checkip.amazonaws.com',
+    'https://ipinfo.io/ip'
+]
+
+
+def _valid_ip(text):
+    """Only IPv4: the address is used unbracketed in store domains and <ip>.nip.io hostnames"""
+    try:
+        ipaddress.IPv4Address(text)
+        return True
+    except ValueError:
+        return False
+
+
+def discover_public_ip(timeout=3):
+    """Look up this host's public IP (GCP metadata, then public IP services); None if nothing answers"""
+    try:
+        response = requests.get(GCP_METADATA_URL, headers={'Metadata-Flavor': 'Google'}, timeout=1)
+        ip = response.text.strip()
+        if _valid_ip(ip):
+            print(f"✅ Using GCP external IP: {ip}")
+            return ip
+    except Exception:
+        pass  # Not on GCP or metadata unavailable
+
+    for service in PUBLIC_IP_SERVICES:
+        try:
+            response = requests.get(service, timeout=timeout)
+            ip = response.text.strip()
+            if _valid_ip(ip):
+                print(f"✅ Using public IP from {service}: {ip}")
+                return ip
+        except Exception as e:
+            print(f"⚠️  Failed to get IP from {service}: {e}")
+    return None
+
+
+class HostIdentity:
+    """The address stores are published on, resolved once and refreshed in the background.
+
+    SERVER_IP wins when set; otherwise the public IP is discovered at
+    startup and re-checked every ttl seconds, so request handlers only
+    ever read the cached value.
+    """
+
+    def __init__(self, configured=SERVER_IP, ttl=HOST_IP_TTL):
+        self.configured = configured
+        self.ttl = ttl
+        self._ip = configured or None
+        self._source = 'SERVER_IP' if configured else None
+        self._resolved_at = time.time() if configured else None
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self):
+        """Resolve the address (unless SERVER_IP is set) and start the refresh loop"""
+        if self.configured or self._thread:
+            return
+        self.refresh()
+        self._thread = threading.Thread(target=self._refresh_loop, name="host-identity", daemon=True)
+        self._thread.start()
+
+    def refresh(self):
+        ip = discover_public_ip()
+        with self._lock:
+            if ip:
+                self._ip, self._source = ip, 'discovered'
+            elif self._ip is None:
+                print(f"🚨 Warning: No public IP found, using {FALLBACK_IP} fallback")
+                self._source = 'fallback'
+            # A failed refresh keeps the last known address
+            self._resolved_at = time.time()
+
+    def ip(self):
+        with self._lock:
+            return self._ip or FALLBACK_IP
+
+    def stats(self):
+        with self._lock:
+            return {
+                'ip': self._ip or FALLBACK_IP,
+                'source': self._source,
+                'resolved_at': self._resolved_at,
+                'ttl': None if self.configured else self.ttl
+            }
+
+    def _refresh_loop(self):
+        while True:
+            # Retry sooner while we are still on the fallback address
+            with self._lock:
+                delay = self.ttl if self._source == 'discovered' else min(self.ttl, 60)
+            time.sleep(delay)
+            try:
+                self.refresh()
+            except Exception as e:
+                print(f"⚠️  Host IP refresh failed: {e}")
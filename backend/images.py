@@ -0,0 +1,204 @@
+import os
+import re
+import threading
+import time
+
+PRESTASHOP_IMAGE = os.getenv('PRESTASHOP_IMAGE', 'prestashop/prestashop:8.1.6-apache')
+MYSQL_IMAGE = os.getenv('MYSQL_IMAGE', 'mysql:5.7')
+IMAGE_CHECK_INTERVAL = int(os.getenv('IMAGE_CHECK_INTERVAL', 60))  # seconds between checks that the images are still there
+IMAGE_PULL_TIMEOUT = int(os.getenv('IMAGE_PULL_TIMEOUT', 1800))
+IMAGE_PULL_RETRY = 30
+# Idle containers holding a reference to each image; `docker system prune -a` removes stopped
+# containers and then every image no container uses, so they keep running
+IMAGE_PIN_LABEL = 'saas.image-pin'
+IMAGE_PIN_MEMORY = 16 * 1024 * 1024
+
+DONE_STATUSES = ('Download complete', 'Pull complete', 'Already exists')
+
+
+class ImageUnavailableError(Exception):
+    """Raised when the images stores are created from can't be pulled"""
+
+
+class ImageCache:
+    """Keeps the images stores are created from pulled on every Docker node.
+
+    `docker system prune -a` removes images no container uses, so each
+    pulled image is pinned by an idle (sleeping) container created from
+    it, which is replaced whenever the tag points at a new image; pins of
+    images no longer configured are removed. Each node is still
+    checked at startup and every IMAGE_CHECK_INTERVAL seconds, and a
+    missing image is pulled in the background, once per node. Deployments
+    wait for their node's images in ensure() instead of each pulling them
+    while creating containers, and see the download progress.
+    A failed pull is retried every IMAGE_PULL_RETRY seconds; until one
+    succeeds, error(node) tells signups placed on that node to come back later.
+    """
+
+    def __init__(self, nodes, images, check_interval=IMAGE_CHECK_INTERVAL, pull_timeout=IMAGE_PULL_TIMEOUT):
+        self.nodes = nodes
+        self.images = list(images)
+        self.check_interval = check_interval
+        self.pull_timeout = pull_timeout
+        self._state = {
+            node.name: {
+                image: {'present': None, 'id': None, 'digest': None, 'pinned': False, 'progress': None, 'error': None}
+                for image in self.images
+            }
+            for node in nodes
+        }
+        self._condition = threading.Condition()
+        self._threads = []
+        self.pulls = 0
+        self.pull_failures = 0
+
+    def start(self):
+        if self._threads:
+            return
+        for node in self.nodes:
+            thread = threading.Thread(target=self._maintain, args=(node,), name=f"image-cache-{node.name}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def check(self, node, image):
+        """Make sure image is on node, pulling it if it is missing"""
+        info = node.engine.inspect_image(image)
+        if info:
+            self._set(node.name, image, present=True, id=info.get('Id'), digest=self._digest(info), progress=None, error=None)
+            self._pin(node, image, info['Id'])
+            return
+        self._set(node.name, image, present=False, progress=0.0, error=None)
+        print(f"📥 Pulling {image} on node {node.name}...")
+        started = time.time()
+        layers = {}
+        try:
+            for message in node.engine.pull_image(image, timeout=self.pull_timeout):
+                layer = message.get('id')
+                detail = message.get('progressDetail') or {}
+                if message.get('status') == 'Downloading' and detail.get('total'):
+                    layers[layer] = (detail.get('current', 0), detail['total'])
+                elif message.get('status') in DONE_STATUSES and layer in layers:
+                    layers[layer] = (layers[layer][1], layers[layer][1])
+                else:
+                    continue
+                progress = sum(current for current, _ in layers.values()) / sum(total for _, total in layers.values())
+                # The daemon reports every few KB; only pass on whole percents
+                if int(progress * 100) != int((self._get(node.name, image)['progress'] or 0) * 100):
+                    self._set(node.name, image, progress=progress)
+            info = node.engine.inspect_image(image)
+        except Exception as e:
+            with self._condition:
+                self.pull_failures += 1
+            self._set(node.name, image, progress=None, error=str(e))
+            raise
+        with self._condition:
+            self.pulls += 1
+        self._set(node.name, image, present=True, id=(info or {}).get('Id'), digest=self._digest(info or {}), progress=None, error=None)
+        print(f"✅ {image} ready on node {node.name} ({time.time() - started:.0f}s)")
+        if info:
+            self._pin(node, image, info['Id'])
+
+    @staticmethod
+    def _digest(info):
+        """The registry digest (repo@sha256:...) the image was pulled as; None for images built locally"""
+        return next(iter(info.get('RepoDigests') or []), None)
+
+    def _pin(self, node, image, image_id):
+        """Keep a sleeping container running on image_id so prunes leave the image alone"""
+        name = 'saas-image-pin-' + re.sub(r'[^a-zA-Z0-9_.-]', '-', image)
+        try:
+            pin = node.engine.inspect_container(name)
+            if pin is None or pin.get('Image') != image_id:
+                node.engine.remove_container(name)
+                node.engine.create_container(name, {
+                    'Image': image_id,
+                    'Entrypoint': ['sleep'],
+                    'Cmd': ['infinity'],
+                    'Labels': {IMAGE_PIN_LABEL: image},
+                    'HostConfig': {'NetworkMode': 'none', 'Memory': IMAGE_PIN_MEMORY, 'RestartPolicy': {'Name': 'unless-stopped'}}
+                })
+                pin = None
+                # A new pin usually means a new tag was configured; the previous tag's pin would hold its image forever
+                self._unpin_stale(node)
+            if pin is None or not pin['State'].get('Running'):
+                node.engine.start_container(name)
+            self._set(node.name, image, pinned=True)
+        except Exception as e:
+            self._set(node.name, image, pinned=False)
+            print(f"⚠️  Could not pin {image} on node {node.name}: {e}")
+
+    def _unpin_stale(self, node):
+        """Remove pins of images stores are no longer created from, so prunes can reclaim them"""
+        for container in node.engine.list_containers(all=True, label=IMAGE_PIN_LABEL):
+            image = (container.get('Labels') or {}).get(IMAGE_PIN_LABEL)
+            if image not in self.images:
+                node.engine.remove_container(container['Names'][0].lstrip('/'))
+                print(f"🧹 Unpinned {image} on node {node.name}")
+
+    def ready(self, node=None):
+        """Whether every image is on node (or on every node)"""
+        with self._condition:
+            names = [node] if node else list(self._state)
+            return all(state['present'] for name in names for state in self._state[name].values())
+
+    def error(self, node):
+        """Why a missing image could not be pulled on node, or None"""
+        with self._condition:
+            for image, state in self._state[node].items():
+                if state['error'] and not state['present']:
+                    return f"{image} could not be pulled on node {node}: {state['error']}"
+        return None
+
+    def ensure(self, node, on_wait=None, timeout=None):
+        """Block until node has every image, calling on_wait(progress 0-1) while downloads run.
+
+        Raises ImageUnavailableError when a pull fails or timeout passes.
+        """
+        deadline = time.time() + (timeout or self.pull_timeout)
+        reported = None
+        while True:
+            with self._condition:
+                states = list(self._state[node].values())
+                if all(state['present'] for state in states):
+                    return
+                failed = next((state['error'] for state in states if state['error'] and not state['present']), None)
+                progress = sum(1 if state['present'] else state['progress'] or 0 for state in states) / len(states)
+                if not failed and progress == reported:
+                    self._condition.wait(min(1, max(0, deadline - time.time())))
+            if failed:
+                raise ImageUnavailableError(f'Store images could not be pulled: {failed}')
+            if time.time() >= deadline:
+                raise ImageUnavailableError('Timed out waiting for store images to download')
+            if on_wait and progress != reported:
+                on_wait(progress)
+            reported = progress
+
+    def stats(self):
+        with self._condition:
+            return {
+                'ready': all(state['present'] for images in self._state.values() for state in images.values()),
+                'images': self.images,
+                'nodes': {name: {image: dict(state) for image, state in images.items()} for name, images in self._state.items()},
+                'pulls': self.pulls,
+                'pull_failures': self.pull_failures
+            }
+
+    def _get(self, node, image):
+        with self._condition:
+            return dict(self._state[node][image])
+
+    def _set(self, node, image, **fields):
+        with self._condition:
+            self._state[node][image].update(fields)
+            self._condition.notify_all()
+
+    def _maintain(self, node):
+        while True:
+            failed = False
+            for image in self.images:
+                try:
+                    self.check(node, image)
+                except Exception as e:
+                    failed = True
+                    print(f"⚠️  Could not make {image} available on node {node.name}: {e}")
+            time.sleep(IMAGE_PULL_RETRY if failed else self.check_interval)
@@ -0,0 +1,134 @@
+import os
+import re
+import threading
+import time
+
+from tenant_spec import PROJECT_LABEL
+
+INVENTORY_RESYNC_INTERVAL = int(os.getenv('INVENTORY_RESYNC_INTERVAL', 300))  # seconds between full listings per node
+
+HEALTH_STATUS = re.compile(r'\((?:health: )?(healthy|unhealthy|starting)\)')
+# Container state an event leaves behind; health_status and destroy are handled separately
+EVENT_STATES = {'create': 'created', 'start': 'running', 'unpause': 'running', 'pause': 'paused', 'die': 'exited', 'stop': 'exited'}
+
+
+class ContainerInventory:
+    """Every container on every Docker node, kept in memory for listings.
+
+    Each node is listed in full at startup, every INVENTORY_RESYNC_INTERVAL
+    seconds and whenever its events stream reconnects (events may have been
+    missed meanwhile). Between listings the Docker events followed by the
+    ContainerEventWatcher keep entries current, so reads never call Docker.
+    """
+
+    def __init__(self, nodes, watcher, resync_interval=INVENTORY_RESYNC_INTERVAL):
+        self.nodes = nodes
+        self.resync_interval = resync_interval
+        self._containers = {}
+        self._synced_at = {}
+        self._lock = threading.Lock()
+        self._resync = threading.Event()
+        self._thread = None
+        self.resyncs = 0
+        self.events = 0
+        watcher.subscribe(self._on_event, lambda index: self._resync.set())
+
+    def start(self):
+        if self._thread:
+            return
+        self._thread = threading.Thread(target=self._resync_loop, name='container-inventory', daemon=True)
+        self._thread.start()
+
+    def sync(self, node):
+        """Replace node's entries with a fresh listing, keeping entries events updated meanwhile"""
+        started = time.time()
+        listed = {}
+        for container in node.engine.list_containers(all=True):
+            status = container.get('Status') or ''
+            health = HEALTH_STATUS.search(status)
+            listed[container['Names'][0].lstrip('/')] = {
+                'project': (container.get('Labels') or {}).get(PROJECT_LABEL),
+                'state': container.get('State') or ('running' if status.startswith('Up') else 'exited'),
+                'health': health.group(1) if health else None,
+                'ports': sorted(p['PublicPort'] for p in container.get('Ports') or [] if p.get('PublicPort')),
+                'image': container.get('Image')
+            }
+        with self._lock:
+            for name, entry in list(self._containers.items()):
+                if entry['node'] == node.name and name not in listed and entry['updated_at'] < started:
+                    del self._containers[name]
+            for name, fields in listed.items():
+                entry = self._containers.get(name)
+                if entry and entry['updated_at'] >= started:
+                    continue
+                self._containers[name] = dict(fields, name=name, node=node.name, updated_at=started)
+            self._synced_at[node.name] = started
+            self.resyncs += 1
+
+    def get(self, name):
+        with self._lock:
+            entry = self._containers.get(name)
+            return dict(entry) if entry else None
+
+    def containers(self, project=None):
+        """Entries sorted by name, optionally only those of one compose project (tenant)"""
+        with self._lock:
+            entries = [dict(entry) for entry in self._containers.values() if project is None or entry['project'] == project]
+        return sorted(entries, key=lambda entry: entry['name'])
+
+    def by_project(self):
+        """{project: entries} for every container with a compose project label"""
+        projects = {}
+        for entry in self.containers():
+            if entry['project']:
+                projects.setdefault(entry['project'], []).append(entry)
+        return projects
+
+    def stats(self):
+        with self._lock:
+            states = {}
+            for entry in self._containers.values():
+                states[entry['state']] = states.get(entry['state'], 0) + 1
+            return {
+                'containers': len(self._containers),
+                'states': states,
+                'synced_at': dict(self._synced_at),
+                'resyncs': self.resyncs,
+                'events': self.events
+            }
+
+    def _on_event(self, index, event):
+        attributes = event.get('Actor', {}).get('Attributes', {})
+        name = attributes['name']
+        action = event.get('Action') or event.get('status') or ''
+        now = time.time()
+        with self._lock:
+            self.events += 1
+            if action == 'destroy':
+                self._containers.pop(name, None)
+                return
+            entry = self._containers.get(name)
+            if entry is None:
+                entry = self._containers[name] = {
+                    'name': name, 'node': self.nodes[index].name, 'project': None,
+                    'state': 'created', 'health': None, 'ports': [], 'image': attributes.get('image')
+                }
+            entry['project'] = attributes.get(PROJECT_LABEL) or entry['project']
+            entry['updated_at'] = now
+            if action.startswith('health_status'):
+                entry['health'] = action.split(':', 1)[-1].strip()
+            elif action in EVENT_STATES:
+                entry['state'] = EVENT_STATES[action]
+                if action == 'start' and entry['health']:
+                    # A restarted container reports health from scratch
+                    entry['health'] = 'starting'
+
+    def _resync_loop(self):
+        while True:
+            for node in self.nodes:
+                try:
+                    self.sync(node)
+                except Exception as e:
+                    print(f"⚠️  Could not list containers on node {node.name}: {e}")
+            self._resync.wait(self.resync_interval)
+            self._resync.clear()
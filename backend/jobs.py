@@ -0,0 +1,191 @@
+import os
+import queue
+import threading
+import time
+
+PROVISION_WORKERS = int(os.getenv('PROVISION_WORKERS', 4))
+PROVISION_QUEUE_LIMIT = int(os.getenv('PROVISION_QUEUE_LIMIT', 20))
+# Deployments allowed in a database-heavy phase (installer or dump import) at once; 0 = no limit
+DB_PHASE_CONCURRENCY = int(os.getenv('DB_PHASE_CONCURRENCY', 2))
+
+
+class QueueFullError(Exception):
+    """Raised when the provisioning queue has reached its depth limit"""
+
+
+class ProvisioningQueue:
+    """Bounded worker pool that runs store provisioning jobs off the request thread"""
+
+    def __init__(self, workers=PROVISION_WORKERS, max_depth=PROVISION_QUEUE_LIMIT):
+        self.workers = max(1, workers)
+        self.max_depth = max(0, max_depth)
+        self._queue = queue.Queue()
+        self._jobs = {}
+        self._waiting = []
+        self._reserved = 0  # places held for jobs a batch is about to submit
+        self._running = 0
+        self._lock = threading.Lock()
+        self._threads = []
+
+    def start(self):
+        """Start the worker threads (idempotent)"""
+        with self._lock:
+            if self._threads:
+                return
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._worker, name=f"provision-worker-{i+1}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+        print(f"👷 Started {self.workers} provisioning workers (queue limit {self.max_depth})")
+
+    def reserve(self, count):
+        """Hold count places for jobs submitted with reserved=True, raising QueueFullError if they don't all fit"""
+        with self._lock:
+            if len(self._waiting) + self._reserved + count > self.max_depth + max(0, self.workers - self._running):
+                raise QueueFullError(f"Provisioning queue can't take {count} more jobs ({self.max_depth} may wait)")
+            self._reserved += count
+
+    def unreserve(self, count):
+        """Give back places reserved for jobs that were never submitted"""
+        with self._lock:
+            self._reserved = max(0, self._reserved - count)
+
+    def submit(self, tenant, fn, *args, reserved=False, **kwargs):
+        """Enqueue a job for tenant, raising QueueFullError when the queue is saturated.
+
+        reserved uses a place held by reserve() (batch jobs).
+        """
+        self.start()
+        with self._lock:
+            # Jobs that an idle worker will pick up straight away don't count against the limit
+            idle_workers = max(0, self.workers - self._running)
+            if reserved:
+                self._reserved = max(0, self._reserved - 1)
+            elif len(self._waiting) + self._reserved >= self.max_depth + idle_workers:
+                raise QueueFullError(f"Provisioning queue is full ({self.max_depth} jobs waiting)")
+            job = {
+                'tenant': tenant,
+                'state': 'queued',  # queued, running, completed, error
+                'queued_at': time.time(),
+                'started_at': None,
+                'finished_at': None,
+                'error': None
+            }
+            self._jobs[tenant] = job
+            self._waiting.append(tenant)
+        self._queue.put((tenant, fn, args, kwargs))
+        return self.get(tenant)
+
+    def get(self, tenant):
+        """Return a snapshot of a job's state, including its queue position"""
+        with self._lock:
+            job = self._jobs.get(tenant)
+            if job is None:
+                return None
+            snapshot = dict(job)
+            if tenant in self._waiting:
+                snapshot['queue_position'] = self._waiting.index(tenant) + 1
+            return snapshot
+
+    def jobs(self):
+        """Snapshots of the jobs that are queued or running, by tenant"""
+        with self._lock:
+            tenants = [tenant for tenant, job in self._jobs.items() if job['state'] in ('queued', 'running')]
+        snapshots = {tenant: self.get(tenant) for tenant in tenants}
+        return {tenant: job for tenant, job in snapshots.items() if job}
+
+    def forget(self, tenant):
+        """Drop a finished job's bookkeeping"""
+        with self._lock:
+            job = self._jobs.get(tenant)
+            if job and job['state'] in ('completed', 'error'):
+                del self._jobs[tenant]
+
+    def idle_workers(self):
+        """Workers that would start a newly submitted job immediately"""
+        with self._lock:
+            return max(0, self.workers - self._running - len(self._waiting) - self._reserved)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'workers': self.workers,
+                'queue_limit': self.max_depth,
+                'queued': len(self._waiting),
+                'reserved': self._reserved,
+                'running': self._running
+            }
+
+    def _worker(self):
+        while True:
+            tenant, fn, args, kwargs = self._queue.get()
+            with self._lock:
+                job = self._jobs[tenant]
+                self._waiting.remove(tenant)
+                job['state'] = 'running'
+                job['started_at'] = time.time()
+                self._running += 1
+            try:
+                fn(*args, **kwargs)
+                state, error = 'completed', None
+            except Exception as e:
+                print(f"❌ Provisioning job for {tenant} failed: {e}")
+                state, error = 'error', str(e)
+            with self._lock:
+                job['state'] = state
+                job['error'] = error
+                job['finished_at'] = time.time()
+                self._running -= 1
+            self._queue.task_done()
+
+
+class PhaseSlots:
+    """Caps how many deployments are in a resource-heavy phase at the same time.
+
+    Other phases (image pulls, container creation, file copies) keep
+    overlapping freely; only the section between acquire() and release()
+    waits for a slot. With a gate, a further slot is only handed out while
+    gate() returns True (re-checked every recheck_interval seconds); the
+    first slot is always granted so work never stalls completely.
+    """
+
+    def __init__(self, size=DB_PHASE_CONCURRENCY, gate=None, recheck_interval=1.0):
+        self.size = max(0, size)
+        self.gate = gate
+        self.recheck_interval = recheck_interval
+        self._holders = set()
+        self._waiting = 0
+        self._condition = threading.Condition()
+
+    def acquire(self, tenant, on_wait=None):
+        """Block until tenant holds a slot; on_wait() is called once if it has to wait"""
+        with self._condition:
+            if tenant in self._holders:
+                return
+            full = self._full()
+        if full and on_wait:
+            on_wait()
+        with self._condition:
+            self._waiting += 1
+            try:
+                while self._full():
+                    self._condition.wait(self.recheck_interval if self.gate else None)
+            finally:
+                self._waiting -= 1
+            self._holders.add(tenant)
+
+    def _full(self):
+        if self.size and len(self._holders) >= self.size:
+            return True
+        return bool(self._holders) and self.gate is not None and not self.gate()
+
+    def release(self, tenant):
+        """Give tenant's slot back (no-op if it holds none)"""
+        with self._condition:
+            if tenant in self._holders:
+                self._holders.discard(tenant)
+                self._condition.notify()
+
+    def stats(self):
+        with self._condition:
+            return {'size': self.size, 'in_use': len(self._holders), 'waiting': self._waiting}
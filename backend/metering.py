@@ -0,0 +1,282 @@
+import os
+import threading
+import time
+
+from tenant_spec import PROJECT_LABEL
+
+METERING_RESOLUTION = int(os.getenv('METERING_RESOLUTION', 10))  # seconds per stored sample
+METERING_WINDOW = int(os.getenv('METERING_WINDOW', 3600))  # seconds of history kept in the registry
+METERING_RECONCILE_INTERVAL = int(os.getenv('METERING_RECONCILE_INTERVAL', 60))  # seconds between checks for unmetered containers
+METERING_SUMMARY_WINDOW = int(os.getenv('METERING_SUMMARY_WINDOW', 300))  # default window of usage summaries and top consumers
+
+# The containers metered for a tenant, by name suffix
+SERVICES = {'_shop': 'shop', '_db': 'db'}
+METRICS = ('cpu', 'memory', 'network', 'disk')
+
+
+def tenant_service(name, project):
+    """(tenant, service) for one of a tenant's own containers, else None"""
+    for suffix, service in SERVICES.items():
+        if name.endswith(suffix) and project and name[:-len(suffix)] == project:
+            return project, service
+    return None
+
+
+def parse_sample(sample):
+    """Cores in use, memory without page cache, and cumulative network and block I/O bytes of a stats sample"""
+    cpu, precpu = sample.get('cpu_stats') or {}, sample.get('precpu_stats') or {}
+    cores = None
+    if precpu.get('system_cpu_usage'):
+        cpu_delta = cpu['cpu_usage']['total_usage'] - precpu['cpu_usage']['total_usage']
+        system_delta = cpu['system_cpu_usage'] - precpu['system_cpu_usage']
+        online = cpu.get('online_cpus') or len(cpu['cpu_usage'].get('percpu_usage') or []) or 1
+        cores = max(0.0, cpu_delta / system_delta * online) if system_delta > 0 else 0.0
+    memory_stats = sample.get('memory_stats') or {}
+    stats = memory_stats.get('stats') or {}
+    # cgroup v2 reports inactive_file, v1 total_inactive_file; both are reclaimable cache
+    cache = stats.get('inactive_file', stats.get('total_inactive_file', 0))
+    networks = (sample.get('networks') or {}).values()
+    blkio = (sample.get('blkio_stats') or {}).get('io_service_bytes_recursive') or []
+    return {
+        'cores': cores,
+        'memory': max(0, memory_stats.get('usage', 0) - cache),
+        'net_rx': sum(network.get('rx_bytes', 0) for network in networks),
+        'net_tx': sum(network.get('tx_bytes', 0) for network in networks),
+        'disk_read': sum(entry['value'] for entry in blkio if entry.get('op', '').lower() == 'read'),
+        'disk_write': sum(entry['value'] for entry in blkio if entry.get('op', '').lower() == 'write')
+    }
+
+
+class _Series:
+    """One tenant's usage: the bucket being filled plus closed buckets not yet written to the registry"""
+
+    COUNTERS = ('net_rx', 'net_tx', 'disk_read', 'disk_write')
+
+    def __init__(self):
+        # (start, average cores, peak memory bytes, net_rx, net_tx, disk_read, disk_write bytes per second)
+        self.closed = []
+        self.current = None
+        self.memory = {}  # container -> latest memory, summed for the tenant's memory
+        self.cores = {}  # container -> latest cores
+
+    def add(self, start, resolution, container, cores, seconds, memory, deltas):
+        if self.current and self.current['start'] != start:
+            self.close(resolution)
+        if self.current is None:
+            self.current = dict({counter: 0 for counter in self.COUNTERS}, start=start, cpu_seconds=0.0, memory=0)
+        self.current['cpu_seconds'] += cores * seconds
+        self.memory[container] = memory
+        self.cores[container] = cores
+        self.current['memory'] = max(self.current['memory'], sum(self.memory.values()))
+        for counter, delta in deltas.items():
+            self.current[counter] += delta
+
+    def close(self, resolution):
+        self.closed.append(self._row(resolution))
+        self.current = None
+
+    def drain(self, resolution, now):
+        """Rows of the buckets closed since the last drain and of the open bucket so far"""
+        if self.current and now >= self.current['start'] + resolution:
+            self.close(resolution)
+        rows, self.closed = self.closed, []
+        if self.current:
+            # The open bucket only covers the time since it started
+            rows.append(self._row(max(1.0, now - self.current['start'])))
+        return rows
+
+    def _row(self, seconds):
+        current = self.current
+        return (current['start'], current['cpu_seconds'] / seconds, current['memory']) + tuple(
+            current[counter] / seconds for counter in self.COUNTERS
+        )
+
+
+class ResourceMeter:
+    """Per-tenant CPU, memory, network and disk usage from the Docker stats stream.
+
+    The leader follows every running `{tenant}_shop` / `{tenant}_db`
+    container over one long-lived stats connection, opened when the
+    container starts (seen on the event stream) or when the periodic
+    reconcile finds it unmetered, and closed by the daemon when the
+    container stops. Samples (about one a second) are folded into
+    METERING_RESOLUTION buckets, which it writes to the registry every
+    METERING_RESOLUTION seconds along with the latest readings; usage
+    queries read them from there in any worker, and samples older than
+    METERING_WINDOW are dropped.
+    """
+
+    def __init__(self, nodes, watcher, inventory, registry, resolution=METERING_RESOLUTION, window=METERING_WINDOW,
+                 reconcile_interval=METERING_RECONCILE_INTERVAL):
+        self.nodes = nodes
+        self.inventory = inventory
+        self.registry = registry
+        self.resolution = max(1, resolution)
+        self.window = max(1, window // self.resolution) * self.resolution
+        self.reconcile_interval = reconcile_interval
+        self._nodes_by_name = {node.name: node for node in nodes}
+        self._streams = {}  # container -> tenant
+        self._last = {}  # container -> (time, parsed sample) of its previous sample
+        self._series = {}
+        self._lock = threading.Lock()
+        self._reconcile = threading.Event()
+        self._thread = None
+        self.samples = 0
+        self.stream_errors = 0
+        self.flush_errors = 0
+        watcher.subscribe(self._on_event, lambda index: self._reconcile.set())
+
+    def start(self):
+        if self._thread:
+            return
+        self._thread = threading.Thread(target=self._reconcile_loop, name='metering-reconcile', daemon=True)
+        self._thread.start()
+        threading.Thread(target=self._flush_loop, name='metering-flush', daemon=True).start()
+        print(f"📈 Metering tenant containers ({self.resolution}s resolution, {self.window}s window)")
+
+    def follow(self, node, name, project):
+        """Open a stats stream for one of a tenant's containers unless one is open already"""
+        owner = tenant_service(name, project)
+        if owner is None:
+            return
+        with self._lock:
+            if name in self._streams:
+                return
+            self._streams[name] = owner[0]
+        threading.Thread(target=self._stream, args=(node, name, owner[0]), name=f'stats-{name}', daemon=True).start()
+
+    def usage(self, tenant, window=None):
+        """A tenant's series over the last window seconds and its latest per-container readings, or None"""
+        samples = self.registry.usage_samples(tenant, time.time() - (window or self.window))
+        current = self.registry.usage_current(tenant)
+        if not samples and not current:
+            return None
+        return {
+            'tenant_id': tenant,
+            'resolution': self.resolution,
+            'current': {
+                container: {'cpu': round(reading['cpu'], 3), 'memory': reading['memory']}
+                for container, reading in current.items()
+            },
+            'series': [
+                {
+                    'at': sample['at'], 'cpu': round(sample['cpu'], 3), 'memory': sample['memory'],
+                    'net_rx': round(sample['net_rx']), 'net_tx': round(sample['net_tx']),
+                    'disk_read': round(sample['disk_read']), 'disk_write': round(sample['disk_write'])
+                }
+                for sample in samples
+            ]
+        }
+
+    def summary(self, tenant, window):
+        """Average cores, peak memory and average network/disk bytes per second over the window"""
+        rows = self.registry.usage_summaries(time.time() - window, tenant=tenant)
+        return self._summary(rows[0]) if rows else None
+
+    def top(self, metric, limit, window):
+        """The limit tenants using the most of metric (cpu, memory, network or disk) over the window"""
+        if metric not in METRICS:
+            raise ValueError(f'metric must be one of {", ".join(METRICS)}')
+        rows = self.registry.usage_summaries(time.time() - window, order=metric, limit=limit)
+        return [dict(self._summary(row), tenant_id=row['tenant']) for row in rows]
+
+    @staticmethod
+    def _summary(row):
+        return {'cpu': round(row['cpu'], 3), 'memory': row['memory'], 'network': round(row['network']), 'disk': round(row['disk'])}
+
+    def received_bytes(self, container):
+        """Bytes the container has received according to its open stats stream, or None if it isn't metered"""
+        with self._lock:
+            if container not in self._streams or container not in self._last:
+                return None
+            return self._last[container][1]['net_rx']
+
+    def forget(self, tenant):
+        with self._lock:
+            self._series.pop(tenant, None)
+        self.registry.forget_usage(tenant)
+
+    def flush(self):
+        """Write every tenant's new and open buckets and the latest readings to the registry"""
+        now = time.time()
+        samples, current = [], []
+        with self._lock:
+            for tenant, series in list(self._series.items()):
+                samples.extend((tenant,) + row for row in series.drain(self.resolution, now))
+                current.extend((container, tenant, series.cores[container], series.memory[container]) for container in series.memory)
+                if series.current is None and not series.memory:
+                    del self._series[tenant]
+        self.registry.record_usage(samples, current, now - self.window)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'streams': len(self._streams),
+                'tenants': len(self._series),
+                'resolution': self.resolution,
+                'window': self.window,
+                'samples': self.samples,
+                'stream_errors': self.stream_errors,
+                'flush_errors': self.flush_errors
+            }
+
+    def _record(self, tenant, container, sample):
+        now = time.time()
+        parsed = parse_sample(sample)
+        with self._lock:
+            self.samples += 1
+            previous = self._last.get(container)
+            self._last[container] = (now, parsed)
+            if previous is None or parsed['cores'] is None:
+                return  # the first sample of a stream only sets the baseline
+            seconds = now - previous[0]
+            # Counters restart from zero with the container; a drop means no usage is known for this interval
+            deltas = {counter: max(0, parsed[counter] - previous[1][counter]) for counter in _Series.COUNTERS}
+            series = self._series.get(tenant)
+            if series is None:
+                series = self._series[tenant] = _Series()
+            start = int(now // self.resolution * self.resolution)
+            series.add(start, self.resolution, container, parsed['cores'], seconds, parsed['memory'], deltas)
+
+    def _stream(self, node, name, tenant):
+        try:
+            for sample in node.engine.stream_stats(name):
+                self._record(tenant, name, sample)
+        except Exception as e:
+            with self._lock:
+                self.stream_errors += 1
+            print(f"⚠️  Stats stream for {name} ended: {e}")
+        finally:
+            with self._lock:
+                self._streams.pop(name, None)
+                self._last.pop(name, None)
+                series = self._series.get(tenant)
+                if series:
+                    # A stopped container uses nothing until its next stream
+                    series.memory.pop(name, None)
+                    series.cores.pop(name, None)
+
+    def _on_event(self, index, event):
+        # Other workers see the same events, but only the leader (which started the meter) opens streams
+        if self._thread is None or (event.get('Action') or event.get('status')) != 'start':
+            return
+        attributes = event.get('Actor', {}).get('Attributes', {})
+        self.follow(self.nodes[index], attributes.get('name', ''), attributes.get(PROJECT_LABEL))
+
+    def _reconcile_loop(self):
+        while True:
+            for entry in self.inventory.containers():
+                node = self._nodes_by_name.get(entry['node'])
+                if entry['state'] == 'running' and node:
+                    self.follow(node, entry['name'], entry['project'])
+            self._reconcile.wait(self.reconcile_interval)
+            self._reconcile.clear()
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(self.resolution)
+            try:
+                self.flush()
+            except Exception as e:
+                self.flush_errors += 1
+                print(f"⚠️  Could not write usage to the registry: {e}")
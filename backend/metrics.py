@@ -0,0 +1,206 @@
+import bisect
+import threading
+import time
+
+PHASE_BUCKETS = (0.1, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 90, 120, 180, 300, 600)
+DOCKER_CALL_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 180)
+# Stages that end a deployment; they close the last phase instead of opening a new one
+FINAL_STAGES = ('completed', 'error')
+
+
+def _format_labels(names, values):
+    if not names:
+        return ''
+    pairs = []
+    for name, value in zip(names, values):
+        escaped = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        pairs.append(f'{name}="{escaped}"')
+    return '{' + ','.join(pairs) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} counter']
+        with self._lock:
+            for label_values, value in sorted(self._values.items()):
+                lines.append(f'{self.name}{_format_labels(self.labels, label_values)} {_format_value(value)}')
+        return lines
+
+
+class Gauge:
+    """A gauge whose samples are read from a callback at scrape time"""
+
+    def __init__(self, name, documentation, collect, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.collect = collect
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} gauge']
+        samples = self.collect()
+        if not self.labels:
+            samples = {(): samples}
+        for label_values, value in sorted(samples.items()):
+            if not isinstance(label_values, tuple):
+                label_values = (label_values,)
+            lines.append(f'{self.name}{_format_labels(self.labels, label_values)} {_format_value(value)}')
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, documentation, labels=(), buckets=PHASE_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = {'counts': [0] * (len(self.buckets) + 1), 'sum': 0.0}
+            series['counts'][bisect.bisect_left(self.buckets, value)] += 1
+            series['sum'] += value
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            for label_values, series in sorted(self._series.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets + (float('inf'),), series['counts']):
+                    cumulative += count
+                    labels = _format_labels(self.labels + ('le',), label_values + (_format_value(bound),))
+                    lines.append(f'{self.name}_bucket{labels} {cumulative}')
+                labels = _format_labels(self.labels, label_values)
+                lines.append(f'{self.name}_sum{labels} {series["sum"]}')
+                lines.append(f'{self.name}_count{labels} {cumulative}')
+        return lines
+
+
+class MetricsRegistry:
+    """Holds metrics and renders them in the Prometheus text exposition format"""
+
+    CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, documentation, labels=()):
+        return self.register(Counter(name, documentation, labels))
+
+    def gauge(self, name, documentation, collect, labels=()):
+        return self.register(Gauge(name, documentation, collect, labels))
+
+    def histogram(self, name, documentation, labels=(), buckets=PHASE_BUCKETS):
+        return self.register(Histogram(name, documentation, labels, buckets))
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            try:
+                lines.extend(metric.render())
+            except Exception as e:
+                lines.append(f'# {metric.name} unavailable: {e}')
+        return '\n'.join(lines) + '\n'
+
+
+class PhaseTracker:
+    """Turns the stream of progress stages into per-phase durations.
+
+    Repeated updates for the same stage extend the current phase; a new
+    stage closes it and observes its duration, and a final stage closes the
+    deployment as a whole.
+    """
+
+    def __init__(self, phase_seconds, deployment_seconds, failures):
+        self.phase_seconds = phase_seconds
+        self.deployment_seconds = deployment_seconds
+        self.failures = failures
+        self._current = {}
+        self._lock = threading.Lock()
+
+    def record(self, tenant, stage, now=None):
+        now = time.time() if now is None else now
+        with self._lock:
+            current = self._current.get(tenant)
+            if current and current['phase'] == stage:
+                return
+            if current:
+                self.phase_seconds.observe(now - current['since'], current['phase'])
+            if stage in FINAL_STAGES:
+                self._current.pop(tenant, None)
+                if current:
+                    self.deployment_seconds.observe(now - current['started'], stage)
+                    if stage == 'error':
+                        self.failures.inc(current['phase'])
+                return
+            self._current[tenant] = {
+                'phase': stage,
+                'since': now,
+                'started': current['started'] if current else now
+            }
+
+    def active(self):
+        """Deployments in flight, by current phase"""
+        with self._lock:
+            counts = {}
+            for current in self._current.values():
+                counts[current['phase']] = counts.get(current['phase'], 0) + 1
+            return counts
+
+    def forget(self, tenant):
+        with self._lock:
+            self._current.pop(tenant, None)
+
+
+class InstrumentedEngine:
+    """Wraps a Docker engine, counting and timing every call by operation"""
+
+    UNTIMED = ('events', 'pull_image', 'stream_stats')
+
+    def __init__(self, engine, calls, call_seconds):
+        self._engine = engine
+        self._calls = calls
+        self._call_seconds = call_seconds
+
+    def __getattr__(self, name):
+        attribute = getattr(self._engine, name)
+        if not callable(attribute) or name.startswith('_') or name in self.UNTIMED:
+            return attribute
+
+        def timed(*args, **kwargs):
+            started = time.monotonic()
+            outcome = 'error'
+            try:
+                result = attribute(*args, **kwargs)
+                # compose() shells out to docker-compose and reports failure through its exit code
+                outcome = 'error' if getattr(result, 'returncode', 0) else 'ok'
+                return result
+            finally:
+                self._calls.inc(name, outcome)
+                self._call_seconds.observe(time.monotonic() - started, name)
+        return timed
@@ -0,0 +1,215 @@
+import json
+import os
+import threading
+from urllib.parse import urlparse
+
+from admission import HostSaturatedError
+from docker_engine import get_engine
+from port_allocator import PORT_RANGE_SIZE, PortAllocator
+
+# JSON list of Docker endpoints stores can be placed on, e.g.
+# [{"name": "local"}, {"name": "node2", "url": "tcp://10.0.0.12:2375", "public_ip": "203.0.113.12", "max_tenants": 150}]
+# Empty means a single node on the local engine. The first node is the primary.
+DOCKER_NODES = os.getenv('DOCKER_NODES', '')
+PLACEMENT_STRATEGY = os.getenv('PLACEMENT_STRATEGY', 'least_loaded')  # least_loaded, binpack
+
+STRATEGIES = ('least_loaded', 'binpack')
+
+
+class NodesFullError(HostSaturatedError):
+    """Raised when no Docker node can take another store"""
+
+
+class Node:
+    """A Docker endpoint stores can be placed on, with its own host port range"""
+
+    def __init__(self, name, url, engine, ports, public_ip=None, max_tenants=0, drain=False):
+        self.name = name
+        self.url = url
+        self.engine = engine
+        self.ports = ports
+        self.public_ip = public_ip
+        self.max_tenants = max_tenants
+        self.drain = drain
+        self.tenants = 0
+
+    def has_room(self):
+        return not self.drain and (not self.max_tenants or self.tenants < self.max_tenants)
+
+    def load(self):
+        """Share of max_tenants in use, or the store count for nodes without a limit"""
+        return self.tenants / self.max_tenants if self.max_tenants else self.tenants
+
+    def stats(self):
+        return {
+            'name': self.name,
+            'url': self.url or 'local',
+            'tenants': self.tenants,
+            'max_tenants': self.max_tenants or None,
+            'drain': self.drain,
+            'ports': self.ports.stats()
+        }
+
+
+def load_nodes(tenants_dir, base_port, wrap=None, config=DOCKER_NODES, registry=None):
+    """Build the nodes listed in DOCKER_NODES; wrap(engine) decorates each node's engine.
+
+    Port reservations are kept in registry (a TenantRegistry), per node.
+    """
+    entries = json.loads(config) if config else [{'name': 'local'}]
+    names = [entry.get('name') for entry in entries]
+    if not entries or not all(names) or len(set(names)) != len(names):
+        raise ValueError('DOCKER_NODES needs at least one node and a unique name for each')
+    wrap = wrap or (lambda engine: engine)
+    nodes = []
+    for index, entry in enumerate(entries):
+        url = entry.get('url', '')
+        remote = url.startswith('tcp://')
+        # JSON ledgers written by older releases, imported into the registry on first start
+        ledger = '.ports.json' if index == 0 else f".ports-{entry['name']}.json"
+        ports = PortAllocator(
+            int(entry.get('base_port', base_port)),
+            int(entry.get('port_range', PORT_RANGE_SIZE)),
+            registry,
+            entry['name'],
+            probe=not remote,
+            legacy_path=os.path.join(tenants_dir, ledger)
+        )
+        nodes.append(Node(
+            entry['name'], url, wrap(get_engine(url)), ports,
+            public_ip=entry.get('public_ip') or (urlparse(url).hostname if remote else None),
+            max_tenants=int(entry.get('max_tenants', 0)),
+            drain=bool(entry.get('drain'))
+        ))
+    return nodes
+
+
+class NodePool:
+    """Places stores on Docker nodes and remembers which node owns each one.
+
+    least_loaded picks the node using the smallest share of its
+    max_tenants (the fewest stores when nodes have no limit); binpack
+    fills nodes in DOCKER_NODES order, so later nodes only take stores
+    once earlier ones are full. Draining nodes keep their stores but get
+    no new ones. The shared database, edge router and wake listeners run
+    on the primary node, so with pinned set every store goes there.
+    """
+
+    def __init__(self, nodes, registry, strategy=PLACEMENT_STRATEGY, pinned=False):
+        if strategy not in STRATEGIES:
+            raise ValueError(f'PLACEMENT_STRATEGY must be one of {", ".join(STRATEGIES)}')
+        self.nodes = nodes
+        self.by_name = {node.name: node for node in nodes}
+        self.primary = nodes[0]
+        self.registry = registry
+        self.strategy = strategy
+        self.pinned = pinned
+        self._owner = {}
+        self._lock = threading.Lock()
+
+    def load(self, tenants):
+        """Restore placements from the registry; tenants without one predate multi-node and are on the primary"""
+        placements = self.registry.placements()
+        with self._lock:
+            self._owner = {}
+            for node in self.nodes:
+                node.tenants = 0
+            for tenant in set(tenants) | set(placements):
+                node = self.by_name.get(placements.get(tenant), self.primary)
+                if tenant in placements and placements[tenant] not in self.by_name:
+                    print(f"⚠️  {tenant} is on unknown node {placements[tenant]}; assuming {node.name}")
+                self._owner[tenant] = node
+                node.tenants += 1
+
+    def place(self, tenant):
+        """Pick a node for a new tenant and record it; raises NodesFullError when none has room"""
+        with self._lock:
+            candidates = [node for node in ([self.primary] if self.pinned else self.nodes) if node.has_room()]
+            if not candidates:
+                raise NodesFullError('Every Docker node is at its store limit')
+            if self.strategy == 'binpack':
+                node = candidates[0]
+            else:
+                # min() keeps DOCKER_NODES order on ties
+                node = min(candidates, key=lambda candidate: candidate.load())
+            self._owner[tenant] = node
+            node.tenants += 1
+        self.registry.update(tenant, node=node.name)
+        if len(self.nodes) > 1:
+            print(f"🖥️  {tenant} placed on node {node.name}")
+        return node
+
+    def forget(self, tenant):
+        with self._lock:
+            node = self._owner.pop(tenant, None)
+            if node:
+                node.tenants -= 1
+
+    def node_of(self, tenant):
+        with self._lock:
+            return self._owner.get(tenant, self.primary)
+
+    def engine_for(self, tenant):
+        return self.node_of(tenant).engine
+
+    def ports(self, tenant):
+        """The port allocator of the tenant's node"""
+        return self.node_of(tenant).ports
+
+    def on_primary(self, tenant):
+        return self.node_of(tenant) is self.primary
+
+    def public_ip(self, tenant):
+        """The configured public address of the tenant's node, or None for the backend's own host"""
+        return self.node_of(tenant).public_ip
+
+    def has_room(self):
+        with self._lock:
+            return any(node.has_room() for node in ([self.primary] if self.pinned else self.nodes))
+
+    def stats(self):
+        with self._lock:
+            return {
+                'strategy': self.strategy,
+                'pinned': self.pinned,
+                'nodes': [node.stats() for node in self.nodes]
+            }
+
+
+class RoutedEngine:
+    """Engine that sends each call to the node owning the container or compose project it names.
+
+    Container names (tenant7_shop) and project directories (tenants/tenant7)
+    map to their tenant; anything else, such as the shared database or the
+    edge router, lives on the primary node. Events are followed per node
+    by the ContainerEventWatcher instead.
+    """
+
+    def __init__(self, pool):
+        self.pool = pool
+
+    def _engine(self, target):
+        if os.sep in target:
+            tenant = os.path.basename(target.rstrip(os.sep))
+        else:
+            tenant = target.rsplit('_', 1)[0]
+        return self.pool.engine_for(tenant)
+
+    def ping(self):
+        return all(node.engine.ping() for node in self.pool.nodes)
+
+    def list_containers(self, all=False, name=None):
+        if name:
+            return self._engine(name).list_containers(all=all, name=name)
+        containers = []
+        for node in self.pool.nodes:
+            containers.extend(node.engine.list_containers(all=all))
+        return containers
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+
+        def routed(target, *args, **kwargs):
+            return getattr(self._engine(target), name)(target, *args, **kwargs)
+        return routed
@@ -0,0 +1,173 @@
+import collections
+import json
+import os
+import socket
+import threading
+
+PORT_RANGE_SIZE = int(os.getenv('PORT_RANGE_SIZE', 1000))
+
+FREE, RESERVED, EXTERNAL = 0, 1, 2
+
+
+class PortExhaustedError(Exception):
+    """Raised when every port in the tenant range is taken"""
+
+
+class PortAllocator:
+    """Constant-time host port allocation with a persisted reservation ledger.
+
+    A state byte per port in the range (free / reserved / used by something
+    else) plus a FIFO of candidate free ports make reserve and release O(1).
+    Each reservation is a row in the registry's port_reservations table,
+    written and deleted one at a time so they survive restarts, and
+    reconcile() re-syncs them with what Docker actually publishes. A JSON
+    ledger from older releases (legacy_path) is imported once. Ports of a
+    remote Docker node can't be probed from here, so probe=False trusts
+    the ledger and reconcile() alone.
+    """
+
+    def __init__(self, base_port, size=PORT_RANGE_SIZE, registry=None, node='local', probe=True, legacy_path=None):
+        self.base_port = base_port
+        self.size = size
+        self.registry = registry
+        self.node = node
+        self.probe = probe
+        self.legacy_path = legacy_path
+        self._state = bytearray(size)
+        self._free = collections.deque(range(base_port, base_port + size))
+        self._by_tenant = {}
+        self._lock = threading.Lock()
+        self._load()
+
+    def _index(self, port):
+        index = port - self.base_port
+        return index if 0 <= index < self.size else None
+
+    def _load(self):
+        if self.registry is None:
+            return
+        ledger = self.registry.port_reservations(self.node)
+        if not ledger and self.legacy_path and os.path.exists(self.legacy_path):
+            ledger = self._import_legacy()
+        for tenant, port in ledger.items():
+            index = self._index(port)
+            if index is not None:
+                self._state[index] = RESERVED
+                self._by_tenant[tenant] = port
+
+    def _import_legacy(self):
+        try:
+            with open(self.legacy_path) as f:
+                ledger = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"⚠️  Ignoring unreadable port ledger {self.legacy_path}: {e}")
+            return {}
+        self.registry.replace_port_reservations(self.node, ledger)
+        os.replace(self.legacy_path, self.legacy_path + '.imported')
+        print(f"🔌 Imported {len(ledger)} port reservations from {self.legacy_path}")
+        return ledger
+
+    def reload(self):
+        """Start over from the registry, which another process may have changed"""
+        with self._lock:
+            self._state = bytearray(self.size)
+            self._by_tenant = {}
+            self._load()
+            self._free = collections.deque(
+                self.base_port + index for index in range(self.size) if self._state[index] == FREE
+            )
+
+    @staticmethod
+    def _bindable(port):
+        try:
+            with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+                s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+                s.bind(('0.0.0.0', port))
+            return True
+        except OSError:
+            return False
+
+    def reserve(self, tenant):
+        """Reserve a port for tenant (idempotent) and return it"""
+        with self._lock:
+            if tenant in self._by_tenant:
+                return self._by_tenant[tenant]
+            while self._free:
+                port = self._free.popleft()
+                index = self._index(port)
+                if self._state[index] != FREE:
+                    # Stale entry left behind by reconcile(); skip it
+                    continue
+                # One bind probe guards against processes outside Docker holding the port
+                if self.probe and not self._bindable(port):
+                    self._state[index] = EXTERNAL
+                    continue
+                self._state[index] = RESERVED
+                self._by_tenant[tenant] = port
+                if self.registry:
+                    self.registry.reserve_port(self.node, tenant, port)
+                return port
+        raise PortExhaustedError(f"No available ports found in range {self.base_port}-{self.base_port + self.size - 1}")
+
+    def release(self, tenant):
+        """Return tenant's port to the free list"""
+        with self._lock:
+            port = self._by_tenant.pop(tenant, None)
+            if port is None:
+                return None
+            self._state[self._index(port)] = FREE
+            self._free.append(port)
+            if self.registry:
+                self.registry.release_port(self.node, tenant)
+            return port
+
+    def port_for(self, tenant):
+        with self._lock:
+            return self._by_tenant.get(tenant)
+
+    def reconcile(self, published_ports, live_tenants):
+        """Sync the ledger with reality.
+
+        published_ports maps host port -> container name as reported by
+        Docker; live_tenants is the set of tenants that still exist.
+        Reservations of deleted tenants are released, running tenant
+        containers missing from the ledger are adopted, and ports Docker
+        publishes for anything else are marked unavailable.
+        """
+        with self._lock:
+            for tenant in list(self._by_tenant):
+                if tenant not in live_tenants:
+                    port = self._by_tenant.pop(tenant)
+                    self._state[self._index(port)] = FREE
+
+            reserved_ports = set(self._by_tenant.values())
+            for index in range(self.size):
+                if self._state[index] == EXTERNAL:
+                    self._state[index] = FREE
+
+            for port, container in published_ports.items():
+                index = self._index(port)
+                if index is None or port in reserved_ports:
+                    continue
+                tenant = container.rsplit('_', 1)[0]
+                if tenant in live_tenants and tenant not in self._by_tenant:
+                    self._by_tenant[tenant] = port
+                    self._state[index] = RESERVED
+                else:
+                    self._state[index] = EXTERNAL
+
+            self._free = collections.deque(
+                self.base_port + index for index in range(self.size) if self._state[index] == FREE
+            )
+            if self.registry:
+                self.registry.replace_port_reservations(self.node, self._by_tenant)
+            print(f"🔌 Port ledger reconciled: {len(self._by_tenant)} reserved, {len(self._free)} free")
+
+    def stats(self):
+        with self._lock:
+            return {
+                'range': [self.base_port, self.base_port + self.size - 1],
+                'reserved': len(self._by_tenant),
+                'unavailable': self._state.count(EXTERNAL),
+                'free': self._state.count(FREE)
+            }
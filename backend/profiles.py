@@ -0,0 +1,140 @@
+import json
+import os
+from dataclasses import asdict, dataclass, fields, replace
+
+# Limits of the standard profile, which every store got before profiles existed; empty means unlimited
+TENANT_SHOP_MEMORY = os.getenv('TENANT_SHOP_MEMORY', '1g')
+TENANT_SHOP_CPUS = os.getenv('TENANT_SHOP_CPUS', '1.5')
+TENANT_DB_MEMORY = os.getenv('TENANT_DB_MEMORY', '512m')
+TENANT_DB_CPUS = os.getenv('TENANT_DB_CPUS', '1')
+DEFAULT_PROFILE = os.getenv('DEFAULT_PROFILE', 'standard')
+# JSON object of profile overrides and additions, e.g. {"trial": {"shop_memory": "320m"}, "xl": {"base": "high-traffic", "apache_workers": 80}}
+PERFORMANCE_PROFILES = os.getenv('PERFORMANCE_PROFILES', '')
+
+# Where the rendered settings go inside the stock images
+MYSQL_CONFIG_PATH = '/etc/mysql/conf.d/zz-profile.cnf'
+PHP_CONFIG_PATH = '/usr/local/etc/php/conf.d/zz-profile.ini'
+APACHE_CONFIG_PATH = '/etc/apache2/conf-enabled/zz-profile.conf'
+
+
+@dataclass(frozen=True)
+class Profile:
+    """Container limits and MySQL, PHP, Apache and PrestaShop settings for one class of store"""
+    name: str
+    shop_memory: str
+    shop_cpus: str
+    db_memory: str
+    db_cpus: str
+    innodb_buffer_pool: str
+    mysql_max_connections: int
+    performance_schema: bool  # costs MySQL 5.7 a few hundred MB
+    php_memory_limit: str
+    opcache_memory: int  # MB
+    opcache_max_files: int
+    realpath_cache_size: str
+    apache_workers: int  # MaxRequestWorkers; each prefork child holds one PHP process
+    smarty_force_compile: int  # 0 never recompiles templates, 1 recompiles changed ones
+    smarty_cache: bool
+    ccc: bool  # combine, compress and cache theme CSS/JS
+
+
+BUILTIN_PROFILES = {
+    'trial': Profile(
+        'trial', shop_memory='384m', shop_cpus='0.5', db_memory='256m', db_cpus='0.5',
+        innodb_buffer_pool='32M', mysql_max_connections=20, performance_schema=False,
+        php_memory_limit='128M', opcache_memory=64, opcache_max_files=10000, realpath_cache_size='2M',
+        apache_workers=4, smarty_force_compile=1, smarty_cache=True, ccc=True
+    ),
+    'standard': Profile(
+        'standard', shop_memory=TENANT_SHOP_MEMORY, shop_cpus=TENANT_SHOP_CPUS, db_memory=TENANT_DB_MEMORY, db_cpus=TENANT_DB_CPUS,
+        innodb_buffer_pool='128M', mysql_max_connections=50, performance_schema=False,
+        php_memory_limit='256M', opcache_memory=128, opcache_max_files=20000, realpath_cache_size='4M',
+        apache_workers=12, smarty_force_compile=1, smarty_cache=True, ccc=True
+    ),
+    'high-traffic': Profile(
+        'high-traffic', shop_memory='2g', shop_cpus='3', db_memory='1536m', db_cpus='2',
+        innodb_buffer_pool='768M', mysql_max_connections=150, performance_schema=True,
+        php_memory_limit='512M', opcache_memory=256, opcache_max_files=40000, realpath_cache_size='8M',
+        apache_workers=40, smarty_force_compile=0, smarty_cache=True, ccc=True
+    )
+}
+
+
+def load_profiles(config=PERFORMANCE_PROFILES):
+    """The built-in profiles with PERFORMANCE_PROFILES applied over them"""
+    profiles = dict(BUILTIN_PROFILES)
+    known = {field.name for field in fields(Profile)} - {'name'}
+    for name, overrides in (json.loads(config) if config else {}).items():
+        overrides = dict(overrides)
+        base = profiles.get(overrides.pop('base', name), profiles['standard'])
+        unknown = set(overrides) - known
+        if unknown:
+            raise ValueError(f'Unknown settings in profile {name}: {", ".join(sorted(unknown))}')
+        profiles[name] = replace(base, name=name, **overrides)
+    if DEFAULT_PROFILE not in profiles:
+        raise ValueError(f'DEFAULT_PROFILE {DEFAULT_PROFILE} is not a profile')
+    return profiles
+
+
+PROFILES = load_profiles()
+
+
+def get_profile(name):
+    """The named profile; tenants created before profiles existed (None) are on standard"""
+    return PROFILES[name or 'standard']
+
+
+def describe(profile):
+    return asdict(profile)
+
+
+def mysql_config(profile):
+    return f"""# Performance profile: {profile.name}
+[mysqld]
+innodb_buffer_pool_size = {profile.innodb_buffer_pool}
+innodb_flush_method = O_DIRECT
+max_connections = {profile.mysql_max_connections}
+performance_schema = {'ON' if profile.performance_schema else 'OFF'}
+table_open_cache = {profile.mysql_max_connections * 20}
+tmp_table_size = 32M
+max_heap_table_size = 32M
+skip-name-resolve
+"""
+
+
+def php_config(profile):
+    return f"""; Performance profile: {profile.name}
+memory_limit = {profile.php_memory_limit}
+opcache.enable = 1
+opcache.memory_consumption = {profile.opcache_memory}
+opcache.interned_strings_buffer = {max(8, profile.opcache_memory // 8)}
+opcache.max_accelerated_files = {profile.opcache_max_files}
+; Module installs change PHP files, so keep checking them, just not on every request
+opcache.validate_timestamps = 1
+opcache.revalidate_freq = 60
+realpath_cache_size = {profile.realpath_cache_size}
+realpath_cache_ttl = 600
+"""
+
+
+def apache_config(profile):
+    return f"""# Performance profile: {profile.name}
+<IfModule mpm_prefork_module>
+    StartServers {min(2, profile.apache_workers)}
+    MinSpareServers 1
+    MaxSpareServers {max(2, profile.apache_workers // 4)}
+    MaxRequestWorkers {profile.apache_workers}
+    MaxConnectionsPerChild 1000
+</IfModule>
+"""
+
+
+def shop_settings(profile):
+    """PrestaShop configuration values (ps_configuration) for the profile"""
+    return {
+        'PS_CSS_THEME_CACHE': int(profile.ccc),
+        'PS_JS_THEME_CACHE': int(profile.ccc),
+        'PS_SMARTY_FORCE_COMPILE': profile.smarty_force_compile,
+        'PS_SMARTY_CACHE': int(profile.smarty_cache),
+        'PS_SMARTY_CACHING_TYPE': 'filesystem'
+    }
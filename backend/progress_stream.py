@@ -0,0 +1,143 @@
+import json
+import os
+import threading
+import time
+
+PROGRESS_HISTORY = int(os.getenv('PROGRESS_HISTORY', 200))
+SSE_KEEPALIVE = int(os.getenv('SSE_KEEPALIVE', 15))
+# Seconds between registry checks for progress recorded by another worker process
+PROGRESS_POLL_INTERVAL = float(os.getenv('PROGRESS_POLL_INTERVAL', 0.5))
+# Stages of work on a deployed store; its status stays completed while they run
+ONGOING_STAGES = ('profile_queued', 'applying_profile')
+
+
+class ProgressBroker:
+    """Feeds deployment progress events to every watcher of a tenant.
+
+    The registry's progress history is the event log, and its row ids are
+    the event ids, so a stream served by any worker process sees progress
+    recorded by the leader, and a client that reconnects with
+    Last-Event-ID only receives what it missed. publish() wakes watchers
+    in this process straight away; the others notice within
+    PROGRESS_POLL_INTERVAL seconds.
+    """
+
+    def __init__(self, registry, history=PROGRESS_HISTORY, poll_interval=PROGRESS_POLL_INTERVAL):
+        self.registry = registry
+        self.history = history
+        self.poll_interval = poll_interval
+        self._versions = {}
+        self._watchers = {}
+        self._condition = threading.Condition()
+
+    def publish(self, tenant):
+        """Wake this process's watchers of tenant after its progress was recorded"""
+        with self._condition:
+            self._versions[tenant] = self._versions.get(tenant, 0) + 1
+            self._condition.notify_all()
+
+    def events_after(self, tenant, last_id):
+        """Events newer than last_id, and whether the log still covered last_id"""
+        status, events, complete = self.registry.events_after(tenant, last_id, self.history)
+        if status is None:
+            return [], complete
+        payloads = []
+        for index, event in enumerate(events):
+            if index == len(events) - 1:
+                # The newest event is the tenant's current status
+                payloads.append((event['id'], status))
+                continue
+            payload = dict(status, stage=event['stage'], message=event['message'])
+            if event['percent'] is not None:
+                payload['percent'] = event['percent']
+            payload['status'] = event['stage'] if event['stage'] in ('completed', 'error') else 'processing'
+            payload.pop('result', None)
+            payloads.append((event['id'], payload))
+        return payloads, complete
+
+    def wait(self, tenant, last_id, timeout):
+        """Block until there are events newer than last_id (or timeout)"""
+        deadline = time.time() + timeout
+        while True:
+            with self._condition:
+                version = self._versions.get(tenant, 0)
+            events, complete = self.events_after(tenant, last_id)
+            remaining = deadline - time.time()
+            if events or remaining <= 0:
+                return events, complete
+            with self._condition:
+                self._condition.wait_for(lambda: self._versions.get(tenant, 0) != version, min(self.poll_interval, remaining))
+
+    def watch(self, tenant, delta):
+        with self._condition:
+            self._watchers[tenant] = self._watchers.get(tenant, 0) + delta
+            if self._watchers[tenant] <= 0:
+                del self._watchers[tenant]
+
+    def forget(self, tenant):
+        with self._condition:
+            self._versions.pop(tenant, None)
+
+    def tenants(self):
+        with self._condition:
+            return list(self._versions)
+
+    def stats(self):
+        with self._condition:
+            return {
+                'tenants': len(self._versions),
+                'watchers': sum(self._watchers.values())
+            }
+
+
+def sse_event(payload, event_id=None, event='progress'):
+    """Format one Server-Sent Events message"""
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append(f"event: {event}")
+    lines.append(f"data: {json.dumps(payload)}")
+    return '\n'.join(lines) + '\n\n'
+
+
+def finished(payload):
+    """Whether a status means nothing more is happening to the store"""
+    return payload.get('status') in ('completed', 'error') and payload.get('stage') not in ONGOING_STAGES
+
+
+def stream_progress(broker, tenant, last_id, snapshot, keepalive=SSE_KEEPALIVE):
+    """Generator behind the SSE endpoint; ends after the newest event is a completed/error one.
+
+    snapshot() returns the tenant's current status and is sent when the
+    client is new or asks to resume from an event we no longer retain.
+    Only an event newer than last_id ends the stream, so a client resuming
+    after the end of one deployment or profile change waits for the next.
+    """
+    broker.watch(tenant, 1)
+    try:
+        yield "retry: 2000\n\n"
+        events, complete = broker.events_after(tenant, last_id)
+        if last_id == 0 or not complete:
+            current = snapshot()
+            if current is None:
+                return
+            # Skip straight to the latest id so resumed streams don't replay the whole log
+            latest_id = events[-1][0] if events else last_id
+            yield sse_event(current, latest_id)
+            if finished(current) and (last_id == 0 or latest_id > last_id):
+                return
+            last_id = latest_id
+            events = []
+
+        while True:
+            for event_id, payload in events:
+                yield sse_event(payload, event_id)
+                last_id = event_id
+            # Replayed completed events of earlier work don't count, only where the store is now
+            if events and finished(events[-1][1]):
+                return
+            events, _ = broker.wait(tenant, last_id, keepalive)
+            if not events:
+                yield ": keepalive\n\n"
+    finally:
+        broker.watch(tenant, -1)
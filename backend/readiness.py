@@ -0,0 +1,126 @@
+import os
+import threading
+import time
+
+PROBE_MIN_INTERVAL = float(os.getenv('PROBE_MIN_INTERVAL', 0.25))
+PROBE_MAX_INTERVAL = float(os.getenv('PROBE_MAX_INTERVAL', 5))
+READINESS_EVENTS = os.getenv('READINESS_EVENTS', '1') == '1'
+
+CONTAINER_EVENTS = ['create', 'start', 'die', 'stop', 'pause', 'unpause', 'destroy', 'health_status']
+
+
+class ContainerEventWatcher:
+    """Follows the Docker events stream and wakes threads waiting on a container.
+
+    Given a list of engines (one per Docker node) it follows every node's
+    stream; container names are unique across nodes. Subscribers see
+    every event too, with the index of the node it came from.
+    """
+
+    def __init__(self, engine):
+        self.engines = list(engine) if isinstance(engine, (list, tuple)) else [engine]
+        self._connected = set()
+        self._versions = {}
+        self._last_action = {}
+        self._condition = threading.Condition()
+        self._threads = []
+        self._subscribers = []
+
+    @property
+    def connected(self):
+        """Whether events are flowing from every node"""
+        return len(self._connected) == len(self.engines)
+
+    def start(self):
+        if self._threads or not READINESS_EVENTS:
+            return
+        for index, engine in enumerate(self.engines):
+            thread = threading.Thread(target=self._follow, args=(index, engine), name=f"docker-events-{index}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def subscribe(self, on_event, on_connect=None):
+        """Call on_event(index, event) for every event, and on_connect(index) whenever node index's stream (re)connects"""
+        self._subscribers.append((on_event, on_connect))
+
+    def version(self, name):
+        """Counter that increases with every event seen for the container"""
+        with self._condition:
+            return self._versions.get(name, 0)
+
+    def last_action(self, name):
+        with self._condition:
+            return self._last_action.get(name)
+
+    def wait_for_event(self, name, version, timeout):
+        """Block until an event newer than version arrives for name, or timeout"""
+        with self._condition:
+            return self._condition.wait_for(lambda: self._versions.get(name, 0) != version, timeout)
+
+    def _dispatch(self, index, event):
+        name = event.get('Actor', {}).get('Attributes', {}).get('name')
+        if not name:
+            return
+        with self._condition:
+            self._versions[name] = self._versions.get(name, 0) + 1
+            self._last_action[name] = event.get('Action') or event.get('status')
+            self._condition.notify_all()
+        self._notify(0, index, event)
+
+    def _notify(self, callback, *args):
+        for subscriber in self._subscribers:
+            if subscriber[callback]:
+                try:
+                    subscriber[callback](*args)
+                except Exception as e:
+                    print(f"⚠️  Docker event subscriber failed: {e}")
+
+    def _follow(self, index, engine):
+        backoff = 1
+        while True:
+            try:
+                stream = engine.events(filters={'type': ['container'], 'event': CONTAINER_EVENTS})
+                self._connected.add(index)
+                backoff = 1
+                print("📡 Following Docker events for readiness detection")
+                self._notify(1, index)
+                for event in stream:
+                    self._dispatch(index, event)
+            except Exception as e:
+                print(f"⚠️  Docker events stream lost: {e}")
+            self._connected.discard(index)
+            # Wake every waiter so it falls back to probing while we reconnect
+            with self._condition:
+                self._condition.notify_all()
+            time.sleep(backoff)
+            backoff = min(backoff * 2, 30)
+
+
+def wait_until(check, timeout, watcher=None, container=None, on_attempt=None):
+    """Evaluate check() until it returns something truthy or timeout expires.
+
+    Re-checks as soon as the watcher reports an event for container, and
+    otherwise probes on an exponential backoff between PROBE_MIN_INTERVAL
+    and PROBE_MAX_INTERVAL. Returns the truthy result, or None on timeout.
+    """
+    start = time.time()
+    deadline = start + timeout
+    interval = PROBE_MIN_INTERVAL
+    attempt = 0
+    while True:
+        version = watcher.version(container) if watcher and container else None
+        attempt += 1
+        result = check()
+        if result:
+            return result
+        now = time.time()
+        if on_attempt:
+            on_attempt(attempt, now - start)
+        if now >= deadline:
+            return None
+        wait = min(interval, deadline - now)
+        if watcher and container and watcher.connected:
+            watcher.wait_for_event(container, version, wait)
+        else:
+            time.sleep(wait)
+        interval = min(interval * 2, PROBE_MAX_INTERVAL)
@@ -0,0 +1,217 @@
+import io
+import json
+import os
+import re
+import tarfile
+import tempfile
+import threading
+
+from readiness import wait_until
+
+ROUTING_MODE = os.getenv('ROUTING_MODE', 'ports')  # ports, host
+ROUTER_DOMAIN = os.getenv('ROUTER_DOMAIN', '')  # stores are served at <tenant>.<ROUTER_DOMAIN>; defaults to <ip>.nip.io
+ROUTER_CONTAINER = os.getenv('ROUTER_CONTAINER', 'saas_router')
+ROUTER_NETWORK = os.getenv('ROUTER_NETWORK', 'saas-proxy')
+ROUTER_IMAGE = os.getenv('ROUTER_IMAGE', 'traefik:v2.11')
+ROUTER_HTTP_PORT = int(os.getenv('ROUTER_HTTP_PORT', 80))
+ROUTER_READY_TIMEOUT = int(os.getenv('ROUTER_READY_TIMEOUT', 60))
+# Where the router sends visitors of stores it has no route for (hibernated stores)
+WAKE_UPSTREAM = os.getenv('WAKE_UPSTREAM', '')
+ROUTES_DIR = '/etc/traefik/routes'
+WAKE_ROUTE_FILE = '_wake.yml'
+# Traefik batches file changes for this long before applying them
+ROUTE_PROPAGATION_DELAY = 1.5
+
+TENANT_NAME = re.compile(r'^tenant\d+$')
+
+
+class RouterError(Exception):
+    """Raised when the edge proxy cannot be started or its routes updated"""
+
+
+class Router:
+    """Shared Traefik edge proxy routing store hostnames to shop containers.
+
+    Stores join ROUTER_NETWORK instead of publishing a host port, and the
+    proxy reaches them by container name. Every route is its own file in
+    the proxy's watched directory, so adding or removing one store never
+    reloads the proxy or touches other stores' connections. The backend
+    keeps the route table in routes.json and re-pushes it at startup.
+    """
+
+    def __init__(self, engine, tenants_dir, host_ip, watcher=None, domain=ROUTER_DOMAIN, wake_upstream=WAKE_UPSTREAM):
+        self.engine = engine
+        self.host_ip = host_ip
+        self.watcher = watcher
+        self.domain = domain
+        self.wake_upstream = wake_upstream
+        self.project_dir = os.path.join(tenants_dir, '.router')
+        self.table_path = os.path.join(self.project_dir, 'routes.json')
+        self._routes = set()
+        self._lock = threading.Lock()
+        self._ready = False
+
+    def _compose(self, backend_network):
+        networks = "\n      - backend" if backend_network else ""
+        external = f"""
+  backend:
+    external: true
+    name: {backend_network}""" if backend_network else ""
+        return f"""
+services:
+  traefik:
+    image: {ROUTER_IMAGE}
+    container_name: {ROUTER_CONTAINER}
+    restart: unless-stopped
+    command:
+      - --entrypoints.web.address=:80
+      - --providers.file.directory={ROUTES_DIR}
+      - --providers.file.watch=true
+      - --providers.providersThrottleDuration=1s
+      - --ping=true
+    ports:
+      - "{ROUTER_HTTP_PORT}:80"
+    extra_hosts:
+      - "host.docker.internal:host-gateway"
+    networks:
+      - proxy{networks}
+    volumes:
+      - router_routes:{ROUTES_DIR}
+    healthcheck:
+      test: ["CMD", "traefik", "healthcheck", "--ping"]
+      interval: 5s
+      timeout: 5s
+      retries: 10
+
+volumes:
+  router_routes:
+
+networks:
+  proxy:
+    name: {ROUTER_NETWORK}
+    driver: bridge{external}
+"""
+
+    def start(self, backend_network=''):
+        """Start the proxy if needed and push the whole route table to it"""
+        with self._lock:
+            os.makedirs(self.project_dir, exist_ok=True)
+            if os.path.exists(self.table_path):
+                with open(self.table_path) as f:
+                    self._routes = set(json.load(f))
+            if self.engine.health_status(ROUTER_CONTAINER) != 'healthy':
+                print(f"🧭 Starting edge router {ROUTER_CONTAINER}...")
+                with open(os.path.join(self.project_dir, 'docker-compose.yml'), 'w') as f:
+                    f.write(self._compose(backend_network))
+                result = self.engine.compose(self.project_dir, 'up', '-d', timeout=180)
+                if result.returncode != 0:
+                    raise RouterError(f'Edge router failed to start: {result.stderr}')
+                healthy = wait_until(
+                    lambda: self.engine.health_status(ROUTER_CONTAINER) == 'healthy',
+                    ROUTER_READY_TIMEOUT, self.watcher, ROUTER_CONTAINER
+                )
+                if not healthy:
+                    raise RouterError('Edge router failed to become healthy')
+            files = {f'{tenant}.yml': self._route(tenant) for tenant in self._routes}
+            if self.wake_upstream:
+                files[WAKE_ROUTE_FILE] = self._wake_route()
+            self._put(files)
+            # Drop route files of stores removed while the backend was down
+            exit_code, stdout, _ = self.engine.exec_run(ROUTER_CONTAINER, ['ls', ROUTES_DIR])
+            stale = [name for name in stdout.split() if name not in files] if exit_code == 0 else []
+            if stale:
+                self.engine.exec_run(ROUTER_CONTAINER, ['rm', '-f'] + [f'{ROUTES_DIR}/{name}' for name in stale])
+            self._ready = True
+            print(f"🧭 Edge router ready with {len(self._routes)} store route(s)")
+
+    def base_domain(self):
+        """ROUTER_DOMAIN, or a nip.io wildcard name for the host IP when no domain is configured"""
+        return self.domain or f'{self.host_ip()}.nip.io'
+
+    def hostname(self, tenant):
+        return f'{tenant}.{self.base_domain()}'
+
+    def tenant_for_host(self, host):
+        """The tenant a Host header points at, or None"""
+        host = host.split(':')[0].lower()
+        suffix = '.' + self.base_domain()
+        if not host.endswith(suffix):
+            return None
+        tenant = host[:-len(suffix)]
+        return tenant if TENANT_NAME.match(tenant) else None
+
+    def add_route(self, tenant):
+        """Route the tenant's hostname to its shop container"""
+        with self._lock:
+            self._put({f'{tenant}.yml': self._route(tenant)})
+            self._routes.add(tenant)
+            self._save()
+
+    def remove_route(self, tenant):
+        with self._lock:
+            if tenant not in self._routes:
+                return
+            exit_code, _, stderr = self.engine.exec_run(ROUTER_CONTAINER, ['rm', '-f', f'{ROUTES_DIR}/{tenant}.yml'])
+            if exit_code != 0:
+                raise RouterError(f'Could not remove route for {tenant}: {stderr.strip()}')
+            self._routes.discard(tenant)
+            self._save()
+
+    def has_route(self, tenant):
+        with self._lock:
+            return tenant in self._routes
+
+    def stats(self):
+        with self._lock:
+            return {'ready': self._ready, 'routes': len(self._routes), 'domain': self.base_domain()}
+
+    def _route(self, tenant):
+        host = self.hostname(tenant)
+        return f"""http:
+  routers:
+    {tenant}:
+      rule: "Host(`{host}`)"
+      entryPoints: [web]
+      service: {tenant}
+  services:
+    {tenant}:
+      loadBalancer:
+        servers:
+          - url: "http://{tenant}_shop:80"
+"""
+
+    def _wake_route(self):
+        return f"""http:
+  routers:
+    wake:
+      rule: "HostRegexp(`{{host:.+}}`)"
+      priority: 1
+      entryPoints: [web]
+      service: wake
+  services:
+    wake:
+      loadBalancer:
+        servers:
+          - url: "{self.wake_upstream}"
+"""
+
+    def _put(self, files):
+        """Copy route files into the proxy's watched directory in one archive"""
+        if not files:
+            return
+        with tempfile.NamedTemporaryFile(suffix='.tar', dir=self.project_dir) as scratch:
+            with tarfile.open(fileobj=scratch, mode='w') as archive:
+                for name, content in files.items():
+                    data = content.encode()
+                    info = tarfile.TarInfo(name)
+                    info.size = len(data)
+                    info.mode = 0o644
+                    archive.addfile(info, io.BytesIO(data))
+            scratch.flush()
+            self.engine.put_archive(ROUTER_CONTAINER, ROUTES_DIR, scratch.name)
+
+    def _save(self):
+        tmp = self.table_path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(sorted(self._routes), f)
+        os.replace(tmp, self.table_path)
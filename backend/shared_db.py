@@ -0,0 +1,156 @@
+import json
+import os
+import secrets
+import threading
+
+from readiness import wait_until
+
+DB_MODE = os.getenv('DB_MODE', 'dedicated')  # dedicated, shared
+SHARED_DB_CONTAINER = os.getenv('SHARED_DB_CONTAINER', 'saas_shared_db')
+SHARED_DB_NETWORK = os.getenv('SHARED_DB_NETWORK', 'saas-shared-db')
+SHARED_DB_IMAGE = os.getenv('SHARED_DB_IMAGE', 'mysql:5.7')
+SHARED_DB_MAX_CONNECTIONS = int(os.getenv('SHARED_DB_MAX_CONNECTIONS', 1000))
+SHARED_DB_BUFFER_POOL = os.getenv('SHARED_DB_BUFFER_POOL', '1G')
+SHARED_DB_READY_TIMEOUT = int(os.getenv('SHARED_DB_READY_TIMEOUT', 180))
+TENANT_DB_FILE = 'db.json'
+
+
+class SharedDatabaseError(Exception):
+    """Raised when the shared MySQL server cannot be started or configured"""
+
+
+class SharedDatabase:
+    """One MySQL server, managed by the backend, hosting a database and user per tenant"""
+
+    def __init__(self, engine, tenants_dir, watcher=None):
+        self.engine = engine
+        self.tenants_dir = tenants_dir
+        self.watcher = watcher
+        self.project_dir = os.path.join(tenants_dir, '.shared-db')
+        self._lock = threading.Lock()
+        self._ready = False
+
+    def _root_password(self):
+        configured = os.getenv('SHARED_DB_ROOT_PASSWORD')
+        if configured:
+            return configured
+        path = os.path.join(self.project_dir, 'root.json')
+        if os.path.exists(path):
+            with open(path) as f:
+                return json.load(f)['password']
+        password = secrets.token_hex(16)
+        with open(path, 'w') as f:
+            json.dump({'password': password}, f)
+        os.chmod(path, 0o600)
+        return password
+
+    def _compose(self, root_password):
+        return f"""
+services:
+  mysql:
+    image: {SHARED_DB_IMAGE}
+    container_name: {SHARED_DB_CONTAINER}
+    restart: unless-stopped
+    command:
+      - --max-connections={SHARED_DB_MAX_CONNECTIONS}
+      - --innodb-buffer-pool-size={SHARED_DB_BUFFER_POOL}
+      - --table-open-cache=4000
+      - --innodb-file-per-table=1
+    environment:
+      MYSQL_ROOT_PASSWORD: {root_password}
+    networks:
+      - shared-db
+    volumes:
+      - shared_db_data:/var/lib/mysql
+    healthcheck:
+      test: ["CMD", "mysqladmin", "ping", "-h", "localhost"]
+      interval: 5s
+      timeout: 20s
+      retries: 10
+
+volumes:
+  shared_db_data:
+
+networks:
+  shared-db:
+    name: {SHARED_DB_NETWORK}
+    driver: bridge
+"""
+
+    def ensure_running(self):
+        """Start the shared server if needed and wait until it is healthy"""
+        with self._lock:
+            if self._ready and self.engine.health_status(SHARED_DB_CONTAINER) == 'healthy':
+                return
+            os.makedirs(self.project_dir, exist_ok=True)
+            root_password = self._root_password()
+            if self.engine.health_status(SHARED_DB_CONTAINER) != 'healthy':
+                print(f"🗄️  Starting shared MySQL server {SHARED_DB_CONTAINER}...")
+                with open(os.path.join(self.project_dir, 'docker-compose.yml'), 'w') as f:
+                    f.write(self._compose(root_password))
+                result = self.engine.compose(self.project_dir, 'up', '-d', timeout=180)
+                if result.returncode != 0:
+                    raise SharedDatabaseError(f'Shared MySQL failed to start: {result.stderr}')
+                healthy = wait_until(
+                    lambda: self.engine.health_status(SHARED_DB_CONTAINER) == 'healthy',
+                    SHARED_DB_READY_TIMEOUT, self.watcher, SHARED_DB_CONTAINER
+                )
+                if not healthy:
+                    raise SharedDatabaseError('Shared MySQL failed to become healthy')
+                print("🗄️  Shared MySQL server is healthy")
+            self._ready = True
+
+    def run_sql(self, sql, user='root', password=None, database=''):
+        """Run SQL inside the shared server container, returning (exit_code, stdout, stderr)"""
+        if password is None:
+            password = self._root_password()
+        cmd = ['mysql', f'-u{user}']
+        if database:
+            cmd.append(database)
+        cmd += ['-e', sql]
+        # MYSQL_PWD keeps the password out of the process list
+        return self.engine.exec_run(SHARED_DB_CONTAINER, cmd, env=[f'MYSQL_PWD={password}'], timeout=60)
+
+    def credentials(self, tenant):
+        """Stored database credentials for a shared-mode tenant, or None for dedicated tenants"""
+        path = os.path.join(self.tenants_dir, tenant, TENANT_DB_FILE)
+        if not os.path.exists(path):
+            return None
+        with open(path) as f:
+            return json.load(f)
+
+    def create_tenant_database(self, tenant):
+        """Create (or re-grant) the tenant's schema and user; returns its credentials"""
+        self.ensure_running()
+        credentials = self.credentials(tenant) or {
+            'host': SHARED_DB_CONTAINER,
+            'name': f'ps_{tenant}',
+            'user': tenant,
+            'password': secrets.token_hex(16)
+        }
+        exit_code, _, stderr = self.run_sql(f"""
+CREATE DATABASE IF NOT EXISTS `{credentials['name']}` CHARACTER SET utf8mb4 COLLATE utf8mb4_general_ci;
+CREATE USER IF NOT EXISTS '{credentials['user']}'@'%' IDENTIFIED BY '{credentials['password']}';
+ALTER USER '{credentials['user']}'@'%' IDENTIFIED BY '{credentials['password']}';
+GRANT ALL PRIVILEGES ON `{credentials['name']}`.* TO '{credentials['user']}'@'%';
+""")
+        if exit_code != 0:
+            raise SharedDatabaseError(f'Could not create database for {tenant}: {stderr.strip()}')
+        path = os.path.join(self.tenants_dir, tenant, TENANT_DB_FILE)
+        with open(path, 'w') as f:
+            json.dump(credentials, f)
+        os.chmod(path, 0o600)
+        return credentials
+
+    def drop_tenant_database(self, tenant):
+        """Drop the tenant's schema and user and forget its credentials"""
+        credentials = self.credentials(tenant)
+        if not credentials:
+            return
+        exit_code, _, stderr = self.run_sql(f"""
+DROP DATABASE IF EXISTS `{credentials['name']}`;
+DROP USER IF EXISTS '{credentials['user']}'@'%';
+""")
+        if exit_code != 0:
+            raise SharedDatabaseError(f'Could not drop database for {tenant}: {stderr.strip()}')
+        os.remove(os.path.join(self.tenants_dir, tenant, TENANT_DB_FILE))
@@ -0,0 +1,96 @@
+import os
+import socket
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from docker_engine import DockerEngineError
+
+# The network a containerized backend shares with the frontend and edge router (never with stores)
+BACKEND_NETWORK = os.getenv('BACKEND_NETWORK', '')
+# The backend's own container, joined to each store's network; inside Docker the hostname is the container ID
+BACKEND_CONTAINER = os.getenv('BACKEND_CONTAINER') or (socket.gethostname() if BACKEND_NETWORK else '')
+TENANT_HTTP_POOL_SIZE = int(os.getenv('TENANT_HTTP_POOL_SIZE', 32))
+
+
+class TenantHTTP:
+    """Pooled HTTP client that reaches store containers directly on their Docker network.
+
+    Requests go to the container's IP rather than the host's public
+    address, so they never hairpin through the public interface. When the
+    backend itself runs in a container (BACKEND_CONTAINER), it joins each
+    store's own network rather than sharing one network with every store,
+    so stores stay isolated from each other and from the backend API.
+    """
+
+    def __init__(self, engine, container=BACKEND_CONTAINER, pool_size=TENANT_HTTP_POOL_SIZE):
+        self.engine = engine
+        self.container = container
+        self.session = requests.Session()
+        # Every store is a distinct host, so keep a connection pool per store
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self._addresses = {}
+        self._networks = {}  # store container -> the network the backend reaches it on
+        self._lock = threading.Lock()
+
+    def attach(self, target, network):
+        """Join the backend container to network so target can be reached on it (no-op outside Docker)"""
+        with self._lock:
+            self._networks[target] = network
+            self._addresses.pop(target, None)
+        if not self.container:
+            return
+        try:
+            self.engine.connect_network(network, self.container)
+        except DockerEngineError as e:
+            # 403: already connected; 404: the store's network is gone
+            if e.status not in (403, 404):
+                raise
+
+    def detach(self, target):
+        """Leave target's network so it can be removed"""
+        with self._lock:
+            network = self._networks.pop(target, None)
+            self._addresses.pop(target, None)
+        if network and self.container:
+            self.engine.disconnect_network(network, self.container)
+
+    def address(self, container):
+        """The container's IP on the network the backend joined (or its first network), cached"""
+        with self._lock:
+            if container in self._addresses:
+                return self._addresses[container]
+            network = self._networks.get(container)
+        info = self.engine.inspect_container(container)
+        networks = (info or {}).get('NetworkSettings', {}).get('Networks') or {}
+        if network in networks:
+            address = networks[network].get('IPAddress')
+        else:
+            address = next((n.get('IPAddress') for n in networks.values() if n.get('IPAddress')), None)
+        if address:
+            with self._lock:
+                self._addresses[container] = address
+        return address
+
+    def forget(self, container):
+        with self._lock:
+            self._addresses.pop(container, None)
+
+    def get(self, container, path='/', host=None, timeout=5):
+        """GET path from the container's port 80; host sets the Host header PrestaShop routes on"""
+        address = self.address(container)
+        if not address:
+            raise requests.ConnectionError(f'{container} has no network address')
+        try:
+            return self.session.get(
+                f"http://{address}{path}",
+                headers={'Host': host} if host else None,
+                timeout=timeout,
+                allow_redirects=False
+            )
+        except requests.RequestException:
+            # The container may have been recreated with a new address
+            self.forget(container)
+            raise
@@ -0,0 +1,521 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+PROGRESS_RETENTION = int(os.getenv('PROGRESS_RETENTION', 7 * 24 * 3600))
+COMMAND_RETENTION = 3600  # seconds an uncollected command result is kept (its worker went away)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tenants (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT UNIQUE,
+    port INTEGER,
+    state TEXT NOT NULL DEFAULT 'processing',
+    stage TEXT NOT NULL DEFAULT '',
+    message TEXT NOT NULL DEFAULT '',
+    percent REAL NOT NULL DEFAULT 0,
+    admin_folder TEXT,
+    result TEXT,
+    last_access REAL,
+    hibernated_at REAL,
+    batch_id TEXT,
+    node TEXT,
+    profile TEXT,
+    created_at REAL NOT NULL,
+    started_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_tenants_state ON tenants (state);
+CREATE TABLE IF NOT EXISTS progress_events (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    tenant TEXT NOT NULL,
+    stage TEXT NOT NULL,
+    message TEXT NOT NULL,
+    percent REAL,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_progress_events_tenant ON progress_events (tenant, id);
+CREATE INDEX IF NOT EXISTS idx_progress_events_created ON progress_events (created_at);
+CREATE TABLE IF NOT EXISTS port_reservations (
+    node TEXT NOT NULL,
+    tenant TEXT NOT NULL,
+    port INTEGER NOT NULL,
+    PRIMARY KEY (node, tenant)
+);
+CREATE TABLE IF NOT EXISTS usage_samples (
+    tenant TEXT NOT NULL,
+    at INTEGER NOT NULL,
+    cpu REAL NOT NULL,
+    memory INTEGER NOT NULL,
+    net_rx REAL NOT NULL,
+    net_tx REAL NOT NULL,
+    disk_read REAL NOT NULL,
+    disk_write REAL NOT NULL,
+    PRIMARY KEY (tenant, at)
+);
+CREATE INDEX IF NOT EXISTS idx_usage_samples_at ON usage_samples (at);
+CREATE TABLE IF NOT EXISTS usage_current (
+    container TEXT PRIMARY KEY,
+    tenant TEXT NOT NULL,
+    cpu REAL NOT NULL,
+    memory INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_usage_current_tenant ON usage_current (tenant);
+CREATE TABLE IF NOT EXISTS commands (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT NOT NULL,
+    args TEXT NOT NULL,
+    state TEXT NOT NULL DEFAULT 'pending',
+    result TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_commands_state ON commands (state, id);
+CREATE TABLE IF NOT EXISTS cluster_state (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL,
+    updated_at REAL NOT NULL
+);
+"""
+# Columns added after the first release, created on registries that predate them
+MIGRATIONS = {
+    'last_access': 'ALTER TABLE tenants ADD COLUMN last_access REAL',
+    'hibernated_at': 'ALTER TABLE tenants ADD COLUMN hibernated_at REAL',
+    'batch_id': 'ALTER TABLE tenants ADD COLUMN batch_id TEXT',
+    'node': 'ALTER TABLE tenants ADD COLUMN node TEXT',
+    'profile': 'ALTER TABLE tenants ADD COLUMN profile TEXT'
+}
+
+
+class TenantRegistry:
+    """SQLite (WAL) store of tenants, their deployment state and progress history.
+
+    Every worker process opens it, so it also carries what they share: port
+    reservations, usage samples, leader state and commands for the leader.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._conn().executescript(SCHEMA)
+        self._migrate()
+
+    def _conn(self):
+        """This thread's connection (sqlite3 connections can't be shared across threads)"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute('PRAGMA busy_timeout=30000')
+            self._local.conn = conn
+        return conn
+
+    def _migrate(self):
+        # In one transaction, so worker processes starting together don't add a column twice
+        with self._transaction() as conn:
+            columns = {row['name'] for row in conn.execute('PRAGMA table_info(tenants)')}
+            for column, statement in MIGRATIONS.items():
+                if column not in columns:
+                    conn.execute(statement)
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_tenants_batch ON tenants (batch_id)')
+
+    def _transaction(self):
+        return _Transaction(self._conn())
+
+    def seed(self, highest_id):
+        """Make sure new ids continue after tenants that predate the registry"""
+        with self._transaction() as conn:
+            row = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'tenants'").fetchone()
+            if row is None:
+                conn.execute("INSERT INTO sqlite_sequence (name, seq) VALUES ('tenants', ?)", (highest_id,))
+            elif row['seq'] < highest_id:
+                conn.execute("UPDATE sqlite_sequence SET seq = ? WHERE name = 'tenants'", (highest_id,))
+
+    def allocate(self):
+        """Atomically allocate the next tenant id and return its name"""
+        now = time.time()
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                "INSERT INTO tenants (created_at, started_at, updated_at) VALUES (?, ?, ?)",
+                (now, now, now)
+            )
+            name = f"tenant{cursor.lastrowid}"
+            conn.execute("UPDATE tenants SET name = ? WHERE id = ?", (name, cursor.lastrowid))
+        return name
+
+    def delete(self, tenant):
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM progress_events WHERE tenant = ?", (tenant,))
+            conn.execute("DELETE FROM tenants WHERE name = ?", (tenant,))
+
+    def record_progress(self, tenant, stage, message, percent=None, state=None, result=None):
+        """Update the tenant's current stage and append it to the progress history"""
+        now = time.time()
+        with self._transaction() as conn:
+            conn.execute(
+                """UPDATE tenants SET stage = ?, message = ?, percent = COALESCE(?, percent),
+                       state = COALESCE(?, state), result = COALESCE(?, result), updated_at = ?
+                   WHERE name = ?""",
+                (stage, message, percent, state, json.dumps(result) if result is not None else None, now, tenant)
+            )
+            conn.execute(
+                "INSERT INTO progress_events (tenant, stage, message, percent, created_at) VALUES (?, ?, ?, ?, ?)",
+                (tenant, stage, message, percent, now)
+            )
+
+    def restart_progress(self, tenant):
+        """Start a fresh deployment timeline for an existing tenant (e.g. a claimed warm stack)"""
+        now = time.time()
+        with self._transaction() as conn:
+            conn.execute(
+                """UPDATE tenants SET state = 'processing', stage = '', message = '', percent = 0,
+                       result = NULL, started_at = ?, updated_at = ? WHERE name = ?""",
+                (now, now, tenant)
+            )
+
+    def update(self, tenant, **fields):
+        """Set plain columns such as port or admin_folder"""
+        if not fields:
+            return
+        assignments = ', '.join(f"{column} = ?" for column in fields)
+        with self._transaction() as conn:
+            conn.execute(
+                f"UPDATE tenants SET {assignments}, updated_at = ? WHERE name = ?",
+                list(fields.values()) + [time.time(), tenant]
+            )
+
+    def get(self, tenant):
+        """Status payload for a tenant, or None if unknown"""
+        row = self._conn().execute("SELECT * FROM tenants WHERE name = ?", (tenant,)).fetchone()
+        return self._status(row) if row else None
+
+    def batch(self, batch_id):
+        """Status payloads of every tenant created by a batch request, in creation order"""
+        rows = self._conn().execute("SELECT * FROM tenants WHERE batch_id = ? ORDER BY id", (batch_id,)).fetchall()
+        return [self._status(row) for row in rows]
+
+    def page(self, state=None, limit=50, offset=0):
+        """(total, status payloads) of tenants in creation order, optionally only those in state"""
+        where, params = ("WHERE state = ?", [state]) if state else ("", [])
+        total = self._conn().execute(f"SELECT COUNT(*) AS n FROM tenants {where}", params).fetchone()['n']
+        rows = self._conn().execute(
+            f"SELECT * FROM tenants {where} ORDER BY id LIMIT ? OFFSET ?", params + [limit, offset]
+        ).fetchall()
+        return total, [self._status(row) for row in rows]
+
+    def history(self, tenant, limit=100):
+        rows = self._conn().execute(
+            """SELECT id, stage, message, percent, created_at FROM progress_events
+               WHERE tenant = ? ORDER BY id DESC LIMIT ?""",
+            (tenant, limit)
+        ).fetchall()
+        return [dict(row) for row in reversed(rows)]
+
+    def events_after(self, tenant, last_id, limit=100):
+        """(status, up to limit newest events after last_id, whether none were skipped), from one snapshot"""
+        conn = self._conn()
+        conn.execute('BEGIN')
+        try:
+            row = conn.execute("SELECT * FROM tenants WHERE name = ?", (tenant,)).fetchone()
+            events = conn.execute(
+                """SELECT id, stage, message, percent FROM progress_events
+                   WHERE tenant = ? AND id > ? ORDER BY id DESC LIMIT ?""",
+                (tenant, last_id, limit + 1)
+            ).fetchall()
+            # last_id itself must still be retained, or events between it and the oldest kept one are gone
+            known = last_id == 0 or conn.execute(
+                "SELECT 1 FROM progress_events WHERE tenant = ? AND id = ?", (tenant, last_id)
+            ).fetchone() is not None
+        finally:
+            conn.execute('COMMIT')
+        complete = known and len(events) <= limit
+        return (self._status(row) if row else None), [dict(event) for event in reversed(events[:limit])], complete
+
+    def timeline(self, tenant):
+        """Phases of the tenant's latest deployment with their start time and duration"""
+        rows = self._conn().execute(
+            """SELECT stage, created_at FROM progress_events
+               WHERE tenant = ? AND created_at >= (SELECT started_at FROM tenants WHERE name = ?)
+               ORDER BY id""",
+            (tenant, tenant)
+        ).fetchall()
+        phases = []
+        for row in rows:
+            if phases and phases[-1]['phase'] == row['stage']:
+                continue
+            if phases:
+                phases[-1]['duration'] = round(row['created_at'] - phases[-1]['started_at'], 3)
+            if row['stage'] in ('completed', 'error'):
+                break
+            phases.append({'phase': row['stage'], 'started_at': row['created_at'], 'duration': None})
+        if phases and phases[-1]['duration'] is None:
+            # Still running: report time spent so far
+            phases[-1]['duration'] = round(time.time() - phases[-1]['started_at'], 3)
+        return phases
+
+    def touch(self, tenant, when=None):
+        """Record that a store was just visited"""
+        with self._transaction() as conn:
+            conn.execute("UPDATE tenants SET last_access = ? WHERE name = ?", (when or time.time(), tenant))
+
+    def set_hibernated(self, tenant, when):
+        """Mark a store as hibernated since when, or as awake again with None"""
+        with self._transaction() as conn:
+            conn.execute("UPDATE tenants SET hibernated_at = ? WHERE name = ?", (when, tenant))
+
+    def awake_tenants(self):
+        """(name, port, last_access) of completed stores that are running"""
+        rows = self._conn().execute(
+            """SELECT name, port, COALESCE(last_access, updated_at) AS last_access FROM tenants
+               WHERE state = 'completed' AND hibernated_at IS NULL"""
+        ).fetchall()
+        return [(row['name'], row['port'], row['last_access']) for row in rows]
+
+    def hibernated_tenants(self):
+        rows = self._conn().execute(
+            "SELECT name, port FROM tenants WHERE hibernated_at IS NOT NULL"
+        ).fetchall()
+        return [(row['name'], row['port']) for row in rows]
+
+    def placements(self):
+        """{tenant: node} for every tenant placed on a Docker node"""
+        rows = self._conn().execute("SELECT name, node FROM tenants WHERE node IS NOT NULL").fetchall()
+        return {row['name']: row['node'] for row in rows}
+
+    def recover(self):
+        """Mark deployments and removals that were in flight when the backend stopped as failed.
+
+        Returns [(tenant, state it was in)]; a failed removal can be retried with another delete.
+        """
+        now = time.time()
+        messages = {
+            'processing': ('interrupted', 'Deployment was interrupted by a backend restart'),
+            'deleting': ('removal_interrupted', 'Removal was interrupted by a backend restart; delete the store again')
+        }
+        with self._transaction() as conn:
+            rows = conn.execute("SELECT name, state FROM tenants WHERE state IN ('processing', 'deleting')").fetchall()
+            tenants = [(row['name'], row['state']) for row in rows]
+            for tenant, state in tenants:
+                stage, message = messages[state]
+                conn.execute(
+                    """UPDATE tenants SET state = 'error', stage = ?, message = ?, percent = 0, updated_at = ?
+                       WHERE name = ?""",
+                    (stage, message, now, tenant)
+                )
+                conn.execute(
+                    "INSERT INTO progress_events (tenant, stage, message, percent, created_at) VALUES (?, ?, ?, 0, ?)",
+                    (tenant, stage, message, now)
+                )
+        return tenants
+
+    def begin_removal(self, tenant, message):
+        """Move a tenant to the deleting state unless it is being deployed or removed; False if it wasn't"""
+        now = time.time()
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                """UPDATE tenants SET state = 'deleting', stage = 'deleting', message = ?, updated_at = ?
+                   WHERE name = ? AND state NOT IN ('processing', 'deleting')""",
+                (message, now, tenant)
+            )
+            if cursor.rowcount == 0:
+                return False
+            conn.execute(
+                "INSERT INTO progress_events (tenant, stage, message, percent, created_at) VALUES (?, 'deleting', ?, NULL, ?)",
+                (tenant, message, now)
+            )
+        return True
+
+    def port_reservations(self, node):
+        """{tenant: port} reserved on a Docker node"""
+        rows = self._conn().execute("SELECT tenant, port FROM port_reservations WHERE node = ?", (node,)).fetchall()
+        return {row['tenant']: row['port'] for row in rows}
+
+    def reserve_port(self, node, tenant, port):
+        with self._transaction() as conn:
+            conn.execute("INSERT OR REPLACE INTO port_reservations (node, tenant, port) VALUES (?, ?, ?)", (node, tenant, port))
+
+    def release_port(self, node, tenant):
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM port_reservations WHERE node = ? AND tenant = ?", (node, tenant))
+
+    def replace_port_reservations(self, node, reservations):
+        """Make {tenant: port} the node's whole set of reservations"""
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM port_reservations WHERE node = ?", (node,))
+            conn.executemany(
+                "INSERT INTO port_reservations (node, tenant, port) VALUES (?, ?, ?)",
+                [(node, tenant, port) for tenant, port in reservations.items()]
+            )
+
+    def record_usage(self, samples, current, before):
+        """Upsert (tenant, at, cpu, memory, net_rx, net_tx, disk_read, disk_write) samples, replace the
+        (container, tenant, cpu, memory) latest readings and drop samples older than before"""
+        with self._transaction() as conn:
+            conn.executemany("INSERT OR REPLACE INTO usage_samples VALUES (?, ?, ?, ?, ?, ?, ?, ?)", samples)
+            conn.execute("DELETE FROM usage_current")
+            conn.executemany("INSERT OR REPLACE INTO usage_current VALUES (?, ?, ?, ?)", current)
+            conn.execute("DELETE FROM usage_samples WHERE at < ?", (before,))
+
+    def usage_samples(self, tenant, since):
+        rows = self._conn().execute(
+            "SELECT * FROM usage_samples WHERE tenant = ? AND at >= ? ORDER BY at", (tenant, since)
+        ).fetchall()
+        return [dict(row) for row in rows]
+
+    def usage_current(self, tenant):
+        """{container: {cpu, memory}} as last read from the tenant's running containers"""
+        rows = self._conn().execute("SELECT * FROM usage_current WHERE tenant = ?", (tenant,)).fetchall()
+        return {row['container']: {'cpu': row['cpu'], 'memory': row['memory']} for row in rows}
+
+    def usage_summaries(self, since, tenant=None, order=None, limit=None):
+        """Average cores, peak memory and average network/disk bytes per second of each tenant since since"""
+        where, params = ("AND tenant = ?", [tenant]) if tenant else ("", [])
+        query = f"""SELECT tenant, AVG(cpu) AS cpu, MAX(memory) AS memory, AVG(net_rx + net_tx) AS network,
+                          AVG(disk_read + disk_write) AS disk
+                   FROM usage_samples WHERE at >= ? {where} GROUP BY tenant"""
+        if order:
+            # order is one of the fixed column names above, never user text
+            query += f" ORDER BY {order} DESC LIMIT ?"
+            params.append(limit or -1)
+        return [dict(row) for row in self._conn().execute(query, [since] + params).fetchall()]
+
+    def forget_usage(self, tenant):
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM usage_samples WHERE tenant = ?", (tenant,))
+            conn.execute("DELETE FROM usage_current WHERE tenant = ?", (tenant,))
+
+    def submit_command(self, name, args):
+        """Queue a command for the leader; returns its id"""
+        now = time.time()
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                "INSERT INTO commands (name, args, created_at, updated_at) VALUES (?, ?, ?, ?)",
+                (name, json.dumps(args), now, now)
+            )
+        return cursor.lastrowid
+
+    def claim_commands(self, limit):
+        """[(id, name, args)] of up to limit pending commands, now marked running"""
+        with self._transaction() as conn:
+            rows = conn.execute(
+                "SELECT id, name, args FROM commands WHERE state = 'pending' ORDER BY id LIMIT ?", (limit,)
+            ).fetchall()
+            # Arguments can hold store owners' passwords, so they aren't kept once read
+            conn.executemany(
+                "UPDATE commands SET state = 'running', args = '{}', updated_at = ? WHERE id = ?",
+                [(time.time(), row['id']) for row in rows]
+            )
+        return [(row['id'], row['name'], json.loads(row['args'])) for row in rows]
+
+    def finish_command(self, command, result):
+        with self._transaction() as conn:
+            conn.execute(
+                "UPDATE commands SET state = 'done', result = ?, updated_at = ? WHERE id = ?",
+                (json.dumps(result), time.time(), command)
+            )
+
+    def collect_command(self, command):
+        """(state, result) of a command, deleting it once done; (None, None) if it is gone"""
+        with self._transaction() as conn:
+            row = conn.execute("SELECT state, result FROM commands WHERE id = ?", (command,)).fetchone()
+            if row is None:
+                return None, None
+            if row['state'] != 'done':
+                return row['state'], None
+            conn.execute("DELETE FROM commands WHERE id = ?", (command,))
+        return 'done', json.loads(row['result'])
+
+    def cancel_command(self, command):
+        """Withdraw a command no leader has taken yet; False if one already has"""
+        with self._transaction() as conn:
+            cursor = conn.execute("DELETE FROM commands WHERE id = ? AND state = 'pending'", (command,))
+        return cursor.rowcount > 0
+
+    def fail_running_commands(self, result):
+        """Answer commands a previous leader took but never finished with result; returns how many"""
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                "UPDATE commands SET state = 'done', result = ?, updated_at = ? WHERE state = 'running'",
+                (json.dumps(result), time.time())
+            )
+        return cursor.rowcount
+
+    def pending_commands(self):
+        return self._conn().execute("SELECT COUNT(*) AS n FROM commands WHERE state = 'pending'").fetchone()['n']
+
+    def prune_history(self, max_age=PROGRESS_RETENTION):
+        now = time.time()
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM progress_events WHERE created_at < ?", (now - max_age,))
+            conn.execute("DELETE FROM commands WHERE state = 'done' AND updated_at < ?", (now - COMMAND_RETENTION,))
+
+    def publish_state(self, key, value):
+        """Share a JSON value with the other worker processes"""
+        with self._transaction() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO cluster_state (key, value, updated_at) VALUES (?, ?, ?)",
+                (key, json.dumps(value), time.time())
+            )
+
+    def state(self, key):
+        """(value, updated_at) last published under key, or (None, None)"""
+        row = self._conn().execute("SELECT value, updated_at FROM cluster_state WHERE key = ?", (key,)).fetchone()
+        return (json.loads(row['value']), row['updated_at']) if row else (None, None)
+
+    def on_profile(self, profile):
+        """Deployed tenants on a performance profile"""
+        rows = self._conn().execute(
+            "SELECT name FROM tenants WHERE state = 'completed' AND COALESCE(profile, 'standard') = ? ORDER BY id", (profile,)
+        ).fetchall()
+        return [row['name'] for row in rows]
+
+    def profile_counts(self):
+        rows = self._conn().execute(
+            "SELECT COALESCE(profile, 'standard') AS profile, COUNT(*) AS n FROM tenants GROUP BY 1"
+        ).fetchall()
+        return {row['profile']: row['n'] for row in rows}
+
+    def counts(self):
+        rows = self._conn().execute("SELECT state, COUNT(*) AS n FROM tenants GROUP BY state").fetchall()
+        return {row['state']: row['n'] for row in rows}
+
+    @staticmethod
+    def _status(row):
+        status = {
+            'tenant_id': row['name'],
+            'stage': row['stage'],
+            'message': row['message'],
+            'percent': row['percent'],
+            'status': row['state'],  # processing, completed, error, deleting
+            'start_time': row['started_at'],
+            'last_update': row['updated_at'],
+            'port': row['port'],
+            'admin_folder': row['admin_folder'],
+            'last_access': row['last_access'],
+            'hibernated': row['hibernated_at'] is not None,
+            'batch_id': row['batch_id'],
+            'node': row['node'],
+            'profile': row['profile'] or 'standard'  # stores created before profiles got the standard limits
+        }
+        if row['result']:
+            status['result'] = json.loads(row['result'])
+        return status
+
+
+class _Transaction:
+    """Context manager wrapping one BEGIN IMMEDIATE ... COMMIT on a connection"""
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        self.conn.execute('BEGIN IMMEDIATE')
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        self.conn.execute('ROLLBACK' if exc_type else 'COMMIT')
+        return False
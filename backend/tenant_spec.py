@@ -0,0 +1,274 @@
+import io
+import json
+import os
+import re
+import tarfile
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+from docker_engine import DockerEngineError
+
+# Labels docker-compose puts on what it creates; with them operators can still run
+# `docker-compose ps/logs/down` in the tenant directory against API-created stacks
+PROJECT_LABEL = 'com.docker.compose.project'
+SERVICE_LABEL = 'com.docker.compose.service'
+NETWORK_LABEL = 'com.docker.compose.network'
+VOLUME_LABEL = 'com.docker.compose.volume'
+
+SIZE_UNITS = {'': 1, 'b': 1, 'k': 1024, 'm': 1024 ** 2, 'g': 1024 ** 3}
+NANOSECONDS = 1000000000
+
+
+def parse_size(value):
+    """Bytes in a compose size like 512m or 1g"""
+    match = re.fullmatch(r'(\d+)([bkmg]?)b?', str(value).strip().lower())
+    if not match:
+        raise ValueError(f'Invalid size {value!r}')
+    return int(match.group(1)) * SIZE_UNITS[match.group(2)]
+
+
+def yaml_string(value):
+    """A double-quoted YAML scalar; $ is doubled so compose doesn't interpolate it"""
+    return json.dumps(str(value)).replace('$', '$$')
+
+
+@dataclass
+class Mount:
+    volume: str  # key in TenantSpec.volumes / external_volumes
+    target: str
+    nocopy: bool = False
+    read_only: bool = False
+
+
+@dataclass
+class ConfigFile:
+    path: str  # absolute path inside the container
+    content: str
+
+
+@dataclass
+class Healthcheck:
+    test: List[str]
+    timeout: int
+    retries: int
+    start_period: int = 0
+    interval: int = 30  # the compose default
+
+
+@dataclass
+class Service:
+    name: str  # compose service name, also the container's alias on its networks
+    container: str
+    image: str
+    environment: Dict[str, str]
+    networks: List[str]  # keys in TenantSpec.networks / external_networks
+    mounts: List[Mount] = field(default_factory=list)
+    port: Optional[int] = None  # host port published to container port 80
+    healthcheck: Optional[Healthcheck] = None
+    memory: str = ''
+    cpus: str = ''
+    depends_on: List[str] = field(default_factory=list)  # services that must be healthy first
+    files: List[ConfigFile] = field(default_factory=list)  # written into the container before it first starts
+    command: List[str] = field(default_factory=list)  # replaces the image's CMD when set
+
+
+@dataclass
+class TenantSpec:
+    """One tenant's stack: rendered to docker-compose.yml for operators, created through the Engine API.
+
+    Resource names and labels follow docker-compose's conventions for a
+    project named after the tenant directory, so the stack looks the same
+    whichever of the two created it.
+    """
+    project: str
+    services: List[Service]
+    networks: List[str]
+    volumes: List[str]
+    external_networks: Dict[str, str] = field(default_factory=dict)
+    external_volumes: Dict[str, str] = field(default_factory=dict)  # shared with other stacks, never created or removed here
+
+    def network_name(self, key):
+        return self.external_networks.get(key) or f'{self.project}_{key}'
+
+    def volume_name(self, key):
+        return self.external_volumes.get(key) or f'{self.project}_{key}'
+
+    def service(self, name):
+        return next(service for service in self.services if service.name == name)
+
+    @staticmethod
+    def config_key(service, config):
+        return f'{service.name}-{os.path.basename(config.path)}'
+
+    def write_files(self, project_dir):
+        """Write every service's config files under project_dir/config, where the compose file mounts them from"""
+        for service in self.services:
+            for config in service.files:
+                path = os.path.join(project_dir, 'config', self.config_key(service, config))
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                with open(path, 'w') as f:
+                    f.write(config.content)
+
+    def upload_files(self, engine, service, project_dir):
+        """Copy a service's config files into its (possibly stopped) container"""
+        if not service.files:
+            return
+        archive_path = os.path.join(project_dir, f'.{service.name}-config.tar')
+        with tarfile.open(archive_path, 'w') as archive:
+            for config in service.files:
+                content = config.content.encode()
+                info = tarfile.TarInfo(config.path.lstrip('/'))
+                info.size = len(content)
+                info.mode = 0o644
+                info.mtime = int(time.time())
+                archive.addfile(info, io.BytesIO(content))
+        try:
+            engine.put_archive(service.container, '/', archive_path)
+        finally:
+            os.remove(archive_path)
+
+    def resources(self, service):
+        """Engine API memory and CPU limits for a service (also accepted by container updates)"""
+        resources = {}
+        if service.memory:
+            # Same swap allowance Docker gives a container created with only a memory limit
+            resources['Memory'] = parse_size(service.memory)
+            resources['MemorySwap'] = 2 * resources['Memory']
+        if service.cpus:
+            resources['NanoCpus'] = int(float(service.cpus) * NANOSECONDS)
+        return resources
+
+    def to_compose(self):
+        lines = ['services:']
+        for service in self.services:
+            lines += [
+                f'  {service.name}:',
+                f'    image: {service.image}',
+                f'    container_name: {service.container}',
+                '    restart: unless-stopped'
+            ]
+            if service.memory:
+                lines.append(f'    mem_limit: {service.memory}')
+            if service.cpus:
+                lines.append(f'    cpus: {service.cpus}')
+            if service.depends_on:
+                lines.append('    depends_on:')
+                for dependency in service.depends_on:
+                    lines += [f'      {dependency}:', '        condition: service_healthy']
+            lines.append('    networks:')
+            lines += [f'      - {network}' for network in service.networks]
+            if service.port:
+                lines += ['    ports:', f'      - "{service.port}:80"']
+            if service.command:
+                lines.append(f'    command: {json.dumps(service.command)}')
+            lines.append('    environment:')
+            lines += [f'      {key}: {yaml_string(value)}' for key, value in service.environment.items()]
+            if service.mounts:
+                lines.append('    volumes:')
+                for mount in service.mounts:
+                    lines += ['      - type: volume', f'        source: {mount.volume}', f'        target: {mount.target}']
+                    if mount.read_only:
+                        lines.append('        read_only: true')
+                    if mount.nocopy:
+                        lines += ['        volume:', '          nocopy: true']
+            if service.files:
+                lines.append('    configs:')
+                for config in service.files:
+                    lines += [f'      - source: {self.config_key(service, config)}', f'        target: {config.path}']
+            if service.healthcheck:
+                check = service.healthcheck
+                lines += ['    healthcheck:', f'      test: {json.dumps(check.test)}', f'      timeout: {check.timeout}s', f'      retries: {check.retries}']
+                if check.start_period:
+                    lines.append(f'      start_period: {check.start_period}s')
+        configs = [(service, config) for service in self.services for config in service.files]
+        if configs:
+            lines += ['', 'configs:']
+            for service, config in configs:
+                key = self.config_key(service, config)
+                lines += [f'  {key}:', f'    file: ./config/{key}']
+        lines += ['', 'volumes:'] + [f'  {volume}:' for volume in self.volumes]
+        for key, name in self.external_volumes.items():
+            lines += [f'  {key}:', '    external: true', f'    name: {name}']
+        lines += ['', 'networks:']
+        for network in self.networks:
+            lines += [f'  {network}:', '    driver: bridge']
+        for key, name in self.external_networks.items():
+            lines += [f'  {key}:', '    external: true', f'    name: {name}']
+        return '\n'.join(lines) + '\n'
+
+    def container_config(self, service):
+        """Engine API create body for one service, attached to its first network"""
+        host_config = {
+            'RestartPolicy': {'Name': 'unless-stopped'},
+            'NetworkMode': self.network_name(service.networks[0]),
+            'Mounts': [
+                {'Type': 'volume', 'Source': self.volume_name(mount.volume), 'Target': mount.target,
+                 'ReadOnly': mount.read_only, 'VolumeOptions': {'NoCopy': mount.nocopy}}
+                for mount in service.mounts
+            ]
+        }
+        host_config.update(self.resources(service))
+        config = {
+            'Image': service.image,
+            'Env': [f'{key}={value}' for key, value in service.environment.items()],
+            'Labels': {
+                PROJECT_LABEL: self.project,
+                SERVICE_LABEL: service.name,
+                'com.docker.compose.oneoff': 'False',
+                'com.docker.compose.container-number': '1'
+            },
+            'HostConfig': host_config,
+            'NetworkingConfig': {'EndpointsConfig': {self.network_name(service.networks[0]): {'Aliases': [service.name]}}}
+        }
+        if service.command:
+            config['Cmd'] = service.command
+        if service.port:
+            config['ExposedPorts'] = {'80/tcp': {}}
+            host_config['PortBindings'] = {'80/tcp': [{'HostIp': '', 'HostPort': str(service.port)}]}
+        if service.healthcheck:
+            check = service.healthcheck
+            config['Healthcheck'] = {
+                'Test': check.test,
+                'Interval': check.interval * NANOSECONDS,
+                'Timeout': check.timeout * NANOSECONDS,
+                'Retries': check.retries,
+                'StartPeriod': check.start_period * NANOSECONDS
+            }
+        return config
+
+    def create(self, engine, project_dir):
+        """Create the stack's networks, volumes and (stopped) containers with their config files in place"""
+        self.write_files(project_dir)
+        for network in self.networks:
+            engine.create_network(self.network_name(network), {PROJECT_LABEL: self.project, NETWORK_LABEL: network})
+        for volume in self.volumes:
+            engine.create_volume(self.volume_name(volume), {PROJECT_LABEL: self.project, VOLUME_LABEL: volume})
+        for service in self.services:
+            config = self.container_config(service)
+            try:
+                engine.create_container(service.container, config)
+            except DockerEngineError as e:
+                if e.status != 404:
+                    raise
+                # The image was pruned since it was last checked; pull it like compose would
+                for _ in engine.pull_image(service.image):
+                    pass
+                engine.create_container(service.container, config)
+            self.upload_files(engine, service, project_dir)
+            for network in service.networks[1:]:
+                engine.connect_network(self.network_name(network), service.container, [service.name])
+
+    def start(self, engine, name):
+        engine.start_container(self.service(name).container)
+
+
+def remove_project(engine, project):
+    """Remove a stack's containers, networks and volumes, whether the API or docker-compose created them"""
+    label = f'{PROJECT_LABEL}={project}'
+    for container in engine.list_containers(all=True, label=label):
+        engine.remove_container(container['Names'][0].lstrip('/'))
+    for network in engine.list_networks(label=label):
+        engine.remove_network(network['Name'])
+    for volume in engine.list_volumes(label=label):
+        engine.remove_volume(volume['Name'])
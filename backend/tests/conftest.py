@@ -0,0 +1,53 @@
+import os
+import sys
+import time
+
+import pytest
+
+# The backend is a directory of flat modules run from backend/
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Modules read their settings at import time, which happens while tests are collected
+os.environ.update({
+    'DOCKER_ENGINE': 'fake',
+    'SERVER_IP': '127.0.0.1',
+    'PROVISION_WORKERS': '2',
+    'MYSQL_READY_TIMEOUT': '2',
+    'SHOP_READY_TIMEOUT': '2',
+    'GOLDEN_SNAPSHOT': '0',
+    'WARM_POOL_SIZE': '0'
+})
+
+FAST_LATENCIES = {'container_start': 0.01, 'db_healthy': 0.05, 'shop_healthy': 0.05, 'shop_restored': 0.05}
+
+
+def wait_until(predicate, timeout=10):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.02)
+    return False
+
+
+@pytest.fixture(scope='session')
+def engine():
+    """The process-wide simulated Docker engine the backend runs on"""
+    from docker_engine import set_engine
+    from fake_engine import FakeDockerEngine
+    fake = FakeDockerEngine(latencies=FAST_LATENCIES, failure_rates={'compose': 0, 'db': 0, 'shop': 0}, seed=1)
+    set_engine(fake)
+    return fake
+
+
+@pytest.fixture(scope='session')
+def backend(engine, tmp_path_factory):
+    """The app module, imported once against the fake engine"""
+    os.environ['TENANTS_DIR'] = str(tmp_path_factory.mktemp('tenants'))
+    import app
+    return app
+
+
+@pytest.fixture
+def client(backend):
+    return backend.app.test_client()
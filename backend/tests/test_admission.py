@@ -0,0 +1,85 @@
+import pytest
+
+import admission
+from admission import MB, AdmissionController
+
+
+@pytest.fixture
+def host(monkeypatch):
+    """Host readings the controller samples; edit the dict to change them"""
+    readings = {'cpu_times': (100, 1000), 'memory': 4096 * MB, 'disk': 20000 * MB}
+    monkeypatch.setattr(admission, 'read_cpu_times', lambda: readings['cpu_times'])
+    monkeypatch.setattr(admission, 'read_memory_available', lambda: readings['memory'])
+    monkeypatch.setattr(admission, 'read_disk_free', lambda path: readings['disk'])
+    return readings
+
+
+def controller():
+    return AdmissionController(max_cpu=0.85, min_memory_mb=1024, min_disk_mb=5120)
+
+
+def test_cpu_utilisation_comes_from_the_jiffy_delta(host):
+    gate = controller()
+    assert gate.snapshot()['cpu'] is None
+    assert gate.cpu_available()
+
+    host['cpu_times'] = (150, 2000)  # 50 idle out of 1000
+    gate.sample()
+    assert gate.snapshot()['cpu'] == 0.95
+    assert not gate.cpu_available()
+
+    host['cpu_times'] = (950, 3000)
+    gate.sample()
+    assert gate.snapshot()['cpu'] == 0.2
+    assert gate.cpu_available()
+
+
+def test_memory_and_disk_shortfalls_refuse_signups(host):
+    gate = controller()
+    assert gate.rejection() is None
+
+    host['memory'] = 512 * MB
+    gate.sample()
+    assert gate.rejection() == 'memory'
+
+    host['memory'], host['disk'] = 4096 * MB, 100 * MB
+    gate.sample()
+    assert gate.rejection(count=False) == 'disk'
+    assert gate.rejection() == 'disk'
+    assert gate.stats()['rejections'] == {'memory': 1, 'disk': 1}
+
+
+def test_missing_readings_never_refuse(host):
+    host.update(cpu_times=None, memory=None, disk=None)
+    gate = controller()
+    assert gate.rejection() is None
+    assert gate.cpu_available()
+
+
+def test_memory_headroom_is_capped_by_the_cgroup_limit(monkeypatch):
+    files = {
+        '/proc/meminfo': 'MemTotal: 16000000 kB\nMemAvailable: 8000000 kB\n',
+        '/sys/fs/cgroup/memory.max': str(3 * 1024 * MB),
+        '/sys/fs/cgroup/memory.current': str(1024 * MB)
+    }
+
+    def fake_open(path, *args, **kwargs):
+        import io
+        if path not in files:
+            raise FileNotFoundError(path)
+        return io.StringIO(files[path])
+
+    monkeypatch.setattr('builtins.open', fake_open)
+    assert admission.read_memory_available() == 2 * 1024 * MB
+    files['/sys/fs/cgroup/memory.max'] = 'max'
+    assert admission.read_memory_available() == 8000000 * 1024
+
+
+def test_a_saturated_host_refuses_signups_with_503(backend, client, monkeypatch):
+    monkeypatch.setattr(backend.admission, 'min_memory', float('inf'))
+    backend.admission.sample()
+    response = client.post('/create-store', json={'email': 'owner@example.com', 'password': 'Secret123!'})
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '120'
+    response = client.post('/tenants/batch', json={'stores': [{'email': 'owner@example.com', 'password': 'Secret123!'}]})
+    assert response.status_code == 503
@@ -0,0 +1,56 @@
+import json
+
+import pytest
+
+from conftest import wait_until
+
+
+def create_store(client):
+    response = client.post('/create-store', json={'email': 'owner@example.com', 'password': 'secret123'})
+    assert response.status_code == 202
+    return response.get_json()['tenant_id']
+
+
+def finished(client, tenant):
+    return client.get(f'/deployment-status/{tenant}').get_json()['status'] != 'processing'
+
+
+def test_signup_deploys_a_store(client):
+    tenant = create_store(client)
+    assert wait_until(lambda: finished(client, tenant))
+
+    status = client.get(f'/deployment-status/{tenant}?history=1').get_json()
+    assert status['status'] == 'completed'
+    assert status['result']['url'].startswith('http://127.0.0.1:')
+    assert [event['stage'] for event in status['history']][-1] == 'completed'
+    assert status['phases']
+
+
+def test_create_store_requires_credentials(client):
+    response = client.post('/create-store', json={'email': 'owner@example.com'})
+    assert response.status_code == 400
+
+
+@pytest.mark.parametrize('body', [[], ['owner@example.com'], 'owner@example.com', 'not json'])
+def test_a_body_that_is_not_an_object_is_400(client, body):
+    data = body if body == 'not json' else json.dumps(body)
+    for method, path in [('POST', '/create-store'), ('POST', '/tenants/batch'), ('DELETE', '/tenants/batch'),
+                         ('PUT', '/tenants/tenant1/profile')]:
+        response = client.open(path, method=method, data=data, content_type='application/json')
+        assert response.status_code == 400
+        assert response.get_json()['error'] == 'The request body must be a JSON object'
+
+
+def test_unknown_tenant_is_404(client):
+    assert client.get('/deployment-status/tenant404').status_code == 404
+    assert client.get('/deployment-stream/tenant404').status_code == 404
+
+
+def test_a_containerised_backend_does_not_hibernate_in_port_mode(backend, client, monkeypatch):
+    tenant = create_store(client)
+    assert wait_until(lambda: finished(client, tenant))
+    monkeypatch.setattr(backend, 'HIBERNATION_AVAILABLE', False)
+    response = client.post(f'/tenants/{tenant}/hibernate')
+    assert response.status_code == 409
+    assert 'ROUTING_MODE=host' in response.get_json()['error']
+    assert not backend.hibernator.hibernated(tenant)
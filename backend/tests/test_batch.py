@@ -0,0 +1,42 @@
+from conftest import wait_until
+from test_teardown import deployed
+
+
+def test_batch_creates_and_tracks_every_store(client):
+    stores = [{'email': f'owner{i}@example.com', 'password': 'Secret123!'} for i in range(3)]
+    response = client.post('/tenants/batch', json={'stores': stores})
+    assert response.status_code == 202
+    body = response.get_json()
+    assert [item['email'] for item in body['tenants']] == [store['email'] for store in stores]
+
+    assert wait_until(lambda: client.get(body['status_url']).get_json()['done'])
+    batch = client.get(body['status_url']).get_json()
+    assert batch['total'] == 3
+    assert batch['counts'] == {'completed': 3}
+    assert [item['tenant_id'] for item in batch['tenants']] == [item['tenant_id'] for item in body['tenants']]
+
+    assert wait_until(lambda: all(deployed(client, item['tenant_id']) for item in body['tenants']))
+    response = client.delete('/tenants/batch', json={'batch_id': body['batch_id']})
+    assert [item['result'] for item in response.get_json()['tenants']] == ['deleting'] * 3
+    assert wait_until(lambda: client.get(body['status_url']).status_code == 404)
+
+
+def test_batch_validates_every_store(client):
+    response = client.post('/tenants/batch', json={'stores': [{'email': 'a@example.com', 'password': 'x'}, {'email': 'b@example.com'}, 'c']})
+    assert response.status_code == 400
+    assert response.get_json()['invalid'] == [1, 2]
+    assert client.post('/tenants/batch', json={'stores': []}).status_code == 400
+    assert client.delete('/tenants/batch', json={}).status_code == 400
+    for tenants in ([{'x': 1}], ['tenant1', 7], [None]):
+        assert client.delete('/tenants/batch', json={'tenants': tenants}).status_code == 400
+    assert client.get('/tenants/batch/batch-unknown').status_code == 404
+
+
+def test_a_batch_that_does_not_fit_the_queue_is_refused_whole(backend, client, monkeypatch):
+    monkeypatch.setattr(backend.provisioning_queue, 'max_depth', 1)
+    # Two idle workers and one place to wait
+    stores = [{'email': f'owner{i}@example.com', 'password': 'Secret123!'} for i in range(4)]
+    response = client.post('/tenants/batch', json={'stores': stores})
+    assert response.status_code == 429
+    assert response.headers['Retry-After'] == '30'
+    assert backend.provisioning_queue.stats()['reserved'] == 0
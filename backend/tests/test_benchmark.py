@@ -0,0 +1,13 @@
+from benchmark import percentile, summarize
+
+
+def test_percentile_uses_the_nearest_rank():
+    values = [5, 1, 4, 2, 3, 6, 7, 8, 9, 10]
+    assert percentile(values, 50) == 5
+    assert percentile(values, 95) == 10
+    assert percentile(values, 1) == 1
+    assert percentile([], 50) is None
+
+
+def test_summarize_empty_run():
+    assert summarize([]) == {'count': 0, 'p50': None, 'p95': None, 'p99': None, 'max': None}
@@ -0,0 +1,82 @@
+import os
+import threading
+
+import pytest
+
+from cluster import CommandQueue, LeaderElection
+from tenant_registry import TenantRegistry
+
+
+def test_one_worker_leads_and_another_takes_over_when_it_dies(tmp_path):
+    path = str(tmp_path / '.leader')
+    elected = []
+    first = LeaderElection(path, retry=0.02)
+    second = LeaderElection(path, retry=0.02)
+    took_over = threading.Event()
+
+    first.start(lambda: elected.append('first'))
+    second.start(lambda: (elected.append('second'), took_over.set()))
+    assert elected == ['first']
+    assert first.leader and not second.leader
+    assert second.stats()['leader_pid'] == os.getpid()
+
+    # The kernel drops the lock when the leader's process (and so its file) goes away
+    first._file.close()
+    assert took_over.wait(5)
+    assert elected == ['first', 'second']
+    assert second.leader
+
+
+class Election:
+    def __init__(self, leader):
+        self.leader = leader
+
+
+@pytest.fixture
+def registry(tmp_path):
+    return TenantRegistry(str(tmp_path / 'registry.db'))
+
+
+def command_queues(registry, **kwargs):
+    """The leader's and another worker's CommandQueue over one registry, with a shared handler"""
+    leader = CommandQueue(registry, Election(True), poll_interval=0.01, **kwargs)
+    worker = CommandQueue(registry, Election(False), poll_interval=0.01, **kwargs)
+
+    def double(value):
+        if value < 0:
+            raise ValueError('negative')
+        return {'value': value * 2}, 202, {'Retry-After': '1'}
+
+    for queue in (leader, worker):
+        queue.handler(double)
+    return leader, worker, double
+
+
+def test_the_leader_runs_calls_directly(registry):
+    leader, _, double = command_queues(registry)
+    assert leader.call(double, value=2) == ({'value': 4}, 202, {'Retry-After': '1'})
+    assert registry.pending_commands() == 0
+
+
+def test_other_workers_get_the_leaders_response(registry):
+    leader, worker, double = command_queues(registry)
+    leader.start()
+    assert worker.call(double, value=21) == ({'value': 42}, 202, {'Retry-After': '1'})
+    assert worker.call(double, value=-1) == ({'error': 'double failed: negative'}, 500)
+    assert leader.stats() == {'executed': 1, 'failed': 1, 'pending': 0}
+
+
+def test_commands_nobody_takes_are_withdrawn(registry):
+    _, worker, double = command_queues(registry, pickup_timeout=0.1)
+    body, status, headers = worker.call(double, value=1)
+    assert status == 503 and headers == {'Retry-After': '5'}
+    assert registry.claim_commands(10) == []
+
+
+def test_a_new_leader_answers_commands_its_predecessor_dropped(registry):
+    leader, _, _ = command_queues(registry)
+    command = registry.submit_command('double', {'value': 1})
+    registry.claim_commands(10)  # taken by a leader that then died
+    leader.start()
+    state, (body, status, headers) = registry.collect_command(command)
+    assert (state, status) == ('done', 503)
@@ -0,0 +1,117 @@
+import os
+import pwd
+import subprocess
+
+import pytest
+
+from code_layer import SEED_SCRIPT, TENANT_PATHS, CodeLayer, CodeLayerError
+from conftest import FAST_LATENCIES
+from docker_engine import DockerEngineError
+from fake_engine import FakeDockerEngine
+from nodes import Node
+
+IMAGE = 'prestashop/prestashop:8.1.6-apache'
+
+
+def can_chown():
+    try:
+        pwd.getpwnam('www-data')
+    except KeyError:
+        return False
+    return os.geteuid() == 0
+
+
+@pytest.fixture
+def node():
+    return Node('local', '', FakeDockerEngine(latencies=dict(FAST_LATENCIES, oneshot=0.05)), ports=None)
+
+
+def test_the_volume_is_named_after_the_image_id(node):
+    layer = CodeLayer(IMAGE, None)
+    image_id = node.engine.inspect_image(IMAGE)['Id'].split(':')[-1]
+    assert layer.volume(node) == f'code-prestashop-8.1.6-apache-{image_id[:12]}'
+
+    node.engine.prune_images()
+    with pytest.raises(CodeLayerError, match='not on node local'):
+        layer.volume(node)
+
+
+def test_ensure_builds_once_and_prunes_older_layers(node):
+    node.engine.create_volume('code-prestashop-old', {'saas.code-layer': IMAGE})
+    node.engine.create_volume('code-prestashop-mounted', {'saas.code-layer': IMAGE})
+    remove_volume = node.engine.remove_volume
+
+    def refuse_mounted(name):
+        if name == 'code-prestashop-mounted':
+            raise DockerEngineError(409, 'volume is in use')
+        remove_volume(name)
+    node.engine.remove_volume = refuse_mounted
+
+    layer = CodeLayer(IMAGE, None, build_timeout=5)
+    assert not layer.ready(node)
+    volume = layer.ensure(node)
+    assert layer.ensure(node) == volume
+    assert layer.ready(node)
+
+    assert layer.stats()['builds'] == 1
+    assert node.engine.calls['create_container'] == 1
+    assert f'{volume}-build' not in node.engine.containers
+    assert sorted(node.engine.volumes) == sorted([volume, 'code-prestashop-mounted'])
+
+
+def test_a_build_that_never_exits_times_out(node):
+    node.engine.latencies['oneshot'] = 5
+    layer = CodeLayer(IMAGE, None, build_timeout=0.1)
+    with pytest.raises(CodeLayerError, match='timed out'):
+        layer.ensure(node)
+    assert not layer.ready(node)
+    assert not [name for name in node.engine.containers if name.endswith('-build')]
+
+
+def seed(tmp_path):
+    """Run the seed script against a fake code layer and web root under tmp_path"""
+    script = SEED_SCRIPT.format(
+        tenant_paths=' '.join(TENANT_PATHS), web_root=tmp_path / 'html', code_root=tmp_path / 'core', start_script='true'
+    )
+    subprocess.run(['sh', '-c', script], check=True)
+
+
+@pytest.fixture
+def code_root(tmp_path):
+    core = tmp_path / 'core'
+    for path in ('app/config', 'app/Resources', 'classes', 'img/p', 'admin'):
+        (core / path).mkdir(parents=True)
+    for path in ('index.php', 'app/config/parameters.php', 'app/AppKernel.php', 'classes/Cart.php', 'img/logo.png', '.htaccess', '.complete'):
+        (core / path).write_text(path)
+    (tmp_path / 'html').mkdir()
+    return core
+
+
+@pytest.mark.skipif(not can_chown(), reason='the seed script chowns tenant paths to www-data')
+def test_seed_copies_tenant_paths_and_links_the_rest(tmp_path, code_root):
+    seed(tmp_path)
+    html = tmp_path / 'html'
+    assert (html / 'app/config/parameters.php').read_text() == 'app/config/parameters.php'
+    assert not (html / 'app/config').is_symlink() and not (html / 'img').is_symlink()
+    assert (html / 'app/Resources').is_symlink() and (html / 'classes').is_symlink()
+    assert os.readlink(html / 'classes') == str(code_root / 'classes')
+    assert (html / 'index.php').is_file() and (html / '.htaccess').is_file()
+    assert (html / '.code-layer').exists() and not (html / '.complete').exists()
+    assert not (html / '.code-layer-seeding').exists()
+
+
+@pytest.mark.skipif(not can_chown(), reason='the seed script chowns tenant paths to www-data')
+def test_seed_leaves_a_restored_web_root_alone(tmp_path, code_root):
+    (tmp_path / 'html/index.php').write_text('restored')
+    seed(tmp_path)
+    assert sorted(os.listdir(tmp_path / 'html')) == ['.code-layer', 'index.php']
+
+
+@pytest.mark.skipif(not can_chown(), reason='the seed script chowns tenant paths to www-data')
+def test_an_interrupted_seed_resumes_keeping_what_exists(tmp_path, code_root):
+    html = tmp_path / 'html'
+    (html / 'index.php').write_text('kept')
+    (html / '.code-layer-seeding').touch()
+    seed(tmp_path)
+    assert (html / 'index.php').read_text() == 'kept'
+    assert (html / 'classes').is_symlink() and (html / 'img/logo.png').is_file()
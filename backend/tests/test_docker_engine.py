@@ -0,0 +1,87 @@
+import json
+import socketserver
+import struct
+import threading
+from http.server import BaseHTTPRequestHandler
+
+import pytest
+
+from docker_engine import DockerEngine, DockerEngineError, demux_stream
+
+
+class FakeDaemon(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """A Docker-like API on a unix socket that counts the connections it accepts"""
+
+    daemon_threads = True
+
+    def __init__(self, path):
+        self.connections = 0
+        super().__init__(path, Handler)
+
+    def get_request(self):
+        self.connections += 1
+        return super().get_request()
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def address_string(self):
+        return 'docker'
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.startswith('/v1.41/containers/missing/json'):
+            self.reply(404, {'message': 'No such container: missing'})
+        elif self.path.startswith('/v1.41/containers/json'):
+            self.reply(200, [{'Names': ['/tenant1_shop'], 'query': self.path.split('?', 1)[-1]}])
+        else:
+            self.reply(500, {'message': 'boom'})
+
+    def reply(self, status, body):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+@pytest.fixture
+def daemon(tmp_path):
+    server = FakeDaemon(str(tmp_path / 'docker.sock'))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_requests_reuse_pooled_connections(daemon):
+    engine = DockerEngine(daemon.server_address, pool_size=2)
+    for _ in range(5):
+        containers = engine.request_json('GET', '/containers/json', params={'all': 1})
+        assert containers[0]['Names'] == ['/tenant1_shop']
+        assert containers[0]['query'] == 'all=1'
+    assert daemon.connections == 1
+
+
+def test_api_errors_carry_the_status_and_message(daemon):
+    engine = DockerEngine(daemon.server_address)
+    assert engine.request_json('GET', '/containers/missing/json', allow_404=True) is None
+    with pytest.raises(DockerEngineError) as error:
+        engine.request_json('GET', '/containers/missing/json')
+    assert error.value.status == 404
+    assert 'No such container' in str(error.value)
+    with pytest.raises(DockerEngineError, match='boom'):
+        engine.request_json('GET', '/info')
+
+
+def test_demux_splits_stdout_and_stderr():
+    def frame(stream, text):
+        data = text.encode()
+        return struct.pack('>BxxxL', stream, len(data)) + data
+
+    data = frame(1, 'hello ') + frame(2, 'oops') + frame(1, 'world') + b'\x01\x00'  # trailing partial header
+    assert demux_stream(data) == ('hello world', 'oops')
@@ -0,0 +1,38 @@
+from golden_snapshot import GoldenSnapshot, render_parameters
+
+PARAMETERS = """<?php return array (
+  'parameters' =>
+  array (
+    'database_host' => 'golden_db',
+    'database_port' => '',
+    'database_name' => 'prestashop',
+    'database_password' => 'it\\'s \\\\old',
+    'secret' => 'abc',
+    'mailer_transport' => 'smtp',
+  ),
+);
+"""
+
+
+def test_render_replaces_only_the_given_keys():
+    rendered = render_parameters(PARAMETERS, {'database_host': 'tenant3_db', 'database_port': 3306})
+    assert "'database_host' => 'tenant3_db'," in rendered
+    assert "'database_port' => '3306'," in rendered
+    assert "'database_name' => 'prestashop'," in rendered
+    assert "'mailer_transport' => 'smtp'," in rendered
+
+
+def test_render_escapes_quotes_and_backslashes():
+    rendered = render_parameters(PARAMETERS, {'database_password': "o'k\\pw", 'secret': 'x'})
+    assert "'database_password' => 'o\\'k\\\\pw'," in rendered
+    assert "'secret' => 'x'," in rendered
+    assert rendered.count("'database_password'") == 1
+
+
+def test_render_ignores_unknown_keys():
+    assert render_parameters(PARAMETERS, {'cookie_key': 'x'}) == PARAMETERS
+
+
+def test_unreadable_snapshot_metadata_is_ignored(tmp_path):
+    (tmp_path / 'snapshot.json').write_text('{not json')
+    assert GoldenSnapshot(str(tmp_path))._meta is None
@@ -0,0 +1,145 @@
+import socket
+import threading
+import time
+
+import pytest
+
+import hibernation
+from conftest import FAST_LATENCIES, wait_until
+from fake_engine import FakeDockerEngine
+from hibernation import Hibernator
+from tenant_registry import TenantRegistry
+
+# The shop fixture redirects socket.create_connection; visitors keep the real one
+connect = socket.create_connection
+
+
+def free_port():
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        return probe.getsockname()[1]
+
+
+@pytest.fixture
+def engine():
+    return FakeDockerEngine(latencies=FAST_LATENCIES)
+
+
+@pytest.fixture
+def registry(tmp_path):
+    return TenantRegistry(str(tmp_path / 'registry.db'))
+
+
+def deployed(engine, registry):
+    tenant = registry.allocate()
+    registry.update(tenant, port=free_port())
+    registry.record_progress(tenant, 'completed', 'Store deployment completed!', 100, state='completed')
+    engine._add_container(f'{tenant}_db', 'db')
+    engine._add_container(f'{tenant}_shop', 'shop')
+    return tenant
+
+
+def hibernator(engine, registry, **options):
+    return Hibernator(
+        engine, None, registry, lambda tenant: [f'{tenant}_db', f'{tenant}_shop'],
+        lambda container: '127.0.0.1', **options
+    )
+
+
+@pytest.fixture
+def shop(monkeypatch):
+    """A stand-in for the shop's port 80 that answers one request per connection"""
+    server = socket.socket()
+    server.bind(('127.0.0.1', 0))
+    server.listen(8)
+
+    def serve():
+        while True:
+            conn, _ = server.accept()
+            with conn:
+                conn.recv(65536)
+                conn.sendall(b'HTTP/1.0 200 OK\r\n\r\nshop')
+
+    threading.Thread(target=serve, daemon=True).start()
+    monkeypatch.setattr(
+        hibernation.socket, 'create_connection',
+        lambda address, timeout=None: connect(('127.0.0.1', server.getsockname()[1]), timeout)
+    )
+    yield
+    server.close()
+
+
+def visit(port, request=b'GET / HTTP/1.0\r\n\r\n'):
+    with connect(('127.0.0.1', port), timeout=10) as client:
+        client.sendall(request)
+        chunks = []
+        while True:
+            data = client.recv(65536)
+            if not data:
+                return b''.join(chunks)
+            chunks.append(data)
+
+
+def test_sweep_hibernates_only_idle_stores(engine, registry):
+    busy, idle, warm = (deployed(engine, registry) for _ in range(3))
+    sleeper = hibernator(engine, registry, idle_after=60, exclude=lambda tenant: tenant == warm)
+    started = time.time()
+    try:
+        sleeper.sweep(now=started + 10)
+        engine.record_traffic(f'{busy}_shop')
+        sleeper.sweep(now=started + 65)
+
+        assert not sleeper.hibernated(busy)
+        assert sleeper.hibernated(idle)
+        assert not sleeper.hibernated(warm)
+        assert not engine.containers[f'{idle}_shop']['running']
+        assert not engine.containers[f'{idle}_db']['running']
+        assert [tenant for tenant, _ in registry.hibernated_tenants()] == [idle]
+        assert sleeper.stats()['hibernations'] == 1
+    finally:
+        sleeper.forget(idle)
+
+
+def test_first_visitor_wakes_the_store_and_gets_its_response(engine, registry, shop):
+    tenant = deployed(engine, registry)
+    port = registry.get(tenant)['port']
+    forgotten = []
+    sleeper = hibernator(engine, registry, forget_address=forgotten.append)
+    sleeper.start()
+    assert sleeper.hibernate(tenant, port)
+
+    assert visit(port) == b'HTTP/1.0 200 OK\r\n\r\nshop'
+    assert wait_until(lambda: not sleeper.hibernated(tenant))
+    assert engine.containers[f'{tenant}_shop']['running']
+    assert registry.hibernated_tenants() == []
+    assert sleeper.stats()['wakes'] == 1
+    assert sleeper.stats()['held_connections'] == 1
+    # The restarted shop may have a new address
+    assert forgotten == [f'{tenant}_shop']
+
+
+def test_failed_wake_answers_503_and_keeps_listening(engine, registry):
+    tenant = deployed(engine, registry)
+    port = registry.get(tenant)['port']
+    sleeper = hibernator(engine, registry, wake_timeout=0.3)
+    sleeper.start()
+    sleeper.hibernate(tenant, port)
+    engine.containers[f'{tenant}_shop']['failing'] = True
+    try:
+        assert visit(port).startswith(b'HTTP/1.1 503 Service Unavailable')
+        assert wait_until(lambda: sleeper.hibernated(tenant) and not engine.containers[f'{tenant}_shop']['running'])
+        assert sleeper.stats()['wake_failures'] == 1
+    finally:
+        sleeper.forget(tenant)
+
+
+def test_forget_releases_the_port(engine, registry):
+    tenant = deployed(engine, registry)
+    port = registry.get(tenant)['port']
+    sleeper = hibernator(engine, registry)
+    sleeper.hibernate(tenant, port)
+    sleeper.forget(tenant)
+    assert not sleeper.hibernated(tenant)
+    with socket.socket() as rebind:
+        rebind.bind(('0.0.0.0', port))
+
@@ -0,0 +1,72 @@
+import pytest
+
+import host_identity
+from host_identity import FALLBACK_IP, HostIdentity
+
+
+class Response:
+    def __init__(self, text):
+        self.text = text
+
+
+@pytest.fixture
+def lookups(monkeypatch):
+    """Map of URL -> reply (an exception is raised); records every request"""
+    replies = {}
+    requested = []
+
+    def get(url, headers=None, timeout=None):
+        requested.append(url)
+        reply = replies.get(url, ConnectionError('unreachable'))
+        if isinstance(reply, Exception):
+            raise reply
+        return Response(reply)
+
+    monkeypatch.setattr(host_identity.requests, 'get', get)
+    return replies, requested
+
+
+def test_configured_ip_never_looks_anything_up(lookups):
+    _, requested = lookups
+    identity = HostIdentity(configured='203.0.113.5')
+    identity.start()
+    assert identity.ip() == '203.0.113.5'
+    assert identity.stats()['source'] == 'SERVER_IP'
+    assert requested == []
+
+
+def test_discovery_skips_services_with_garbage_replies(lookups):
+    replies, requested = lookups
+    replies[host_identity.PUBLIC_IP_SERVICES[0]] = '<html>rate limited</html>'
+    replies[host_identity.PUBLIC_IP_SERVICES[1]] = '198.51.100.7\n'
+    identity = HostIdentity(configured='')
+    identity.refresh()
+    assert identity.ip() == '198.51.100.7'
+    assert identity.stats()['source'] == 'discovered'
+    assert host_identity.PUBLIC_IP_SERVICES[2] not in requested
+
+
+def test_failed_refresh_keeps_the_last_known_address(lookups):
+    replies, _ = lookups
+    identity = HostIdentity(configured='')
+    identity.refresh()
+    assert identity.ip() == FALLBACK_IP
+    assert identity.stats()['source'] == 'fallback'
+
+    replies[host_identity.GCP_METADATA_URL] = '198.51.100.7'
+    identity.refresh()
+    assert identity.ip() == '198.51.100.7'
+
+    replies.clear()
+    identity.refresh()
+    assert identity.ip() == '198.51.100.7'
+    assert identity.stats()['source'] == 'discovered'
+
+
+def test_discovery_skips_ipv6_answers(lookups):
+    replies, _ = lookups
+    replies[host_identity.PUBLIC_IP_SERVICES[0]] = '2001:db8::1\n'
+    replies[host_identity.PUBLIC_IP_SERVICES[1]] = '198.51.100.7'
+    identity = HostIdentity(configured='')
+    identity.refresh()
+    assert identity.ip() == '198.51.100.7'
@@ -0,0 +1,97 @@
+import threading
+
+import pytest
+
+from conftest import FAST_LATENCIES
+from fake_engine import FakeDockerEngine
+from images import ImageCache, ImageUnavailableError
+from nodes import Node
+
+IMAGES = ['prestashop/prestashop:8.1.6-apache', 'mysql:5.7']
+
+
+@pytest.fixture
+def node():
+    engine = FakeDockerEngine(latencies=dict(FAST_LATENCIES, image_pull=0.05))
+    engine.prune_images()
+    return Node('local', '', engine, ports=None)
+
+
+def test_check_pulls_missing_images_and_reports_progress(node):
+    cache = ImageCache([node], IMAGES)
+    progress = []
+    waiter = threading.Thread(target=cache.ensure, args=('local', progress.append, 10))
+    waiter.start()
+    assert not cache.ready()
+    for image in IMAGES:
+        cache.check(node, image)
+    waiter.join()
+
+    assert cache.ready('local')
+    assert cache.stats()['pulls'] == 2
+    assert node.engine.calls['pull_image'] == 2
+    assert progress == sorted(progress) and progress[-1] < 1
+
+    cache.check(node, IMAGES[0])
+    assert node.engine.calls['pull_image'] == 2
+
+
+def test_failed_pull_refuses_waiting_signups(node):
+    node.engine.failure_rates['pull'] = 1.0
+    cache = ImageCache([node], IMAGES[:1])
+    with pytest.raises(RuntimeError):
+        cache.check(node, IMAGES[0])
+    assert 'simulated pull failure' in cache.error('local')
+    with pytest.raises(ImageUnavailableError):
+        cache.ensure('local', timeout=1)
+
+    node.engine.failure_rates['pull'] = 0
+    cache.check(node, IMAGES[0])
+    assert cache.error('local') is None
+    assert cache.stats()['pull_failures'] == 1
+
+
+def test_ensure_times_out(node):
+    cache = ImageCache([node], IMAGES[:1])
+    with pytest.raises(ImageUnavailableError, match='Timed out'):
+        cache.ensure('local', timeout=0.1)
+
+
+def test_pulled_images_are_pinned_against_prunes(node):
+    cache = ImageCache([node], IMAGES)
+    for image in IMAGES:
+        cache.check(node, image)
+    pins = [name for name in node.engine.containers if name.startswith('saas-image-pin-')]
+    assert len(pins) == 2 and all(node.engine.containers[name]['running'] for name in pins)
+    assert all(state['pinned'] for state in cache.stats()['nodes']['local'].values())
+
+    node.engine.prune_images()
+    assert all(node.engine.inspect_image(image) for image in IMAGES)
+    cache.check(node, IMAGES[0])
+    assert node.engine.calls['create_container'] == 2
+
+
+def test_pinning_a_new_tag_removes_the_old_tags_pin(node):
+    ImageCache([node], IMAGES).check(node, IMAGES[0])
+    upgraded = ['prestashop/prestashop:8.1.7-apache', IMAGES[1]]
+    cache = ImageCache([node], upgraded)
+    for image in upgraded:
+        cache.check(node, image)
+    pins = sorted(name for name in node.engine.containers if name.startswith('saas-image-pin-'))
+    assert pins == ['saas-image-pin-mysql-5.7', 'saas-image-pin-prestashop-prestashop-8.1.7-apache']
+
+    node.engine.prune_images()
+    assert node.engine.inspect_image(IMAGES[0]) is None
+    assert all(node.engine.inspect_image(image) for image in upgraded)
+
+
+def test_a_failing_pull_only_refuses_its_own_node():
+    nodes = [Node(name, '', FakeDockerEngine(latencies=dict(FAST_LATENCIES, image_pull=0.05)), ports=None) for name in ('a', 'b')]
+    for node in nodes:
+        node.engine.prune_images()
+    nodes[0].engine.failure_rates['pull'] = 1.0
+    cache = ImageCache(nodes, IMAGES[:1])
+    with pytest.raises(RuntimeError):
+        cache.check(nodes[0], IMAGES[0])
+    cache.check(nodes[1], IMAGES[0])
+    assert cache.error('a') and cache.error('b') is None
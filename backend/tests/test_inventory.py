@@ -0,0 +1,88 @@
+import pytest
+
+from conftest import FAST_LATENCIES
+from fake_engine import FakeDockerEngine
+from inventory import ContainerInventory
+from nodes import Node
+from tenant_spec import PROJECT_LABEL
+
+
+class Watcher:
+    """Hands the inventory's callbacks to the test instead of following Docker events"""
+
+    def subscribe(self, on_event, on_connect=None):
+        self.on_event, self.on_connect = on_event, on_connect
+
+
+def event(name, action, project=None):
+    attributes = {'name': name}
+    if project:
+        attributes[PROJECT_LABEL] = project
+    return {'Type': 'container', 'Action': action, 'Actor': {'Attributes': attributes}}
+
+
+@pytest.fixture
+def node():
+    engine = FakeDockerEngine(latencies=dict(FAST_LATENCIES, db_healthy=0, shop_healthy=0))
+    engine._add_container('tenant1_db', 'db', labels={PROJECT_LABEL: 'tenant1'})
+    engine._add_container('tenant1_shop', 'shop', ports=[9001], labels={PROJECT_LABEL: 'tenant1'})
+    engine._add_container('tenant2_shop', 'shop', labels={PROJECT_LABEL: 'tenant2'}, start=False)
+    engine._add_container('saas_router', 'service')
+    return Node('local', '', engine, ports=None)
+
+
+@pytest.fixture
+def watcher():
+    return Watcher()
+
+
+def test_sync_lists_every_container_by_project(node, watcher):
+    inventory = ContainerInventory([node], watcher)
+    inventory.sync(node)
+
+    shop = inventory.get('tenant1_shop')
+    assert (shop['project'], shop['state'], shop['health'], shop['ports'], shop['node']) == ('tenant1', 'running', 'healthy', [9001], 'local')
+    assert inventory.get('tenant2_shop')['state'] == 'exited'
+    assert [entry['name'] for entry in inventory.containers('tenant1')] == ['tenant1_db', 'tenant1_shop']
+    assert sorted(inventory.by_project()) == ['tenant1', 'tenant2']
+    assert inventory.stats()['states'] == {'running': 3, 'exited': 1}
+
+
+def test_events_keep_entries_current_between_listings(node, watcher):
+    inventory = ContainerInventory([node], watcher)
+    inventory.sync(node)
+
+    watcher.on_event(0, event('tenant2_shop', 'start'))
+    watcher.on_event(0, event('tenant2_shop', 'health_status: starting'))
+    assert (inventory.get('tenant2_shop')['state'], inventory.get('tenant2_shop')['health']) == ('running', 'starting')
+
+    watcher.on_event(0, event('tenant3_db', 'create', project='tenant3'))
+    assert inventory.containers('tenant3')[0]['state'] == 'created'
+
+    watcher.on_event(0, event('tenant1_db', 'destroy'))
+    assert inventory.get('tenant1_db') is None
+    assert inventory.stats()['events'] == 4
+
+
+def test_a_listing_drops_vanished_containers_but_keeps_newer_events(node, watcher):
+    inventory = ContainerInventory([node], watcher)
+    inventory.sync(node)
+    del node.engine.containers['tenant1_db']
+    list_containers = node.engine.list_containers
+
+    def listing_with_an_event_meanwhile(**kwargs):
+        listed = list_containers(**kwargs)
+        watcher.on_event(0, event('tenant4_shop', 'create', project='tenant4'))
+        return listed
+
+    node.engine.list_containers = listing_with_an_event_meanwhile
+    inventory.sync(node)
+    assert inventory.get('tenant1_db') is None
+    assert inventory.get('tenant4_shop')['project'] == 'tenant4'
+
+
+def test_a_reconnected_event_stream_triggers_a_resync(node, watcher):
+    inventory = ContainerInventory([node], watcher)
+    assert not inventory._resync.is_set()
+    watcher.on_connect(0)
+    assert inventory._resync.is_set()
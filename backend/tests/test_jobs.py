@@ -0,0 +1,120 @@
+import threading
+
+import pytest
+
+from conftest import wait_until
+from jobs import PhaseSlots, ProvisioningQueue, QueueFullError
+
+
+@pytest.fixture
+def busy_queue():
+    """A one-worker queue whose worker is stuck on a job until release is set"""
+    release = threading.Event()
+    jobs = ProvisioningQueue(workers=1, max_depth=2)
+    jobs.submit('running', release.wait)
+    assert wait_until(lambda: jobs.stats()['running'] == 1)
+    yield jobs
+    release.set()
+
+
+def test_submit_refuses_jobs_beyond_the_depth_limit(busy_queue):
+    busy_queue.submit('tenant1', lambda: None)
+    busy_queue.submit('tenant2', lambda: None)
+    with pytest.raises(QueueFullError):
+        busy_queue.submit('tenant3', lambda: None)
+    assert busy_queue.get('tenant2')['queue_position'] == 2
+    assert busy_queue.get('tenant3') is None
+
+
+def test_idle_workers_start_jobs_without_counting_against_the_limit():
+    release = threading.Event()
+    jobs = ProvisioningQueue(workers=2, max_depth=0)
+    jobs.submit('tenant1', release.wait)
+    jobs.submit('tenant2', release.wait)
+    with pytest.raises(QueueFullError):
+        jobs.submit('tenant3', release.wait)
+    release.set()
+
+
+def test_jobs_record_their_outcome():
+    def fail():
+        raise RuntimeError('compose failed')
+
+    jobs = ProvisioningQueue(workers=1, max_depth=5)
+    jobs.submit('tenant1', lambda: None)
+    jobs.submit('tenant2', fail)
+    assert wait_until(lambda: jobs.get('tenant2')['state'] == 'error')
+    assert jobs.get('tenant1')['state'] == 'completed'
+    assert jobs.get('tenant2')['error'] == 'compose failed'
+    assert jobs.stats()['running'] == 0
+
+    jobs.forget('tenant1')
+    assert jobs.get('tenant1') is None
+
+
+def test_idle_workers_leave_room_for_waiting_jobs(busy_queue):
+    assert busy_queue.idle_workers() == 0
+    release = threading.Event()
+    jobs = ProvisioningQueue(workers=3, max_depth=5)
+    assert jobs.idle_workers() == 3
+    jobs.submit('tenant1', release.wait)
+    assert wait_until(lambda: jobs.stats()['running'] == 1)
+    assert jobs.idle_workers() == 2
+    release.set()
+
+
+def test_a_batch_is_accepted_or_refused_as_a_whole(busy_queue):
+    with pytest.raises(QueueFullError):
+        busy_queue.reserve(3)
+    assert busy_queue.stats()['reserved'] == 0
+
+    busy_queue.reserve(2)
+    # Reserved places are taken: neither other signups nor another batch get them
+    with pytest.raises(QueueFullError):
+        busy_queue.submit('other', lambda: None)
+    with pytest.raises(QueueFullError):
+        busy_queue.reserve(1)
+
+    busy_queue.submit('batch1', lambda: None, reserved=True)
+    assert busy_queue.get('batch1')['queue_position'] == 1
+    busy_queue.unreserve(1)  # the second store of the batch was rejected
+    assert busy_queue.stats()['reserved'] == 0
+    busy_queue.submit('other', lambda: None)
+    with pytest.raises(QueueFullError):
+        busy_queue.submit('another', lambda: None)
+
+
+def test_phase_slots_make_extra_deployments_wait():
+    slots = PhaseSlots(size=1)
+    slots.acquire('tenant1')
+    slots.acquire('tenant1')  # re-entrant for the holder
+    waited = []
+    acquired = threading.Event()
+
+    def second():
+        slots.acquire('tenant2', on_wait=lambda: waited.append(True))
+        acquired.set()
+
+    threading.Thread(target=second, daemon=True).start()
+    assert wait_until(lambda: slots.stats()['waiting'] == 1)
+    assert not acquired.is_set()
+    slots.release('tenant1')
+    assert acquired.wait(5)
+    assert waited == [True]
+    assert slots.stats() == {'size': 1, 'in_use': 1, 'waiting': 0}
+
+
+def test_phase_slots_gate_holds_back_all_but_the_first_holder():
+    busy = [True]
+    slots = PhaseSlots(size=3, gate=lambda: not busy[0], recheck_interval=0.05)
+    slots.acquire('tenant1')  # the first slot ignores the gate
+    acquired = threading.Event()
+
+    def second():
+        slots.acquire('tenant2')
+        acquired.set()
+
+    threading.Thread(target=second, daemon=True).start()
+    assert not acquired.wait(0.2)
+    busy[0] = False
+    assert acquired.wait(5)
@@ -0,0 +1,219 @@
+import types
+
+import pytest
+
+import metering
+from conftest import FAST_LATENCIES, wait_until
+from fake_engine import FakeDockerEngine
+from metering import ResourceMeter, _Series, parse_sample, tenant_service
+from nodes import Node
+from tenant_registry import TenantRegistry
+from tenant_spec import PROJECT_LABEL
+
+GB = 1024 ** 3
+
+
+class Watcher:
+    """Hands the meter's callbacks to the test instead of following Docker events"""
+
+    def subscribe(self, on_event, on_connect=None):
+        self.on_event, self.on_connect = on_event, on_connect
+
+
+class Inventory:
+    def containers(self):
+        return []
+
+
+def sample(total, system, precpu=None, memory=0, cache=0, rx=0, tx=0, read=0, write=0, online=2):
+    return {
+        'cpu_stats': {'cpu_usage': {'total_usage': total}, 'system_cpu_usage': system, 'online_cpus': online},
+        'precpu_stats': precpu or {},
+        'memory_stats': {'usage': memory, 'stats': {'inactive_file': cache}},
+        'networks': {'eth0': {'rx_bytes': rx, 'tx_bytes': tx}},
+        'blkio_stats': {'io_service_bytes_recursive': [{'op': 'Read', 'value': read}, {'op': 'Write', 'value': write}]}
+    }
+
+
+class Clock:
+    def __init__(self, now):
+        self.now = now
+
+    def time(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock(999.0)
+    monkeypatch.setattr(metering, 'time', types.SimpleNamespace(time=clock.time))
+    return clock
+
+
+@pytest.fixture
+def registry(tmp_path):
+    return TenantRegistry(str(tmp_path / 'registry.db'))
+
+
+@pytest.fixture
+def meter(clock, registry):
+    return ResourceMeter([], Watcher(), Inventory(), registry, resolution=10, window=60)
+
+
+class Container:
+    """Feeds one container's cumulative counters to the meter, a second apart"""
+
+    def __init__(self, meter, clock, name, cores=0.0, memory=0, rx_per_second=0):
+        self.meter, self.clock, self.name = meter, clock, name
+        self.cores, self.memory, self.rx_per_second = cores, memory, rx_per_second
+        self.cpu = self.rx = 0
+        self.system = 10 ** 9
+        self.previous = None
+
+    def tick(self, seconds=1):
+        self.clock.now += seconds
+        self.cpu += int(self.cores * 1e9 * seconds)
+        self.system += int(1e9 * seconds)
+        self.rx += self.rx_per_second * seconds
+        cpu = {'cpu_usage': {'total_usage': self.cpu}, 'system_cpu_usage': self.system, 'online_cpus': 1}
+        self.meter._record(self.name.split('_')[0], self.name, dict(
+            sample(self.cpu, self.system, memory=self.memory, rx=self.rx), cpu_stats=cpu, precpu_stats=self.previous or {}
+        ))
+        self.previous = cpu
+
+
+def test_parse_sample_takes_cores_from_the_cpu_delta():
+    previous = {'cpu_usage': {'total_usage': 1_000_000_000}, 'system_cpu_usage': 10_000_000_000}
+    parsed = parse_sample(sample(2_000_000_000, 14_000_000_000, previous, memory=300, cache=100,
+                                 rx=5, tx=7, read=11, write=13, online=4))
+    # 1s of CPU over 4s of system time across 4 CPUs
+    assert parsed == {'cores': 1.0, 'memory': 200, 'net_rx': 5, 'net_tx': 7, 'disk_read': 11, 'disk_write': 13}
+
+
+def test_parse_sample_without_precpu_stats_has_no_cores():
+    assert parse_sample(sample(2_000_000_000, 14_000_000_000))['cores'] is None
+    previous = {'cpu_usage': {'total_usage': 1}, 'system_cpu_usage': 14_000_000_000}
+    assert parse_sample(sample(2, 14_000_000_000, previous))['cores'] == 0.0
+
+
+def test_parse_sample_subtracts_cgroup_v1_cache():
+    parsed = parse_sample({'memory_stats': {'usage': 500, 'stats': {'total_inactive_file': 800}}})
+    assert parsed['memory'] == 0 and parsed['net_rx'] == 0 and parsed['disk_read'] == 0
+
+
+def test_tenant_service_only_matches_a_projects_own_containers():
+    assert tenant_service('tenant1_shop', 'tenant1') == ('tenant1', 'shop')
+    assert tenant_service('tenant1_db', 'tenant1') == ('tenant1', 'db')
+    assert tenant_service('tenant1_shop', 'tenant2') is None
+    assert tenant_service('saas_router', None) is None
+
+
+def test_series_drains_closed_buckets_and_the_open_one_so_far():
+    series = _Series()
+    deltas = {'net_rx': 100, 'net_tx': 0, 'disk_read': 0, 'disk_write': 0}
+    for start in (0, 10):
+        series.add(start, 10, 'tenant1_shop', 0.5, 10, 300, deltas)
+        series.add(start, 10, 'tenant1_db', 0.25, 10, 200, deltas)
+    # Average cores and bytes per second over the bucket, peak memory summed across the tenant's containers
+    assert series.drain(10, now=15) == [(0, 0.75, 500, 20, 0, 0, 0), (10, 1.5, 500, 40, 0, 0, 0)]
+    # The open bucket is drained again, over its full length, once it has ended
+    assert series.drain(10, now=25) == [(10, 0.75, 500, 20, 0, 0, 0)]
+    assert series.current is None and series.drain(10, now=30) == []
+
+
+def test_usage_downsamples_samples_into_buckets(meter, clock):
+    shop = Container(meter, clock, 'tenant1_shop', cores=0.5, memory=GB, rx_per_second=1000)
+    shop.tick(0)
+    meter.flush()
+    assert meter.usage('tenant1') is None  # the first sample only sets the baseline
+    for _ in range(15):
+        shop.tick()
+    clock.now += 1
+    meter.flush()
+
+    usage = meter.usage('tenant1')
+    assert usage['current'] == {'tenant1_shop': {'cpu': 0.5, 'memory': GB}}
+    assert [point['at'] for point in usage['series']] == [1000, 1010]  # closed and open buckets
+    assert [point['cpu'] for point in usage['series']] == [0.5, 0.5]
+    assert [point['net_rx'] for point in usage['series']] == [1000, 1000]
+    assert meter.summary('tenant1', 60) == {'cpu': 0.5, 'memory': GB, 'network': 1000, 'disk': 0}
+    assert meter.stats()['samples'] == 16
+
+
+def test_a_counter_reset_counts_as_no_traffic(meter, clock):
+    shop = Container(meter, clock, 'tenant1_shop', rx_per_second=1000)
+    shop.tick(0)
+    for _ in range(5):
+        shop.tick()
+    shop.rx = -1000  # the container restarted and its counters with it
+    for _ in range(6):
+        shop.tick()
+    meter.flush()
+    # 5 seconds before the restart and 4 after it; the interval spanning it counts nothing
+    assert meter.usage('tenant1')['series'][0] == {
+        'at': 1000, 'cpu': 0.0, 'memory': 0, 'net_rx': 900, 'net_tx': 0, 'disk_read': 0, 'disk_write': 0
+    }
+    assert meter.received_bytes('tenant1_shop') is None  # not followed over a stream
+
+
+def test_top_ranks_tenants_by_the_chosen_metric(meter, clock):
+    containers = [
+        Container(meter, clock, 'tenant1_shop', cores=0.2, memory=3 * GB),
+        Container(meter, clock, 'tenant2_shop', cores=0.9, memory=GB),
+        Container(meter, clock, 'tenant3_shop', cores=0.5, memory=2 * GB, rx_per_second=5000)
+    ]
+    for _ in range(3):
+        for container in containers:
+            container.tick(1 / 3)
+    meter.flush()
+
+    assert [entry['tenant_id'] for entry in meter.top('cpu', 3, 60)] == ['tenant2', 'tenant3', 'tenant1']
+    assert [entry['tenant_id'] for entry in meter.top('memory', 2, 60)] == ['tenant1', 'tenant3']
+    assert meter.top('network', 1, 60)[0]['tenant_id'] == 'tenant3'
+
+
+def test_forget_drops_a_tenants_usage(meter, clock, registry):
+    shop = Container(meter, clock, 'tenant1_shop', cores=0.5)
+    for _ in range(3):
+        shop.tick()
+    meter.flush()
+    meter.forget('tenant1')
+    assert meter.usage('tenant1') is None
+    assert meter.top('cpu', 10, 60) == []
+    meter.flush()
+    assert registry.usage_current('tenant1') == {}
+
+
+def test_flushing_keeps_the_stored_samples_within_the_window(meter, clock, registry):
+    shop = Container(meter, clock, 'tenant1_shop', cores=0.5)
+    shop.tick(0)
+    for second in range(1, 600):
+        shop.tick()
+        if second % 10 == 0:
+            meter.flush()
+    meter.flush()
+    count = registry._conn().execute('SELECT COUNT(*) AS n FROM usage_samples').fetchone()['n']
+    # 60s window at 10s resolution, plus the bucket being filled
+    assert count <= 7
+    assert [point['at'] for point in meter.usage('tenant1')['series']] == list(range(1540, 1600, 10))
+
+
+def test_started_containers_are_followed_over_the_stats_stream(registry):
+    engine = FakeDockerEngine(latencies=dict(FAST_LATENCIES, stats_interval=0.01))
+    engine._add_container('tenant1_shop', 'shop', labels={PROJECT_LABEL: 'tenant1'})
+    watcher = Watcher()
+    meter = ResourceMeter([Node('local', '', engine, ports=None)], watcher, Inventory(), registry, resolution=1, window=60)
+    meter.start()
+
+    event = {'Action': 'start', 'Actor': {'Attributes': {'name': 'tenant1_shop', PROJECT_LABEL: 'tenant1'}}}
+    watcher.on_event(0, event)
+    watcher.on_event(0, event)
+    assert wait_until(lambda: meter.flush() or meter.usage('tenant1'))
+    engine.record_traffic('tenant1_shop', 4000)
+    assert wait_until(lambda: meter.received_bytes('tenant1_shop') == 4000)
+    assert engine.calls['stream_stats'] == 1
+
+    engine.remove_container('tenant1_shop')
+    assert wait_until(lambda: meter.stats()['streams'] == 0)
+    meter.flush()
+    assert meter.usage('tenant1')['current'] == {}
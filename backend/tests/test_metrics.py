@@ -0,0 +1,81 @@
+import subprocess
+
+from metrics import Histogram, InstrumentedEngine, MetricsRegistry, PhaseTracker
+
+
+def test_histogram_renders_cumulative_buckets():
+    histogram = Histogram('phase_seconds', 'Phase time', labels=('phase',), buckets=(1, 5, 10))
+    for value in (0.5, 1, 3, 7, 60):
+        histogram.observe(value, 'mysql')
+
+    assert histogram.render() == [
+        '# HELP phase_seconds Phase time',
+        '# TYPE phase_seconds histogram',
+        'phase_seconds_bucket{phase="mysql",le="1"} 2',
+        'phase_seconds_bucket{phase="mysql",le="5"} 3',
+        'phase_seconds_bucket{phase="mysql",le="10"} 4',
+        'phase_seconds_bucket{phase="mysql",le="+Inf"} 5',
+        'phase_seconds_sum{phase="mysql"} 71.5',
+        'phase_seconds_count{phase="mysql"} 5',
+    ]
+
+
+def test_histogram_formats_float_bounds_and_escapes_labels():
+    histogram = Histogram('call_seconds', 'Call time', labels=('op',), buckets=(0.25,))
+    histogram.observe(0.1, 'say "hi"')
+    lines = histogram.render()
+    assert 'call_seconds_bucket{op="say \\"hi\\"",le="0.25"} 1' in lines
+
+
+def tracker():
+    registry = MetricsRegistry()
+    phases = registry.histogram('phase_seconds', 'Phase time', labels=('phase',))
+    deployments = registry.histogram('deployment_seconds', 'Deployment time', labels=('outcome',))
+    failures = registry.counter('failures_total', 'Failures', labels=('phase',))
+    return PhaseTracker(phases, deployments, failures), registry
+
+
+def test_repeated_stages_extend_the_current_phase():
+    phases, registry = tracker()
+    phases.record('tenant1', 'mysql', now=0)
+    phases.record('tenant1', 'mysql', now=4)
+    phases.record('tenant1', 'prestashop', now=10)
+    phases.record('tenant1', 'completed', now=25)
+
+    text = registry.render()
+    assert 'phase_seconds_sum{phase="mysql"} 10.0' in text
+    assert 'phase_seconds_sum{phase="prestashop"} 15.0' in text
+    assert 'deployment_seconds_sum{outcome="completed"} 25.0' in text
+    assert 'phase="completed"' not in text
+    assert phases.active() == {}
+
+
+def test_error_counts_a_failure_in_the_phase_it_happened():
+    phases, registry = tracker()
+    phases.record('tenant1', 'mysql', now=0)
+    phases.record('tenant2', 'mysql', now=0)
+    assert phases.active() == {'mysql': 2}
+    phases.record('tenant1', 'error', now=3)
+
+    text = registry.render()
+    assert 'failures_total{phase="mysql"} 1' in text
+    assert 'deployment_seconds_count{outcome="error"} 1' in text
+    assert phases.active() == {'mysql': 1}
+
+
+def test_final_stage_without_a_phase_is_ignored():
+    phases, registry = tracker()
+    phases.record('tenant1', 'completed', now=5)
+    assert 'deployment_seconds_count' not in registry.render()
+
+
+def test_instrumented_engine_reports_compose_failures():
+    class Engine:
+        def compose(self, *args):
+            return subprocess.CompletedProcess(args, 1, '', 'boom')
+
+    registry = MetricsRegistry()
+    calls = registry.counter('calls_total', 'Calls', labels=('op', 'outcome'))
+    seconds = registry.histogram('call_seconds', 'Call time', labels=('op',))
+    InstrumentedEngine(Engine(), calls, seconds).compose('up')
+    assert 'calls_total{op="compose",outcome="error"} 1' in registry.render()
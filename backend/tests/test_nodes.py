@@ -0,0 +1,94 @@
+import pytest
+
+from nodes import Node, NodePool, NodesFullError, RoutedEngine, load_nodes
+from tenant_registry import TenantRegistry
+
+
+class NamedEngine:
+    """Answers every call with its own name"""
+
+    def __init__(self, name):
+        self.name = name
+
+    def inspect_container(self, container):
+        return (self.name, container)
+
+    def compose(self, project_dir, *args):
+        return (self.name, project_dir)
+
+
+class Ports:
+    def stats(self):
+        return {}
+
+
+@pytest.fixture
+def registry(tmp_path):
+    return TenantRegistry(str(tmp_path / 'registry.db'))
+
+
+def pool(registry, strategy='least_loaded', limits=(2, 4), **options):
+    nodes = [Node(f'node{i}', '', NamedEngine(f'node{i}'), Ports(), max_tenants=limit) for i, limit in enumerate(limits)]
+    return NodePool(nodes, registry, strategy=strategy, **options)
+
+
+def place(nodes, registry, count):
+    return [nodes.place(registry.allocate()).name for _ in range(count)]
+
+
+def test_least_loaded_spreads_by_share_of_capacity(registry):
+    nodes = pool(registry)
+    assert place(nodes, registry, 6) == ['node0', 'node1', 'node1', 'node0', 'node1', 'node1']
+    with pytest.raises(NodesFullError):
+        place(nodes, registry, 1)
+
+
+def test_binpack_fills_nodes_in_order(registry):
+    nodes = pool(registry, strategy='binpack')
+    assert place(nodes, registry, 3) == ['node0', 'node0', 'node1']
+
+
+def test_draining_and_pinned_nodes_take_no_new_stores(registry):
+    nodes = pool(registry)
+    nodes.nodes[0].drain = True
+    assert place(nodes, registry, 2) == ['node1', 'node1']
+
+    pinned = pool(registry, pinned=True)
+    assert place(pinned, registry, 2) == ['node0', 'node0']
+    assert not pinned.has_room()
+
+
+def test_placements_survive_a_restart(registry):
+    nodes = pool(registry, strategy='binpack', limits=(1, 0))
+    tenants = [registry.allocate() for _ in range(2)]
+    for tenant in tenants:
+        nodes.place(tenant)
+
+    restarted = pool(registry, limits=(1, 0))
+    restarted.load(tenants + ['tenant99'])
+    assert restarted.node_of(tenants[0]).name == 'node0'
+    assert restarted.node_of(tenants[1]).name == 'node1'
+    # Tenants from before multi-node live on the primary
+    assert restarted.node_of('tenant99') is restarted.primary
+    assert [node.tenants for node in restarted.nodes] == [2, 1]
+
+    restarted.forget(tenants[1])
+    assert restarted.nodes[1].tenants == 0
+
+
+def test_routed_engine_sends_calls_to_the_owning_node(registry):
+    nodes = pool(registry, strategy='binpack', limits=(1, 0))
+    first, second = registry.allocate(), registry.allocate()
+    nodes.place(first)
+    nodes.place(second)
+    engine = RoutedEngine(nodes)
+    assert engine.inspect_container(f'{second}_shop') == ('node1', f'{second}_shop')
+    assert engine.compose(f'/srv/tenants/{second}/') == ('node1', f'/srv/tenants/{second}/')
+    assert engine.inspect_container('saas_shared_db') == ('node0', 'saas_shared_db')
+
+
+def test_node_names_must_be_unique(tmp_path):
+    with pytest.raises(ValueError):
+        load_nodes(str(tmp_path), 9000, config='[{"name": "a"}, {"name": "a"}]')
+    with pytest.raises(ValueError):
+        load_nodes(str(tmp_path), 9000, config='[{"url": "tcp://10.0.0.2:2375"}]')
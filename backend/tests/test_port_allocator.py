@@ -0,0 +1,103 @@
+import json
+import socket
+
+import pytest
+
+from port_allocator import PortAllocator, PortExhaustedError
+from tenant_registry import TenantRegistry
+
+BASE = 47100
+
+
+@pytest.fixture
+def registry(tmp_path):
+    return TenantRegistry(str(tmp_path / 'registry.db'))
+
+
+def allocator(registry, size=10, **kwargs):
+    return PortAllocator(BASE, size, registry, 'local', **kwargs)
+
+
+def test_reserve_is_idempotent_and_distinct(registry):
+    ports = allocator(registry)
+    first = ports.reserve('tenant1')
+    assert ports.reserve('tenant1') == first
+    assert ports.reserve('tenant2') != first
+    assert ports.stats()['reserved'] == 2
+
+
+def test_release_returns_the_port(registry):
+    ports = allocator(registry, size=1)
+    port = ports.reserve('tenant1')
+    with pytest.raises(PortExhaustedError):
+        ports.reserve('tenant2')
+    assert ports.release('tenant1') == port
+    assert ports.reserve('tenant2') == port
+    assert ports.release('unknown') is None
+
+
+def test_ports_held_outside_docker_are_skipped(registry):
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as held:
+        held.bind(('0.0.0.0', BASE))
+        held.listen()
+        ports = allocator(registry)
+        assert ports.reserve('tenant1') == BASE + 1
+        assert ports.stats()['unavailable'] == 1
+
+
+def test_remote_nodes_skip_the_local_bind_probe(registry):
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as held:
+        held.bind(('0.0.0.0', BASE))
+        held.listen()
+        ports = allocator(registry, probe=False)
+        assert ports.reserve('tenant1') == BASE
+
+
+def test_reservations_survive_a_restart(registry):
+    ports = allocator(registry)
+    port = ports.reserve('tenant1')
+    ports.reserve('tenant2')
+    ports.release('tenant2')
+
+    restarted = allocator(registry)
+    assert restarted.port_for('tenant1') == port
+    assert restarted.port_for('tenant2') is None
+    assert registry.port_reservations('local') == {'tenant1': port}
+    assert registry.port_reservations('other') == {}
+
+
+def test_legacy_ledger_is_imported_once(registry, tmp_path):
+    legacy = tmp_path / 'ports.json'
+    legacy.write_text(json.dumps({'tenant7': BASE + 3}))
+
+    ports = allocator(registry, legacy_path=str(legacy))
+    assert ports.port_for('tenant7') == BASE + 3
+    assert not legacy.exists()
+    assert (tmp_path / 'ports.json.imported').exists()
+    assert registry.port_reservations('local') == {'tenant7': BASE + 3}
+    assert ports.reserve('tenant8') != BASE + 3
+
+
+def test_reconcile_syncs_with_docker(registry):
+    ports = allocator(registry, size=5, probe=False)
+    ports.reserve('tenant1')  # BASE
+    ports.reserve('gone')  # BASE + 1
+
+    # tenant2 publishes a port the ledger lost; something else holds BASE + 3
+    ports.reconcile({BASE + 2: 'tenant2_shop', BASE + 3: 'stranger'}, {'tenant1', 'tenant2'})
+
+    assert ports.port_for('gone') is None
+    assert ports.port_for('tenant2') == BASE + 2
+    assert registry.port_reservations('local') == {'tenant1': BASE, 'tenant2': BASE + 2}
+    assert ports.stats()['unavailable'] == 1
+    assert {ports.reserve('a'), ports.reserve('b')} == {BASE + 1, BASE + 4}
+
+
+def test_reload_picks_up_reservations_made_by_another_process(registry):
+    ports = allocator(registry)
+    leader = allocator(registry)
+    port = leader.reserve('tenant1')
+    assert ports.port_for('tenant1') is None
+    ports.reload()
+    assert ports.port_for('tenant1') == port
+    assert ports.reserve('tenant2') != port
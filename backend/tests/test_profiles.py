@@ -0,0 +1,106 @@
+import json
+
+import pytest
+
+import profiles
+from conftest import wait_until
+from jobs import ProvisioningQueue
+from profiles import BUILTIN_PROFILES, load_profiles, mysql_config, shop_settings
+from test_teardown import create_store
+
+
+def test_overrides_extend_builtin_and_base_profiles():
+    loaded = load_profiles(json.dumps({
+        'trial': {'shop_memory': '320m'},
+        'xl': {'base': 'high-traffic', 'apache_workers': 80},
+        'custom': {'apache_workers': 6}
+    }))
+    assert loaded['trial'].shop_memory == '320m'
+    assert loaded['trial'].db_memory == BUILTIN_PROFILES['trial'].db_memory
+    assert (loaded['xl'].name, loaded['xl'].apache_workers, loaded['xl'].shop_memory) == ('xl', 80, '2g')
+    # A new profile without a base starts from standard
+    assert loaded['custom'].innodb_buffer_pool == BUILTIN_PROFILES['standard'].innodb_buffer_pool
+    assert load_profiles('') == BUILTIN_PROFILES
+
+
+def test_unknown_settings_are_rejected():
+    with pytest.raises(ValueError, match='Unknown settings in profile trial: shop_ram'):
+        load_profiles(json.dumps({'trial': {'shop_ram': '320m'}}))
+    with pytest.raises(ValueError, match='Unknown settings'):
+        load_profiles(json.dumps({'xl': {'base': 'high-traffic', 'name': 'other'}}))
+
+
+def test_malformed_json_is_rejected():
+    with pytest.raises(ValueError):
+        load_profiles('{trial: {}}')
+
+
+def test_default_profile_must_exist(monkeypatch):
+    monkeypatch.setattr(profiles, 'DEFAULT_PROFILE', 'gold')
+    with pytest.raises(ValueError, match='DEFAULT_PROFILE gold is not a profile'):
+        load_profiles('')
+    assert 'gold' in load_profiles(json.dumps({'gold': {}}))
+
+
+def test_rendered_settings_follow_the_profile():
+    trial, busy = BUILTIN_PROFILES['trial'], BUILTIN_PROFILES['high-traffic']
+    assert 'performance_schema = OFF' in mysql_config(trial)
+    assert 'innodb_buffer_pool_size = 768M' in mysql_config(busy)
+    assert shop_settings(busy)['PS_SMARTY_FORCE_COMPILE'] == 0
+
+
+def test_profile_change_restarts_the_store_on_new_limits(backend, engine, client):
+    tenant = create_store(client)
+    assert client.put(f'/tenants/{tenant}/profile', json={'profile': 'gold'}).status_code == 400
+
+    response = client.put(f'/tenants/{tenant}/profile', json={'profile': 'trial'})
+    assert response.status_code == 202
+    assert wait_until(lambda: backend.registry.get(tenant)['profile'] == 'trial')
+    status = client.get(f'/deployment-status/{tenant}').get_json()
+    assert (status['status'], status['stage']) == ('completed', 'completed')
+    assert client.get('/profiles').get_json()['profiles']['trial']['tenants'] >= 1
+
+
+def read_stream(client, path, headers=None):
+    """The SSE events of a stream until the server closes it"""
+    response = client.get(path, headers=headers or {})
+    payloads = []
+    for message in response.get_data(as_text=True).split('\n\n'):
+        data = [line[6:] for line in message.split('\n') if line.startswith('data: ')]
+        ids = [int(line[4:]) for line in message.split('\n') if line.startswith('id: ')]
+        if data:
+            payloads.append((ids[0], json.loads(data[0])))
+    return payloads
+
+
+def test_a_profile_change_stream_stays_open_until_the_change_is_done(backend, engine, client):
+    tenant = create_store(client)
+    assert client.put(f'/tenants/{tenant}/profile', json={'profile': 'trial'}).status_code == 202
+
+    events = read_stream(client, f'/deployment-stream/{tenant}')
+    assert events[-1][1]['message'] == 'Now on the trial profile'
+    assert backend.registry.get(tenant)['profile'] == 'trial'
+
+    # Resuming from the last event waits for new work instead of closing straight away
+    # The worker lets go of the job just after recording its last event
+    assert wait_until(lambda: client.put(f'/tenants/{tenant}/profile', json={'profile': 'standard'}).status_code == 202)
+    resumed = read_stream(client, f'/deployment-stream/{tenant}', {'Last-Event-ID': str(events[-1][0])})
+    assert resumed[0][1]['stage'] == 'profile_queued'
+    assert resumed[-1][1]['message'] == 'Now on the standard profile'
+
+
+def test_a_rollout_waits_for_idle_workers_instead_of_overfilling_the_queue(backend, engine, client, monkeypatch):
+    tenants = [create_store(client) for _ in range(3)]
+    # No waiting places at all: every job has to go straight to an idle worker
+    monkeypatch.setattr(backend, 'provisioning_queue', ProvisioningQueue(workers=1, max_depth=0))
+    monkeypatch.setattr(backend, 'ROLLOUT_POLL_INTERVAL', 0.01)
+    response = client.post('/profiles/standard/rollout')
+    assert response.status_code == 202
+    items = {item['tenant_id']: item['result'] for item in response.get_json()['tenants']}
+    assert all(items[tenant] == 'queued' for tenant in tenants)
+
+    def done(tenant):
+        status = client.get(f'/deployment-status/{tenant}').get_json()
+        return status['message'] == 'Now on the standard profile'
+    assert wait_until(lambda: all(done(tenant) for tenant, result in items.items() if result == 'queued'), timeout=30)
+    assert backend.provisioning_queue.stats()['queued'] == 0
@@ -0,0 +1,136 @@
+import json
+import threading
+
+import pytest
+
+from progress_stream import ProgressBroker, stream_progress
+from tenant_registry import TenantRegistry
+
+
+def parse(message):
+    """(id, event, data) of one SSE message, or the raw text of comments and retry hints"""
+    fields = dict(line.split(': ', 1) for line in message.strip().split('\n') if not line.startswith(':') and ': ' in line)
+    if 'data' not in fields:
+        return message
+    return int(fields['id']) if 'id' in fields else None, fields['event'], json.loads(fields['data'])
+
+
+@pytest.fixture
+def registry(tmp_path):
+    return TenantRegistry(str(tmp_path / 'registry.db'))
+
+
+@pytest.fixture
+def broker(registry):
+    return ProgressBroker(registry, history=3, poll_interval=0.05)
+
+
+@pytest.fixture
+def tenant(registry):
+    return registry.allocate()
+
+
+def progress(registry, broker, tenant, stage, state=None):
+    registry.record_progress(tenant, stage, f'{stage}...', state=state)
+    broker.publish(tenant)
+
+
+def stream(broker, registry, tenant, last_id, keepalive=5):
+    return stream_progress(broker, tenant, last_id, lambda: registry.get(tenant), keepalive=keepalive)
+
+
+def test_a_new_watcher_gets_the_snapshot_then_live_events(registry, broker, tenant):
+    progress(registry, broker, tenant, 'queued')
+    events = stream(broker, registry, tenant, 0)
+    assert next(events).startswith('retry:')
+    event_id, _, payload = parse(next(events))
+    assert (event_id, payload['stage'], payload['status']) == (1, 'queued', 'processing')
+
+    progress(registry, broker, tenant, 'starting')
+    progress(registry, broker, tenant, 'completed', state='completed')
+    assert [parse(next(events))[:2] for _ in range(2)] == [(2, 'progress'), (3, 'progress')]
+    # The terminal event ends the stream
+    assert list(events) == []
+    assert broker.stats()['watchers'] == 0
+
+
+def test_resume_replays_only_missed_events(registry, broker, tenant):
+    for stage in ('queued', 'starting', 'installing'):
+        progress(registry, broker, tenant, stage)
+    events = stream_progress(broker, tenant, 1, lambda: pytest.fail('no snapshot on resume'), keepalive=5)
+    next(events)
+    assert [parse(next(events))[2]['stage'] for _ in range(2)] == ['starting', 'installing']
+
+
+def test_resume_from_a_pruned_event_falls_back_to_the_snapshot(registry, broker, tenant):
+    for i in range(5):
+        progress(registry, broker, tenant, f'step{i}')
+    events = stream(broker, registry, tenant, 1)
+    next(events)
+    event_id, _, payload = parse(next(events))
+    assert (event_id, payload['stage']) == (5, 'step4')
+
+
+def test_a_finished_deployment_closes_after_its_snapshot(registry, broker, tenant):
+    progress(registry, broker, tenant, 'error', state='error')
+    events = stream(broker, registry, tenant, 0)
+    next(events)
+    assert parse(next(events))[2]['status'] == 'error'
+    assert list(events) == []
+
+
+def test_an_idle_stream_sends_keepalives(registry, broker, tenant):
+    progress(registry, broker, tenant, 'queued')
+    events = stream(broker, registry, tenant, 1, keepalive=0.05)
+    next(events)
+    assert next(events) == ': keepalive\n\n'
+    threading.Timer(0.01, progress, (registry, broker, tenant, 'completed', 'completed')).start()
+    messages = list(events)
+    assert parse(messages[-1])[2]['status'] == 'completed'
+
+
+def test_watchers_in_another_worker_see_progress_without_a_publish(registry, broker, tenant):
+    progress(registry, broker, tenant, 'queued')
+    other_worker = ProgressBroker(registry, poll_interval=0.05)
+    events = stream(other_worker, registry, tenant, 1)
+    next(events)
+    # Recorded by the leader, so this process's broker is never told
+    threading.Timer(0.05, registry.record_progress, (tenant, 'starting', 'Starting...')).start()
+    assert parse(next(events))[:2] == (2, 'progress')
+
+
+def test_a_profile_change_on_a_completed_store_streams_until_it_is_done(registry, broker, tenant):
+    progress(registry, broker, tenant, 'completed', state='completed')
+    progress(registry, broker, tenant, 'profile_queued')
+    events = stream(broker, registry, tenant, 0)
+    next(events)
+    event_id, _, payload = parse(next(events))
+    # The store's status stays completed, but the change is still running
+    assert (event_id, payload['status'], payload['stage']) == (2, 'completed', 'profile_queued')
+
+    progress(registry, broker, tenant, 'applying_profile')
+    assert parse(next(events))[2]['stage'] == 'applying_profile'
+    progress(registry, broker, tenant, 'completed')
+    assert parse(next(events))[:2] == (4, 'progress')
+    assert list(events) == []
+
+
+def test_a_replayed_completed_event_does_not_end_the_stream(registry, broker, tenant):
+    for stage, state in (('installing', None), ('completed', 'completed'), ('profile_queued', None)):
+        progress(registry, broker, tenant, stage, state=state)
+    events = stream(broker, registry, tenant, 1, keepalive=0.1)
+    next(events)
+    assert [parse(next(events))[2]['stage'] for _ in range(2)] == ['completed', 'profile_queued']
+    assert next(events) == ": keepalive\n\n"
+
+
+def test_resuming_after_the_terminal_event_waits_for_new_work(registry, broker, tenant):
+    progress(registry, broker, tenant, 'completed', state='completed')
+    events = stream(broker, registry, tenant, 1, keepalive=0.1)
+    next(events)
+    assert next(events) == ": keepalive\n\n"
+
+    progress(registry, broker, tenant, 'profile_queued')
+    progress(registry, broker, tenant, 'completed')
+    assert [parse(next(events))[0] for _ in range(2)] == [2, 3]
+    assert list(events) == []
@@ -0,0 +1,56 @@
+import queue
+import threading
+import time
+
+import readiness
+from conftest import wait_until as eventually
+from readiness import ContainerEventWatcher, wait_until
+
+
+class EventSource:
+    """An engine whose events() stream yields what the test puts on it"""
+
+    def __init__(self):
+        self.queue = queue.Queue()
+
+    def events(self, filters=None):
+        while True:
+            yield self.queue.get()
+
+    def emit(self, name, action):
+        self.queue.put({'Action': action, 'Actor': {'Attributes': {'name': name}}})
+
+
+def test_probes_until_the_check_passes():
+    results = iter([None, None, 'ready'])
+    attempts = []
+    assert wait_until(lambda: next(results), 5, on_attempt=lambda attempt, elapsed: attempts.append(attempt)) == 'ready'
+    assert attempts == [1, 2]
+
+
+def test_gives_up_at_the_timeout():
+    started = time.time()
+    assert wait_until(lambda: None, 0.3) is None
+    assert 0.3 <= time.time() - started < 1
+
+
+def test_an_event_wakes_the_waiter_before_its_next_probe(monkeypatch):
+    monkeypatch.setattr(readiness, 'PROBE_MIN_INTERVAL', 30)
+    source = EventSource()
+    watcher = ContainerEventWatcher(source)
+    watcher.start()
+    assert eventually(lambda: watcher.connected)
+    healthy = threading.Event()
+
+    def become_healthy():
+        time.sleep(0.2)
+        healthy.set()
+        source.emit('tenant1_shop', 'health_status')
+
+    threading.Thread(target=become_healthy, daemon=True).start()
+    started = time.time()
+    assert wait_until(healthy.is_set, 60, watcher, 'tenant1_shop')
+    assert time.time() - started < 5
+    assert watcher.last_action('tenant1_shop') == 'health_status'
+    assert watcher.version('tenant1_shop') == 1
+    assert watcher.version('tenant1_db') == 0
@@ -0,0 +1,60 @@
+import pytest
+
+from conftest import FAST_LATENCIES
+from fake_engine import FakeDockerEngine
+from router import ROUTER_CONTAINER, Router
+
+
+@pytest.fixture
+def engine():
+    return FakeDockerEngine(latencies=FAST_LATENCIES)
+
+
+def router(engine, tmp_path, **options):
+    return Router(engine, str(tmp_path), lambda: '203.0.113.5', **options)
+
+
+def route_files(engine):
+    return engine.containers[ROUTER_CONTAINER]['files']
+
+
+def test_route_points_the_store_hostname_at_its_shop(engine, tmp_path):
+    edge = router(engine, tmp_path)
+    route = edge._route('tenant7')
+    assert 'rule: "Host(`tenant7.203.0.113.5.nip.io`)"' in route
+    assert 'url: "http://tenant7_shop:80"' in route
+    assert router(engine, tmp_path, domain='shops.example.com').hostname('tenant7') == 'tenant7.shops.example.com'
+
+
+def test_tenant_for_host_only_accepts_store_names(engine, tmp_path):
+    edge = router(engine, tmp_path, domain='shops.example.com')
+    assert edge.tenant_for_host('Tenant7.Shops.Example.com:80') == 'tenant7'
+    assert edge.tenant_for_host('admin.shops.example.com') is None
+    assert edge.tenant_for_host('tenant7.other.com') is None
+    assert edge.tenant_for_host('x.tenant7.shops.example.com') is None
+
+
+def test_route_table_is_pushed_and_pruned_on_start(engine, tmp_path):
+    edge = router(engine, tmp_path, wake_upstream='http://backend:8070')
+    edge.start()
+    assert route_files(engine) == {'_wake.yml'}
+
+    edge.add_route('tenant1')
+    edge.add_route('tenant2')
+    edge.remove_route('tenant1')
+    edge.remove_route('tenant404')
+    assert route_files(engine) == {'_wake.yml', 'tenant2.yml'}
+
+    # A route file left behind while the backend was down
+    route_files(engine).add('tenant9.yml')
+    restarted = router(engine, tmp_path, wake_upstream='http://backend:8070')
+    restarted.start()
+    assert route_files(engine) == {'_wake.yml', 'tenant2.yml'}
+    assert restarted.has_route('tenant2')
+    assert restarted.stats() == {'ready': True, 'routes': 1, 'domain': '203.0.113.5.nip.io'}
+
+
+def test_wake_route_is_the_lowest_priority_catch_all(engine, tmp_path):
+    route = router(engine, tmp_path, wake_upstream='http://backend:8070')._wake_route()
+    assert 'priority: 1' in route
+    assert 'url: "http://backend:8070"' in route
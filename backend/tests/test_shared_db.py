@@ -0,0 +1,63 @@
+import json
+import os
+import stat
+
+import pytest
+
+from shared_db import SHARED_DB_CONTAINER, SharedDatabase, SharedDatabaseError
+
+
+class SqlEngine:
+    """Records the SQL sent to the shared server container"""
+
+    def __init__(self, exit_code=0):
+        self.exit_code = exit_code
+        self.calls = []
+
+    def health_status(self, container):
+        return 'healthy'
+
+    def exec_run(self, container, cmd, env=None, timeout=None):
+        self.calls.append((container, cmd, env))
+        return self.exit_code, '', 'ERROR 1045' if self.exit_code else ''
+
+
+@pytest.fixture
+def shared(tmp_path, monkeypatch):
+    monkeypatch.setenv('SHARED_DB_ROOT_PASSWORD', 'rootpw')
+    os.makedirs(tmp_path / 'tenant7')
+    return SharedDatabase(SqlEngine(), str(tmp_path))
+
+
+def test_create_grants_the_tenant_its_own_schema(shared, tmp_path):
+    credentials = shared.create_tenant_database('tenant7')
+    assert credentials['name'] == 'ps_tenant7'
+    assert credentials['user'] == 'tenant7'
+    assert credentials['host'] == SHARED_DB_CONTAINER
+
+    container, cmd, env = shared.engine.calls[-1]
+    sql = cmd[-1]
+    assert container == SHARED_DB_CONTAINER
+    assert cmd[:2] == ['mysql', '-uroot']
+    assert env == ['MYSQL_PWD=rootpw']
+    assert "CREATE DATABASE IF NOT EXISTS `ps_tenant7`" in sql
+    assert f"CREATE USER IF NOT EXISTS 'tenant7'@'%' IDENTIFIED BY '{credentials['password']}'" in sql
+    assert "GRANT ALL PRIVILEGES ON `ps_tenant7`.* TO 'tenant7'@'%'" in sql
+    assert credentials['password'] not in ' '.join(cmd[:-1])
+
+    path = tmp_path / 'tenant7' / 'db.json'
+    assert json.loads(path.read_text()) == credentials
+    assert stat.S_IMODE(os.stat(path).st_mode) == 0o600
+
+
+def test_create_reuses_stored_credentials(shared):
+    first = shared.create_tenant_database('tenant7')
+    assert shared.create_tenant_database('tenant7') == first
+    assert f"ALTER USER 'tenant7'@'%' IDENTIFIED BY '{first['password']}'" in shared.engine.calls[-1][1][-1]
+
+
+def test_failed_grant_raises(shared):
+    shared.engine.exit_code = 1
+    with pytest.raises(SharedDatabaseError, match='ERROR 1045'):
+        shared.create_tenant_database('tenant7')
+    assert shared.credentials('tenant7') is None
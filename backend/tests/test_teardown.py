@@ -0,0 +1,105 @@
+import os
+import threading
+
+import pytest
+
+from conftest import wait_until
+
+
+def deployed(client, tenant):
+    """Completed, and its provisioning job has finished too"""
+    status = client.get(f'/deployment-status/{tenant}').get_json()
+    return status['status'] == 'completed' and status.get('job', {}).get('state', 'completed') == 'completed'
+
+
+def create_store(client):
+    response = client.post('/create-store', json={'email': 'owner@example.com', 'password': 'Secret123!'})
+    assert response.status_code == 202
+    tenant = response.get_json()['tenant_id']
+    assert wait_until(lambda: deployed(client, tenant))
+    return tenant
+
+
+def leftovers(backend, engine, tenant):
+    """What a tenant still holds: containers, registry row, port, directory"""
+    return {
+        'containers': [name for name in engine.containers if name.startswith(f'{tenant}_')],
+        'registry': backend.registry.get(tenant) is not None,
+        'port': backend.nodes.ports(tenant).port_for(tenant),
+        'directory': os.path.exists(os.path.join(backend.TENANTS_DIR, tenant))
+    }
+
+
+GONE = {'containers': [], 'registry': False, 'port': None, 'directory': False}
+
+
+def test_delete_removes_everything(backend, engine, client):
+    tenant = create_store(client)
+    assert leftovers(backend, engine, tenant)['containers']
+
+    response = client.delete(f'/tenants/{tenant}')
+    assert response.status_code == 200
+    assert leftovers(backend, engine, tenant) == GONE
+    assert client.get(f'/deployment-status/{tenant}').status_code == 404
+    assert client.delete(f'/tenants/{tenant}').status_code == 404
+
+
+def test_delete_refuses_a_store_that_is_still_deploying(backend, client):
+    response = client.post('/create-store', json={'email': 'owner@example.com', 'password': 'Secret123!'})
+    tenant = response.get_json()['tenant_id']
+    assert client.delete(f'/tenants/{tenant}').status_code == 409
+    assert wait_until(lambda: deployed(client, tenant))
+    assert client.delete(f'/tenants/{tenant}').status_code == 200
+
+
+def test_concurrent_deletes_tear_down_once(backend, engine, client):
+    tenant = create_store(client)
+    barrier = threading.Barrier(6)
+    refusals = []
+
+    def delete():
+        barrier.wait()
+        refusals.append(backend.begin_removal(tenant))
+
+    threads = [threading.Thread(target=delete) for _ in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(refusals, key=str) == [None] + ['busy'] * 5
+
+    backend.remove_tenant(tenant)
+    assert leftovers(backend, engine, tenant) == GONE
+
+
+def test_interrupted_removal_can_be_retried(backend, engine, client):
+    tenant = create_store(client)
+    # The backend stopped after marking the store as being removed
+    assert backend.registry.begin_removal(tenant, 'Removing store...')
+    backend.recover_registry()
+
+    status = client.get(f'/deployment-status/{tenant}').get_json()
+    assert (status['status'], status['stage']) == ('error', 'removal_interrupted')
+    assert client.delete(f'/tenants/{tenant}').status_code == 200
+    assert leftovers(backend, engine, tenant) == GONE
+
+
+def test_batch_delete_reports_each_store(backend, engine, client):
+    tenant = create_store(client)
+    response = client.delete('/tenants/batch', json={'tenants': [tenant, 'tenant404']})
+    assert response.status_code == 202
+    assert response.get_json()['tenants'] == [
+        {'tenant_id': tenant, 'result': 'deleting'},
+        {'tenant_id': 'tenant404', 'result': 'not_found'}
+    ]
+    assert wait_until(lambda: leftovers(backend, engine, tenant) == GONE)
+
+
+def test_a_failed_warm_install_leaves_nothing_behind(backend, engine, monkeypatch):
+    monkeypatch.setitem(engine.failure_rates, 'db', 1.0)
+    tenant = backend.allocate_tenant()
+    backend.warm_pool.begin_fill(tenant)
+    with pytest.raises(Exception):
+        backend.provision_warm_store(tenant)
+    assert leftovers(backend, engine, tenant) == GONE
+    assert not backend.warm_pool.is_warm(tenant)
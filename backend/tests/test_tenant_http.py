@@ -0,0 +1,86 @@
+import pytest
+import requests
+
+from docker_engine import DockerEngineError
+from tenant_http import TenantHTTP
+
+
+class NetworkEngine:
+    def __init__(self, networks):
+        self.networks = networks
+        self.inspections = 0
+        self.connected = []
+        self.connect_error = None
+
+    def inspect_container(self, container):
+        self.inspections += 1
+        return {'NetworkSettings': {'Networks': self.networks}}
+
+    def connect_network(self, network, container):
+        if self.connect_error:
+            raise DockerEngineError(self.connect_error, 'refused')
+        self.connected.append((network, container))
+
+    def disconnect_network(self, network, container):
+        self.connected.remove((network, container))
+
+
+def test_address_prefers_the_attached_network_and_is_cached():
+    engine = NetworkEngine({
+        'tenant1_default': {'IPAddress': '172.18.0.3'},
+        'tenant1_tenant1-net': {'IPAddress': '172.30.0.9'}
+    })
+    http = TenantHTTP(engine, container='backend')
+    http.attach('tenant1_shop', 'tenant1_tenant1-net')
+    assert engine.connected == [('tenant1_tenant1-net', 'backend')]
+    assert http.address('tenant1_shop') == '172.30.0.9'
+    assert http.address('tenant1_shop') == '172.30.0.9'
+    assert engine.inspections == 1
+
+    http.detach('tenant1_shop')
+    assert engine.connected == []
+    http.detach('tenant1_shop')
+
+
+def test_address_falls_back_to_any_network():
+    http = TenantHTTP(NetworkEngine({'tenant1_default': {'IPAddress': '172.18.0.3'}}), container='')
+    assert http.address('tenant1_shop') == '172.18.0.3'
+
+
+def test_attach_outside_docker_joins_nothing():
+    engine = NetworkEngine({})
+    http = TenantHTTP(engine, container='')
+    http.attach('tenant1_shop', 'tenant1_tenant1-net')
+    http.detach('tenant1_shop')
+    assert engine.connected == []
+
+
+def test_attach_tolerates_an_existing_or_vanished_network():
+    engine = NetworkEngine({})
+    http = TenantHTTP(engine, container='backend')
+    for status in (403, 404):
+        engine.connect_error = status
+        http.attach('tenant1_shop', 'tenant1_tenant1-net')
+    engine.connect_error = 500
+    with pytest.raises(DockerEngineError):
+        http.attach('tenant1_shop', 'tenant1_tenant1-net')
+
+
+def test_failed_request_forgets_the_address(monkeypatch):
+    engine = NetworkEngine({'tenant1_default': {'IPAddress': '172.18.0.3'}})
+    http = TenantHTTP(engine, container='')
+
+    def refuse(*args, **kwargs):
+        raise requests.ConnectionError('refused')
+
+    monkeypatch.setattr(http.session, 'get', refuse)
+    with pytest.raises(requests.ConnectionError):
+        http.get('tenant1_shop')
+    http.address('tenant1_shop')
+    assert engine.inspections == 2
+
+
+def test_unaddressable_container_raises_connection_error():
+    http = TenantHTTP(NetworkEngine({}), container='')
+    with pytest.raises(requests.ConnectionError):
+        http.get('tenant1_shop')
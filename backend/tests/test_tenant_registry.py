@@ -0,0 +1,160 @@
+import threading
+
+import pytest
+
+from tenant_registry import TenantRegistry
+
+
+@pytest.fixture
+def registry(tmp_path):
+    return TenantRegistry(str(tmp_path / 'registry.db'))
+
+
+def deployed(registry):
+    tenant = registry.allocate()
+    registry.record_progress(tenant, 'completed', 'Store deployment completed!', 100, state='completed')
+    return tenant
+
+
+def test_allocate_hands_out_unique_names_across_threads(registry):
+    names = []
+
+    def allocate():
+        for _ in range(10):
+            names.append(registry.allocate())
+
+    threads = [threading.Thread(target=allocate) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(names) == sorted(f"tenant{i}" for i in range(1, 41))
+
+
+def test_seed_continues_after_existing_tenants(registry):
+    registry.seed(41)
+    assert registry.allocate() == 'tenant42'
+    registry.seed(10)
+    assert registry.allocate() == 'tenant43'
+
+
+def test_progress_updates_status_and_history(registry):
+    tenant = registry.allocate()
+    registry.update(tenant, port=9001, admin_folder='admin123')
+    registry.record_progress(tenant, 'mysql', 'Starting database...', 20)
+    registry.record_progress(tenant, 'completed', 'Done', 100, state='completed', result={'url': 'http://x'})
+
+    status = registry.get(tenant)
+    assert status['status'] == 'completed'
+    assert status['percent'] == 100
+    assert status['port'] == 9001
+    assert status['admin_folder'] == 'admin123'
+    assert status['result'] == {'url': 'http://x'}
+    assert [event['stage'] for event in registry.history(tenant)] == ['mysql', 'completed']
+    assert registry.counts() == {'completed': 1}
+    assert registry.get('tenant404') is None
+
+
+def test_restart_progress_starts_a_fresh_timeline(registry):
+    tenant = deployed(registry)
+    registry.restart_progress(tenant)
+    status = registry.get(tenant)
+    assert status['status'] == 'processing'
+    assert status['percent'] == 0
+    assert 'result' not in status
+
+
+def test_recover_fails_interrupted_deployments_and_removals(registry):
+    deploying = registry.allocate()
+    removing = deployed(registry)
+    registry.begin_removal(removing, 'Removing store...')
+    done = deployed(registry)
+
+    assert sorted(registry.recover()) == sorted([(deploying, 'processing'), (removing, 'deleting')])
+    assert registry.get(deploying)['status'] == 'error'
+    assert registry.get(deploying)['stage'] == 'interrupted'
+    assert registry.history(deploying)[-1]['stage'] == 'interrupted'
+    assert registry.get(removing)['status'] == 'error'
+    assert registry.get(removing)['stage'] == 'removal_interrupted'
+    assert registry.get(done)['status'] == 'completed'
+    assert registry.recover() == []
+
+
+def test_begin_removal_refuses_busy_tenants(registry):
+    deploying = registry.allocate()
+    assert not registry.begin_removal(deploying, 'Removing store...')
+    assert not registry.begin_removal('tenant404', 'Removing store...')
+
+    tenant = deployed(registry)
+    assert registry.begin_removal(tenant, 'Removing store...')
+    assert registry.get(tenant)['status'] == 'deleting'
+    assert not registry.begin_removal(tenant, 'Removing store...')
+
+
+def test_begin_removal_lets_one_of_concurrent_deletes_through(registry):
+    tenant = deployed(registry)
+    barrier = threading.Barrier(8)
+    results = []
+
+    def delete():
+        barrier.wait()
+        results.append(registry.begin_removal(tenant, 'Removing store...'))
+
+    threads = [threading.Thread(target=delete) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(results) == [False] * 7 + [True]
+
+
+def test_prune_and_delete_drop_history(registry):
+    tenant = deployed(registry)
+    registry.prune_history(max_age=3600)
+    assert len(registry.history(tenant)) == 1
+    registry.prune_history(max_age=-1)
+    assert registry.history(tenant) == []
+
+    registry.delete(tenant)
+    assert registry.get(tenant) is None
+
+
+def test_published_state_is_shared_through_the_registry(registry, tmp_path):
+    assert registry.state('health') == (None, None)
+    registry.publish_state('health', {'ok': True})
+    other_worker = TenantRegistry(str(tmp_path / 'registry.db'))
+    value, updated_at = other_worker.state('health')
+    assert value == {'ok': True}
+    assert updated_at is not None
+
+
+def test_commands_pass_results_back_and_drop_arguments(registry):
+    command = registry.submit_command('queue_store', {'admin_password': 'secret'})
+    assert registry.collect_command(command) == ('pending', None)
+
+    assert registry.claim_commands(10) == [(command, 'queue_store', {'admin_password': 'secret'})]
+    assert registry.claim_commands(10) == []
+    row = registry._conn().execute('SELECT args FROM commands WHERE id = ?', (command,)).fetchone()
+    assert row['args'] == '{}'
+
+    registry.finish_command(command, [{'tenant_id': 'tenant1'}, 202])
+    assert registry.collect_command(command) == ('done', [{'tenant_id': 'tenant1'}, 202])
+    assert registry.collect_command(command) == (None, None)
+
+
+def test_only_pending_commands_can_be_cancelled(registry):
+    taken = registry.submit_command('wake_store', {'tenant': 'tenant1'})
+    waiting = registry.submit_command('wake_store', {'tenant': 'tenant2'})
+    registry.claim_commands(1)
+
+    assert not registry.cancel_command(taken)
+    assert registry.cancel_command(waiting)
+    assert registry.collect_command(waiting) == (None, None)
+    assert registry.claim_commands(10) == []
+
+
+def test_commands_of_a_dead_leader_are_answered(registry):
+    command = registry.submit_command('remove_store', {'tenant': 'tenant1'})
+    registry.claim_commands(10)
+    assert registry.fail_running_commands([{'error': 'restarted'}, 503]) == 1
+    assert registry.collect_command(command) == ('done', [{'error': 'restarted'}, 503])
@@ -0,0 +1,92 @@
+import itertools
+
+import pytest
+import yaml
+
+from code_layer import CODE_ROOT, CodeLayer
+from profiles import PROFILES
+from tenant_spec import NANOSECONDS, PROJECT_LABEL, SERVICE_LABEL, parse_size
+
+SHARED_DATABASE = {'host': 'saas_shared_db', 'name': 'ps_tenant5', 'user': 'tenant5', 'password': 'p$ss"word'}
+
+
+def compose_env(service):
+    # Values are quoted with $ doubled against compose interpolation
+    return {key: str(value).replace('$$', '$') for key, value in service['environment'].items()}
+
+
+def assert_round_trip(spec, project_dir):
+    """The compose file and the Engine API bodies describe the same containers"""
+    compose = yaml.safe_load(spec.to_compose())
+    spec.write_files(str(project_dir))
+    assert set(compose['services']) == {service.name for service in spec.services}
+    for key, network in compose['networks'].items():
+        assert network.get('name', f'{spec.project}_{key}') == spec.network_name(key)
+    for key, volume in compose['volumes'].items():
+        volume = volume or {}
+        assert volume.get('external', False) == (key in spec.external_volumes)
+        assert volume.get('name', f'{spec.project}_{key}') == spec.volume_name(key)
+
+    for service in spec.services:
+        rendered = compose['services'][service.name]
+        config = spec.container_config(service)
+        host = config['HostConfig']
+
+        assert rendered['container_name'] == service.container
+        assert rendered['image'] == config['Image']
+        assert compose_env(rendered) == dict(entry.split('=', 1) for entry in config['Env'])
+        assert config['Labels'][PROJECT_LABEL] == spec.project
+        assert config['Labels'][SERVICE_LABEL] == service.name
+        assert rendered.get('command', []) == config.get('Cmd', [])
+
+        assert [
+            (spec.volume_name(mount['source']), mount['target'], mount.get('volume', {}).get('nocopy', False), mount.get('read_only', False))
+            for mount in rendered.get('volumes', [])
+        ] == [(mount['Source'], mount['Target'], mount['VolumeOptions']['NoCopy'], mount['ReadOnly']) for mount in host['Mounts']]
+
+        assert parse_size(rendered['mem_limit']) == host['Memory']
+        assert int(float(rendered['cpus']) * NANOSECONDS) == host['NanoCpus']
+
+        assert spec.network_name(rendered['networks'][0]) == host['NetworkMode']
+        assert list(config['NetworkingConfig']['EndpointsConfig']) == [host['NetworkMode']]
+        assert rendered.get('ports', []) == [
+            f"{binding['HostPort']}:{port.split('/')[0]}" for port, bindings in host.get('PortBindings', {}).items() for binding in bindings
+        ]
+        # Config files: mounted from the project directory by compose, uploaded before start by the API
+        mounted = {config['target']: (project_dir / compose['configs'][config['source']]['file']).read_text()
+                   for config in rendered.get('configs', [])}
+        assert mounted == {config.path: config.content for config in service.files}
+
+        if 'healthcheck' in rendered:
+            assert rendered['healthcheck']['test'] == config['Healthcheck']['Test']
+            assert int(rendered['healthcheck']['timeout'].rstrip('s')) * NANOSECONDS == config['Healthcheck']['Timeout']
+            assert rendered['healthcheck']['retries'] == config['Healthcheck']['Retries']
+
+
+@pytest.mark.parametrize('database,port,restored,backend_network,profile,code_mode', list(itertools.product(
+    [None, SHARED_DATABASE], [9001, None], [False, True], ['', 'saas-backend'], list(PROFILES), ['private', 'shared']
+)))
+def test_compose_and_engine_api_agree(backend, monkeypatch, tmp_path, database, port, restored, backend_network, profile, code_mode):
+    monkeypatch.setattr(backend, 'BACKEND_NETWORK', backend_network)
+    monkeypatch.setattr(backend, 'code_layer', CodeLayer(backend.PRESTASHOP_IMAGE, None) if code_mode == 'shared' else None)
+    spec = backend.tenant_spec(
+        'tenant5', port, 'tenant5.example.com', 'admin7f3a', 'owner@example.com', 'Pa$$w0rd "x"',
+        database=database, restored=restored, profile=PROFILES[profile]
+    )
+    assert_round_trip(spec, tmp_path)
+    assert spec.service('prestashop').memory == PROFILES[profile].shop_memory
+    assert [service.name for service in spec.services] == (['prestashop'] if database else ['db', 'prestashop'])
+    shop = spec.service('prestashop')
+    if code_mode == 'shared':
+        assert [(mount.target, mount.read_only) for mount in shop.mounts] == [(backend.WEB_ROOT, False), (CODE_ROOT, True)]
+        assert spec.volume_name('code') == backend.code_layer.volume(backend.nodes.primary)
+    else:
+        assert not shop.command and not spec.external_volumes
+
+
+def test_parse_size():
+    assert parse_size('512m') == 512 * 1024 ** 2
+    assert parse_size('1G') == 1024 ** 3
+    assert parse_size('2gb') == 2 * 1024 ** 3
+    with pytest.raises(ValueError):
+        parse_size('lots')
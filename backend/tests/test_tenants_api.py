@@ -0,0 +1,60 @@
+from conftest import wait_until
+from test_teardown import create_store
+
+
+def walk(client, **params):
+    """Every tenant id across all pages of /tenants"""
+    tenants, page = [], 1
+    while True:
+        body = client.get('/tenants', query_string=dict(params, page=page)).get_json()
+        tenants += [entry['tenant_id'] for entry in body['tenants']]
+        if page >= body['pages']:
+            return tenants, body['total']
+        page += 1
+
+
+def test_pages_cover_every_tenant_once_in_creation_order(client):
+    for _ in range(3):
+        create_store(client)
+    tenants, total = walk(client, per_page=2)
+    assert len(tenants) == total >= 3
+    assert tenants == sorted(tenants, key=lambda name: int(name[len('tenant'):]))
+    assert len(set(tenants)) == total
+
+    body = client.get('/tenants', query_string={'per_page': 2, 'page': 1}).get_json()
+    assert (body['page'], body['per_page'], body['pages']) == (1, 2, (total + 1) // 2)
+    assert client.get('/tenants', query_string={'page': body['pages'] + 1}).get_json()['tenants'] == []
+
+
+def test_state_filter_and_listing_entries(client):
+    tenant = create_store(client)
+    tenants, total = walk(client, state='completed', per_page=100)
+    assert tenant in tenants
+    body = client.get('/tenants', query_string={'state': 'completed', 'per_page': 100}).get_json()
+    assert {entry['status'] for entry in body['tenants']} == {'completed'}
+
+    entry = next(entry for entry in body['tenants'] if entry['tenant_id'] == tenant)
+    assert entry['url'].startswith('http://')
+    assert 'result' not in entry and 'admin_password' not in str(entry)
+    assert wait_until(lambda: {container['name'] for container in next(
+        e for e in client.get('/tenants', query_string={'state': 'completed', 'per_page': 100}).get_json()['tenants']
+        if e['tenant_id'] == tenant
+    )['containers']} == {f'{tenant}_db', f'{tenant}_shop'})
+
+    assert walk(client, state='deleting')[1] == 0
+
+
+def test_listing_parameters_are_validated(client):
+    assert client.get('/tenants?state=sleeping').status_code == 400
+    assert client.get('/tenants?page=0').status_code == 400
+    assert client.get('/tenants?per_page=0').status_code == 400
+    assert client.get('/tenants?per_page=many').status_code == 400
+    assert client.get('/tenants/tenant404').status_code == 404
+
+
+def test_a_tenant_is_shown_without_its_credentials(client):
+    tenant = create_store(client)
+    body = client.get(f'/tenants/{tenant}').get_json()
+    assert body['result'] == {'url': body['result']['url'], 'admin_url': body['result']['admin_url']}
+    assert body['result']['url'].startswith('http://')
+    assert 'admin_password' not in str(body)
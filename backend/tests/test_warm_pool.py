@@ -0,0 +1,85 @@
+import os
+import time
+import types
+
+import pytest
+
+import warm_pool
+from warm_pool import WARM_MARKER, WarmPool
+
+
+@pytest.fixture
+def pool(tmp_path):
+    return WarmPool(str(tmp_path), size=2)
+
+
+def warm(pool, tenant, port):
+    os.makedirs(os.path.join(pool.tenants_dir, tenant), exist_ok=True)
+    pool.begin_fill(tenant)
+    pool.mark_ready(tenant, {'port': port, 'admin_folder': 'admin123'})
+
+
+def test_claim_hands_out_ready_stacks_in_order(pool):
+    warm(pool, 'tenant1', 8081)
+    warm(pool, 'tenant2', 8082)
+
+    tenant, info = pool.claim()
+    assert (tenant, info['port'], info['admin_folder']) == ('tenant1', 8081, 'admin123')
+    assert not os.path.exists(os.path.join(pool.tenants_dir, 'tenant1', WARM_MARKER))
+    assert pool.claim()[0] == 'tenant2'
+    assert pool.claim() is None
+    assert pool.stats()['hits'] == 2 and pool.stats()['misses'] == 1
+
+
+def test_unclaim_puts_a_stack_back_first(pool):
+    warm(pool, 'tenant1', 8081)
+    warm(pool, 'tenant2', 8082)
+    tenant, info = pool.claim()
+    pool.unclaim(tenant, info)
+    assert pool.claim()[0] == 'tenant1'
+    assert pool.stats()['hits'] == 1
+
+
+def test_ready_stacks_survive_a_restart(pool, tmp_path):
+    warm(pool, 'tenant1', 8081)
+    warm(pool, 'tenant2', 8082)
+    pool.claim()
+
+    restarted = WarmPool(str(tmp_path), size=0)
+    restarted.start(fill=lambda needed: None)
+    assert restarted.stats()['ready'] == 1
+    assert restarted.claim()[0] == 'tenant2'
+
+
+def test_refill_asks_for_the_missing_stacks(pool):
+    requested = []
+    pool._fill = requested.append
+    warm(pool, 'tenant1', 8081)
+    pool.refill()
+    pool.begin_fill('tenant2')
+    pool.refill()
+    assert requested == [1]
+
+    pool.mark_failed('tenant2', backoff=False)
+    pool.refill()
+    assert requested == [1, 1]
+    assert pool.stats()['refills_failed'] == 1
+
+
+def test_failed_installs_back_off_the_refill(tmp_path, monkeypatch):
+    pool = WarmPool(str(tmp_path), size=1, refill_interval=10, max_backoff=30)
+    requested = []
+    pool._fill = requested.append
+    for failures, pause in ((1, 20), (2, 30), (3, 30)):
+        pool.begin_fill(f'tenant{failures}')
+        pool.mark_failed(f'tenant{failures}')
+        assert (pool.stats()['consecutive_failures'], pool.stats()['paused_for']) == (failures, pause)
+    pool.refill()
+    assert requested == []
+
+    later = time.time() + 31
+    monkeypatch.setattr(warm_pool, 'time', types.SimpleNamespace(time=lambda: later))
+    pool.refill()
+    assert requested == [1]
+    warm(pool, 'tenant4', 8084)
+    assert pool.stats()['consecutive_failures'] == 0
@@ -0,0 +1,159 @@
+import json
+import os
+import threading
+import time
+
+WARM_POOL_SIZE = int(os.getenv('WARM_POOL_SIZE', 0))
+WARM_POOL_REFILL_INTERVAL = int(os.getenv('WARM_POOL_REFILL_INTERVAL', 30))
+# Longest pause between refills after consecutive failed installs (the pause doubles per failure)
+WARM_POOL_MAX_BACKOFF = int(os.getenv('WARM_POOL_MAX_BACKOFF', 1800))
+WARM_MARKER = 'warm.json'
+
+
+class WarmPool:
+    """Keeps a number of fully installed, unclaimed tenant stacks ready for signups"""
+
+    def __init__(self, tenants_dir, size=WARM_POOL_SIZE, refill_interval=WARM_POOL_REFILL_INTERVAL,
+                 max_backoff=WARM_POOL_MAX_BACKOFF):
+        self.tenants_dir = tenants_dir
+        self.size = max(0, size)
+        self.refill_interval = refill_interval
+        self.max_backoff = max_backoff
+        self._failures = 0  # consecutive failed installs
+        self._retry_at = 0.0
+        self._ready = []
+        self._filling = set()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._fill = None
+        self.stats_counters = {
+            'hits': 0,
+            'misses': 0,
+            'refills_started': 0,
+            'refills_completed': 0,
+            'refills_failed': 0
+        }
+
+    def start(self, fill):
+        """Restore ready stacks from disk and start the background refill loop.
+
+        fill(tenants_needed) is called from the refill loop; it should call
+        begin_fill() for every stack it starts warming (it may start fewer
+        than requested).
+        """
+        self._fill = fill
+        self._restore()
+        if self.size == 0 or self._thread:
+            return
+        self._thread = threading.Thread(target=self._refill_loop, name="warm-pool-refill", daemon=True)
+        self._thread.start()
+        print(f"🔥 Warm pool enabled: keeping {self.size} stores ready ({len(self._ready)} restored)")
+
+    def claim(self):
+        """Pop a ready stack, returning (tenant, warm_info) or None on a pool miss"""
+        with self._lock:
+            if not self._ready:
+                self.stats_counters['misses'] += 1
+                return None
+            tenant = self._ready.pop(0)
+            self.stats_counters['hits'] += 1
+        marker = os.path.join(self.tenants_dir, tenant, WARM_MARKER)
+        with open(marker) as f:
+            info = json.load(f)
+        # Remove the marker before handing the stack out so a restart can never offer it twice
+        os.remove(marker)
+        return tenant, info
+
+    def unclaim(self, tenant, info):
+        """Put back a stack that was claimed but could not be handed out"""
+        marker = os.path.join(self.tenants_dir, tenant, WARM_MARKER)
+        with open(marker, 'w') as f:
+            json.dump(info, f)
+        with self._lock:
+            self._ready.insert(0, tenant)
+            self.stats_counters['hits'] -= 1
+
+    def discard(self, tenant):
+        """Take a ready stack out of the pool (it is being deleted)"""
+        with self._lock:
+            if tenant in self._ready:
+                self._ready.remove(tenant)
+
+    def begin_fill(self, tenant):
+        with self._lock:
+            self._filling.add(tenant)
+            self.stats_counters['refills_started'] += 1
+
+    def mark_ready(self, tenant, info):
+        """Record a freshly installed stack as claimable"""
+        marker = os.path.join(self.tenants_dir, tenant, WARM_MARKER)
+        with open(marker, 'w') as f:
+            json.dump(dict(info, warmed_at=time.time()), f)
+        with self._lock:
+            self._filling.discard(tenant)
+            self._ready.append(tenant)
+            self._failures = 0
+            self._retry_at = 0.0
+            self.stats_counters['refills_completed'] += 1
+        print(f"🔥 {tenant} added to warm pool ({len(self._ready)}/{self.size} ready)")
+
+    def mark_failed(self, tenant, backoff=True):
+        """Record a stack that could not be installed; with backoff, refills pause for longer after each such failure"""
+        with self._lock:
+            self._filling.discard(tenant)
+            self.stats_counters['refills_failed'] += 1
+            if not backoff:
+                return
+            self._failures += 1
+            delay = min(self.refill_interval * 2 ** self._failures, self.max_backoff)
+            self._retry_at = time.time() + delay
+        print(f"⚠️  Warm pool install of {tenant} failed ({self._failures} in a row); next refill in {delay:.0f}s")
+
+    def is_warm(self, tenant):
+        """Whether tenant is an unclaimed stack (ready or still warming)"""
+        with self._lock:
+            return tenant in self._ready or tenant in self._filling
+
+    def tenants(self):
+        """Every unclaimed stack, ready or still warming"""
+        with self._lock:
+            return self._ready + sorted(self._filling)
+
+    def stats(self):
+        with self._lock:
+            return dict(
+                self.stats_counters,
+                size=self.size,
+                ready=len(self._ready),
+                filling=len(self._filling),
+                consecutive_failures=self._failures,
+                paused_for=round(max(0.0, self._retry_at - time.time()))
+            )
+
+    def _restore(self):
+        if not os.path.isdir(self.tenants_dir):
+            return
+        restored = []
+        for tenant in sorted(os.listdir(self.tenants_dir)):
+            if os.path.exists(os.path.join(self.tenants_dir, tenant, WARM_MARKER)):
+                restored.append(tenant)
+        with self._lock:
+            self._ready = restored
+
+    def refill(self):
+        """Start warming stacks until ready + filling reaches the configured size"""
+        with self._lock:
+            if time.time() < self._retry_at:
+                return
+            needed = self.size - len(self._ready) - len(self._filling)
+        if needed <= 0 or self._fill is None:
+            return
+        self._fill(needed)
+
+    def _refill_loop(self):
+        while True:
+            try:
+                self.refill()
+            except Exception as e:
+                print(f"⚠️  Warm pool refill failed: {e}")
+            time.sleep(self.refill_interval)
@@ -37,6 +37,7 @@ export default function Home() {
   // Dummy progress tracking with milestone-based increments
   const [dummyProgress, setDummyProgress] = useState(0);
   const dummyProgressRef = useRef<NodeJS.Timeout | null>(null);
+  const dummyProgressValueRef = useRef(0);
   const startTimeRef = useRef<number | null>(null);
   const totalDummyTime = 165; // 2 minutes 45 seconds in seconds
   const [showLinks, setShowLinks] = useState(false);
@@ -128,11 +129,63 @@ export default function Home() {
     }
   }, [email, password, loading, result]);
 
-  // Poll for progress updates
+  // Keep the latest dummy progress readable from the progress stream callbacks
   useEffect(() => {
-    let pollInterval: NodeJS.Timeout;
+    dummyProgressValueRef.current = dummyProgress;
+  }, [dummyProgress]);
 
-    if (tenantId && loading) {
+  // Stream progress updates over Server-Sent Events, falling back to polling
+  useEffect(() => {
+    let pollInterval: NodeJS.Timeout | undefined;
+    let eventSource: EventSource | null = null;
+    let finished = false;
+
+    const stopUpdates = () => {
+      if (eventSource) {
+        eventSource.close();
+        eventSource = null;
+      }
+      if (pollInterval) {
+        clearInterval(pollInterval);
+        pollInterval = undefined;
+      }
+    };
+
+    const applyProgress = (data: any) => {
+      console.log('Progress data received:', data);
+
+      // Update progress state with received data
+      setProgress(prev => ({
+        ...prev,
+        percent: data.percent !== undefined ? data.percent : prev.percent,
+        stage: data.stage || prev.stage,
+        message: data.message || prev.message,
+        status: data.status || prev.status
+      }));
+
+      setPollingCount(prev => prev + 1);
+
+      // If deployment is completed or errored, stop listening
+      if (data.status === 'completed' || data.status === 'error') {
+        console.log(`Deployment ${data.status}, stopping progress updates`);
+        finished = true;
+        stopUpdates();
+        setLoading(false);
+
+        if (data.status === 'completed' && data.result) {
+          setResult(data.result);
+          // If we have result and dummy progress is at 99% or 100%, show links immediately
+          if (dummyProgressValueRef.current >= 99) {
+            setShowLinks(true);
+          }
+        } else if (data.status === 'error') {
+          setError(data.message || 'Deployment failed');
+          stopDummyProgress();
+        }
+      }
+    };
+
+    const startPolling = () => {
       const pollProgress = async () => {
         try {
           console.log(`Polling progress for tenant: ${tenantId}`);
@@ -142,37 +195,7 @@ export default function Home() {
             throw new Error(`HTTP ${response.status}: Failed to fetch progress`);
           }
 
-          const data = await response.json();
-          console.log('Progress data received:', data);
-
-          // Update progress state with received data
-          setProgress(prev => ({
-            ...prev,
-            percent: data.percent !== undefined ? data.percent : prev.percent,
-            stage: data.stage || prev.stage,
-            message: data.message || prev.message,
-            status: data.status || prev.status
-          }));
-
-          setPollingCount(prev => prev + 1);
-
-          // If deployment is completed or errored, stop polling
-          if (data.status === 'completed' || data.status === 'error') {
-            console.log(`Deployment ${data.status}, stopping polling`);
-            clearInterval(pollInterval);
-            setLoading(false);
-
-            if (data.status === 'completed' && data.result) {
-              setResult(data.result);
-              // If we have result and dummy progress is at 99% or 100%, show links immediately
-              if (dummyProgress >= 99) {
-                setShowLinks(true);
-              }
-            } else if (data.status === 'error') {
-              setError(data.message || 'Deployment failed');
-              stopDummyProgress();
-            }
-          }
+          applyProgress(await response.json());
         } catch (err) {
           console.error('Error polling progress:', err);
           setPollingCount(prev => prev + 1);
@@ -182,14 +205,29 @@ export default function Home() {
       // Start polling immediately and then every 2 seconds
       pollProgress();
       pollInterval = setInterval(pollProgress, 2000);
-    }
+    };
 
-    return () => {
-      if (pollInterval) {
-        clearInterval(pollInterval);
+    if (tenantId && loading) {
+      if (typeof window !== 'undefined' && 'EventSource' in window) {
+        eventSource = new EventSource(`${process.env.NEXT_PUBLIC_BACKEND_URL}/deployment-stream/${tenantId}`);
+        eventSource.addEventListener('progress', (event) => {
+          applyProgress(JSON.parse((event as MessageEvent).data));
+        });
+        eventSource.onerror = () => {
+          // EventSource reconnects by itself (resuming from Last-Event-ID); poll only once it gives up
+          if (!finished && eventSource && eventSource.readyState === EventSource.CLOSED) {
+            console.warn('Progress stream unavailable, falling back to polling');
+            eventSource = null;
+            startPolling();
+          }
+        };
+      } else {
+        startPolling();
       }
-    };
-  }, [tenantId, loading, dummyProgress]);
+    }
+
+    return stopUpdates;
+  }, [tenantId, loading]);
 
   // Handle dummy progress completion and real deployment coordination
   useEffect(() => {